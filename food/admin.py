@@ -1,3 +1,305 @@
+"""
+Admin do time de suporte, feito para tabelas com milhões de linhas.
+
+Cada changelist roda em tempo limitado, independente do tamanho da tabela:
+
+- a contagem é exata só até ``LIMITE_CONTAGEM`` linhas (``COUNT`` sobre um ``LIMIT``); acima
+  disso vem da estimativa do planejador do PostgreSQL (``EXPLAIN``), e o segundo ``COUNT(*)``
+  da tabela inteira (``show_full_result_count``) fica desligado;
+- as colunas e o ``__str__`` que seguem chaves estrangeiras vêm no mesmo SELECT
+  (``list_select_related``), sem N+1;
+- chaves estrangeiras usam ``raw_id_fields`` (ou autocomplete nas tabelas do catálogo), nunca um
+  ``<select>`` com a tabela inteira;
+- ``list_filter`` só em colunas com índice, e a busca das tabelas grandes é por igualdade em
+  colunas indexadas (id, chave estrangeira, username, e-mail), não ``icontains``;
+- a hierarquia de datas lista os anos/meses/dias entre o MIN e o MAX da coluna (dois acessos ao
+  índice), em vez do ``SELECT DISTINCT`` sobre todas as linhas do período.
+"""
+import json
+from datetime import date
+
 from django.contrib import admin
+from django.contrib.auth.admin import UserAdmin
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Max, Min, Q, QuerySet
+from django.utils.functional import cached_property
+
+from .models import (
+    Endereco, GrupoOpcao, Opcao, Usuario, Restaurante, CategoriaProduto, Produto,
+    Carrinho, ItemCarrinho, Pedido, ItemPedido, EventoPedido, Pagamento,
+    Entrega, RastreamentoEntrega,
+    AvaliacaoRestaurante, AvaliacaoEntregador, AvaliacaoProduto, Tarefa,
+)
+
+LIMITE_CONTAGEM = 10_000
+
+
+# -----------------------------
+# CONTAGEM E DATAS
+# -----------------------------
+def estimar_linhas(queryset):
+    """Linhas que o planejador espera para a consulta, ou ``None`` fora do PostgreSQL."""
+    if connections[queryset.db].vendor != 'postgresql':
+        return None
+    plano = json.loads(queryset.order_by().explain(format='json'))
+    return int(plano[0]['Plan']['Plan Rows'])
+
+
+class ContagemEstimadaPaginator(Paginator):
+    @cached_property
+    def count(self):
+        limitada = self.object_list.order_by()[:LIMITE_CONTAGEM + 1].count()
+        if limitada <= LIMITE_CONTAGEM:
+            return limitada
+        estimativa = estimar_linhas(self.object_list)
+        # Sem estimativa (SQLite em desenvolvimento) a tabela é pequena: conta de verdade
+        return max(estimativa, limitada) if estimativa is not None else self.object_list.count()
+
+
+def _periodos(primeira, ultima, kind):
+    atual = date(primeira.year, primeira.month if kind != 'year' else 1, primeira.day if kind == 'day' else 1)
+    while atual <= ultima:
+        yield atual
+        if kind == 'year':
+            atual = atual.replace(year=atual.year + 1)
+        elif kind == 'month':
+            atual = date(atual.year + atual.month // 12, atual.month % 12 + 1, 1)
+        else:
+            atual = date.fromordinal(atual.toordinal() + 1)
+
+
+class QuerySetAdmin(QuerySet):
+    """``dates()`` pela faixa MIN/MAX da coluna: a hierarquia de datas não varre o período."""
+
+    def dates(self, field_name, kind, order='ASC'):
+        faixa = self.aggregate(primeira=Min(field_name), ultima=Max(field_name))
+        if faixa['primeira'] is None:
+            return []
+        periodos = list(_periodos(faixa['primeira'], faixa['ultima'], kind))
+        return periodos[::-1] if order == 'DESC' else periodos
+
+
+# -----------------------------
+# BASE
+# -----------------------------
+class GrandesTabelasMixin:
+    paginator = ContagemEstimadaPaginator
+    show_full_result_count = False
+    show_facets = admin.ShowFacets.NEVER
+    list_per_page = 50
+    # Busca só por igualdade nestes campos indexados; vazio usa o search_fields padrão
+    busca_exata = ()
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        return QuerySetAdmin(model=queryset.model, query=queryset.query, using=queryset._db, hints=queryset._hints)
+
+    def get_search_fields(self, request):
+        return self.busca_exata or super().get_search_fields(request)
+
+    def get_search_results(self, request, queryset, search_term):
+        if not self.busca_exata:
+            return super().get_search_results(request, queryset, search_term)
+        termo = search_term.strip()
+        if not termo:
+            return queryset, False
+        condicoes = Q()
+        for campo in self.busca_exata:
+            try:
+                condicoes |= Q(**{campo: self.model._meta.get_field(campo).to_python(termo)})
+            except ValidationError:
+                continue  # termo que não cabe no campo (texto num id, por exemplo)
+        return (queryset.filter(condicoes) if condicoes else queryset.none()), False
+
+
+class GrandesTabelasAdmin(GrandesTabelasMixin, admin.ModelAdmin):
+    pass
+
+
+# -----------------------------
+# USUÁRIOS E ENDEREÇOS
+# -----------------------------
+@admin.register(Usuario)
+class UsuarioAdmin(GrandesTabelasMixin, UserAdmin):
+    list_display = ('username', 'email', 'perfil', 'is_active', 'data_cadastro')
+    list_filter = ('perfil',)
+    busca_exata = ('username', 'email', 'id')
+    fieldsets = UserAdmin.fieldsets + (('Perfil', {'fields': ('perfil', 'telefone', 'foto', 'foto_url', 'ativo')}),)
+
+
+@admin.register(Endereco)
+class EnderecoAdmin(GrandesTabelasAdmin):
+    list_display = ('__str__', 'usuario', 'cidade', 'criado_em')
+    list_select_related = ('usuario',)
+    raw_id_fields = ('usuario', 'restaurante')
+    busca_exata = ('id', 'usuario')
+
+
+# -----------------------------
+# RESTAURANTES E CARDÁPIO
+# -----------------------------
+@admin.register(Restaurante)
+class RestauranteAdmin(GrandesTabelasAdmin):
+    list_display = ('nome', 'dono', 'aberto', 'criado_em')
+    list_select_related = ('dono',)
+    list_filter = ('aberto',)
+    search_fields = ('nome', '=cnpj')
+    raw_id_fields = ('dono',)
+
+
+@admin.register(CategoriaProduto)
+class CategoriaProdutoAdmin(GrandesTabelasAdmin):
+    search_fields = ('nome',)
+
+
+class OpcaoInline(admin.TabularInline):
+    model = Opcao
+    extra = 0
+
+
+@admin.register(Produto)
+class ProdutoAdmin(GrandesTabelasAdmin):
+    list_display = ('nome', 'restaurante', 'categoria', 'preco', 'disponivel', 'estoque')
+    list_select_related = ('restaurante', 'categoria')
+    list_filter = ('disponivel',)
+    search_fields = ('nome',)
+    autocomplete_fields = ('restaurante', 'categoria')
+
+
+@admin.register(GrupoOpcao)
+class GrupoOpcaoAdmin(GrandesTabelasAdmin):
+    list_display = ('nome', 'produto', 'obrigatorio', 'multipla_escolha')
+    list_select_related = ('produto__restaurante',)
+    search_fields = ('nome',)
+    autocomplete_fields = ('produto',)
+    inlines = [OpcaoInline]
+
+
+@admin.register(Opcao)
+class OpcaoAdmin(GrandesTabelasAdmin):
+    list_display = ('nome', 'grupo', 'preco_adicional')
+    list_select_related = ('grupo',)
+    raw_id_fields = ('grupo',)
+    busca_exata = ('id', 'grupo')
+
+
+# -----------------------------
+# CARRINHO E PEDIDOS
+# -----------------------------
+@admin.register(Carrinho)
+class CarrinhoAdmin(GrandesTabelasAdmin):
+    list_display = ('__str__', 'restaurante', 'criado_em')
+    list_select_related = ('usuario', 'restaurante')
+    raw_id_fields = ('usuario', 'restaurante')
+    busca_exata = ('id', 'usuario')
+
+
+@admin.register(ItemCarrinho)
+class ItemCarrinhoAdmin(GrandesTabelasAdmin):
+    list_display = ('__str__', 'carrinho', 'quantidade')
+    list_select_related = ('produto', 'carrinho__usuario')
+    raw_id_fields = ('carrinho', 'produto', 'opcoes_escolhidas')
+    busca_exata = ('id', 'carrinho')
+
+
+class ItemPedidoInline(admin.TabularInline):
+    model = ItemPedido
+    extra = 0
+    raw_id_fields = ('produto',)
+
+
+@admin.register(Pedido)
+class PedidoAdmin(GrandesTabelasAdmin):
+    list_display = ('__str__', 'usuario', 'status', 'valor_total', 'data_referencia', 'criado_em')
+    list_select_related = ('restaurante', 'usuario')
+    list_filter = ('status',)
+    date_hierarchy = 'data_referencia'
+    ordering = ('-data_referencia',)
+    raw_id_fields = ('usuario',)
+    autocomplete_fields = ('restaurante',)
+    busca_exata = ('id', 'usuario')
+    inlines = [ItemPedidoInline]
+
+
+@admin.register(ItemPedido)
+class ItemPedidoAdmin(GrandesTabelasAdmin):
+    list_display = ('__str__', 'pedido', 'quantidade', 'preco_unitario')
+    list_select_related = ('produto', 'pedido__restaurante')
+    raw_id_fields = ('pedido', 'produto')
+    busca_exata = ('id', 'pedido')
+
+
+@admin.register(EventoPedido)
+class EventoPedidoAdmin(GrandesTabelasAdmin):
+    list_display = ('id', 'pedido', 'status_anterior', 'status_novo', 'criado_em')
+    list_select_related = ('pedido__restaurante',)
+    ordering = ('-id',)
+    raw_id_fields = ('pedido',)
+    busca_exata = ('id', 'pedido')
+
+
+@admin.register(Pagamento)
+class PagamentoAdmin(GrandesTabelasAdmin):
+    list_display = ('__str__', 'metodo', 'valor', 'status', 'criado_em')
+    raw_id_fields = ('pedido',)
+    busca_exata = ('id', 'pedido')
+
+
+# -----------------------------
+# ENTREGA E RASTREAMENTO
+# -----------------------------
+@admin.register(Entrega)
+class EntregaAdmin(GrandesTabelasAdmin):
+    list_display = ('__str__', 'entregador', 'status', 'inicio', 'fim')
+    list_select_related = ('entregador',)
+    list_filter = ('status',)
+    ordering = ('-inicio',)
+    raw_id_fields = ('pedido', 'entregador')
+    busca_exata = ('id', 'pedido', 'entregador')
+
+
+@admin.register(RastreamentoEntrega)
+class RastreamentoEntregaAdmin(GrandesTabelasAdmin):
+    list_display = ('entrega', 'latitude', 'longitude', 'registrado_em')
+    list_select_related = ('entrega',)
+    raw_id_fields = ('entrega',)
+    busca_exata = ('id', 'entrega')
+
+
+# -----------------------------
+# AVALIAÇÕES
+# -----------------------------
+@admin.register(AvaliacaoRestaurante)
+class AvaliacaoRestauranteAdmin(GrandesTabelasAdmin):
+    list_display = ('__str__', 'usuario', 'nota', 'criado_em')
+    list_select_related = ('restaurante', 'usuario')
+    raw_id_fields = ('restaurante', 'usuario')
+    busca_exata = ('id', 'restaurante', 'usuario')
+
+
+@admin.register(AvaliacaoEntregador)
+class AvaliacaoEntregadorAdmin(GrandesTabelasAdmin):
+    list_display = ('__str__', 'usuario', 'nota', 'criado_em')
+    list_select_related = ('entregador', 'usuario')
+    raw_id_fields = ('entregador', 'usuario')
+    busca_exata = ('id', 'entregador', 'usuario')
+
+
+@admin.register(AvaliacaoProduto)
+class AvaliacaoProdutoAdmin(GrandesTabelasAdmin):
+    list_display = ('__str__', 'usuario', 'nota', 'criado_em')
+    list_select_related = ('produto', 'usuario')
+    raw_id_fields = ('produto', 'usuario')
+    busca_exata = ('id', 'produto', 'usuario')
+
 
-# Register your models here.
+# -----------------------------
+# TAREFAS EM SEGUNDO PLANO
+# -----------------------------
+@admin.register(Tarefa)
+class TarefaAdmin(GrandesTabelasAdmin):
+    list_display = ('nome', 'fila', 'status', 'tentativas', 'disponivel_em')
+    list_filter = ('fila', 'status')
+    busca_exata = ('id',)
@@ -1,6 +1,22 @@
+import logging
+
 from django.apps import AppConfig
+from django.conf import settings
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
 
 
 class FoodConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'food'
\ No newline at end of file
+    name = 'food'
+
+    def ready(self):
+        from . import sinais  # noqa: F401 (registra os sinais de invalidação dos caches)
+        from .metricas import instalar_contador_sql
+        connection_created.connect(instalar_contador_sql, dispatch_uid='food.metricas')
+        if not settings.DEBUG and not settings.CACHE_COMPARTILHADO:
+            logger.error(
+                'CACHES é a memória local de cada processo (defina REDIS_URL): com mais de um worker, '
+                'carrinhos, chaves de idempotência e limites de requisição não são vistos pelos outros.'
+            )
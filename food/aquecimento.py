@@ -0,0 +1,119 @@
+"""
+Aquecimento do processo antes da primeira requisição.
+
+A primeira requisição de um worker paga trabalho que depois fica em cache no processo:
+compilar as regex das rotas, montar os campos dos serializers (e o ``_meta`` dos models que
+eles consultam), os forms dos filtros, os algoritmos do JWT, abrir a conexão com o banco e
+montar o índice do autocompletar.
+``aquecer_processo`` faz isso no import do ``wsgi.py``/``asgi.py``. Com ``gunicorn --preload``
+o import acontece uma vez no master e os workers já nascem aquecidos pelo fork; as conexões,
+que não podem ser herdadas, são fechadas antes do fork e reabertas em cada worker.
+"""
+import logging
+import os
+from time import perf_counter
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.urls import get_resolver
+
+logger = logging.getLogger(__name__)
+_fork_registrado = False
+
+
+def _compilar(padroes):
+    for padrao in padroes:
+        padrao.pattern.regex  # compilada no primeiro acesso
+        if hasattr(padrao, 'url_patterns'):
+            _compilar(padrao.url_patterns)
+
+
+def aquecer_rotas():
+    for urlconf in filter(None, (settings.ROOT_URLCONF, getattr(settings, 'ASYNC_ROOT_URLCONF', None))):
+        resolver = get_resolver(urlconf)
+        _compilar(resolver.url_patterns)
+        resolver.reverse_dict  # monta os índices do reverse
+
+
+def _subclasses(classe):
+    for subclasse in classe.__subclasses__():
+        yield subclasse
+        yield from _subclasses(subclasse)
+
+
+def aquecer_serializers():
+    from .serializers import SerializerDinamico
+
+    for serializer_class in _subclasses(SerializerDinamico):
+        serializer_class().fields
+
+
+def aquecer_filtros():
+    from .urls import router
+
+    for _, viewset, _ in router.registry:
+        filterset_class = getattr(viewset, 'filterset_class', None)
+        if filterset_class is not None:
+            filterset_class(queryset=filterset_class._meta.model.objects.none()).form
+
+
+def aquecer_jwt():
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    AccessToken(str(AccessToken()))
+
+
+ETAPAS = {
+    'rotas': aquecer_rotas,
+    'serializers': aquecer_serializers,
+    'filtros': aquecer_filtros,
+    'jwt': aquecer_jwt,
+}
+
+
+def aquecer():
+    """Executa as etapas e devolve o tempo (s) de cada uma."""
+    tempos = {}
+    for nome, etapa in ETAPAS.items():
+        inicio = perf_counter()
+        etapa()
+        tempos[nome] = perf_counter() - inicio
+    return tempos
+
+
+def abrir_conexoes():
+    """Abre as conexões que sobrevivem entre requisições (``CONN_MAX_AGE`` diferente de 0)."""
+    for alias in connections:
+        conexao = connections[alias]
+        if conexao.settings_dict.get('CONN_MAX_AGE') == 0:
+            continue  # seria fechada no início da primeira requisição
+        try:
+            conexao.ensure_connection()
+        except DatabaseError:
+            # Banco fora do ar no boot: o worker sobe e conecta na primeira requisição
+            logger.warning('Não foi possível abrir a conexão %s no aquecimento', alias, exc_info=True)
+
+
+def montar_autocompletar():
+    """Índice de prefixos da busca (``autocompletar.py``) pronto antes da primeira tecla."""
+    from . import autocompletar
+    try:
+        autocompletar.indice()
+    except DatabaseError:
+        # Sem banco no boot: a primeira busca monta o índice
+        logger.warning('Não foi possível montar o índice do autocompletar no aquecimento', exc_info=True)
+
+
+def aquecer_processo():
+    """Chamado pelos pontos de entrada WSGI/ASGI; desligue com ``AQUECER=0``."""
+    global _fork_registrado
+    if os.getenv('AQUECER', '1') == '0':
+        return
+    tempos = aquecer()
+    logger.info('Aquecimento: %s', ', '.join(f'{nome} {tempo * 1000:.1f} ms' for nome, tempo in tempos.items()))
+    abrir_conexoes()
+    montar_autocompletar()
+    if not _fork_registrado:
+        # Conexões abertas não podem ser herdadas pelos workers (preload + fork)
+        os.register_at_fork(before=connections.close_all, after_in_child=abrir_conexoes)
+        _fork_registrado = True
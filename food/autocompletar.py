@@ -0,0 +1,265 @@
+"""
+Sugestões da caixa de busca a cada tecla, sem consultar o banco.
+
+Cada processo guarda os nomes de restaurantes, produtos e categorias normalizados (minúsculas,
+sem acento e sem pontuação) numa lista ordenada por tipo. Cada palavra do nome, até
+``PALAVRAS_POR_NOME``, abre uma chave com o resto do nome, então "burg" encontra
+"X-Burguer". A busca por prefixo é um ``bisect`` seguido de poucos passos, em microssegundos, e
+a memória de cada processo é limitada por ``AUTOCOMPLETAR_MAXIMO_CHAVES`` chaves por tipo.
+
+O índice é montado na subida (``aquecimento.py``; com ``--preload``, uma vez antes do fork) e
+acompanha os sinais dos models (``sinais.py``). Um sinal só dispara no processo que salvou, por
+isso cada mudança também entra num log no cache, numerado por um contador. Antes de responder,
+cada processo aplica as mudanças que faltam, no máximo uma vez a cada ``INTERVALO_SINCRONIA``
+segundos. Se o log já não tem o que falta (expirou, ou o cache foi limpo), o processo remonta o
+índice a partir do banco.
+
+O nome vem sem a disponibilidade: o estoque muda por ``update()``, sem sinal, e a página do
+produto já mostra se ele está disponível.
+"""
+import bisect
+import logging
+import re
+import threading
+import time
+import unicodedata
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Restaurante, CategoriaProduto, Produto
+
+logger = logging.getLogger(__name__)
+
+TIPOS = ('restaurante', 'produto', 'categoria')
+PALAVRAS_POR_NOME = 4
+LIMITE_PADRAO = 10
+LIMITE_MAXIMO = 20
+INTERVALO_SINCRONIA = 1.0  # segundos
+# Mais atrasado que isso, remontar do banco sai mais barato que aplicar mudança por mudança
+MAXIMO_MUDANCAS = 1000
+# Uma mudança numerada que ainda não apareceu no log: quem incrementou o contador está
+# gravando. Se continuar faltando depois disso, ela se perdeu
+ESPERA_MUDANCA = 5.0
+TEMPO_MUDANCA = 60 * 60
+_CHAVE_VERSAO = 'autocompletar:versao'
+_SEPARADOR = re.compile(r'[\W_]+')
+_ACENTOS = re.compile('[\u0300-\u036f]')  # marcas que o NFKD separa das letras
+_FIM_TERMO = '\x00'
+
+
+def _chave_mudanca(numero):
+    return f'autocompletar:mudanca:{numero}'
+
+
+def normalizar(texto):
+    """Minúsculas, sem acentos, e o que não é letra nem número vira um espaço."""
+    sem_acento = _ACENTOS.sub('', unicodedata.normalize('NFKD', texto))
+    return ' '.join(_SEPARADOR.sub(' ', sem_acento.casefold()).split())
+
+
+def termos(nome):
+    """As chaves do nome: ele inteiro e o resto a partir de cada palavra seguinte."""
+    palavras = normalizar(nome).split()
+    return list(dict.fromkeys(' '.join(palavras[i:]) for i in range(min(len(palavras), PALAVRAS_POR_NOME))))
+
+
+class IndicePrefixos:
+    """Chaves ``termo\\0id`` de um tipo em ordem, para a busca por prefixo com ``bisect``."""
+
+    def __init__(self, maximo):
+        self.maximo = maximo
+        self.chaves = []
+        # {id: (nome, restaurante_id, chaves)}
+        self.documentos = {}
+        self.descartados = 0
+
+    def _chaves(self, documento_id, nome):
+        return tuple(f'{termo}{_FIM_TERMO}{documento_id}' for termo in termos(nome))
+
+    def carregar(self, linhas):
+        """Monta o índice de ``(id, nome, restaurante_id)`` ordenando uma vez só, no fim."""
+        self.chaves, self.documentos, self.descartados = [], {}, 0
+        for documento_id, nome, restaurante_id in linhas:
+            chaves = self._chaves(documento_id, nome)
+            if len(self.chaves) + len(chaves) > self.maximo:
+                self.descartados += 1
+                continue
+            self.chaves.extend(chaves)
+            self.documentos[documento_id] = (nome, restaurante_id, chaves)
+        self.chaves.sort()
+
+    def colocar(self, documento_id, nome, restaurante_id=None):
+        self.tirar(documento_id)
+        chaves = self._chaves(documento_id, nome)
+        if len(self.chaves) + len(chaves) > self.maximo:
+            self.descartados += 1
+            return
+        for chave in chaves:
+            bisect.insort(self.chaves, chave)
+        self.documentos[documento_id] = (nome, restaurante_id, chaves)
+
+    def tirar(self, documento_id):
+        documento = self.documentos.pop(documento_id, None)
+        for chave in documento[2] if documento else ():
+            posicao = bisect.bisect_left(self.chaves, chave)
+            if posicao < len(self.chaves) and self.chaves[posicao] == chave:
+                del self.chaves[posicao]
+
+    def buscar(self, prefixo, limite):
+        """``[(termo, id)]`` dos primeiros ``limite`` documentos com uma chave que começa por ``prefixo``."""
+        encontrados = {}
+        posicao = bisect.bisect_left(self.chaves, prefixo)
+        while posicao < len(self.chaves) and len(encontrados) < limite:
+            chave = self.chaves[posicao]
+            if not chave.startswith(prefixo):
+                break
+            termo, _, documento_id = chave.partition(_FIM_TERMO)
+            encontrados.setdefault(documento_id, termo)
+            posicao += 1
+        return [(termo, documento_id) for documento_id, termo in encontrados.items()]
+
+
+class _Estado:
+    def __init__(self, maximo):
+        self.indices = {tipo: IndicePrefixos(maximo) for tipo in TIPOS}
+        self.versao = 0
+        self.sincronizado_em = 0.0
+        self.faltando_desde = None
+
+
+_estado = None
+# Leitura e alteração das listas (trechos curtos)
+_trava = threading.Lock()
+# Uma montagem ou sincronia por vez; as buscas seguem no índice atual enquanto isso
+_trava_sincronia = threading.Lock()
+
+
+def _versao_no_cache():
+    return cache.get(_CHAVE_VERSAO, 0)
+
+
+def montar():
+    """Monta o índice do processo a partir do banco (três consultas) e o troca pelo atual."""
+    global _estado
+    estado = _Estado(settings.AUTOCOMPLETAR_MAXIMO_CHAVES)
+    # A versão é lida antes do banco: o que mudar durante a leitura é aplicado de novo depois
+    estado.versao = _versao_no_cache()
+    fontes = {
+        'restaurante': Restaurante.objects.values_list('pk', 'nome'),
+        'produto': Produto.objects.values_list('pk', 'nome', 'restaurante_id'),
+        'categoria': CategoriaProduto.objects.values_list('pk', 'nome'),
+    }
+    for tipo, consulta in fontes.items():
+        estado.indices[tipo].carregar(
+            (str(linha[0]), linha[1], str(linha[2]) if len(linha) > 2 else None)
+            for linha in consulta.iterator(chunk_size=10_000)
+        )
+        if estado.indices[tipo].descartados:
+            logger.warning(
+                'Autocompletar: %d %s(s) fora do índice (AUTOCOMPLETAR_MAXIMO_CHAVES=%d)',
+                estado.indices[tipo].descartados, tipo, estado.indices[tipo].maximo,
+            )
+    estado.sincronizado_em = time.monotonic()
+    with _trava:
+        _estado = estado
+    return estado
+
+
+def _aplicar(estado, mudanca):
+    tipo, documento_id, nome, restaurante_id = mudanca
+    if nome is None:
+        estado.indices[tipo].tirar(documento_id)
+    else:
+        estado.indices[tipo].colocar(documento_id, nome, restaurante_id)
+
+
+def _sincronizar(estado):
+    """Aplica as mudanças do log que o processo ainda não viu; devolve o estado (novo, se remontou)."""
+    estado.sincronizado_em = time.monotonic()
+    versao = _versao_no_cache()
+    if versao == estado.versao:
+        return estado
+    if versao < estado.versao or versao - estado.versao > MAXIMO_MUDANCAS:
+        return montar()  # cache limpo, ou atrasado demais
+    numeros = range(estado.versao + 1, versao + 1)
+    mudancas = cache.get_many([_chave_mudanca(numero) for numero in numeros])
+    for numero in numeros:
+        mudanca = mudancas.get(_chave_mudanca(numero))
+        if mudanca is None:
+            if estado.faltando_desde is None:
+                estado.faltando_desde = estado.sincronizado_em
+            elif estado.sincronizado_em - estado.faltando_desde > ESPERA_MUDANCA:
+                return montar()
+            return estado
+        with _trava:
+            _aplicar(estado, mudanca)
+        estado.versao, estado.faltando_desde = numero, None
+    return estado
+
+
+def indice():
+    """O índice do processo, montado na primeira vez e em dia com o log de mudanças."""
+    estado = _estado
+    if estado is not None and time.monotonic() - estado.sincronizado_em < INTERVALO_SINCRONIA:
+        return estado
+    # Com índice, quem chega durante a sincronia de outra thread não espera por ela
+    if not _trava_sincronia.acquire(blocking=estado is None):
+        return estado
+    try:
+        if _estado is None:
+            return montar()
+        if time.monotonic() - _estado.sincronizado_em < INTERVALO_SINCRONIA:
+            return _estado
+        return _sincronizar(_estado)
+    finally:
+        _trava_sincronia.release()
+
+
+def sugerir(texto, tipos=TIPOS, limite=LIMITE_PADRAO):
+    """Até ``limite`` nomes dos ``tipos`` com uma palavra começando pelo ``texto`` digitado."""
+    prefixo = normalizar(texto)
+    if not prefixo:
+        return []
+    estado = indice()
+    encontrados = []
+    with _trava:
+        for tipo in tipos:
+            indice_tipo = estado.indices[tipo]
+            for termo, documento_id in indice_tipo.buscar(prefixo, limite):
+                nome, restaurante_id, _ = indice_tipo.documentos[documento_id]
+                encontrados.append((termo, tipo, documento_id, nome, restaurante_id))
+    encontrados.sort(key=lambda encontrado: encontrado[0])
+    sugestoes = []
+    for _, tipo, documento_id, nome, restaurante_id in encontrados[:limite]:
+        sugestao = {'tipo': tipo, 'id': documento_id, 'nome': nome}
+        if tipo == 'produto':
+            sugestao['restaurante'] = restaurante_id
+        sugestoes.append(sugestao)
+    return sugestoes
+
+
+def publicar(tipo, documento_id, nome, restaurante_id=None):
+    """
+    Registra a mudança de um nome (``nome=None`` para remoção) no log do cache e no índice deste
+    processo, se ele já tiver um. Chamado pelos sinais depois do commit.
+    """
+    mudanca = (tipo, str(documento_id), nome, restaurante_id and str(restaurante_id))
+    cache.add(_CHAVE_VERSAO, 0, None)
+    numero = cache.incr(_CHAVE_VERSAO)
+    cache.set(_chave_mudanca(numero), mudanca, TEMPO_MUDANCA)
+    with _trava:
+        if _estado is not None:
+            _aplicar(_estado, mudanca)
+
+
+def estatisticas():
+    """Chaves, documentos e descartados de cada tipo no índice deste processo (vazio se não montado)."""
+    estado = _estado
+    if estado is None:
+        return {}
+    return {
+        tipo: {'chaves': len(indice_tipo.chaves), 'documentos': len(indice_tipo.documentos),
+               'descartados': indice_tipo.descartados}
+        for tipo, indice_tipo in estado.indices.items()
+    }
@@ -0,0 +1,460 @@
+"""
+Carrinho em cache com persistência adiada (write-behind).
+
+O conteúdo do carrinho fica no cache do Django (``CACHES['default']``: locmem em
+desenvolvimento, Redis em produção). Adicionar itens não toca o banco: o carrinho é lido
+do banco uma vez, os produtos vêm de um snapshot em cache invalidado por sinais, e as
+tabelas ``Carrinho``/``ItemCarrinho`` só são gravadas no checkout (``fechar_carrinho``)
+ou pelo comando ``persistir_carrinhos``, que grava os carrinhos alterados desde a última vez.
+Os grupos de opções de cada produto também ficam em cache, para validar as escolhas sem
+consultas por grupo. Os sinais que invalidam os snapshots estão em ``sinais.py``.
+"""
+import copy
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from . import precos
+from .models import Produto, GrupoOpcao, Opcao, Carrinho, ItemCarrinho
+from .serializers_leitura import serializar_produtos, _data_hora, _decimal, _filtrar, _nome_usuario, _texto
+
+TEMPO_PRODUTO = 60 * 60
+_CHAVE_SUJOS = 'carrinhos:sujos'
+
+
+def _tempo_carrinho():
+    return getattr(settings, 'CARRINHO_CACHE_TIMEOUT', 7 * 24 * 60 * 60)
+
+
+def _ids_validos(ids):
+    """Ids como string; os que não são UUID não existem (como no ``get_object_or_404``)."""
+    validos = []
+    for valor in ids:
+        try:
+            validos.append(str(uuid.UUID(str(valor))))
+        except ValueError:
+            pass
+    return validos
+
+
+def _chave_carrinho(carrinho_id):
+    return f'carrinho:{carrinho_id}'
+
+
+def _chave_produto(produto_id):
+    return f'produto:{produto_id}'
+
+
+def _chave_grupos(produto_id):
+    return f'produto:{produto_id}:grupos'
+
+
+@contextmanager
+def _trava(chave, validade=10):
+    """Trava entre processos com ``cache.add``; expira sozinha se o dono morrer."""
+    chave = f'{chave}:trava'
+    while not cache.add(chave, 1, validade):
+        time.sleep(0.002)
+    try:
+        yield
+    finally:
+        cache.delete(chave)
+
+
+# -----------------------------
+# PRODUTOS
+# -----------------------------
+def produtos_em_cache(ids):
+    """Snapshots (saída do ``ProdutoSerializer``) dos produtos; só vai ao banco nos que faltam."""
+    chaves = {_chave_produto(produto_id): produto_id for produto_id in _ids_validos(ids)}
+    encontrados = cache.get_many(chaves)
+    faltando = [produto_id for chave, produto_id in chaves.items() if chave not in encontrados]
+    if faltando:
+        novos = {
+            _chave_produto(produto['id']): produto
+            for produto in serializar_produtos(Produto.objects.filter(pk__in=faltando))
+        }
+        cache.set_many(novos, TEMPO_PRODUTO)
+        encontrados.update(novos)
+    return {chaves[chave]: produto for chave, produto in encontrados.items()}
+
+
+def produto_em_cache(produto_id):
+    return next(iter(produtos_em_cache([produto_id]).values()), None)
+
+
+def invalidar_produtos(ids):
+    """Para alterações feitas com ``update()``, que não disparam os sinais."""
+    cache.delete_many([_chave_produto(produto_id) for produto_id in ids])
+
+
+# -----------------------------
+# GRUPOS DE OPÇÕES
+# -----------------------------
+def grupos_em_cache(produto_ids):
+    """Grupos de opções (com as opções) de cada produto; só vai ao banco nos que faltam."""
+    chaves = {_chave_grupos(produto_id): produto_id for produto_id in _ids_validos(produto_ids)}
+    encontrados = cache.get_many(chaves)
+    faltando = [produto_id for chave, produto_id in chaves.items() if chave not in encontrados]
+    if faltando:
+        novos = {produto_id: [] for produto_id in faltando}
+        grupos = {}
+        for linha in GrupoOpcao.objects.filter(produto_id__in=faltando).values(
+            'id', 'produto_id', 'nome', 'obrigatorio', 'multipla_escolha'
+        ):
+            grupos[linha['id']] = {
+                'id': str(linha['id']),
+                'nome': linha['nome'],
+                'obrigatorio': linha['obrigatorio'],
+                'multipla_escolha': linha['multipla_escolha'],
+                'opcoes': [],
+            }
+            novos[str(linha['produto_id'])].append(grupos[linha['id']])
+        for linha in Opcao.objects.filter(grupo_id__in=grupos).values('id', 'grupo_id', 'nome', 'preco_adicional'):
+            grupos[linha['grupo_id']]['opcoes'].append({
+                'id': str(linha['id']),
+                'nome': linha['nome'],
+                'preco_adicional': _decimal(linha['preco_adicional']),
+            })
+        novos = {_chave_grupos(produto_id): grupos_do_produto for produto_id, grupos_do_produto in novos.items()}
+        cache.set_many(novos, TEMPO_PRODUTO)
+        encontrados.update(novos)
+    return {chaves[chave]: grupos for chave, grupos in encontrados.items()}
+
+
+def invalidar_grupos(produto_ids):
+    cache.delete_many([_chave_grupos(produto_id) for produto_id in produto_ids])
+
+
+def escolher_opcoes(produto, grupos, opcoes_ids):
+    """
+    Snapshots das opções escolhidas para o produto, validadas contra os grupos dele (as mesmas
+    regras do ``ItemCarrinho.save``); ValueError se a escolha não for válida.
+    """
+    if not produto['disponivel']:
+        raise ValueError(f"O produto '{produto['nome']}' está indisponível.")
+    disponiveis = {opcao['id']: (grupo, opcao) for grupo in grupos for opcao in grupo['opcoes']}
+    escolhidas = {}
+    por_grupo = defaultdict(int)
+    for valor in opcoes_ids:
+        opcao_id = next(iter(_ids_validos([valor])), None)
+        if opcao_id not in disponiveis:
+            raise ValueError(f"A opção '{valor}' não pertence ao produto '{produto['nome']}'.")
+        if opcao_id not in escolhidas:
+            grupo, escolhidas[opcao_id] = disponiveis[opcao_id]
+            por_grupo[grupo['id']] += 1
+    for grupo in grupos:
+        if not grupo['multipla_escolha'] and por_grupo[grupo['id']] > 1:
+            raise ValueError(f"O grupo de opções '{grupo['nome']}' não permite múltiplas escolhas.")
+        if grupo['obrigatorio'] and not por_grupo[grupo['id']]:
+            raise ValueError(f"O grupo de opções '{grupo['nome']}' é obrigatório.")
+    return list(escolhidas.values())
+
+
+# -----------------------------
+# ESTADO DO CARRINHO
+# -----------------------------
+def _carregar_do_banco(ids):
+    """Monta o estado dos carrinhos a partir das tabelas (só em cache miss)."""
+    estados = {
+        str(linha['id']): {
+            'id': str(linha['id']),
+            'usuario': _nome_usuario(linha['usuario__username'], linha['usuario__email']),
+            'criado_em': _data_hora(linha['criado_em']),
+            'itens': [],
+            'sujo': False,
+        }
+        for linha in Carrinho.objects.filter(pk__in=ids).values(
+            'id', 'usuario__username', 'usuario__email', 'criado_em'
+        )
+    }
+    if not estados:
+        return {}
+
+    itens = {}
+    for linha in ItemCarrinho.objects.filter(carrinho_id__in=estados).values(
+        'id', 'carrinho_id', 'produto_id', 'quantidade', 'observacao'
+    ):
+        item = {
+            'id': str(linha['id']),
+            'produto_id': str(linha['produto_id']),
+            'quantidade': linha['quantidade'],
+            'observacao': _texto(linha['observacao']),
+            'opcoes': [],
+        }
+        itens[linha['id']] = item
+        estados[str(linha['carrinho_id'])]['itens'].append(item)
+
+    escolhas = ItemCarrinho.opcoes_escolhidas.through.objects.filter(itemcarrinho_id__in=itens)
+    for linha in escolhas.values('itemcarrinho_id', 'opcao_id', 'opcao__nome', 'opcao__preco_adicional'):
+        itens[linha['itemcarrinho_id']]['opcoes'].append({
+            'id': str(linha['opcao_id']),
+            'nome': linha['opcao__nome'],
+            'preco_adicional': _decimal(linha['opcao__preco_adicional']),
+        })
+
+    cache.set_many({_chave_carrinho(i): estado for i, estado in estados.items()}, _tempo_carrinho())
+    return estados
+
+
+def obter_carrinhos(ids):
+    """Estado dos carrinhos por id (os inexistentes ficam de fora)."""
+    chaves = {_chave_carrinho(carrinho_id): carrinho_id for carrinho_id in _ids_validos(ids)}
+    estados = {chaves[chave]: estado for chave, estado in cache.get_many(chaves).items()}
+    faltando = [carrinho_id for carrinho_id in chaves.values() if carrinho_id not in estados]
+    if faltando:
+        estados.update(_carregar_do_banco(faltando))
+    return estados
+
+
+def obter_carrinho(carrinho_id):
+    estados = obter_carrinhos([carrinho_id])
+    return next(iter(estados.values()), None)
+
+
+def _marcar_sujo(estado):
+    if estado['sujo']:
+        return
+    estado['sujo'] = True
+    _marcar_pendentes([estado['id']])
+
+
+@contextmanager
+def alterar_carrinho(carrinho_id):
+    """Entrega o estado do carrinho (ou ``None``) e, se não houver erro, grava de volta no cache."""
+    validos = _ids_validos([carrinho_id])
+    if not validos:
+        yield None
+        return
+    chave = _chave_carrinho(validos[0])
+    with _trava(chave):
+        estado = obter_carrinho(validos[0])
+        yield estado
+        if estado is not None:
+            _marcar_sujo(estado)
+            cache.set(chave, estado, _tempo_carrinho())
+
+
+def _mesma_escolha(item, observacao, opcoes):
+    return item['observacao'] == observacao and {o['id'] for o in item['opcoes']} == {o['id'] for o in opcoes}
+
+
+def adicionar_item(estado, produto_id, quantidade, observacao, opcoes=()):
+    """Soma ao item do mesmo produto, opções e observação ou cria um novo; devolve o item."""
+    produto_id = str(produto_id)
+    for item in estado['itens']:
+        if item['produto_id'] == produto_id and _mesma_escolha(item, observacao, opcoes):
+            item['quantidade'] += quantidade
+            return item
+    item = {
+        'id': str(uuid.uuid4()),
+        'produto_id': produto_id,
+        'quantidade': quantidade,
+        'observacao': observacao,
+        'opcoes': list(opcoes),
+    }
+    estado['itens'].append(item)
+    return item
+
+
+class OperacoesInvalidas(ValueError):
+    """Alguma operação do lote não pode ser aplicada; ``erros`` traz a mensagem por posição."""
+
+    def __init__(self, erros):
+        super().__init__(erros)
+        self.erros = erros
+
+
+def _item(itens, item_id):
+    for item in itens:
+        if item['id'] == str(item_id):
+            return item
+    raise ValueError('Item não encontrado no carrinho.')
+
+
+def _aplicar(rascunho, operacao, produtos, grupos):
+    if operacao['acao'] == 'adicionar':
+        produto = produtos.get(str(operacao['produto_id']))
+        if produto is None:
+            raise ValueError('Produto não encontrado.')
+        opcoes = escolher_opcoes(produto, grupos.get(produto['id'], []), operacao.get('opcoes', []))
+        adicionar_item(
+            rascunho, produto['id'], operacao.get('quantidade', 1), operacao.get('observacao', ''), opcoes
+        )
+        return
+
+    item = _item(rascunho['itens'], operacao['item_id'])
+    if operacao['acao'] == 'remover':
+        rascunho['itens'].remove(item)
+        return
+    if 'opcoes' in operacao:
+        produto = produtos.get(item['produto_id'])
+        if produto is None:
+            raise ValueError('Produto não encontrado.')
+        item['opcoes'] = escolher_opcoes(produto, grupos.get(produto['id'], []), operacao['opcoes'])
+    item['quantidade'] = operacao.get('quantidade', item['quantidade'])
+    item['observacao'] = operacao.get('observacao', item['observacao'])
+
+
+def aplicar_operacoes(estado, operacoes):
+    """
+    Aplica um lote de operações (``adicionar``, ``alterar``, ``remover``) ao carrinho. Produtos
+    e grupos de opções de todas elas são carregados de uma vez; se alguma falhar, levanta
+    ``OperacoesInvalidas`` e o estado fica como estava (nada é aplicado).
+    """
+    por_id = {item['id']: item['produto_id'] for item in estado['itens']}
+    produto_ids = {
+        str(operacao['produto_id']) if operacao['acao'] == 'adicionar' else por_id.get(str(operacao['item_id']))
+        for operacao in operacoes
+    } - {None}
+    produtos = produtos_em_cache(produto_ids)
+    grupos = grupos_em_cache(produto_ids)
+
+    rascunho = {'itens': copy.deepcopy(estado['itens'])}
+    erros = {}
+    for indice, operacao in enumerate(operacoes):
+        try:
+            _aplicar(rascunho, operacao, produtos, grupos)
+        except ValueError as e:
+            erros[indice] = str(e)
+    if erros:
+        raise OperacoesInvalidas(erros)
+    estado['itens'] = rascunho['itens']
+
+
+# -----------------------------
+# SERIALIZAÇÃO
+# -----------------------------
+def serializar_item(item, produtos, tabelas):
+    """
+    Equivalente a ``ItemCarrinhoSerializer(item).data``. O subtotal vem da tabela de preços atual
+    (``precos.tabelas``), a mesma do checkout; opções removidas depois da escolha não contam.
+    """
+    tabela = tabelas.get(item['produto_id'])
+    opcoes = [opcao['id'] for opcao in item['opcoes']]
+    return {
+        'id': item['id'],
+        'produto': produtos.get(item['produto_id']),
+        'quantidade': item['quantidade'],
+        'observacao': item['observacao'],
+        'opcoes_escolhidas': item['opcoes'],
+        'subtotal': tabela.subtotal(opcoes, item['quantidade'], ignorar_ausentes=True) if tabela else Decimal('0'),
+    }
+
+
+def serializar_carrinhos(estados, campos=None):
+    """Equivalente a ``CarrinhoSerializer(carrinhos, many=True).data``."""
+    if campos is not None and 'itens' not in campos:
+        return _filtrar([{'id': e['id'], 'usuario': e['usuario'], 'criado_em': e['criado_em']} for e in estados], campos)
+    produto_ids = {item['produto_id'] for estado in estados for item in estado['itens']}
+    produtos = produtos_em_cache(produto_ids)
+    tabelas = precos.tabelas(produto_ids)
+    return _filtrar([
+        {
+            'id': estado['id'],
+            'usuario': estado['usuario'],
+            'criado_em': estado['criado_em'],
+            'itens': [serializar_item(item, produtos, tabelas) for item in estado['itens']],
+        }
+        for estado in estados
+    ], campos)
+
+
+# -----------------------------
+# PERSISTÊNCIA
+# -----------------------------
+def _gravar(estado):
+    """Substitui os itens do carrinho no banco pelo conteúdo do cache; ``False`` se ele não existe mais."""
+    carrinho_id = estado['id']
+    with transaction.atomic():
+        if not Carrinho.objects.filter(pk=carrinho_id).exists():
+            cache.delete(_chave_carrinho(carrinho_id))
+            return False
+        # Produtos removidos depois de entrarem no carrinho são descartados
+        existentes = {str(pk) for pk in Produto.objects.filter(
+            pk__in=[item['produto_id'] for item in estado['itens']]
+        ).values_list('pk', flat=True)}
+        itens = [item for item in estado['itens'] if item['produto_id'] in existentes]
+        opcoes_existentes = {str(pk) for pk in Opcao.objects.filter(
+            pk__in=[opcao['id'] for item in itens for opcao in item['opcoes']]
+        ).values_list('pk', flat=True)}
+
+        ItemCarrinho.objects.filter(carrinho_id=carrinho_id).delete()
+        ItemCarrinho.objects.bulk_create([
+            ItemCarrinho(
+                id=item['id'], carrinho_id=carrinho_id, produto_id=item['produto_id'],
+                quantidade=item['quantidade'], observacao=item['observacao'],
+            )
+            for item in itens
+        ])
+        Escolha = ItemCarrinho.opcoes_escolhidas.through
+        Escolha.objects.bulk_create([
+            Escolha(itemcarrinho_id=item['id'], opcao_id=opcao['id'])
+            for item in itens for opcao in item['opcoes'] if opcao['id'] in opcoes_existentes
+        ])
+    estado['sujo'] = False
+    return True
+
+
+def persistir_carrinho(carrinho_id):
+    """Grava no banco o carrinho, se ele tiver alterações pendentes; devolve se gravou."""
+    chave = _chave_carrinho(carrinho_id)
+    with _trava(chave):
+        estado = cache.get(chave)
+        if estado is None or not estado['sujo']:
+            return False
+        if not _gravar(estado):
+            return False
+        cache.set(chave, estado, _tempo_carrinho())
+    return True
+
+
+def _marcar_pendentes(ids):
+    with _trava(_CHAVE_SUJOS):
+        pendentes = cache.get(_CHAVE_SUJOS, set())
+        pendentes.update(ids)
+        cache.set(_CHAVE_SUJOS, pendentes, None)
+
+
+def persistir_pendentes():
+    """Grava todos os carrinhos alterados desde a última execução; devolve quantos gravou."""
+    with _trava(_CHAVE_SUJOS):
+        sujos = list(cache.get(_CHAVE_SUJOS, set()))
+        cache.set(_CHAVE_SUJOS, set(), None)
+
+    gravados = 0
+    for indice, carrinho_id in enumerate(sujos):
+        try:
+            gravados += persistir_carrinho(carrinho_id)
+        except Exception:
+            # Os que não foram gravados voltam para a fila da próxima execução
+            _marcar_pendentes(sujos[indice:])
+            raise
+    return gravados
+
+
+@contextmanager
+def fechar_carrinho(carrinho_id):
+    """
+    Para o checkout: grava o conteúdo pendente, bloqueia mutações enquanto o pedido é
+    criado a partir das tabelas e, no final, descarta o estado em cache.
+    """
+    chave = _chave_carrinho(carrinho_id)
+    with _trava(chave):
+        estado = cache.get(chave)
+        if estado is not None and estado['sujo']:
+            _gravar(estado)
+        try:
+            yield
+        finally:
+            cache.delete(chave)
+
+
+def descartar_carrinho(carrinho_id):
+    cache.delete(_chave_carrinho(carrinho_id))
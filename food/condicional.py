@@ -0,0 +1,190 @@
+"""
+GET condicional (ETag / Last-Modified) sem serializar nada.
+
+A versão de uma resposta é o MAX(``atualizado_em``) das linhas que ela mostra e das relações
+que aparecem aninhadas nela, mais a contagem de cada uma (remoção não muda o MAX). Uma
+consulta de agregação decide entre ``304 Not Modified`` e montar a resposta. As respostas
+públicas do catálogo (sem login) saem com ``Cache-Control: public`` para a CDN; as demais
+com ``private, no-cache``, que obriga o cliente a revalidar.
+"""
+import hashlib
+from dataclasses import dataclass
+from datetime import datetime
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+from rest_framework import status
+from rest_framework.response import Response
+
+from .serializers import campos_incluidos
+
+
+@dataclass
+class Validadores:
+    etag: str
+    ultima_modificacao: datetime | None
+    linhas: int
+
+
+def _agregacoes(campos):
+    agregacoes = {'linhas': Count('pk', distinct=True)}
+    for indice, campo in enumerate(campos):
+        agregacoes[f'max_{indice}'] = Max(campo)
+        relacao = campo.rpartition('__')[0]
+        if relacao:
+            agregacoes[f'total_{indice}'] = Count(relacao, distinct=True)
+    return agregacoes
+
+
+def _montar(valores, variante):
+    datas = [valor for chave, valor in valores.items() if chave.startswith('max_') and valor is not None]
+    impressao = repr(sorted(valores.items())) + variante
+    return Validadores(
+        etag=f'W/"{hashlib.sha256(impressao.encode()).hexdigest()[:32]}"',
+        ultima_modificacao=max(datas) if datas else None,
+        linhas=valores['linhas'],
+    )
+
+
+def variante(request, usuario):
+    """O que, além dos dados, muda a representação: URL completa (host, filtros) e o usuário."""
+    return f"{request.build_absolute_uri()}|{usuario.pk if usuario.is_authenticated else '-'}"
+
+
+def _juntar(valores):
+    """Agregações de cada shard numa só: contagens somadas, datas pelo maior MAX."""
+    juntos = {}
+    for chave in valores[0]:
+        if chave.startswith('max_'):
+            datas = [parte[chave] for parte in valores if parte[chave] is not None]
+            juntos[chave] = max(datas) if datas else None
+        else:
+            juntos[chave] = sum(parte[chave] for parte in valores)
+    return juntos
+
+
+def calcular(queryset, campos, variante=''):
+    """``queryset`` também pode ser a lista de um queryset por shard (``shards.espalhar``)."""
+    if isinstance(queryset, list):
+        return _montar(_juntar([parte.aggregate(**_agregacoes(campos)) for parte in queryset]), variante)
+    return _montar(queryset.aggregate(**_agregacoes(campos)), variante)
+
+
+async def acalcular(queryset, campos, variante=''):
+    return _montar(await queryset.aaggregate(**_agregacoes(campos)), variante)
+
+
+def campos_mostrados(campos, serializer_class, request):
+    """Só as datas das relações que a resposta mostra (``?fields=``/``?expand=``)."""
+    incluidos = campos_incluidos(serializer_class, request)
+    return tuple(campo for campo in campos if '__' not in campo or campo.split('__')[0] in incluidos)
+
+
+def _sem_prefixo_fraco(etag):
+    return etag[2:] if etag.startswith('W/') else etag
+
+
+def so_relacoes_diretas(modelo, campos):
+    """Se nenhum campo passa por relação reversa (onde remover uma linha não avança a data)."""
+    for campo in campos:
+        atual = modelo
+        for nome in campo.split('__')[:-1]:
+            relacao = atual._meta.get_field(nome)
+            if relacao.one_to_many or relacao.many_to_many:
+                return False
+            atual = relacao.related_model
+    return True
+
+
+def nao_modificado(request, validadores, usar_data):
+    """
+    Se a cópia do cliente ainda vale. ``If-None-Match`` tem precedência; ``If-Modified-Since``
+    só é usado com ``usar_data``: no detalhe de um objeto sem relações reversas, já que
+    remoções não avançam a data.
+    """
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        etags = parse_etags(if_none_match)
+        return '*' in etags or _sem_prefixo_fraco(validadores.etag) in map(_sem_prefixo_fraco, etags)
+
+    if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    if not usar_data or if_modified_since is None or validadores.ultima_modificacao is None:
+        return False
+    return int(validadores.ultima_modificacao.timestamp()) <= if_modified_since
+
+
+def aplicar_cabecalhos(resposta, validadores, publico):
+    resposta['ETag'] = validadores.etag
+    if validadores.ultima_modificacao is not None:
+        resposta['Last-Modified'] = http_date(validadores.ultima_modificacao.timestamp())
+    if publico:
+        resposta['Cache-Control'] = f'public, max-age={settings.CATALOGO_CACHE_MAX_AGE}'
+    else:
+        resposta['Cache-Control'] = 'private, no-cache'
+    patch_vary_headers(resposta, ('Authorization',))
+    return resposta
+
+
+class RespostaCondicionalMixin:
+    """
+    ETag/Last-Modified e 304 em ``list``/``retrieve`` (e nas actions que a ViewSet incluir em
+    ``get_validadores``). Deve vir antes do ``LeituraEmReplicaMixin``, para a agregação
+    também ir para a réplica.
+    """
+
+    # MAX de cada campo versiona a resposta: o do modelo e os das relações aninhadas
+    campos_atualizacao = ('atualizado_em',)
+    # Catálogo: respostas a anônimos podem ficar na CDN
+    cache_publico = False
+
+    _validadores = None
+
+    def get_validadores(self):
+        """
+        ``(queryset, campos)`` das linhas mostradas pela action atual, ou ``None``; o queryset
+        pode ser uma lista, um por shard.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        campos = campos_mostrados(self.campos_atualizacao, self.get_serializer_class(), self.request)
+        if self.action == 'list':
+            return queryset, campos
+        if self.action == 'retrieve':
+            lookup = self.lookup_url_kwarg or self.lookup_field
+            return queryset.filter(**{self.lookup_field: self.kwargs[lookup]}), campos
+        return None
+
+    def _nao_modificado(self, request, *args, **kwargs):
+        return Response(status=status.HTTP_304_NOT_MODIFIED)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self._validadores = None
+        if request.method not in ('GET', 'HEAD'):
+            return
+        try:
+            alvo = self.get_validadores()
+            if alvo is None:
+                return
+            queryset, campos = alvo
+            validadores = calcular(queryset, campos, variante(request, request.user))
+        except (TypeError, ValueError, ValidationError):
+            # pk malformado: a própria view responde 404
+            return
+        detalhe = self.action == 'retrieve'
+        if detalhe and not validadores.linhas:
+            return
+
+        self._validadores = validadores
+        modelo = (queryset[0] if isinstance(queryset, list) else queryset).model
+        if nao_modificado(request, validadores, detalhe and so_relacoes_diretas(modelo, campos)):
+            # O dispatch do DRF busca o handler depois do initial
+            setattr(self, request.method.lower(), self._nao_modificado)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if self._validadores is not None and response.status_code in (200, 304):
+            publico = self.cache_publico and not request.user.is_authenticated
+            aplicar_cabecalhos(response, self._validadores, publico)
+        return super().finalize_response(request, response, *args, **kwargs)
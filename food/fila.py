@@ -0,0 +1,204 @@
+"""
+Fila de tarefas para efeitos colaterais que não precisam terminar antes da resposta.
+
+Funções decoradas com ``@tarefa`` ganham ``.enfileirar(...)``, que publica a chamada no
+broker quando a transação atual faz commit (``transaction.on_commit``): rollback não deixa
+tarefa órfã e o worker nunca vê dados que ainda não foram gravados. O broker vem de
+``TAREFAS_BROKER``; o padrão guarda as tarefas na tabela ``Tarefa`` e os workers
+(``manage.py run_workers``) as reservam com ``SELECT ... FOR UPDATE SKIP LOCKED``. Tarefas
+que falham voltam para a fila com backoff exponencial até ``max_tentativas``.
+
+A reserva vale ``PRAZO_RESERVA`` segundos e é renovada logo antes de cada tarefa do lote: as
+últimas de um lote lento não vencem na fila do worker. Se ela venceu mesmo assim (outro worker já
+a pegou), a tarefa é pulada. Reserva vencida é de um worker que parou no meio (crash, OOM): conta
+como tentativa, e na última a tarefa vai para ``falhou`` em vez de voltar para a fila.
+"""
+import logging
+import random
+import traceback
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Tarefa
+
+logger = logging.getLogger(__name__)
+
+FILA_PADRAO = 'padrao'
+BACKOFF_BASE = 2
+BACKOFF_MAXIMO = 60 * 60
+# Reserva de um worker que morreu sem concluir volta para a fila depois disto; renovada antes de
+# cada tarefa do lote, então só uma tarefa que sozinha passe disso é executada de novo
+PRAZO_RESERVA = 5 * 60
+ERRO_RESERVA_VENCIDA = 'Reserva vencida na última tentativa: o worker parou no meio da execução.'
+
+
+def tarefa(funcao=None, *, fila=FILA_PADRAO, max_tentativas=5):
+    """Registra a função como tarefa; os argumentos precisam ser serializáveis em JSON."""
+    def registrar(funcao):
+        funcao.nome_tarefa = f'{funcao.__module__}.{funcao.__qualname__}'
+        funcao.fila = fila
+        funcao.max_tentativas = max_tentativas
+        funcao.enfileirar = lambda *args, **kwargs: enfileirar(funcao, *args, **kwargs)
+        return funcao
+    return registrar(funcao) if funcao is not None else registrar
+
+
+def enfileirar(funcao, *args, **kwargs):
+    dados = {
+        'nome': funcao.nome_tarefa,
+        'fila': funcao.fila,
+        'argumentos': {'args': list(args), 'kwargs': kwargs},
+        'max_tentativas': funcao.max_tentativas,
+    }
+    transaction.on_commit(lambda: broker().publicar(**dados))
+
+
+_broker = {}
+
+
+def broker():
+    caminho = settings.TAREFAS_BROKER
+    if caminho not in _broker:
+        _broker[caminho] = import_string(caminho)()
+    return _broker[caminho]
+
+
+def executar(nome, argumentos):
+    funcao = import_string(nome)
+    if getattr(funcao, 'nome_tarefa', None) != nome:
+        raise ValueError(f'{nome} não é uma tarefa registrada.')
+    return funcao(*argumentos['args'], **argumentos['kwargs'])
+
+
+def backoff(tentativas):
+    """Espera antes da próxima tentativa: exponencial, com teto e um pouco de jitter."""
+    espera = min(BACKOFF_MAXIMO, BACKOFF_BASE ** tentativas)
+    return timedelta(seconds=espera * random.uniform(0.8, 1.2))
+
+
+# -----------------------------
+# BROKERS
+# -----------------------------
+@dataclass
+class Reserva:
+    id: object
+    nome: str
+    argumentos: dict
+    tentativas: int
+    max_tentativas: int
+    # Fim da reserva, gravado em disponivel_em; outro valor lá quer dizer que outro worker a pegou
+    prazo: object = None
+
+
+class BrokerBanco:
+    """Tarefas na tabela ``Tarefa`` do banco principal."""
+
+    def publicar(self, nome, fila, argumentos, max_tentativas):
+        Tarefa.objects.create(nome=nome, fila=fila, argumentos=argumentos, max_tentativas=max_tentativas)
+
+    def reservar(self, fila, limite):
+        agora = timezone.now()
+        prazo = agora + timedelta(seconds=PRAZO_RESERVA)
+        with transaction.atomic():
+            # Workers concorrentes pulam as linhas já travadas em vez de esperar por elas
+            ids = list(
+                Tarefa.objects.select_for_update(skip_locked=True)
+                .filter(Q(status='pendente') | Q(status='executando'), fila=fila, disponivel_em__lte=agora)
+                .order_by('disponivel_em')
+                .values_list('id', flat=True)[:limite]
+            )
+            # Reserva vencida na última tentativa: o worker não chegou ao falhar()
+            Tarefa.objects.filter(
+                id__in=ids, status='executando', tentativas__gte=F('max_tentativas')
+            ).update(status='falhou', erro=ERRO_RESERVA_VENCIDA)
+            Tarefa.objects.filter(id__in=ids).exclude(status='falhou').update(
+                status='executando',
+                tentativas=F('tentativas') + 1,
+                disponivel_em=prazo,
+            )
+        return [
+            Reserva(prazo=linha.pop('disponivel_em'), **linha)
+            for linha in Tarefa.objects.filter(id__in=ids, status='executando').order_by('id').values(
+                'id', 'nome', 'argumentos', 'tentativas', 'max_tentativas', 'disponivel_em'
+            )
+        ]
+
+    def renovar(self, reserva):
+        """Estende a reserva antes de executar; False se ela venceu e outro worker a pegou."""
+        prazo = timezone.now() + timedelta(seconds=PRAZO_RESERVA)
+        renovada = Tarefa.objects.filter(id=reserva.id, status='executando', disponivel_em=reserva.prazo).update(
+            disponivel_em=prazo
+        )
+        if renovada:
+            reserva.prazo = prazo
+        return bool(renovada)
+
+    def concluir(self, reserva):
+        Tarefa.objects.filter(id=reserva.id).delete()
+
+    def falhar(self, reserva, erro):
+        if reserva.tentativas >= reserva.max_tentativas:
+            Tarefa.objects.filter(id=reserva.id).update(status='falhou', erro=erro)
+        else:
+            Tarefa.objects.filter(id=reserva.id).update(
+                status='pendente', erro=erro, disponivel_em=timezone.now() + backoff(reserva.tentativas)
+            )
+
+
+class BrokerImediato:
+    """Executa a tarefa na hora, no próprio processo (desenvolvimento e testes)."""
+
+    def publicar(self, nome, fila, argumentos, max_tentativas):
+        executar(nome, argumentos)
+
+    def reservar(self, fila, limite):
+        return []
+
+    def renovar(self, reserva):
+        return True
+
+
+# -----------------------------
+# WORKERS
+# -----------------------------
+def processar(fila=FILA_PADRAO, limite=10):
+    """Reserva e executa um lote de tarefas; devolve quantas executou."""
+    atual = broker()
+    reservas = atual.reservar(fila, limite)
+    for reserva in reservas:
+        # As anteriores do lote podem ter levado mais que a reserva
+        if not atual.renovar(reserva):
+            logger.warning('Tarefa %s pulada: a reserva venceu e outro worker a pegou', reserva.nome)
+            continue
+        try:
+            executar(reserva.nome, reserva.argumentos)
+        except Exception:
+            logger.exception('Tarefa %s falhou (tentativa %s/%s)', reserva.nome, reserva.tentativas,
+                             reserva.max_tentativas)
+            atual.falhar(reserva, traceback.format_exc())
+        else:
+            atual.concluir(reserva)
+    return len(reservas)
+
+
+def trabalhar(parar, fila=FILA_PADRAO, limite=10, intervalo=1.0):
+    """Laço de um worker: processa lotes até ``parar`` (um Event) ser sinalizado."""
+    try:
+        while not parar.is_set():
+            try:
+                executadas = processar(fila, limite)
+            except DatabaseError:
+                # Banco fora do ar ou conexão derrubada: reconecta na próxima volta
+                logger.exception('Erro ao consultar a fila %s', fila)
+                connections.close_all()
+                executadas = 0
+            if not executadas:
+                parar.wait(intervalo)
+    finally:
+        connections.close_all()
@@ -0,0 +1,67 @@
+"""
+Filtros e ordenação das listagens (django-filter).
+
+Cada filtro exposto tem um índice correspondente em ``models.py``: as combinações daqui viram
+varredura de índice, nunca de tabela. Relações são filtradas pelo id (``UUIDFilter``), sem a
+consulta que o ``ModelChoiceFilter`` faria para validar a escolha; assim os mesmos FilterSets
+servem às views assíncronas. ``ordering`` só aceita os campos listados (400 para os demais).
+"""
+from django_filters import rest_framework as filters
+from django_filters.utils import translate_validation
+
+from .models import Restaurante, Produto, Pedido, Entrega
+
+
+class RestauranteFiltro(filters.FilterSet):
+    aberto = filters.BooleanFilter()
+    dono = filters.UUIDFilter(field_name='dono_id')
+    ordering = filters.OrderingFilter(fields=('nome', 'criado_em'))
+
+    class Meta:
+        model = Restaurante
+        fields = []
+
+
+class ProdutoFiltro(filters.FilterSet):
+    restaurante = filters.UUIDFilter(field_name='restaurante_id')
+    categoria = filters.UUIDFilter(field_name='categoria_id')
+    disponivel = filters.BooleanFilter()
+    preco_min = filters.NumberFilter(field_name='preco', lookup_expr='gte')
+    preco_max = filters.NumberFilter(field_name='preco', lookup_expr='lte')
+    ordering = filters.OrderingFilter(fields=('preco', 'nome', 'atualizado_em'))
+
+    class Meta:
+        model = Produto
+        fields = []
+
+
+class PedidoFiltro(filters.FilterSet):
+    restaurante = filters.UUIDFilter(field_name='restaurante_id')
+    status = filters.ChoiceFilter(choices=Pedido.STATUS_CHOICES)
+    data_inicio = filters.DateFilter(field_name='data_referencia', lookup_expr='gte')
+    data_fim = filters.DateFilter(field_name='data_referencia', lookup_expr='lte')
+    ordering = filters.OrderingFilter(fields=('criado_em', 'data_referencia', 'valor_total'))
+
+    class Meta:
+        model = Pedido
+        fields = []
+
+
+class EntregaFiltro(filters.FilterSet):
+    status = filters.ChoiceFilter(choices=Entrega.STATUS_CHOICES)
+    entregador = filters.UUIDFilter(field_name='entregador_id')
+    inicio_apos = filters.IsoDateTimeFilter(field_name='inicio', lookup_expr='gte')
+    inicio_antes = filters.IsoDateTimeFilter(field_name='inicio', lookup_expr='lte')
+    ordering = filters.OrderingFilter(fields=('inicio', 'fim'))
+
+    class Meta:
+        model = Entrega
+        fields = []
+
+
+def filtrar(filterset_class, request, queryset):
+    """Aplica o FilterSet fora de uma ViewSet (views assíncronas); 400 se algum filtro for inválido."""
+    filtro = filterset_class(request.GET, queryset=queryset, request=request)
+    if not filtro.is_valid():
+        raise translate_validation(filtro.errors)
+    return filtro.qs
@@ -0,0 +1,128 @@
+"""
+Suporte ao cabeçalho ``Idempotency-Key`` para POSTs que não podem executar duas vezes.
+
+A primeira resposta fica guardada no cache por ``IDEMPOTENCIA_TTL`` segundos, com chave
+por usuário + Idempotency-Key. Repetições que chegam enquanto a primeira ainda executa
+esperam o resultado dela; as que chegam depois recebem a resposta guardada, sem executar
+a view de novo.
+
+A marca de "em andamento" expira em ``ESPERA_MAXIMA`` segundos, mas uma thread do processo a
+renova enquanto a view executa: uma primeira execução lenta não libera a chave para uma
+repetição. Se o processo morrer no meio, a marca expira e a repetição executa.
+"""
+import functools
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+
+CABECALHO = 'HTTP_IDEMPOTENCY_KEY'
+TAMANHO_MAXIMO_CHAVE = 255
+# Quanto uma repetição espera pela execução em andamento antes de desistir com 409
+ESPERA_MAXIMA = 30
+# Intervalo entre as renovações da marca de andamento (bem menor que a validade dela)
+RENOVACAO_ANDAMENTO = ESPERA_MAXIMA / 3
+
+# Marcas das execuções em andamento neste processo, renovadas por _renovador
+_em_andamento = set()
+_trava = threading.Lock()
+_renovador = None
+
+
+def _chaves(usuario, chave):
+    base = f"idempotencia:{usuario.pk}:{hashlib.sha256(chave.encode()).hexdigest()}"
+    return base, f'{base}:andamento'
+
+
+def _renovar():
+    while True:
+        time.sleep(RENOVACAO_ANDAMENTO)
+        with _trava:
+            chaves = list(_em_andamento)
+        for chave in chaves:
+            # Se a execução terminou nesse meio tempo, a marca já não existe e o touch não a recria
+            cache.touch(chave, ESPERA_MAXIMA)
+
+
+def _manter_andamento(chave):
+    global _renovador
+    with _trava:
+        _em_andamento.add(chave)
+        # Depois de um fork (gunicorn --preload) a thread do processo pai não existe no filho
+        if _renovador is None or not _renovador.is_alive():
+            _renovador = threading.Thread(target=_renovar, name='idempotencia-renovacao', daemon=True)
+            _renovador.start()
+
+
+def _soltar_andamento(chave):
+    with _trava:
+        _em_andamento.discard(chave)
+    cache.delete(chave)
+
+
+def _impressao(request):
+    """Identifica o conteúdo da requisição, para recusar a mesma chave com outro corpo."""
+    return hashlib.sha256(b'\n'.join([request.method.encode(), request.path.encode(), request.body])).hexdigest()
+
+
+def _reproduzir(salva, impressao):
+    if salva['impressao'] != impressao:
+        return Response(
+            {'erro': 'Idempotency-Key já usada com outra requisição.'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
+    return Response(salva['dados'], status=salva['status'], headers={'Idempotent-Replayed': 'true'})
+
+
+def idempotente(metodo_view):
+    """Decorator para métodos de ViewSet (create ou @action) que aceitam ``Idempotency-Key``."""
+    @functools.wraps(metodo_view)
+    def view(self, request, *args, **kwargs):
+        chave = request.META.get(CABECALHO)
+        if not chave or not request.user.is_authenticated:
+            return metodo_view(self, request, *args, **kwargs)
+        if len(chave) > TAMANHO_MAXIMO_CHAVE:
+            return Response(
+                {'erro': f'Idempotency-Key deve ter no máximo {TAMANHO_MAXIMO_CHAVE} caracteres.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        chave_resposta, chave_andamento = _chaves(request.user, chave)
+        impressao = _impressao(request)
+        limite = time.monotonic() + ESPERA_MAXIMA
+        while True:
+            salva = cache.get(chave_resposta)
+            if salva is not None:
+                return _reproduzir(salva, impressao)
+            if cache.add(chave_andamento, impressao, ESPERA_MAXIMA):
+                break
+            if time.monotonic() > limite:
+                return Response(
+                    {'erro': 'Requisição com esta Idempotency-Key ainda em andamento.'},
+                    status=status.HTTP_409_CONFLICT
+                )
+            time.sleep(0.05)
+
+        _manter_andamento(chave_andamento)
+        try:
+            # A primeira execução pode ter terminado entre o get e o add
+            salva = cache.get(chave_resposta)
+            if salva is not None:
+                return _reproduzir(salva, impressao)
+
+            resposta = metodo_view(self, request, *args, **kwargs)
+            # Erros do servidor não são guardados: o cliente pode tentar de novo
+            if resposta.status_code < 500:
+                cache.set(chave_resposta, {
+                    'impressao': impressao,
+                    'status': resposta.status_code,
+                    'dados': resposta.data,
+                }, settings.IDEMPOTENCIA_TTL)
+            return resposta
+        finally:
+            _soltar_andamento(chave_andamento)
+    return view
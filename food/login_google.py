@@ -0,0 +1,70 @@
+"""
+Verificação do id_token do Google contra as chaves públicas em cache.
+
+As chaves ficam no cache do Django pelo ``max-age`` que o Google informa, compartilhadas
+entre workers e entre as views síncrona e assíncrona. Quando faltam menos de
+``RENOVAR_ANTES`` segundos para expirarem, a renovação vai para a fila de tarefas e o login
+segue com as chaves atuais: só o primeiro login depois de um cache vazio espera o download.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+GOOGLE_CERTS_URL = 'https://www.googleapis.com/oauth2/v1/certs'
+GOOGLE_ISSUERS = ('accounts.google.com', 'https://accounts.google.com')
+CHAVE_CERTS = 'google:certs'
+RENOVAR_ANTES = 10 * 60
+
+
+def max_age(cache_control):
+    for diretiva in cache_control.split(','):
+        nome, _, valor = diretiva.strip().partition('=')
+        if nome == 'max-age' and valor.isdigit():
+            return int(valor)
+    return 0
+
+
+def guardar_certificados(certs, validade):
+    if validade:
+        cache.set(CHAVE_CERTS, {'certs': certs, 'expira_em': time.time() + validade}, validade)
+
+
+def baixar_certificados():
+    """Baixa as chaves públicas do Google e guarda no cache; devolve as chaves."""
+    import requests
+
+    resposta = requests.get(GOOGLE_CERTS_URL, timeout=5)
+    resposta.raise_for_status()
+    certs = resposta.json()
+    guardar_certificados(certs, max_age(resposta.headers.get('Cache-Control', '')))
+    return certs
+
+
+def certificados_em_cache():
+    """As chaves em cache (ou ``None``); perto de expirarem, agenda a renovação."""
+    entrada = cache.get(CHAVE_CERTS)
+    if entrada is None:
+        return None
+    if entrada['expira_em'] - time.time() < RENOVAR_ANTES and cache.add(f'{CHAVE_CERTS}:renovando', 1, 60):
+        from .tarefas import atualizar_certificados_google
+        atualizar_certificados_google.enfileirar()
+    return entrada['certs']
+
+
+def decodificar(token, certs):
+    """Valida assinatura, audiência, validade e emissor; ValueError se o token for inválido."""
+    from google.auth import exceptions as google_exceptions, jwt as google_jwt
+
+    try:
+        info = google_jwt.decode(token, certs=certs, audience=settings.GOOGLE_CLIENT_ID)
+    except google_exceptions.GoogleAuthError as exc:
+        raise ValueError(str(exc)) from exc
+    if info.get('iss') not in GOOGLE_ISSUERS:
+        raise ValueError('Emissor do token inválido.')
+    return info
+
+
+def verificar_token(token):
+    """Equivalente a ``id_token.verify_oauth2_token`` com as chaves em cache."""
+    return decodificar(token, certificados_em_cache() or baixar_certificados())
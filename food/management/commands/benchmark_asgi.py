@@ -0,0 +1,211 @@
+import asyncio
+import json
+import threading
+import time
+import uuid
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from food import login_google
+from food.models import Usuario, Restaurante, Produto, Pedido, Entrega, RastreamentoEntrega
+from .teste_carga import percentil
+
+ROTAS = ('catalogo', 'cardapio', 'entrega', 'google')
+NIVEIS_PADRAO = '1,4,16,64'
+CLIENT_ID = 'benchmark-asgi'
+
+
+class _ServidorCertificados:
+    """Imita o endpoint de certificados do Google, com latência e max-age configuráveis"""
+
+    def __init__(self, certs, latencia, max_age):
+        corpo = json.dumps(certs).encode()
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                time.sleep(latencia)
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(corpo)))
+                if max_age:
+                    self.send_header('Cache-Control', f'public, max-age={max_age}')
+                self.end_headers()
+                self.wfile.write(corpo)
+
+            def log_message(self, *args):
+                pass
+
+        self.servidor = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.servidor.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.servidor.server_port}/certs'
+
+    def __enter__(self):
+        threading.Thread(target=self.servidor.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.servidor.shutdown()
+        self.servidor.server_close()
+
+
+def _token_google():
+    """Gera um par de chaves e um id_token assinado no formato do Google."""
+    import rsa
+    from google.auth import crypt, jwt as google_jwt
+
+    publica, privada = rsa.newkeys(2048)
+    signer = crypt.RSASigner.from_string(privada.save_pkcs1().decode(), key_id='benchmark')
+    agora = int(time.time())
+    token = google_jwt.encode(signer, {
+        'iss': 'https://accounts.google.com', 'aud': CLIENT_ID, 'iat': agora, 'exp': agora + 3600,
+        'email': f'bench-{uuid.uuid4().hex[:8]}@gmail.com', 'name': 'Benchmark',
+    })
+    return token.decode(), {'benchmark': publica.save_pkcs1().decode()}
+
+
+async def _chamar(app, metodo, caminho, corpo=b'', headers=()):
+    """Executa uma requisição direto na aplicação ASGI e devolve o status."""
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': metodo,
+        'scheme': 'http', 'path': caminho, 'raw_path': caminho.encode(), 'query_string': b'',
+        'root_path': '', 'client': ('127.0.0.1', 50000), 'server': ('testserver', 80),
+        'headers': [
+            (b'host', b'testserver'), (b'content-type', b'application/json'),
+            (b'content-length', str(len(corpo)).encode()), *headers,
+        ],
+    }
+    entregue = False
+
+    async def receive():
+        nonlocal entregue
+        if not entregue:
+            entregue = True
+            return {'type': 'http.request', 'body': corpo, 'more_body': False}
+        await asyncio.Event().wait()
+
+    status = None
+
+    async def send(mensagem):
+        nonlocal status
+        if mensagem['type'] == 'http.response.start':
+            status = mensagem['status']
+
+    await app(scope, receive, send)
+    return status
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara, sob ASGI, as views síncronas com as assíncronas de leitura: p99 e vazão por nível de "
+        "concorrência e o máximo de requisições simultâneas por worker que mantém o p99 no alvo."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rotas', default=','.join(ROTAS), help=f"Subconjunto de {', '.join(ROTAS)}")
+        parser.add_argument('--niveis', default=NIVEIS_PADRAO, help='Níveis de concorrência (separados por vírgula)')
+        parser.add_argument('--requisicoes', type=int, default=200, help='Requisições por nível')
+        parser.add_argument('--latencia-google-ms', type=float, default=50.0,
+                            help='Latência simulada do endpoint de certificados do Google')
+        parser.add_argument('--max-age-google', type=int, default=0,
+                            help='max-age devolvido pelo Google simulado (0 = sem cache, compara só o I/O)')
+        parser.add_argument('--p99-alvo-ms', type=float,
+                            help='p99 alvo; padrão: 2x o p99 síncrono com concorrência 1')
+
+    def handle(self, *args, **opts):
+        rotas = [r.strip() for r in opts['rotas'].split(',') if r.strip()]
+        if set(rotas) - set(ROTAS):
+            raise CommandError(f"Rotas inválidas: {', '.join(sorted(set(rotas) - set(ROTAS)))}")
+        niveis = [int(n) for n in opts['niveis'].split(',')]
+
+        prefixo = f'bench-asgi-{uuid.uuid4().hex[:8]}'
+        token_google, certs = _token_google()
+        try:
+            caminhos = self._preparar(prefixo)
+            with _ServidorCertificados(certs, opts['latencia_google_ms'] / 1000,
+                                       opts['max_age_google']) as servidor, \
+                    mock.patch.object(login_google, 'GOOGLE_CERTS_URL', servidor.url), \
+                    override_settings(GOOGLE_CLIENT_ID=CLIENT_ID, THROTTLE_BALDES={},
+                                      ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                app = get_asgi_application()
+                cache.delete(login_google.CHAVE_CERTS)
+                for rota in rotas:
+                    metodo, caminho, corpo = caminhos[rota]
+                    if rota == 'google':
+                        corpo = json.dumps({'id_token': token_google}).encode()
+                    self._comparar(app, rota, metodo, caminho, corpo, caminhos['headers'], niveis, opts)
+        finally:
+            Usuario.objects.filter(username__startswith=prefixo).delete()
+            Usuario.objects.filter(email__startswith='bench-', email__endswith='@gmail.com').delete()
+
+    def _preparar(self, prefixo):
+        dono = Usuario.objects.create(username=f'{prefixo}-dono', perfil='restaurante')
+        cliente = Usuario.objects.create(username=f'{prefixo}-cliente', perfil='cliente')
+        entregador = Usuario.objects.create(username=f'{prefixo}-entregador', perfil='entregador')
+        restaurante = Restaurante.objects.create(dono=dono, nome=prefixo, cnpj=prefixo[-14:], endereco='Rua 1')
+        Produto.objects.bulk_create([
+            Produto(restaurante=restaurante, nome=f'Produto {i}', preco=Decimal('19.90')) for i in range(30)
+        ])
+        pedido = Pedido.objects.create(usuario=cliente, restaurante=restaurante)
+        entrega = Entrega.objects.create(pedido=pedido, entregador=entregador, status='em_rota')
+        RastreamentoEntrega.objects.bulk_create([
+            RastreamentoEntrega(entrega=entrega, latitude=Decimal('-23.55'), longitude=Decimal('-46.63'))
+            for _ in range(30)
+        ])
+        return {
+            'headers': [(b'authorization', f'Bearer {AccessToken.for_user(cliente)}'.encode())],
+            'catalogo': ('GET', '/api/restaurantes/', b''),
+            'cardapio': ('GET', f'/api/restaurantes/{restaurante.pk}/produtos/', b''),
+            'entrega': ('GET', f'/api/entregas/{entrega.pk}/', b''),
+            'google': ('POST', '/api/auth/google/', b''),
+        }
+
+    def _medir(self, app, metodo, caminho, corpo, headers, concorrencia, total):
+        async def rodada():
+            semaforo = asyncio.Semaphore(concorrencia)
+            latencias, erros = [], 0
+
+            async def uma():
+                nonlocal erros
+                async with semaforo:
+                    inicio = time.perf_counter()
+                    status = await _chamar(app, metodo, caminho, corpo, headers)
+                    latencias.append(time.perf_counter() - inicio)
+                    erros += status != 200
+
+            await _chamar(app, metodo, caminho, corpo, headers)  # aquecimento
+            inicio = time.perf_counter()
+            await asyncio.gather(*(uma() for _ in range(total)))
+            return sorted(latencias), time.perf_counter() - inicio, erros
+
+        latencias, duracao, erros = asyncio.run(rodada())
+        return percentil(latencias, 99) * 1000, total / duracao, erros
+
+    def _comparar(self, app, rota, metodo, caminho, corpo, headers, niveis, opts):
+        resultados = {}
+        for modo, urlconf in (('síncrono', None), ('assíncrono', settings.ASYNC_ROOT_URLCONF)):
+            with override_settings(ASYNC_ROOT_URLCONF=urlconf):
+                for nivel in niveis:
+                    resultados[modo, nivel] = self._medir(
+                        app, metodo, caminho, corpo, headers, nivel, opts['requisicoes']
+                    )
+
+        alvo = opts['p99_alvo_ms'] or 2 * resultados['síncrono', niveis[0]][0]
+        self.stdout.write(f"\n{rota} ({metodo} {caminho.split('/')[2]}) — p99 alvo {alvo:.1f} ms")
+        self.stdout.write(f"{'concorrência':>12} | {'síncrono p99 ms':>15} {'req/s':>8} | {'assíncrono p99 ms':>17} {'req/s':>8}")
+        for nivel in niveis:
+            p99_s, rps_s, erros_s = resultados['síncrono', nivel]
+            p99_a, rps_a, erros_a = resultados['assíncrono', nivel]
+            aviso = f'  ({erros_s}/{erros_a} erros)' if erros_s or erros_a else ''
+            self.stdout.write(f"{nivel:>12} | {p99_s:>15.1f} {rps_s:>8.0f} | {p99_a:>17.1f} {rps_a:>8.0f}{aviso}")
+
+        for modo in ('síncrono', 'assíncrono'):
+            dentro = [nivel for nivel in niveis if resultados[modo, nivel][0] <= alvo]
+            self.stdout.write(f"  {modo}: até {max(dentro) if dentro else 0} requisições simultâneas no p99 alvo")
@@ -0,0 +1,82 @@
+import random
+import time
+import tracemalloc
+import uuid
+
+from django.core.management.base import BaseCommand
+
+from food.autocompletar import IndicePrefixos, LIMITE_PADRAO, normalizar
+from food.models import Produto
+from .teste_carga import percentil
+
+PALAVRAS = (
+    'pizza', 'calabresa', 'mussarela', 'burguer', 'duplo', 'açaí', 'tigela', 'pão', 'queijo', 'frango',
+    'grelhado', 'suco', 'laranja', 'refrigerante', 'batata', 'frita', 'salada', 'combo', 'família',
+    'especial', 'da', 'casa', 'do', 'chef', 'temaki', 'salmão', 'yakisoba', 'pastel', 'carne', 'coxinha',
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Mede o índice de prefixos do autocompletar com nomes sintéticos: montagem, memória, latência "
+        "de cada tecla (p50/p99) e inserções. Compara com um ILIKE por tecla no banco atual."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--nomes', type=int, default=200_000)
+        parser.add_argument('--buscas', type=int, default=50_000, help='Teclas simuladas no índice')
+        parser.add_argument('--consultas', type=int, default=500, help='Teclas simuladas no banco (ILIKE)')
+        parser.add_argument('--semente', type=int, default=42)
+
+    def handle(self, *args, **opts):
+        aleatorio = random.Random(opts['semente'])
+        nomes = [
+            ' '.join(aleatorio.choices(PALAVRAS, k=aleatorio.randint(1, 5))).title() for _ in range(opts['nomes'])
+        ]
+        indice = IndicePrefixos(maximo=len(nomes) * 5)
+
+        tracemalloc.start()
+        inicio = time.perf_counter()
+        indice.carregar((str(uuid.UUID(int=i)), nome, None) for i, nome in enumerate(nomes))
+        montagem = time.perf_counter() - inicio
+        memoria = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        self.stdout.write(
+            f"{len(nomes)} nomes, {len(indice.chaves)} chaves: montagem {montagem:.2f} s, "
+            f"{memoria / 1024 / 1024:.1f} MiB ({memoria / len(indice.chaves):.0f} bytes por chave)"
+        )
+
+        # Cada nome digitado tecla a tecla, do começo de uma das palavras
+        teclas = []
+        while len(teclas) < opts['buscas']:
+            palavras = normalizar(aleatorio.choice(nomes)).split()
+            digitado = ' '.join(palavras[aleatorio.randrange(len(palavras)):])
+            teclas.extend(digitado[:n] for n in range(1, min(len(digitado), 12) + 1))
+        teclas = teclas[:opts['buscas']]
+
+        self.stdout.write(f"{'modo':<22} {'p50 µs':>10} {'p99 µs':>10} {'buscas/s':>12}")
+        latencias = []
+        for tecla in teclas:
+            inicio = time.perf_counter()
+            indice.buscar(tecla, LIMITE_PADRAO)
+            latencias.append(time.perf_counter() - inicio)
+        self._linha('índice em memória', latencias)
+
+        latencias = []
+        for tecla in teclas[:opts['consultas']]:
+            inicio = time.perf_counter()
+            list(Produto.objects.filter(nome__icontains=tecla).values_list('pk', 'nome')[:LIMITE_PADRAO])
+            latencias.append(time.perf_counter() - inicio)
+        self._linha(f'ILIKE ({Produto.objects.count()} produtos)', latencias)
+
+        inicio = time.perf_counter()
+        for i in range(1000):
+            indice.colocar(str(uuid.UUID(int=len(nomes) + i)), aleatorio.choice(nomes))
+        self.stdout.write(f"Inserção pelo sinal: {(time.perf_counter() - inicio) * 1000:.1f} µs por nome")
+
+    def _linha(self, nome, latencias):
+        latencias.sort()
+        self.stdout.write(
+            f"{nome:<22} {percentil(latencias, 50) * 1e6:>10.1f} {percentil(latencias, 99) * 1e6:>10.1f} "
+            f"{len(latencias) / sum(latencias):>12.0f}"
+        )
@@ -0,0 +1,88 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, RequestFactory
+from django.test.utils import override_settings
+
+from food import metricas
+
+MIDDLEWARE_METRICAS = 'food.metricas.MetricasMiddleware'
+
+
+class Command(BaseCommand):
+    help = "Mede o custo por requisição do MetricasMiddleware e do wrapper de SQL"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='/api/restaurantes/')
+        parser.add_argument('--requisicoes', type=int, default=1000)
+        parser.add_argument('--rodadas', type=int, default=5)
+        parser.add_argument('--limite', type=float, default=2.0, help='Overhead máximo aceito (%%)')
+
+    @override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'])
+    def handle(self, *args, **opts):
+        if MIDDLEWARE_METRICAS not in settings.MIDDLEWARE:
+            raise CommandError(f"{MIDDLEWARE_METRICAS} não está em MIDDLEWARE.")
+        sem_metricas = [m for m in settings.MIDDLEWARE if m != MIDDLEWARE_METRICAS]
+        n = opts['requisicoes']
+
+        def medir(middleware):
+            with override_settings(MIDDLEWARE=middleware):
+                client = Client()
+                client.get(opts['url'])  # aquece conexões e caches
+                inicio = time.perf_counter()
+                for _ in range(n):
+                    resposta = client.get(opts['url'])
+                return (time.perf_counter() - inicio) / n, resposta
+
+        # Ponta a ponta: rodadas intercaladas, fica o melhor tempo de cada lado.
+        # Serve de referência; a variação entre rodadas costuma passar de 2%.
+        base, com = [], []
+        for _ in range(opts['rodadas']):
+            tempo, resposta = medir(sem_metricas)
+            base.append(tempo)
+            com.append(medir(settings.MIDDLEWARE)[0])
+        base, com = min(base), min(com)
+
+        # Custo isolado: middleware com uma view que só devolve a resposta pronta,
+        # mais o wrapper de SQL multiplicado pelas consultas da requisição.
+        contador = metricas._ContadorSQL()
+        token = metricas._contador_atual.set(contador)
+        try:
+            with override_settings(MIDDLEWARE=sem_metricas):
+                Client().get(opts['url'])
+        finally:
+            metricas._contador_atual.reset(token)
+        consultas = contador.consultas
+
+        middleware = metricas.MetricasMiddleware(lambda request: resposta)
+        request = RequestFactory().get(opts['url'])
+        inicio = time.perf_counter()
+        for _ in range(n * 10):
+            middleware(request)
+        custo_middleware = (time.perf_counter() - inicio) / (n * 10)
+
+        def execute(sql, params, many, context):
+            return None
+
+        token = metricas._contador_atual.set(metricas._ContadorSQL())
+        try:
+            inicio = time.perf_counter()
+            for _ in range(n * 10):
+                metricas._contar_sql(execute, '', (), False, None)
+            custo_sql = (time.perf_counter() - inicio) / (n * 10)
+        finally:
+            metricas._contador_atual.reset(token)
+        metricas.limpar()
+
+        overhead = (custo_middleware + custo_sql * consultas) / base * 100
+        self.stdout.write(
+            f"ponta a ponta: sem métricas {base * 1e6:.1f} µs/req | com métricas {com * 1e6:.1f} µs/req"
+            f" ({(com - base) / base * 100:+.2f}%)"
+        )
+        self.stdout.write(
+            f"isolado: middleware {custo_middleware * 1e6:.2f} µs + {consultas} consultas x"
+            f" {custo_sql * 1e6:.2f} µs | overhead {overhead:.2f}%"
+        )
+        if overhead > opts['limite']:
+            raise CommandError(f"Overhead acima de {opts['limite']}%.")
@@ -0,0 +1,111 @@
+import random
+import time
+import uuid
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from food import precos
+from food.models import Usuario, Restaurante, Produto, GrupoOpcao, Opcao
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara a vazão do preço de itens com opções: consultando as opções a cada item (como antes), "
+        "com a tabela de preços lida do cache e com a tabela já em memória. Confere que os três batem."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--produtos', type=int, default=100)
+        parser.add_argument('--grupos', type=int, default=4, help='Grupos de opções por produto')
+        parser.add_argument('--opcoes', type=int, default=6, help='Opções por grupo')
+        parser.add_argument('--selecoes', type=int, default=2000, help='Itens precificados em cada modo')
+        parser.add_argument('--itens-por-carrinho', type=int, default=5)
+        parser.add_argument('--semente', type=int, default=42)
+
+    def handle(self, *args, **opts):
+        try:
+            with transaction.atomic():
+                selecoes = self._popular(opts)
+                self._comparar(selecoes, opts)
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _popular(self, opts):
+        aleatorio = random.Random(opts['semente'])
+        sufixo = uuid.uuid4().hex[:8]
+        dono = Usuario.objects.create(username=f'bench-{sufixo}', email=f'bench-{sufixo}@email.com')
+        restaurante = Restaurante.objects.create(dono=dono, nome='Benchmark', cnpj=sufixo, endereco='Rua Benchmark')
+        produtos = Produto.objects.bulk_create([
+            Produto(restaurante=restaurante, nome=f'Produto {i}', preco=Decimal(aleatorio.randint(500, 5000)) / 100)
+            for i in range(opts['produtos'])
+        ])
+        grupos = GrupoOpcao.objects.bulk_create([
+            GrupoOpcao(produto=produto, nome=f'Grupo {g}', multipla_escolha=True)
+            for produto in produtos for g in range(opts['grupos'])
+        ])
+        opcoes = Opcao.objects.bulk_create([
+            Opcao(grupo=grupo, nome=f'Opção {o}', preco_adicional=Decimal(aleatorio.randint(0, 990)) / 100)
+            for grupo in grupos for o in range(opts['opcoes'])
+        ])
+        # bulk_create não dispara os sinais: as tabelas destes produtos ainda não existem no cache
+        por_produto = {}
+        for opcao in opcoes:
+            por_produto.setdefault(opcao.grupo.produto_id, []).append(opcao.pk)
+        selecoes = []
+        for _ in range(opts['selecoes']):
+            produto = aleatorio.choice(produtos)
+            escolhidas = aleatorio.sample(por_produto[produto.pk], aleatorio.randint(0, opts['grupos']))
+            selecoes.append((produto.pk, escolhidas, aleatorio.randint(1, 3)))
+        return selecoes
+
+    def _comparar(self, selecoes, opts):
+        carrinhos = [
+            selecoes[i:i + opts['itens_por_carrinho']] for i in range(0, len(selecoes), opts['itens_por_carrinho'])
+        ]
+
+        def por_consulta():
+            # O ItemCarrinho.subtotal antigo: o produto e as opções lidos a cada item
+            totais = []
+            for produto_id, opcoes, quantidade in selecoes:
+                preco = Produto.objects.values_list('preco', flat=True).get(pk=produto_id)
+                adicionais = sum(Opcao.objects.filter(pk__in=opcoes).values_list('preco_adicional', flat=True))
+                totais.append((preco + adicionais) * quantidade)
+            return totais
+
+        def por_cache():
+            # Um get_many por carrinho, como serializar_carrinhos e o checkout
+            totais = []
+            for carrinho in carrinhos:
+                tabelas = precos.tabelas({produto_id for produto_id, _, _ in carrinho})
+                totais.extend(tabelas[str(p)].subtotal(opcoes, quantidade) for p, opcoes, quantidade in carrinho)
+            return totais
+
+        produto_ids = {produto_id for produto_id, _, _ in selecoes}
+        precos.invalidar(produto_ids)
+        inicio = time.perf_counter()
+        em_memoria = precos.tabelas(produto_ids)  # compila e guarda no cache
+        self.stdout.write(f"Compilação de {len(produto_ids)} tabelas: {(time.perf_counter() - inicio) * 1000:.1f} ms")
+
+        def por_tabela():
+            return [em_memoria[str(p)].subtotal(opcoes, quantidade) for p, opcoes, quantidade in selecoes]
+
+        resultados = {}
+        self.stdout.write(f"{'modo':<22} {'itens/s':>12} {'µs/item':>9}")
+        for nome, funcao in (('consulta por item', por_consulta), ('tabela no cache', por_cache),
+                             ('tabela em memória', por_tabela)):
+            inicio = time.perf_counter()
+            resultados[nome] = funcao()
+            duracao = time.perf_counter() - inicio
+            self.stdout.write(f"{nome:<22} {len(selecoes) / duracao:>12.0f} {duracao / len(selecoes) * 1e6:>9.1f}")
+
+        precos.invalidar(produto_ids)  # os produtos somem no rollback
+        if len({tuple(totais) for totais in resultados.values()}) != 1:
+            raise CommandError('Os modos calcularam preços diferentes.')
+        self.stdout.write(f"Os três modos concordam nos {len(selecoes)} itens (Decimal exato).")
@@ -0,0 +1,124 @@
+import itertools
+import time
+import uuid
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from food import recomendacoes
+
+
+def _pares(matriz):
+    """``{(produto, produto): contagem}`` e ``{produto: popularidade}`` com ids, para comparar matrizes."""
+    ids = matriz['produtos'].tolist()
+    pares = {
+        tuple(sorted((ids[a], ids[b]))): n
+        for a, b, n in zip(matriz['linhas'].tolist(), matriz['colunas'].tolist(), matriz['contagens'].tolist())
+    }
+    return pares, dict(zip(ids, matriz['popularidade'].tolist())), matriz['pedidos']
+
+
+class Command(BaseCommand):
+    help = (
+        "Mede o cálculo das recomendações sobre itens de pedido sintéticos (sem banco): a janela inteira "
+        "vetorizada, a atualização incremental de um dia, as listas top-K e o tamanho das matrizes "
+        "compactadas. Confere a incremental contra o cálculo do zero e o vetorizado contra um laço Python."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--itens', type=int, default=3_000_000, help='Itens de pedido na janela')
+        parser.add_argument('--restaurantes', type=int, default=1000)
+        parser.add_argument('--produtos', type=int, default=60, help='Produtos por restaurante')
+        parser.add_argument('--dias', type=int, default=recomendacoes.JANELA_RECOMENDACOES)
+        parser.add_argument('--laco', type=int, default=200_000, help='Itens do comparativo com o laço Python')
+        parser.add_argument('--semente', type=int, default=42)
+
+    def handle(self, *args, **opts):
+        import numpy as np
+
+        aleatorio = np.random.default_rng(opts['semente'])
+        restaurantes, por_restaurante = opts['restaurantes'], opts['produtos']
+        # Pedidos de 1 a 6 itens, cardápio com poucos produtos muito pedidos
+        tamanhos = aleatorio.integers(1, 7, size=max(1, opts['itens'] * 2 // 7))
+        pedidos = np.repeat(np.arange(len(tamanhos)), tamanhos)
+        restaurante = aleatorio.integers(0, restaurantes, size=len(tamanhos))[pedidos]
+        local = (por_restaurante * aleatorio.random(len(pedidos)) ** 2).astype(np.int64)
+        produtos = restaurante * por_restaurante + local
+        produto_ids = np.array([str(uuid.UUID(int=i + 1)) for i in range(restaurantes * por_restaurante)], dtype=str)
+        restaurante_do_produto = np.arange(restaurantes * por_restaurante) // por_restaurante
+        restaurante_ids = [str(uuid.UUID(int=(i + 1) << 64)) for i in range(restaurantes)]
+
+        def calcular(fatia):
+            return recomendacoes.matrizes(
+                pedidos[fatia], produtos[fatia], produto_ids, restaurante_do_produto, restaurante_ids,
+            )
+
+        self.stdout.write(f"{len(pedidos)} itens em {len(tamanhos)} pedidos, {restaurantes} restaurantes")
+        self.stdout.write(f"{'etapa':<34} {'ms':>10} {'itens/s':>12}")
+
+        def medir(nome, funcao, itens=None):
+            inicio = time.perf_counter()
+            resultado = funcao()
+            duracao = time.perf_counter() - inicio
+            vazao = f"{itens / duracao:>12.0f}" if itens else ''
+            self.stdout.write(f"{nome:<34} {duracao * 1000:>10.1f} {vazao}")
+            return resultado
+
+        # Janela de --dias dias: um dia entra (o fim dos pedidos) e um sai (o começo)
+        por_dia = len(tamanhos) // opts['dias']
+        sai, entra = np.searchsorted(pedidos, [por_dia, len(tamanhos) - por_dia]).tolist()
+        anterior, atual = slice(0, entra), slice(sai, None)
+        novo, expirado = slice(entra, None), slice(0, sai)
+        base = medir('janela inteira', lambda: calcular(anterior), entra)
+
+        def incremental():
+            matrizes = dict(base)
+            for r, matriz in calcular(novo).items():
+                matrizes[r] = recomendacoes.somar(matrizes[r], matriz) if r in matrizes else matriz
+            for r, matriz in calcular(expirado).items():
+                matrizes[r] = recomendacoes.somar(matrizes[r], matriz, -1)
+            return matrizes
+
+        somadas = medir('incremental (um dia entra e sai)', incremental, len(pedidos) - entra + sai)
+        somadas = {r: matriz for r, matriz in somadas.items() if matriz['pedidos']}
+        do_zero = calcular(atual)
+        if set(somadas) != set(do_zero) or any(_pares(somadas[r]) != _pares(do_zero[r]) for r in do_zero):
+            raise CommandError('A atualização incremental difere do cálculo do zero.')
+
+        medir('top-K de todos os produtos', lambda: [
+            recomendacoes.vizinhos(matriz, np.ones(len(matriz['produtos']), dtype=bool))
+            for matriz in somadas.values()
+        ])
+        compactadas = medir('compactar', lambda: [recomendacoes.compactar(m, None) for m in somadas.values()])
+        medir('expandir', lambda: [recomendacoes.expandir(guardada) for guardada in compactadas])
+        total = sum(recomendacoes.tamanho(guardada) for guardada in compactadas)
+        self.stdout.write(
+            f"Matrizes compactadas: {total / 1024 / 1024:.1f} MiB, {total / max(1, len(compactadas)) / 1024:.1f} KiB "
+            f"por restaurante; a incremental confere com o cálculo do zero."
+        )
+        self._comparar_laco(pedidos, produtos, produto_ids, calcular, opts['laco'], medir)
+
+    def _comparar_laco(self, pedidos, produtos, produto_ids, calcular, itens, medir):
+        itens = min(itens, len(pedidos))
+
+        def laco():
+            # Contagem "ingênua": um Counter de pares por pedido
+            pares, popularidade = Counter(), Counter()
+            for _, grupo in itertools.groupby(zip(pedidos[:itens].tolist(), produtos[:itens].tolist()), lambda x: x[0]):
+                distintos = sorted({produto for _, produto in grupo})
+                popularidade.update(distintos)
+                if len(distintos) <= recomendacoes.MAXIMO_ITENS_PARES:
+                    pares.update(itertools.combinations(distintos, 2))
+            return pares, popularidade
+
+        pares, popularidade = medir('laço Python (comparativo)', laco, itens)
+        vetorizado = medir('vetorizado (mesmos itens)', lambda: calcular(slice(0, itens)), itens)
+        esperado_pares = {tuple(sorted((produto_ids[a], produto_ids[b]))): n for (a, b), n in pares.items()}
+        esperado_popularidade = {produto_ids[p]: n for p, n in popularidade.items()}
+        obtido_pares, obtido_popularidade = {}, {}
+        for matriz in vetorizado.values():
+            matriz_pares, matriz_popularidade, _ = _pares(matriz)
+            obtido_pares.update(matriz_pares)
+            obtido_popularidade.update(matriz_popularidade)
+        if (obtido_pares, obtido_popularidade) != (esperado_pares, esperado_popularidade):
+            raise CommandError('O cálculo vetorizado difere do laço Python.')
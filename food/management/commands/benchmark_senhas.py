@@ -0,0 +1,94 @@
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test.utils import override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from food.models import Usuario, Restaurante
+from .teste_carga import percentil
+
+SENHA = 'benchmark-senhas'
+
+
+class Command(BaseCommand):
+    help = (
+        "Mede o p99 do catálogo (GET /api/restaurantes/) sozinho e durante uma rajada de logins, com o "
+        "hash de senha na thread da requisição (SENHA_WORKERS=0) e no pool limitado."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--leitores', type=int, default=4, help='Threads lendo o catálogo')
+        parser.add_argument('--logins', type=int, default=32, help='Threads da rajada de logins')
+        parser.add_argument('--duracao', type=float, default=10.0, help='Segundos de cada cenário')
+
+    def handle(self, *args, **opts):
+        prefixo = f'bench-senhas-{uuid.uuid4().hex[:8]}'
+        workers = settings.SENHA_WORKERS or 1
+        try:
+            dono = Usuario.objects.create_user(f'{prefixo}-dono', password=SENHA, perfil='restaurante')
+            Restaurante.objects.bulk_create([
+                Restaurante(dono=dono, nome=f'{prefixo} {i}', cnpj=f'{prefixo[-8:]}{i}', endereco='Rua 1')
+                for i in range(20)
+            ])
+            cenarios = (
+                ('sem rajada', 0, 0),
+                ('rajada, hash na requisição', opts['logins'], 0),
+                (f'rajada, pool de {workers}', opts['logins'], workers),
+            )
+            self.stdout.write(
+                f"{'cenário':<28} | {'catálogo p50 ms':>15} {'p99 ms':>8} | {'logins/s':>8} {'503':>5} {'erros':>5}"
+            )
+            for nome, logins, pool in cenarios:
+                with override_settings(THROTTLE_BALDES={}, SENHA_WORKERS=pool,
+                                       ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                    latencias, codigos, duracao = self._rodar(dono, opts['leitores'], logins, opts['duracao'])
+                ok = codigos[200] / duracao
+                outros = sum(n for codigo, n in codigos.items() if codigo not in (200, 503))
+                self.stdout.write(
+                    f"{nome:<28} | {percentil(latencias, 50) * 1000:>15.1f} {percentil(latencias, 99) * 1000:>8.1f} | "
+                    f"{ok:>8.1f} {codigos[503]:>5} {outros:>5}"
+                )
+        finally:
+            Usuario.objects.filter(username__startswith=prefixo).delete()
+
+    def _rodar(self, dono, leitores, logins, duracao):
+        from rest_framework.test import APIClient
+
+        fim = time.perf_counter() + duracao
+        latencias, codigos = [], Counter()
+        trava = threading.Lock()
+
+        def ler():
+            cliente = APIClient()
+            cliente.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(dono)}')
+            try:
+                while time.perf_counter() < fim:
+                    inicio = time.perf_counter()
+                    cliente.get('/api/restaurantes/')
+                    with trava:
+                        latencias.append(time.perf_counter() - inicio)
+            finally:
+                connections.close_all()
+
+        def logar():
+            cliente = APIClient(raise_request_exception=False)
+            try:
+                while time.perf_counter() < fim:
+                    resposta = cliente.post('/auth/token/', {'username': dono.username, 'password': SENHA}, format='json')
+                    with trava:
+                        codigos[resposta.status_code] += 1
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=ler) for _ in range(leitores)]
+        threads += [threading.Thread(target=logar) for _ in range(logins)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return sorted(latencias), codigos, duracao
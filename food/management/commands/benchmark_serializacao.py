@@ -0,0 +1,81 @@
+import time
+import uuid
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from food.models import Usuario, Restaurante, CategoriaProduto, Produto, Pedido, ItemPedido
+from food.serializers import ProdutoSerializer, RestauranteSerializer, PedidoSerializer
+from food.serializers_leitura import serializar_produtos, serializar_restaurantes, serializar_pedidos
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Compara o custo por linha dos serializers com a serialização rápida de leitura"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--restaurantes', type=int, default=20)
+        parser.add_argument('--produtos', type=int, default=50, help='Produtos por restaurante')
+        parser.add_argument('--pedidos', type=int, default=500)
+        parser.add_argument('--repeticoes', type=int, default=3)
+
+    def handle(self, *args, **opts):
+        try:
+            with transaction.atomic():
+                self._popular(opts)
+                self._medir('produtos', Produto.objects.all(),
+                            lambda qs: ProdutoSerializer(qs, many=True).data,
+                            serializar_produtos, opts['repeticoes'])
+                self._medir('restaurantes', Restaurante.objects.prefetch_related('produtos__categoria', 'produtos__restaurante').select_related('dono'),
+                            lambda qs: RestauranteSerializer(qs, many=True).data,
+                            serializar_restaurantes, opts['repeticoes'])
+                self._medir('pedidos', Pedido.objects.select_related('usuario', 'restaurante').prefetch_related('itens__produto__categoria', 'itens__produto__restaurante'),
+                            lambda qs: PedidoSerializer(qs, many=True).data,
+                            serializar_pedidos, opts['repeticoes'])
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _popular(self, opts):
+        sufixo = uuid.uuid4().hex[:8]
+        dono = Usuario.objects.create(username=f'bench-{sufixo}', email=f'bench-{sufixo}@email.com')
+        categoria = CategoriaProduto.objects.create(nome='Benchmark')
+        restaurantes = Restaurante.objects.bulk_create([
+            Restaurante(dono=dono, nome=f'Restaurante {i}', cnpj=f'{sufixo}-{i}', endereco='Rua Benchmark')
+            for i in range(opts['restaurantes'])
+        ])
+        produtos = Produto.objects.bulk_create([
+            Produto(restaurante=r, categoria=categoria, nome=f'Produto {i}', preco=Decimal('19.90'))
+            for r in restaurantes for i in range(opts['produtos'])
+        ])
+        pedidos = Pedido.objects.bulk_create([
+            Pedido(usuario=dono, restaurante=restaurantes[i % len(restaurantes)], numero_pedido=i + 1,
+                   data_referencia='2000-01-01', valor_total=Decimal('39.80'))
+            for i in range(opts['pedidos'])
+        ])
+        ItemPedido.objects.bulk_create([
+            ItemPedido(pedido=p, produto=produtos[(i * 7 + j) % len(produtos)], quantidade=2,
+                       preco_unitario=Decimal('19.90'), opcoes=[{'nome': 'Extra', 'preco_adicional': '0.00'}])
+            for i, p in enumerate(pedidos) for j in range(3)
+        ])
+
+    def _medir(self, nome, queryset, original, rapido, repeticoes):
+        def melhor_tempo(funcao):
+            tempos = []
+            for _ in range(repeticoes):
+                inicio = time.perf_counter()
+                funcao(queryset.all())
+                tempos.append(time.perf_counter() - inicio)
+            return min(tempos)
+
+        linhas = queryset.count()
+        t_original = melhor_tempo(original)
+        t_rapido = melhor_tempo(rapido)
+        self.stdout.write(
+            f"{nome:<13} {linhas:>6} linhas | serializer {t_original / linhas * 1e6:9.1f} µs/linha"
+            f" | rápido {t_rapido / linhas * 1e6:9.1f} µs/linha | {t_original / t_rapido:5.1f}x"
+        )
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from food.previsao import JANELA_HISTORICO, atualizar_historico
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula a mediana da duração e da distância das entregas concluídas, por restaurante, "
+        "usada na previsão de chegada. Rode periodicamente (cron), por exemplo a cada hora."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=JANELA_HISTORICO,
+                            help='Janela de entregas concluídas consideradas')
+
+    def handle(self, *args, **opts):
+        historico = atualizar_historico(opts['dias'])
+        geral = historico.pop('*', None)
+        if geral is None:
+            self.stdout.write('Nenhuma entrega concluída na janela')
+            return
+        self.stdout.write(
+            f"{geral['entregas']} entrega(s); {len(historico)} restaurante(s) com histórico próprio; "
+            f"duração mediana geral {geral['duracao'] / 60:.1f} min"
+        )
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from food.recomendacoes import JANELA_RECOMENDACOES, atualizar
+
+
+class Command(BaseCommand):
+    help = (
+        "Atualiza as matrizes de coocorrência de produtos por restaurante e as recomendações "
+        "\"peça também\" de cada produto. Incremental: rode periodicamente (cron), por exemplo a cada "
+        "15 minutos; --completo relê a janela inteira."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=JANELA_RECOMENDACOES,
+                            help='Janela de pedidos considerados')
+        parser.add_argument('--completo', action='store_true',
+                            help='Recalcula do zero em vez de somar e subtrair as bordas da janela')
+
+    def handle(self, *args, **opts):
+        inicio = time.perf_counter()
+        resumo = atualizar(opts['dias'], completo=opts['completo'])
+        self.stdout.write(
+            f"{resumo['modo']}: {resumo['itens']} item(ns) de pedido lidos em {time.perf_counter() - inicio:.1f} s; "
+            f"{resumo['restaurantes']} restaurante(s), {resumo['produtos']} produto(s) com recomendações; "
+            f"matrizes com {resumo['bytes'] / 1024:.1f} KiB"
+        )
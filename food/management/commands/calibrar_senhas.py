@@ -0,0 +1,87 @@
+import math
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from food.senhas import PBKDF2Calibrado, ScryptCalibrado, Argon2Calibrado
+
+ALGORITMOS = ('pbkdf2', 'scrypt', 'argon2')
+
+
+def medir_ms(hasher, repeticoes):
+    """Mediana, em ms, do tempo de um hash com o custo atual do settings."""
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        hasher.encode('calibrar-senhas', hasher.salt())
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(tempos)
+
+
+class Command(BaseCommand):
+    help = (
+        "Mede o hash de senha nesta máquina e sugere o custo (SENHA_*) em que um hash leva --alvo-ms. "
+        "Cada worker do pool verifica cerca de 1000/alvo senhas por segundo."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--algoritmo', choices=ALGORITMOS, help='Padrão: SENHA_HASHER')
+        parser.add_argument('--alvo-ms', type=float, default=100.0, help='Tempo de um hash')
+        parser.add_argument('--memoria-kib', type=int, default=64 * 1024,
+                            help='argon2: memória por hash (o custo de tempo é o calibrado)')
+        parser.add_argument('--repeticoes', type=int, default=5)
+
+    def handle(self, *args, **opts):
+        algoritmo = opts['algoritmo'] or settings.SENHA_HASHER
+        alvo, repeticoes = opts['alvo_ms'], opts['repeticoes']
+        try:
+            sugestao, tempo = getattr(self, f'_calibrar_{algoritmo}')(alvo, repeticoes, opts)
+        except ValueError as exc:  # argon2-cffi ausente
+            raise CommandError(str(exc))
+
+        for nome, valor in sugestao.items():
+            self.stdout.write(f'{nome}={valor}')
+        workers = settings.SENHA_WORKERS or 1
+        self.stdout.write(
+            f'# {tempo:.0f} ms por hash: ~{workers * 1000 / tempo:.0f} senhas/s por processo '
+            f'com SENHA_WORKERS={workers}'
+        )
+
+    def _calibrar_pbkdf2(self, alvo, repeticoes, opts):
+        # O tempo cresce linearmente com as iterações: uma medida basta para escalar
+        base = 100_000
+        with override_settings(SENHA_PBKDF2_ITERACOES=base):
+            tempo = medir_ms(PBKDF2Calibrado(), repeticoes)
+        iteracoes = max(base, math.ceil(base * alvo / tempo / 10_000) * 10_000)
+        with override_settings(SENHA_PBKDF2_ITERACOES=iteracoes):
+            tempo = medir_ms(PBKDF2Calibrado(), repeticoes)
+        return {'SENHA_HASHER': 'pbkdf2', 'SENHA_PBKDF2_ITERACOES': iteracoes}, tempo
+
+    def _calibrar_scrypt(self, alvo, repeticoes, opts):
+        # N é potência de 2 e a memória (128·N·r) dobra junto: o maior N que não passa do alvo
+        n, tempo = 2 ** 12, None
+        while True:
+            with override_settings(SENHA_SCRYPT_N=n * 2, SENHA_SCRYPT_R=8, SENHA_SCRYPT_P=1):
+                proximo = medir_ms(ScryptCalibrado(), repeticoes)
+            if tempo is not None and proximo > alvo:
+                break
+            n, tempo = n * 2, proximo
+            if n >= 2 ** 20:
+                break
+        return {'SENHA_HASHER': 'scrypt', 'SENHA_SCRYPT_N': n, 'SENHA_SCRYPT_R': 8, 'SENHA_SCRYPT_P': 1}, tempo
+
+    def _calibrar_argon2(self, alvo, repeticoes, opts):
+        memoria = opts['memoria_kib']
+        custos = dict(SENHA_ARGON2_MEMORIA=memoria, SENHA_ARGON2_PARALELISMO=1)
+        with override_settings(SENHA_ARGON2_TEMPO=1, **custos):
+            por_passada = medir_ms(Argon2Calibrado(), repeticoes)
+        passadas = max(1, math.floor(alvo / por_passada))
+        with override_settings(SENHA_ARGON2_TEMPO=passadas, **custos):
+            tempo = medir_ms(Argon2Calibrado(), repeticoes)
+        return {
+            'SENHA_HASHER': 'argon2', 'SENHA_ARGON2_TEMPO': passadas,
+            'SENHA_ARGON2_MEMORIA': memoria, 'SENHA_ARGON2_PARALELISMO': 1,
+        }, tempo
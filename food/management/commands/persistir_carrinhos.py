@@ -0,0 +1,30 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from food.carrinho_cache import persistir_pendentes
+
+
+class Command(BaseCommand):
+    help = (
+        "Grava no banco os carrinhos alterados no cache desde a última execução. "
+        "Rode periodicamente (cron) ou deixe rodando com --intervalo."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--intervalo', type=float, help='Segundos entre execuções; sem ele roda uma vez')
+
+    def handle(self, *args, **opts):
+        if not settings.CACHE_COMPARTILHADO:
+            # Com memória local, este processo não vê os carrinhos que ficaram nos workers
+            mensagem = 'O cache não é compartilhado (defina REDIS_URL): nenhum carrinho dos workers seria gravado.'
+            if not settings.DEBUG:
+                raise CommandError(mensagem)
+            self.stderr.write(self.style.WARNING(mensagem))
+        while True:
+            gravados = persistir_pendentes()
+            self.stdout.write(f'{gravados} carrinho(s) gravado(s)')
+            if not opts['intervalo']:
+                return
+            time.sleep(opts['intervalo'])
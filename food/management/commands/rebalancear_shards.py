@@ -0,0 +1,72 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from food import shards
+from food.models import Pedido, ItemPedido, EventoPedido, Pagamento, Entrega, RastreamentoEntrega
+
+# Tabelas copiadas com cada lote de pedidos, as referenciadas antes
+_TABELAS = (
+    (Pedido, 'pk__in'),
+    (ItemPedido, 'pedido__in'),
+    (EventoPedido, 'pedido__in'),
+    (Pagamento, 'pedido__in'),
+    (Entrega, 'pedido__in'),
+    (RastreamentoEntrega, 'entrega__pedido__in'),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Leva os pedidos de cada restaurante (com itens, eventos, pagamento, entrega e rastreamento) para o "
+        "shard que o anel de DATABASE_SHARDS indica; também divide um banco único (o default) entre os shards. "
+        "Rode com o novo DB_SHARDS antes do deploy e de novo depois, para levar o que chegou no meio tempo."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--simular', action='store_true', help='Só mostra o que seria movido')
+        parser.add_argument('--lote', type=int, default=500, help='Pedidos copiados por transação')
+
+    def handle(self, *args, **opts):
+        if not shards.shards():
+            raise CommandError('DATABASE_SHARDS está vazio (defina DB_SHARDS).')
+
+        total = 0
+        for origem in dict.fromkeys([DEFAULT_DB_ALIAS, *shards.shards()]):
+            restaurantes = list(
+                Pedido._base_manager.using(origem).order_by('restaurante_id')
+                .values_list('restaurante_id', flat=True).distinct()
+            )
+            for restaurante in restaurantes:
+                destino = shards.banco_do_restaurante(restaurante)
+                if destino == origem:
+                    continue
+                pedidos = Pedido._base_manager.using(origem).filter(restaurante_id=restaurante)
+                if opts['simular']:
+                    quantidade = pedidos.count()
+                else:
+                    quantidade = self._mover(pedidos, origem, destino, opts['lote'])
+                self.stdout.write(f'Restaurante {restaurante}: {quantidade} pedido(s) {origem} → {destino}')
+                total += quantidade
+
+        self.stdout.write(f"{total} pedido(s) {'a mover' if opts['simular'] else 'movido(s)'}")
+
+    def _mover(self, pedidos, origem, destino, lote):
+        movidos = 0
+        while True:
+            ids = list(pedidos.order_by('pk').values_list('pk', flat=True)[:lote])
+            if not ids:
+                return movidos
+            # Um lote interrompido entre a cópia e a exclusão já está no destino: só falta excluir
+            copiados = set(Pedido._base_manager.using(destino).filter(pk__in=ids).values_list('pk', flat=True))
+            copiar = [pk for pk in ids if pk not in copiados]
+            with transaction.atomic(using=destino):
+                for model, filtro in _TABELAS:
+                    for objeto in model._base_manager.using(origem).filter(**{filtro: copiar}).order_by('pk'):
+                        if model is EventoPedido:
+                            objeto.pk = None  # cada shard numera os próprios eventos
+                        # raw: mantém criado_em/atualizado_em, que o auto_now sobrescreveria
+                        objeto.save_base(raw=True, force_insert=True, using=destino)
+            # A exclusão em cascata leva itens, eventos, pagamento, entrega e rastreamento
+            with transaction.atomic(using=origem):
+                Pedido._base_manager.using(origem).filter(pk__in=ids).delete()
+            movidos += len(ids)
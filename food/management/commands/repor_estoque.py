@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from food.carrinho_cache import invalidar_produtos
+from food.models import Produto
+
+
+class Command(BaseCommand):
+    help = (
+        "Volta o estoque dos produtos com limite diário para o limite e reativa os que tinham esgotado. "
+        "Rode uma vez por dia (cron), antes da abertura."
+    )
+
+    def handle(self, *args, **opts):
+        ids = list(Produto.objects.filter(limite_diario__isnull=False).values_list('pk', flat=True))
+        repostos = Produto.repor_estoque_diario()
+        # O UPDATE em lote não dispara os sinais que limpam os snapshots do carrinho
+        invalidar_produtos(ids)
+        self.stdout.write(f'{repostos} produto(s) reposto(s)')
@@ -0,0 +1,81 @@
+import multiprocessing
+import signal
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+def _processo(parar, fila, lote, intervalo):
+    """Entrada de cada processo worker (também funciona com o start method 'spawn')."""
+    import django
+    django.setup()
+    from food.fila import trabalhar
+
+    # Ctrl+C chega ao grupo todo; quem decide parar é o processo principal
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    trabalhar(parar, fila, lote, intervalo)
+
+
+class Command(BaseCommand):
+    help = (
+        "Executa as tarefas da fila (food.fila) com um pool de threads ou de processos. "
+        "Encerra com Ctrl+C/SIGTERM depois de terminar o lote em andamento."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fila', default='padrao')
+        parser.add_argument('--threads', type=int, default=1, help='Workers em threads deste processo')
+        parser.add_argument('--processos', type=int, default=0,
+                            help='Workers em processos separados (substitui --threads)')
+        parser.add_argument('--lote', type=int, default=10, help='Tarefas reservadas por vez, por worker')
+        parser.add_argument('--intervalo', type=float, default=1.0,
+                            help='Segundos entre consultas quando a fila está vazia')
+        parser.add_argument('--uma-vez', action='store_true',
+                            help='Processa o que está na fila agora e sai (cron, testes)')
+
+    def handle(self, *args, **opts):
+        from food.fila import processar, trabalhar
+
+        if opts['uma_vez']:
+            total = 0
+            while executadas := processar(opts['fila'], opts['lote']):
+                total += executadas
+            self.stdout.write(f'{total} tarefa(s) executada(s)')
+            return
+
+        if opts['processos'] < 0 or opts['threads'] < 1:
+            raise CommandError('--threads deve ser pelo menos 1 e --processos não pode ser negativo.')
+        argumentos = (opts['fila'], opts['lote'], opts['intervalo'])
+        if opts['processos']:
+            # Conexões abertas não podem ser herdadas pelos processos filhos
+            connections.close_all()
+            contexto = multiprocessing.get_context()
+            parar = contexto.Event()
+            workers = [
+                contexto.Process(target=_processo, args=(parar, *argumentos), daemon=True)
+                for _ in range(opts['processos'])
+            ]
+        else:
+            parar = threading.Event()
+            workers = [
+                threading.Thread(target=trabalhar, args=(parar, *argumentos), daemon=True)
+                for _ in range(opts['threads'])
+            ]
+
+        # SIGTERM vira KeyboardInterrupt: o Event não pode ser sinalizado de dentro do handler
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+        for worker in workers:
+            worker.start()
+        self.stdout.write(
+            f"{len(workers)} worker(s) em {'processos' if opts['processos'] else 'threads'} na fila '{opts['fila']}'"
+        )
+        try:
+            while any(worker.is_alive() for worker in workers):
+                time.sleep(0.5)
+        except KeyboardInterrupt:
+            parar.set()
+        for worker in workers:
+            worker.join()
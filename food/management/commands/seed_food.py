@@ -0,0 +1,437 @@
+import contextlib
+import random
+import time
+import uuid
+from bisect import bisect
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, models, transaction
+from django.utils import timezone
+
+from food.models import (
+    Usuario, Restaurante, CategoriaProduto, Produto, GrupoOpcao, Opcao,
+    Carrinho, ItemCarrinho, Pedido, ItemPedido, Pagamento, Entrega, RastreamentoEntrega,
+    AvaliacaoRestaurante, AvaliacaoEntregador, AvaliacaoProduto, Endereco, EventoPedido, Tarefa,
+)
+
+# Quantidades para --escala 1 (~390 mil linhas); a escala multiplica tudo exceto categorias
+POR_ESCALA = {
+    'restaurantes': 50,
+    'produtos_por_restaurante': 30,
+    'clientes': 5000,
+    'entregadores': 200,
+    'pedidos': 20000,
+}
+PONTOS_POR_ENTREGA = 15
+CATEGORIAS = (
+    'Lanches', 'Pizzas', 'Japonesa', 'Brasileira', 'Árabe', 'Saudável', 'Doces',
+    'Sorvetes', 'Bebidas', 'Padaria', 'Marmitas', 'Italiana',
+)
+# Peso relativo de cada hora do dia: picos no almoço e no jantar
+PESOS_HORA = (1, 1, 0, 0, 0, 0, 1, 2, 3, 4, 8, 22, 30, 18, 6, 4, 4, 5, 12, 24, 26, 16, 7, 3)
+METODOS_PAGAMENTO = ('pix', 'cartao_credito', 'cartao_debito', 'dinheiro')
+# (latitude, longitude) aproximada do centro de São Paulo
+CENTRO = (-23.5505, -46.6333)
+
+
+def _uuid(rng):
+    return uuid.UUID(int=rng.getrandbits(128), version=4)
+
+
+def _reais(valor):
+    return Decimal(valor).quantize(Decimal('0.01'))
+
+
+# -----------------------------
+# ESCRITORES
+# -----------------------------
+class _EscritorCopy:
+    """Grava linhas com ``COPY ... FROM STDIN`` (PostgreSQL + psycopg 3)"""
+
+    def __init__(self, connection):
+        from psycopg.types.json import Jsonb
+        self.connection = connection
+        self.jsonb = Jsonb
+
+    def gravar(self, model, linhas):
+        if not linhas:
+            return
+        # Chaves automáticas (ex.: tabelas de ligação M2M) ficam por conta do banco
+        campos = [
+            campo for campo in model._meta.concrete_fields
+            if not (campo.primary_key and campo.attname not in linhas[0])
+        ]
+        quote = self.connection.ops.quote_name
+        colunas = ', '.join(quote(campo.column) for campo in campos)
+        # Sem o save(), ninguém preenche auto_now/auto_now_add; as colunas são NOT NULL
+        agora = timezone.now()
+        padroes = [
+            agora if getattr(campo, 'auto_now', False) or getattr(campo, 'auto_now_add', False)
+            else None if campo.primary_key or not campo.has_default() else campo.get_default()
+            for campo in campos
+        ]
+        attnames = [campo.attname for campo in campos]
+        json = [isinstance(campo, models.JSONField) for campo in campos]
+        sql = f'COPY {quote(model._meta.db_table)} ({colunas}) FROM STDIN'
+        with self.connection.cursor() as cursor, cursor.cursor.copy(sql) as copy:
+            for linha in linhas:
+                valores = [linha.get(nome, padrao) for nome, padrao in zip(attnames, padroes)]
+                for i, eh_json in enumerate(json):
+                    if eh_json:
+                        valores[i] = self.jsonb(valores[i])
+                copy.write_row(valores)
+
+
+class _EscritorBulkCreate:
+    """Fallback para outros bancos (ex.: SQLite) usando ``bulk_create``"""
+
+    def __init__(self, connection, tamanho_lote=2000):
+        self.connection = connection
+        self.tamanho_lote = tamanho_lote
+
+    def gravar(self, model, linhas):
+        if linhas:
+            model.objects.using(self.connection.alias).bulk_create(
+                [model(**linha) for linha in linhas], batch_size=self.tamanho_lote
+            )
+
+
+@contextlib.contextmanager
+def _datas_informadas():
+    """Desliga ``auto_now_add`` para que ``bulk_create`` mantenha as datas geradas."""
+    campos = [
+        campo for model in (Usuario, Restaurante, Carrinho, Pedido, Pagamento, RastreamentoEntrega,
+                            AvaliacaoRestaurante, AvaliacaoEntregador, AvaliacaoProduto, Endereco)
+        for campo in model._meta.concrete_fields if getattr(campo, 'auto_now_add', False)
+    ]
+    for campo in campos:
+        campo.auto_now_add = False
+    try:
+        yield
+    finally:
+        for campo in campos:
+            campo.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = (
+        "Gera um conjunto de dados sintético e determinístico (restaurantes populares, picos de almoço e jantar, "
+        "produtos com opções). Usa COPY no PostgreSQL e bulk_create nos demais bancos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--escala', type=float, default=1.0, help='Multiplicador de volume (1 = ~390 mil linhas)')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--dias', type=int, default=90, help='Janela de dias dos pedidos')
+        parser.add_argument('--ate', help='Último dia dos pedidos (AAAA-MM-DD); padrão: hoje')
+        parser.add_argument('--lote', type=int, default=5000, help='Pedidos gravados por transação')
+        parser.add_argument('--senha', default='senha123', help='Senha de todos os usuários gerados')
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--limpar', action='store_true', help='Apaga os dados do app food antes de gerar')
+
+    def handle(self, *args, **opts):
+        if opts['escala'] <= 0:
+            raise CommandError('--escala deve ser positiva.')
+        connection = connections[opts['database']]
+        if connection.vendor == 'postgresql':
+            self.escritor = _EscritorCopy(connection)
+        else:
+            self.escritor = _EscritorBulkCreate(connection)
+        self.alias = opts['database']
+        self.contagem = {}
+        self.rng = random.Random(opts['seed'])
+        self.opts = opts
+        self.ate = datetime.strptime(opts['ate'], '%Y-%m-%d').date() if opts['ate'] else timezone.now().date()
+        self.quantidades = {
+            chave: max(1, int(valor * opts['escala'])) for chave, valor in POR_ESCALA.items()
+        }
+        self.quantidades['produtos_por_restaurante'] = POR_ESCALA['produtos_por_restaurante']
+
+        inicio = time.perf_counter()
+        with _datas_informadas():
+            if opts['limpar']:
+                self._limpar()
+            with transaction.atomic(using=self.alias):
+                self._gerar_usuarios()
+                self._gerar_cardapio()
+                self._gerar_carrinhos()
+            self._gerar_pedidos()
+        duracao = time.perf_counter() - inicio
+
+        total = sum(self.contagem.values())
+        for tabela, quantidade in self.contagem.items():
+            self.stdout.write(f'{tabela:<24} {quantidade:>12,}')
+        self.stdout.write(self.style.SUCCESS(
+            f'{total:,} linhas em {duracao:.1f}s ({total / duracao:,.0f} linhas/s, {connection.vendor})'
+        ))
+
+    def _gravar(self, model, linhas):
+        self.escritor.gravar(model, linhas)
+        nome = model._meta.db_table
+        self.contagem[nome] = self.contagem.get(nome, 0) + len(linhas)
+
+    def _limpar(self):
+        self.stdout.write('Apagando dados existentes...')
+        with transaction.atomic(using=self.alias):
+            for model in (Tarefa, RastreamentoEntrega, Entrega, Pagamento, ItemPedido, EventoPedido, Pedido,
+                          ItemCarrinho.opcoes_escolhidas.through, ItemCarrinho,
+                          Carrinho, AvaliacaoProduto, AvaliacaoRestaurante, AvaliacaoEntregador,
+                          Opcao, GrupoOpcao, Produto, CategoriaProduto, Endereco, Restaurante):
+                model._base_manager.using(self.alias).all()._raw_delete(self.alias)
+            Usuario.objects.using(self.alias).filter(is_superuser=False).delete()
+
+    def _data_hora(self, dia, hora=None):
+        rng = self.rng
+        if hora is None:
+            hora = bisect(self.pesos_hora, rng.random() * self.pesos_hora[-1])
+        return datetime(dia.year, dia.month, dia.day, hora, rng.randrange(60), rng.randrange(60),
+                        tzinfo=dt_timezone.utc)
+
+    # -----------------------------
+    # USUÁRIOS E CARDÁPIO
+    # -----------------------------
+    def _gerar_usuarios(self):
+        rng, seed = self.rng, self.opts['seed']
+        self.pesos_hora = list(accumulate(PESOS_HORA))
+        senha = make_password(self.opts['senha'])
+        inicio_cadastros = self.ate - timedelta(days=self.opts['dias'] + 365)
+
+        def usuario(perfil, i):
+            dia = inicio_cadastros + timedelta(days=rng.randrange(365))
+            username = f'seed{seed}-{perfil}-{i}'
+            return {
+                'id': _uuid(rng), 'username': username, 'email': f'{username}@exemplo.com',
+                'password': senha, 'first_name': perfil.title(), 'last_name': str(i),
+                'perfil': perfil, 'date_joined': self._data_hora(dia), 'data_cadastro': self._data_hora(dia),
+                'telefone': f'11 9{rng.randrange(10**8):08d}', 'foto': '',
+            }
+
+        self.donos = [usuario('restaurante', i) for i in range(self.quantidades['restaurantes'])]
+        self.clientes = [usuario('cliente', i) for i in range(self.quantidades['clientes'])]
+        self.entregadores = [usuario('entregador', i) for i in range(self.quantidades['entregadores'])]
+        self._gravar(Usuario, self.donos + self.clientes + self.entregadores)
+
+        bairros = ('Centro', 'Pinheiros', 'Moema', 'Tatuapé', 'Santana', 'Lapa', 'Butantã', 'Mooca')
+        self.enderecos = [
+            {
+                'id': _uuid(rng), 'usuario_id': cliente['id'], 'apelido': 'Casa', 'tipo': 'residencial',
+                'rua': f'Rua {rng.randrange(1, 500)}', 'numero': str(rng.randrange(1, 3000)),
+                'bairro': rng.choice(bairros), 'cidade': 'São Paulo', 'estado': 'SP',
+                'cep': f'0{rng.randrange(1000, 9999)}-{rng.randrange(1000):03d}',
+                'criado_em': cliente['data_cadastro'],
+            }
+            for cliente in self.clientes
+        ]
+        self._gravar(Endereco, self.enderecos)
+
+    def _gerar_cardapio(self):
+        rng, seed = self.rng, self.opts['seed']
+        categorias = [{'id': _uuid(rng), 'nome': nome} for nome in CATEGORIAS]
+        self._gravar(CategoriaProduto, categorias)
+
+        self.restaurantes = [
+            {
+                'id': _uuid(rng), 'dono_id': dono['id'], 'nome': f'Restaurante {i}',
+                'cnpj': f'{seed % 10**6:06d}{i:08d}', 'endereco': f'Avenida {rng.randrange(1, 200)}, {i}',
+                'aberto': rng.random() < 0.9, 'criado_em': dono['data_cadastro'],
+            }
+            for i, dono in enumerate(self.donos)
+        ]
+        self._gravar(Restaurante, self.restaurantes)
+        # Popularidade tipo Zipf: poucos restaurantes concentram a maior parte dos pedidos
+        self.pesos_restaurante = list(accumulate(1 / (i + 1) ** 1.1 for i in range(len(self.restaurantes))))
+
+        produtos, grupos, opcoes = [], [], []
+        self.cardapio = {}
+        for restaurante in self.restaurantes:
+            categoria = rng.choice(categorias)['id']
+            itens = []
+            for j in range(self.quantidades['produtos_por_restaurante']):
+                produto = {
+                    'id': _uuid(rng), 'restaurante_id': restaurante['id'],
+                    'categoria_id': categoria if rng.random() < 0.8 else rng.choice(categorias)['id'],
+                    'nome': f'Produto {j}', 'descricao': f'Descrição do produto {j}',
+                    'preco': _reais(rng.uniform(8, 90)), 'disponivel': rng.random() < 0.95, 'imagem': '',
+                }
+                # Grupos de opções: [(multipla_escolha, obrigatorio, [opcao, ...]), ...]
+                grupos_produto = []
+                if rng.random() < 0.4:
+                    for k in range(rng.randint(1, 3)):
+                        grupo = {
+                            'id': _uuid(rng), 'produto_id': produto['id'], 'nome': f'Grupo {k}',
+                            'obrigatorio': k == 0 and rng.random() < 0.5,
+                            'multipla_escolha': rng.random() < 0.5,
+                        }
+                        opcoes_grupo = [
+                            {'id': _uuid(rng), 'grupo_id': grupo['id'], 'nome': f'Opção {k}.{m}',
+                             'preco_adicional': _reais(rng.choice((0, 0, 1, 2, 3.5, 5)))}
+                            for m in range(rng.randint(2, 5))
+                        ]
+                        grupos.append(grupo)
+                        opcoes.extend(opcoes_grupo)
+                        grupos_produto.append((grupo['multipla_escolha'], grupo['obrigatorio'], opcoes_grupo))
+                produtos.append(produto)
+                itens.append((produto, grupos_produto))
+            self.cardapio[restaurante['id']] = itens
+        self._gravar(Produto, produtos)
+        self._gravar(GrupoOpcao, grupos)
+        self._gravar(Opcao, opcoes)
+
+    def _escolher_opcoes(self, grupos_produto):
+        rng = self.rng
+        escolhidas = []
+        for multipla, obrigatorio, opcoes in grupos_produto:
+            if not obrigatorio and rng.random() < 0.5:
+                continue
+            quantidade = rng.randint(1, min(3, len(opcoes))) if multipla else 1
+            escolhidas.extend(rng.sample(opcoes, quantidade))
+        return escolhidas
+
+    def _gerar_carrinhos(self):
+        rng = self.rng
+        carrinhos, itens, escolhas = [], [], []
+        ligacao = ItemCarrinho.opcoes_escolhidas.through
+        # Um em cada cinco clientes tem carrinhos abertos, em restaurantes distintos (unique_together)
+        for cliente in self.clientes[::5]:
+            for restaurante in rng.sample(self.restaurantes, min(len(self.restaurantes), rng.randint(1, 2))):
+                carrinho = {'id': _uuid(rng), 'usuario_id': cliente['id'], 'restaurante_id': restaurante['id'],
+                            'criado_em': self._data_hora(self.ate)}
+                carrinhos.append(carrinho)
+                for produto, grupos_produto in rng.sample(self.cardapio[restaurante['id']], rng.randint(1, 3)):
+                    item = {'id': _uuid(rng), 'carrinho_id': carrinho['id'], 'produto_id': produto['id'],
+                            'quantidade': rng.randint(1, 3), 'observacao': ''}
+                    itens.append(item)
+                    escolhas.extend(
+                        {'itemcarrinho_id': item['id'], 'opcao_id': opcao['id']}
+                        for opcao in self._escolher_opcoes(grupos_produto)
+                    )
+        self._gravar(Carrinho, carrinhos)
+        self._gravar(ItemCarrinho, itens)
+        self._gravar(ligacao, escolhas)
+
+    # -----------------------------
+    # PEDIDOS, ENTREGAS E AVALIAÇÕES
+    # -----------------------------
+    def _gerar_pedidos(self):
+        total = self.quantidades['pedidos']
+        self.numeracao = {}
+        self.entregadores_livres = list(self.entregadores)
+        gerados = 0
+        while gerados < total:
+            lote = min(self.opts['lote'], total - gerados)
+            with transaction.atomic(using=self.alias):
+                self._gerar_lote_pedidos(lote)
+            gerados += lote
+            self.stdout.write(f'  pedidos: {gerados:,}/{total:,}', ending='\r')
+        self.stdout.write('')
+
+    def _gerar_lote_pedidos(self, quantidade):
+        rng = self.rng
+        dias = self.opts['dias']
+        pedidos, itens, pagamentos, entregas, pontos = [], [], [], [], []
+        av_restaurante, av_produto, av_entregador = [], [], []
+
+        for _ in range(quantidade):
+            restaurante = self.restaurantes[bisect(self.pesos_restaurante, rng.random() * self.pesos_restaurante[-1])]
+            cliente_indice = rng.randrange(len(self.clientes))
+            cliente = self.clientes[cliente_indice]
+            dias_atras = min(dias - 1, int(rng.expovariate(3 / dias)))  # mais pedidos nos dias recentes
+            dia = self.ate - timedelta(days=dias_atras)
+            criado_em = self._data_hora(dia)
+
+            chave = (restaurante['id'], dia)
+            numero = self.numeracao.get(chave, 0) + 1
+            self.numeracao[chave] = numero
+
+            if dias_atras == 0:
+                status = rng.choice(('pendente', 'confirmado', 'em_preparo', 'a_caminho', 'entregue'))
+            else:
+                status = 'cancelado' if rng.random() < 0.04 else 'entregue'
+
+            pedido_id = _uuid(rng)
+            valor_total = Decimal('0.00')
+            cardapio = self.cardapio[restaurante['id']]
+            escolhidos = rng.sample(cardapio, min(len(cardapio), 1 + int(rng.expovariate(0.7))))
+            for produto, grupos_produto in escolhidos:
+                opcoes = self._escolher_opcoes(grupos_produto)
+                preco_unitario = produto['preco'] + sum((o['preco_adicional'] for o in opcoes), Decimal('0.00'))
+                quantidade_item = 1 if rng.random() < 0.75 else rng.randint(2, 4)
+                valor_total += preco_unitario * quantidade_item
+                itens.append({
+                    'id': _uuid(rng), 'pedido_id': pedido_id, 'produto_id': produto['id'],
+                    'quantidade': quantidade_item, 'preco_unitario': preco_unitario, 'observacao': '',
+                    'opcoes': [{'nome': o['nome'], 'preco_adicional': str(o['preco_adicional'])} for o in opcoes],
+                })
+                if status == 'entregue' and rng.random() < 0.1:
+                    av_produto.append({
+                        'id': _uuid(rng), 'produto_id': produto['id'], 'usuario_id': cliente['id'],
+                        'nota': rng.choices((1, 2, 3, 4, 5), (1, 1, 3, 8, 12))[0],
+                        'comentario': '', 'criado_em': criado_em + timedelta(hours=2),
+                    })
+
+            endereco = self.enderecos[cliente_indice]
+            pedidos.append({
+                'id': pedido_id, 'usuario_id': cliente['id'], 'restaurante_id': restaurante['id'],
+                'numero_pedido': numero, 'data_referencia': dia, 'valor_total': valor_total,
+                'status': status, 'criado_em': criado_em,
+                'endereco_entrega': f"{endereco['rua']}, {endereco['numero']} - {endereco['bairro']}, São Paulo/SP",
+                'endereco_origem': restaurante['endereco'],
+            })
+            pagamentos.append({
+                'id': _uuid(rng), 'pedido_id': pedido_id, 'metodo': rng.choice(METODOS_PAGAMENTO),
+                'valor': valor_total, 'criado_em': criado_em,
+                'status': {'cancelado': 'estornado', 'pendente': 'pendente'}.get(status, 'aprovado'),
+            })
+
+            if status in ('a_caminho', 'entregue'):
+                inicio = criado_em + timedelta(minutes=rng.randint(10, 40))
+                duracao = timedelta(minutes=rng.randint(10, 50))
+                entregador = None
+                # Entregador é OneToOne: só as entregas em andamento recebem um
+                if status == 'a_caminho' and self.entregadores_livres:
+                    entregador = self.entregadores_livres.pop()
+                entrega = {
+                    'id': _uuid(rng), 'pedido_id': pedido_id,
+                    'entregador_id': entregador['id'] if entregador else None,
+                    'status': 'em_rota' if status == 'a_caminho' else 'entregue',
+                    'inicio': inicio, 'fim': inicio + duracao if status == 'entregue' else None,
+                }
+                entregas.append(entrega)
+                lat = CENTRO[0] + rng.uniform(-0.1, 0.1)
+                lon = CENTRO[1] + rng.uniform(-0.1, 0.1)
+                passo_lat, passo_lon = rng.uniform(-0.002, 0.002), rng.uniform(-0.002, 0.002)
+                for k in range(PONTOS_POR_ENTREGA):
+                    pontos.append({
+                        'id': _uuid(rng), 'entrega_id': entrega['id'],
+                        'latitude': _coordenada(lat + passo_lat * k), 'longitude': _coordenada(lon + passo_lon * k),
+                        'registrado_em': inicio + duracao * k / PONTOS_POR_ENTREGA,
+                    })
+                if entregador is not None and rng.random() < 0.1:
+                    av_entregador.append({
+                        'id': _uuid(rng), 'entregador_id': entregador['id'], 'usuario_id': cliente['id'],
+                        'nota': rng.randint(3, 5), 'comentario': '', 'criado_em': inicio + duracao,
+                    })
+
+            if status == 'entregue' and rng.random() < 0.2:
+                av_restaurante.append({
+                    'id': _uuid(rng), 'restaurante_id': restaurante['id'], 'usuario_id': cliente['id'],
+                    'nota': rng.choices((1, 2, 3, 4, 5), (1, 1, 2, 6, 10))[0], 'comentario': '',
+                    'criado_em': criado_em + timedelta(hours=1),
+                })
+
+        self._gravar(Pedido, pedidos)
+        self._gravar(ItemPedido, itens)
+        self._gravar(Pagamento, pagamentos)
+        self._gravar(Entrega, entregas)
+        self._gravar(RastreamentoEntrega, pontos)
+        self._gravar(AvaliacaoRestaurante, av_restaurante)
+        self._gravar(AvaliacaoProduto, av_produto)
+        self._gravar(AvaliacaoEntregador, av_entregador)
+
+
+def _coordenada(valor):
+    return Decimal(f'{valor:.6f}')
@@ -0,0 +1,95 @@
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Dependências pesadas usadas só em caminhos raros: têm de ser importadas dentro das funções
+ADIADAS = ('google', 'numpy', 'httpx', 'rsa')
+
+
+def _alvos():
+    projeto = settings.ROOT_URLCONF.partition('.')[0]
+    return {
+        'comando': '',
+        'setup': f'import {settings.ROOT_URLCONF}',
+        'wsgi': f'import {projeto}.wsgi',
+        'asgi': f'import {projeto}.asgi',
+    }
+
+
+def medir(codigo):
+    """Roda ``codigo`` num processo novo com ``-X importtime``; devolve ``[(nivel, proprio_us, cumulativo_us, modulo)]``."""
+    resultado = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import django; django.setup(); {codigo}'],
+        capture_output=True, text=True, env={**os.environ, 'AQUECER': '0'},
+    )
+    if resultado.returncode:
+        raise CommandError(resultado.stderr.strip().splitlines()[-1])
+    linhas = []
+    for linha in resultado.stderr.splitlines():
+        if not linha.startswith('import time:') or 'self [us]' in linha:
+            continue
+        proprio, cumulativo, nome = linha[len('import time:'):].split('|')
+        nivel = (len(nome) - len(nome.lstrip())) // 2
+        linhas.append((nivel, int(proprio), int(cumulativo), nome.strip()))
+    return linhas
+
+
+def importador(linhas, indice):
+    """Quem importou o módulo da linha ``indice``: o ``-X importtime`` lista o pai depois dos filhos."""
+    nivel = linhas[indice][0]
+    for outro in linhas[indice + 1:]:
+        if outro[0] < nivel:
+            return outro[3]
+    return '<raiz>'
+
+
+class Command(BaseCommand):
+    help = (
+        "Mostra o tempo de importação na subida do processo: por pacote (tempo próprio) e por módulo do "
+        "projeto (cumulativo, com as dependências que ele puxa). --verificar falha se alguma dependência "
+        "que deveria ser carregada sob demanda entrou na subida."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--alvo', choices=sorted(_alvos()), default='wsgi',
+                            help='comando: só o django.setup() de todo manage.py; setup: mais as rotas; '
+                                 'wsgi/asgi: o ponto de entrada (sem aquecimento)')
+        parser.add_argument('--top', type=int, default=15)
+        parser.add_argument('--verificar', action='store_true')
+
+    def handle(self, *args, **opts):
+        linhas = medir(_alvos()[opts['alvo']])
+        total = sum(linha[1] for linha in linhas)
+        por_pacote = defaultdict(int)
+        importado_por = {}
+        for indice, (_, proprio, _, nome) in enumerate(linhas):
+            por_pacote[nome.partition('.')[0]] += proprio
+            if '.' not in nome:
+                importado_por[nome] = importador(linhas, indice)
+
+        self.stdout.write(f"Importação ({opts['alvo']}): {total / 1000:.1f} ms, {len(linhas)} módulos")
+        self.stdout.write(f"\n{'pacote':<28} {'ms':>8} {'%':>6}  importado por")
+        for pacote, tempo in sorted(por_pacote.items(), key=lambda item: -item[1])[:opts['top']]:
+            self.stdout.write(
+                f"{pacote:<28} {tempo / 1000:>8.1f} {100 * tempo / total:>6.1f}  {importado_por.get(pacote, '')}"
+            )
+
+        projeto = {'food', settings.ROOT_URLCONF.partition('.')[0]}
+        nossos = [linha for linha in linhas if linha[3].partition('.')[0] in projeto]
+        self.stdout.write(f"\n{'módulo do projeto':<28} {'ms cumulativo':>14} {'ms próprio':>11}")
+        for _, proprio, cumulativo, nome in sorted(nossos, key=lambda linha: -linha[2])[:opts['top']]:
+            self.stdout.write(f'{nome:<28} {cumulativo / 1000:>14.1f} {proprio / 1000:>11.1f}')
+
+        if opts['verificar']:
+            carregadas = [
+                f'{nome} (importado por {importador(linhas, indice)})'
+                for indice, (_, _, _, nome) in enumerate(linhas)
+                if nome in ADIADAS
+            ]
+            if carregadas:
+                raise CommandError(f"Importadas na subida: {', '.join(carregadas)}")
+            self.stdout.write(f"\nNenhuma de {', '.join(ADIADAS)} é importada na subida")
@@ -0,0 +1,320 @@
+import json
+import contextlib
+import math
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from food.models import Usuario, Restaurante, Produto, Carrinho, Pedido, Entrega, Endereco
+
+PASSOS = (
+    'listar_restaurantes', 'listar_produtos', 'adicionar_item', 'finalizar',
+    'atualizar_localizacao', 'refresh_token', 'abuso_catalogo', 'abuso_login',
+)
+CENARIOS = ('pedido', 'rastreamento', 'token')
+
+
+def percentil(valores_ordenados, p):
+    """Percentil pelo método nearest-rank (valores já ordenados)."""
+    if not valores_ordenados:
+        return 0.0
+    indice = max(0, min(len(valores_ordenados) - 1, math.ceil(p / 100 * len(valores_ordenados)) - 1))
+    return valores_ordenados[indice]
+
+
+# -----------------------------
+# CLIENTES HTTP
+# -----------------------------
+class _ClienteTeste:
+    """Executa as requisições pelo test client do Django, no mesmo processo"""
+
+    def __init__(self, alvo):
+        from rest_framework.test import APIClient
+        # Erros 500 contam como falha do passo em vez de interromper a carga
+        self.client = APIClient(raise_request_exception=False)
+
+    def enviar(self, metodo, url, dados=None, token=None):
+        extras = {'HTTP_AUTHORIZATION': f'Bearer {token}'} if token else {}
+        resposta = getattr(self.client, metodo)(url, dados, format='json', **extras)
+        try:
+            corpo = resposta.json()
+        except ValueError:
+            corpo = None
+        return resposta.status_code, corpo
+
+
+class _ClienteHttp:
+    """Executa as requisições contra um servidor em execução (ex.: runserver, gunicorn)"""
+
+    def __init__(self, alvo):
+        import requests
+        self.alvo = alvo.rstrip('/')
+        self.sessao = requests.Session()
+
+    def enviar(self, metodo, url, dados=None, token=None):
+        cabecalhos = {'Authorization': f'Bearer {token}'} if token else {}
+        resposta = self.sessao.request(metodo.upper(), self.alvo + url, json=dados, headers=cabecalhos)
+        try:
+            corpo = resposta.json()
+        except ValueError:
+            corpo = None
+        return resposta.status_code, corpo
+
+
+# -----------------------------
+# USUÁRIO VIRTUAL
+# -----------------------------
+class _UsuarioVirtual:
+    def __init__(self, cliente_http, dados, registrar, opts):
+        self.http = cliente_http
+        self.dados = dados
+        self.registrar = registrar
+        self.opts = opts
+
+    def medir(self, passo, metodo, url, corpo=None, token=None, esperado=(200, 201)):
+        inicio = time.perf_counter()
+        try:
+            status, resposta = self.http.enviar(metodo, url, corpo, token)
+        except Exception:
+            status, resposta = None, None
+        self.registrar(passo, time.perf_counter() - inicio, status in esperado)
+        return resposta
+
+    def pedido(self):
+        token = self.dados['token_cliente']
+        self.medir('listar_restaurantes', 'get', '/api/restaurantes/', token=token)
+        produtos = self.medir(
+            'listar_produtos', 'get', f"/api/restaurantes/{self.dados['restaurante']}/produtos/", token=token
+        ) or []
+        carrinho = self.dados['carrinho']
+        for i in range(self.opts['itens']):
+            produto = produtos[i % len(produtos)]['id'] if produtos else self.dados['produtos'][0]
+            self.medir('adicionar_item', 'post', f'/api/carrinhos/{carrinho}/adicionar_item/',
+                       {'produto_id': produto, 'quantidade': 1}, token=token)
+        self.medir('finalizar', 'post', f'/api/carrinhos/{carrinho}/finalizar/',
+                   {'endereco_id': self.dados['endereco']}, token=token)
+
+    def rastreamento(self):
+        entrega = self.dados['entrega']
+        for i in range(self.opts['rajada']):
+            self.medir('atualizar_localizacao', 'post', f'/api/entregas/{entrega}/atualizar_localizacao/',
+                       {'latitude': f'{-23.55 + i * 0.0001:.6f}', 'longitude': f'{-46.63 - i * 0.0001:.6f}'},
+                       token=self.dados['token_entregador'])
+
+    def token(self):
+        resposta = self.medir('refresh_token', 'post', '/auth/token/refresh/', {'refresh': self.dados['refresh']})
+        if resposta and 'refresh' in resposta:
+            self.dados['refresh'] = resposta['refresh']
+
+    def abuso(self):
+        """Cliente mal comportado: catálogo sem pausa e tentativas de senha"""
+        self.medir('abuso_catalogo', 'get', '/api/restaurantes/', token=self.dados['token_cliente'], esperado=(429,))
+        self.medir('abuso_login', 'post', '/auth/token/',
+                   {'username': self.dados['usuario'], 'password': 'senha-errada'}, esperado=(429,))
+
+
+class Command(BaseCommand):
+    help = (
+        "Teste de carga dos fluxos principais (catálogo, carrinho, checkout, rastreamento e refresh de token). "
+        "Reporta p50/p95/p99 e requisições por segundo de cada passo."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--alvo', help='URL base de um servidor em execução; sem ela usa o test client')
+        parser.add_argument('--concorrencia', type=int, default=4, help='Usuários virtuais simultâneos')
+        parser.add_argument('--iteracoes', type=int, default=10, help='Iterações por usuário virtual')
+        parser.add_argument('--cenarios', default=','.join(CENARIOS), help=f"Subconjunto de {', '.join(CENARIOS)}")
+        parser.add_argument('--itens', type=int, default=3, help='Itens adicionados por pedido')
+        parser.add_argument('--rajada', type=int, default=10, help='Atualizações de GPS por rajada')
+        parser.add_argument('--produtos', type=int, default=20, help='Produtos no cardápio de teste')
+        parser.add_argument('--estoque', type=int,
+                            help='Estoque de cada produto (o checkout passa a baixá-lo); sem ele, sem controle')
+        parser.add_argument('--salvar-baseline', metavar='ARQUIVO', help='Grava o resultado em JSON')
+        parser.add_argument('--comparar', metavar='ARQUIVO', help='Compara com um baseline gravado antes')
+        parser.add_argument('--manter-dados', action='store_true', help='Não apaga os dados de teste ao final')
+        parser.add_argument('--abusivos', type=int, default=0,
+                            help='Clientes abusivos em paralelo (catálogo e login sem pausa); "erros" deles = não limitados')
+        parser.add_argument('--com-limites', action='store_true',
+                            help='Mantém os throttles (THROTTLE_BALDES) no test client; sem ela a carga não é limitada')
+
+    def handle(self, *args, **opts):
+        cenarios = [c.strip() for c in opts['cenarios'].split(',') if c.strip()]
+        invalidos = set(cenarios) - set(CENARIOS)
+        if invalidos:
+            raise CommandError(f"Cenários inválidos: {', '.join(sorted(invalidos))}")
+        if opts['alvo']:
+            classe_cliente = _ClienteHttp
+            ambiente = contextlib.nullcontext()
+        else:
+            classe_cliente = _ClienteTeste
+            configuracao = {'ALLOWED_HOSTS': [*settings.ALLOWED_HOSTS, 'testserver']}
+            if not opts['com_limites']:
+                configuracao['THROTTLE_BALDES'] = {}
+            ambiente = override_settings(**configuracao)
+
+        prefixo = f'carga-{uuid.uuid4().hex[:8]}'
+        usuarios = self._preparar(prefixo, opts)
+        amostras = defaultdict(list)
+        falhas = defaultdict(int)
+        trava = threading.Lock()
+
+        def registrar(passo, duracao, ok):
+            with trava:
+                amostras[passo].append(duracao)
+                if not ok:
+                    falhas[passo] += 1
+
+        def executar(dados):
+            virtual = _UsuarioVirtual(classe_cliente(opts['alvo']), dados, registrar, opts)
+            try:
+                for _ in range(opts['iteracoes']):
+                    for cenario in cenarios:
+                        getattr(virtual, cenario)()
+            finally:
+                if threading.current_thread() is not threading.main_thread():
+                    connection.close()
+
+        parar = threading.Event()
+
+        def abusar(dados):
+            virtual = _UsuarioVirtual(classe_cliente(opts['alvo']), dados, registrar, opts)
+            try:
+                while not parar.is_set():
+                    virtual.abuso()
+            finally:
+                connection.close()
+
+        inicio = time.perf_counter()
+        try:
+            with ambiente:
+                abusivos = [
+                    threading.Thread(target=abusar, args=(dados,))
+                    for dados in self._preparar_abusivos(prefixo, opts)
+                ]
+                for thread in abusivos:
+                    thread.start()
+                try:
+                    if opts['concorrencia'] == 1:
+                        executar(usuarios[0])
+                    else:
+                        with ThreadPoolExecutor(max_workers=opts['concorrencia']) as executor:
+                            list(executor.map(executar, usuarios))
+                finally:
+                    parar.set()
+                    for thread in abusivos:
+                        thread.join()
+        finally:
+            duracao_total = time.perf_counter() - inicio
+            if not opts['manter_dados']:
+                Usuario.objects.filter(username__startswith=prefixo).delete()
+
+        resultado = self._resumir(amostras, falhas, duracao_total, opts)
+        self._imprimir(resultado)
+        if opts['comparar']:
+            with open(opts['comparar'], encoding='utf-8') as arquivo:
+                self._comparar(resultado, json.load(arquivo))
+        if opts['salvar_baseline']:
+            with open(opts['salvar_baseline'], 'w', encoding='utf-8') as arquivo:
+                json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+            self.stdout.write(f"Baseline gravado em {opts['salvar_baseline']}")
+
+    def _preparar(self, prefixo, opts):
+        """Cria o cardápio, clientes, carrinhos e entregas usados pelos usuários virtuais."""
+        dono = Usuario.objects.create(username=f'{prefixo}-dono', perfil='restaurante')
+        restaurante = Restaurante.objects.create(
+            dono=dono, nome=f'Restaurante {prefixo}', cnpj=prefixo, endereco='Rua da Carga, 1'
+        )
+        produtos = Produto.objects.bulk_create([
+            Produto(restaurante=restaurante, nome=f'Produto {i}', preco=Decimal('10.00') + i, estoque=opts['estoque'])
+            for i in range(opts['produtos'])
+        ])
+
+        usuarios = []
+        for i in range(opts['concorrencia']):
+            cliente = Usuario.objects.create(username=f'{prefixo}-cliente-{i}', perfil='cliente')
+            entregador = Usuario.objects.create(username=f'{prefixo}-entregador-{i}', perfil='entregador')
+            endereco = Endereco.objects.create(
+                usuario=cliente, rua='Rua do Cliente', numero=str(i), bairro='Centro',
+                cidade='São Paulo', estado='SP', cep='01000-000'
+            )
+            carrinho = Carrinho.objects.create(usuario=cliente, restaurante=restaurante)
+            pedido = Pedido.objects.create(usuario=cliente, restaurante=restaurante)
+            entrega = Entrega.objects.create(pedido=pedido, entregador=entregador, status='em_rota')
+            refresh = RefreshToken.for_user(cliente)
+            usuarios.append({
+                'restaurante': str(restaurante.id),
+                'produtos': [str(p.id) for p in produtos],
+                'carrinho': str(carrinho.id),
+                'endereco': str(endereco.id),
+                'entrega': str(entrega.id),
+                'token_cliente': str(refresh.access_token),
+                'token_entregador': str(RefreshToken.for_user(entregador).access_token),
+                'refresh': str(refresh),
+            })
+        return usuarios
+
+    def _preparar_abusivos(self, prefixo, opts):
+        abusivos = []
+        for i in range(opts['abusivos']):
+            usuario = Usuario.objects.create(username=f'{prefixo}-abusivo-{i}', perfil='cliente')
+            usuario.set_password('senha-certa')
+            usuario.save(update_fields=['password'])
+            abusivos.append({
+                'usuario': usuario.username,
+                'token_cliente': str(RefreshToken.for_user(usuario).access_token),
+            })
+        return abusivos
+
+    def _resumir(self, amostras, falhas, duracao_total, opts):
+        passos = {}
+        for passo in PASSOS:
+            tempos = sorted(amostras.get(passo, []))
+            if not tempos:
+                continue
+            passos[passo] = {
+                'requisicoes': len(tempos),
+                'erros': falhas.get(passo, 0),
+                'p50_ms': round(percentil(tempos, 50) * 1000, 3),
+                'p95_ms': round(percentil(tempos, 95) * 1000, 3),
+                'p99_ms': round(percentil(tempos, 99) * 1000, 3),
+                'rps': round(len(tempos) / duracao_total, 2),
+            }
+        return {
+            'alvo': opts['alvo'] or 'test-client',
+            'concorrencia': opts['concorrencia'],
+            'iteracoes': opts['iteracoes'],
+            'duracao_s': round(duracao_total, 3),
+            'passos': passos,
+        }
+
+    def _imprimir(self, resultado):
+        self.stdout.write(
+            f"{'passo':<22} {'req':>7} {'erros':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>9}"
+        )
+        for passo, m in resultado['passos'].items():
+            self.stdout.write(
+                f"{passo:<22} {m['requisicoes']:>7} {m['erros']:>6} {m['p50_ms']:>9.2f}"
+                f" {m['p95_ms']:>9.2f} {m['p99_ms']:>9.2f} {m['rps']:>9.1f}"
+            )
+        self.stdout.write(f"duração total: {resultado['duracao_s']:.2f}s")
+
+    def _comparar(self, resultado, baseline):
+        self.stdout.write(f"\nComparação com o baseline ({baseline.get('alvo')}, concorrência {baseline.get('concorrencia')}):")
+        for passo, atual in resultado['passos'].items():
+            anterior = baseline.get('passos', {}).get(passo)
+            if not anterior:
+                continue
+            variacoes = []
+            for chave in ('p50_ms', 'p95_ms', 'p99_ms', 'rps'):
+                if anterior[chave]:
+                    variacoes.append(f"{chave} {(atual[chave] - anterior[chave]) / anterior[chave] * 100:+.1f}%")
+            self.stdout.write(f"{passo:<22} " + ' | '.join(variacoes))
@@ -0,0 +1,226 @@
+"""
+Métricas por endpoint: latência, consultas SQL, bytes de resposta e status.
+
+Cada thread escreve somente no seu próprio buffer (sem locks); a raspagem
+(``exportar_prometheus``) apenas lê e soma os buffers de todas as threads do
+processo. Os valores são por processo: cada worker expõe os seus.
+"""
+import threading
+from bisect import bisect_left
+from contextvars import ContextVar
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+# Limites (em segundos) dos buckets do histograma de latência
+LIMITES_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+ROTA_NAO_RESOLVIDA = '<nao_resolvida>'
+
+
+class _Serie:
+    __slots__ = ('buckets', 'soma', 'contagem', 'consultas', 'tempo_sql', 'bytes', 'status')
+
+    def __init__(self):
+        self.buckets = [0] * (len(LIMITES_LATENCIA) + 1)
+        self.soma = 0.0
+        self.contagem = 0
+        self.consultas = 0
+        self.tempo_sql = 0.0
+        self.bytes = 0
+        self.status = {}
+
+
+# {thread: buffer} das threads vivas (a inclusão é atômica). A raspagem soma os buffers das
+# threads que terminaram em _encerradas e os tira daqui: os contadores não voltam para trás
+_buffers = {}
+_encerradas = {}
+_trava_raspagem = threading.Lock()
+_local = threading.local()
+
+
+def _buffer_da_thread():
+    try:
+        return _local.series
+    except AttributeError:
+        _local.series = series = {}
+        _buffers[threading.current_thread()] = series
+        return series
+
+
+def registrar(rota, metodo, duracao, status, tamanho, consultas=0, tempo_sql=0.0):
+    """Registra uma requisição no buffer da thread atual."""
+    series = _buffer_da_thread()
+    serie = series.get((rota, metodo))
+    if serie is None:
+        serie = series[(rota, metodo)] = _Serie()
+    serie.buckets[bisect_left(LIMITES_LATENCIA, duracao)] += 1
+    serie.soma += duracao
+    serie.contagem += 1
+    serie.consultas += consultas
+    serie.tempo_sql += tempo_sql
+    serie.bytes += tamanho
+    serie.status[status] = serie.status.get(status, 0) + 1
+
+
+def limpar():
+    """Zera as métricas do processo (usado nos testes)."""
+    with _trava_raspagem:
+        for series in list(_buffers.values()):
+            series.clear()
+        _encerradas.clear()
+
+
+def _somar(total, series):
+    for chave, serie in list(series.items()):
+        acumulado = total.get(chave)
+        if acumulado is None:
+            acumulado = total[chave] = _Serie()
+        for i, valor in enumerate(serie.buckets):
+            acumulado.buckets[i] += valor
+        acumulado.soma += serie.soma
+        acumulado.contagem += serie.contagem
+        acumulado.consultas += serie.consultas
+        acumulado.tempo_sql += serie.tempo_sql
+        acumulado.bytes += serie.bytes
+        for codigo, quantidade in list(serie.status.items()):
+            acumulado.status[codigo] = acumulado.status.get(codigo, 0) + quantidade
+
+
+def _agregar():
+    with _trava_raspagem:
+        for thread, series in list(_buffers.items()):
+            if not thread.is_alive():
+                # Ninguém mais escreve neste buffer
+                _somar(_encerradas, series)
+                del _buffers[thread]
+        total = {}
+        _somar(total, _encerradas)
+        for series in list(_buffers.values()):
+            _somar(total, series)
+    return total
+
+
+def _rotulos(rota, metodo, **extras):
+    pares = [('rota', rota), ('metodo', metodo), *extras.items()]
+    return ','.join(
+        '{}="{}"'.format(nome, str(valor).replace('\\', '\\\\').replace('"', '\\"'))
+        for nome, valor in pares
+    )
+
+
+def exportar_prometheus():
+    """Gera o texto no formato de exposição do Prometheus (versão 0.0.4)."""
+    series = sorted(_agregar().items())
+    linhas = [
+        '# HELP happyfood_http_request_duration_seconds Latência das requisições por rota.',
+        '# TYPE happyfood_http_request_duration_seconds histogram',
+    ]
+    for (rota, metodo), serie in series:
+        acumulado = 0
+        for limite, quantidade in zip((*LIMITES_LATENCIA, '+Inf'), serie.buckets):
+            acumulado += quantidade
+            linhas.append(
+                f'happyfood_http_request_duration_seconds_bucket{{{_rotulos(rota, metodo, le=limite)}}} {acumulado}'
+            )
+        linhas.append(f'happyfood_http_request_duration_seconds_sum{{{_rotulos(rota, metodo)}}} {serie.soma}')
+        linhas.append(f'happyfood_http_request_duration_seconds_count{{{_rotulos(rota, metodo)}}} {serie.contagem}')
+
+    contadores = (
+        ('happyfood_db_queries_total', 'Consultas SQL executadas por rota.', 'consultas'),
+        ('happyfood_db_query_duration_seconds_total', 'Tempo gasto em SQL por rota.', 'tempo_sql'),
+        ('happyfood_http_response_bytes_total', 'Bytes de resposta enviados por rota.', 'bytes'),
+    )
+    for nome, ajuda, atributo in contadores:
+        linhas.append(f'# HELP {nome} {ajuda}')
+        linhas.append(f'# TYPE {nome} counter')
+        for (rota, metodo), serie in series:
+            linhas.append(f'{nome}{{{_rotulos(rota, metodo)}}} {getattr(serie, atributo)}')
+
+    linhas.append('# HELP happyfood_http_responses_total Respostas por rota e status HTTP.')
+    linhas.append('# TYPE happyfood_http_responses_total counter')
+    for (rota, metodo), serie in series:
+        for codigo, quantidade in sorted(serie.status.items()):
+            linhas.append(f'happyfood_http_responses_total{{{_rotulos(rota, metodo, status=codigo)}}} {quantidade}')
+    return '\n'.join(linhas) + '\n'
+
+
+# -----------------------------
+# MIDDLEWARE
+# -----------------------------
+class _ContadorSQL:
+    __slots__ = ('consultas', 'tempo')
+
+    def __init__(self):
+        self.consultas = 0
+        self.tempo = 0.0
+
+
+# Contador da requisição corrente; ContextVar para acompanhar sync_to_async no ASGI
+_contador_atual = ContextVar('happyfood_contador_sql', default=None)
+
+
+def _contar_sql(execute, sql, params, many, context):
+    """Wrapper de ``execute`` que soma consultas e tempo no contador da requisição."""
+    contador = _contador_atual.get()
+    if contador is None:
+        return execute(sql, params, many, context)
+    inicio = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        contador.consultas += 1
+        contador.tempo += perf_counter() - inicio
+
+
+def instalar_contador_sql(sender, connection, **kwargs):
+    """Receiver de ``connection_created``: instala o wrapper uma vez por conexão."""
+    if _contar_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _contar_sql)
+
+
+class MetricasMiddleware:
+    """Registra latência, SQL, bytes e status de cada requisição, por rota resolvida e método"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        contador = _ContadorSQL()
+        token = _contador_atual.set(contador)
+        inicio = perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            duracao = perf_counter() - inicio
+            _contador_atual.reset(token)
+        return self._registrar(request, response, duracao, contador)
+
+    async def __acall__(self, request):
+        contador = _ContadorSQL()
+        token = _contador_atual.set(contador)
+        inicio = perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            duracao = perf_counter() - inicio
+            _contador_atual.reset(token)
+        return self._registrar(request, response, duracao, contador)
+
+    def _registrar(self, request, response, duracao, contador):
+        match = getattr(request, 'resolver_match', None)
+        rota = match.view_name if match is not None else ROTA_NAO_RESOLVIDA
+        if response.streaming:
+            tamanho = int(response.get('Content-Length', 0))
+        else:
+            tamanho = len(response.content)
+        registrar(rota, request.method, duracao, response.status_code, tamanho,
+                  contador.consultas, contador.tempo)
+        return response
@@ -0,0 +1,30 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+
+
+class RotasAssincronasMiddleware:
+    """Sob ASGI, resolve as URLs por ``ASYNC_ROOT_URLCONF`` (views assíncronas de leitura)"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        self._definir_urlconf(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        self._definir_urlconf(request)
+        return await self.get_response(request)
+
+    def _definir_urlconf(self, request):
+        urlconf = getattr(settings, 'ASYNC_ROOT_URLCONF', None)
+        if urlconf and isinstance(request, ASGIRequest):
+            request.urlconf = urlconf
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-19 05:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('food', '0003_carrinho_restaurante_pedido_endereco_entrega_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='pedido',
+            name='numero_pedido',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
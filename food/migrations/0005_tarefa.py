@@ -0,0 +1,32 @@
+# Generated by Django 5.2.6 on 2026-10-19 06:12
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('food', '0004_pedido_numero_pedido_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tarefa',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('nome', models.CharField(max_length=255)),
+                ('fila', models.CharField(default='padrao', max_length=50)),
+                ('argumentos', models.JSONField(default=dict)),
+                ('status', models.CharField(choices=[('pendente', 'Pendente'), ('executando', 'Executando'), ('falhou', 'Falhou')], default='pendente', max_length=20)),
+                ('tentativas', models.PositiveIntegerField(default=0)),
+                ('max_tentativas', models.PositiveIntegerField(default=5)),
+                ('disponivel_em', models.DateTimeField(default=django.utils.timezone.now)),
+                ('erro', models.TextField(blank=True, default='')),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['fila', 'status', 'disponivel_em'], name='food_tarefa_fila_8b43b8_idx')],
+            },
+        ),
+    ]
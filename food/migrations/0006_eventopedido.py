@@ -0,0 +1,24 @@
+# Generated by Django 5.2.6 on 2026-10-19 06:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('food', '0005_tarefa'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventoPedido',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('status_anterior', models.CharField(choices=[('pendente', 'Pendente'), ('confirmado', 'Confirmado'), ('em_preparo', 'Em preparo'), ('a_caminho', 'A caminho'), ('entregue', 'Entregue'), ('cancelado', 'Cancelado')], max_length=30)),
+                ('status_novo', models.CharField(choices=[('pendente', 'Pendente'), ('confirmado', 'Confirmado'), ('em_preparo', 'Em preparo'), ('a_caminho', 'A caminho'), ('entregue', 'Entregue'), ('cancelado', 'Cancelado')], max_length=30)),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('pedido', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='eventos', to='food.pedido')),
+            ],
+        ),
+    ]
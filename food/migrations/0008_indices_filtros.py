@@ -0,0 +1,53 @@
+# Generated by Django 5.2.6 on 2026-10-19 06:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('food', '0007_atualizado_em'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='entrega',
+            index=models.Index(fields=['status', 'inicio'], name='food_entreg_status_d052ed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='entrega',
+            index=models.Index(fields=['inicio'], name='food_entreg_inicio_aed741_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['restaurante', 'status', 'data_referencia'], name='food_pedido_restaur_1e1d32_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['status', 'data_referencia'], name='food_pedido_status_8ab83f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['data_referencia'], name='food_pedido_data_re_ef3d03_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='produto',
+            index=models.Index(fields=['restaurante', 'disponivel', 'preco'], name='food_produt_restaur_887525_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='produto',
+            index=models.Index(fields=['categoria', 'disponivel', 'preco'], name='food_produt_categor_f55141_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='produto',
+            index=models.Index(fields=['disponivel', 'preco'], name='food_produt_disponi_82684c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='produto',
+            index=models.Index(fields=['preco'], name='food_produt_preco_982827_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='restaurante',
+            index=models.Index(fields=['aberto', 'nome'], name='food_restau_aberto_a69381_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-19 06:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('food', '0008_indices_filtros'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='produto',
+            name='estoque',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='produto',
+            name='limite_diario',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
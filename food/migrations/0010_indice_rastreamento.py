@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-19 06:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('food', '0009_produto_estoque'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='rastreamentoentrega',
+            index=models.Index(fields=['entrega', 'registrado_em'], name='food_rastre_entrega_18a7dd_idx'),
+        ),
+    ]
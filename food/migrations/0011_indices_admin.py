@@ -0,0 +1,22 @@
+# Generated by Django 5.2.6 on 2026-10-19 07:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('food', '0010_indice_rastreamento'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='usuario',
+            index=models.Index(fields=['email'], name='food_usuari_email_5101c9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usuario',
+            index=models.Index(fields=['perfil'], name='food_usuari_perfil_3f8b7d_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.6 on 2026-10-19 07:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('food', '0011_indices_admin'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='entrega',
+            name='entregador',
+            field=models.OneToOneField(db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='entregas', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='itempedido',
+            name='produto',
+            field=models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to='food.produto'),
+        ),
+        migrations.AlterField(
+            model_name='pedido',
+            name='restaurante',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='pedidos', to='food.restaurante'),
+        ),
+        migrations.AlterField(
+            model_name='pedido',
+            name='usuario',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='pedidos', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
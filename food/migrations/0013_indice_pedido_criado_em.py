@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-19 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('food', '0012_shards_sem_constraint'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['criado_em'], name='food_pedido_criado__5dfe2e_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.6 on 2026-10-19 08:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('food', '0013_indice_pedido_criado_em'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='entrega',
+            index=models.Index(fields=['fim'], name='food_entreg_fim_54597d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['valor_total'], name='food_pedido_valor_t_f95530_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='produto',
+            index=models.Index(fields=['nome'], name='food_produt_nome_85ee82_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='restaurante',
+            index=models.Index(fields=['nome'], name='food_restau_nome_16faa9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='restaurante',
+            index=models.Index(fields=['criado_em'], name='food_restau_criado__7d5e81_idx'),
+        ),
+    ]
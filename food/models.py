@@ -1,12 +1,17 @@
+from django.conf import settings
 from django.db import models
+from django.db.models import Case, F, Q, Value, When
 from django.contrib.auth.models import BaseUserManager, AbstractUser, Group, Permission
 from django.db.models.signals import pre_save
 from django.dispatch import receiver
-import os
 import uuid
-from django.db import transaction
+from datetime import timedelta
+from django.db import router, transaction
 from django.utils import timezone
 
+from . import senhas
+from .shards import QuerySetShard
+
 
 # -----------------------------
 # USUÁRIOS E PERFIS
@@ -62,10 +67,28 @@ class Usuario(AbstractUser):
     objects = UsuarioManager()
     USERNAME_FIELD = 'username'
     REQUIRED_FIELDS = ['email']
-    
+
+    class Meta(AbstractUser.Meta):
+        # Busca por e-mail e filtro por perfil no admin (ver admin.py)
+        indexes = [models.Index(fields=["email"]), models.Index(fields=["perfil"])]
+
     def __str__(self):
         return self.username or self.email
 
+    # Hash no pool de food/senhas.py, fora da thread da requisição
+    def set_password(self, raw_password):
+        self.password = senhas.gerar_hash(raw_password)
+        self._password = raw_password
+
+    def check_password(self, raw_password):
+        valida, novo_hash = senhas.verificar(raw_password, self.password)
+        if novo_hash:
+            # Algoritmo ou custo mudou no settings: refaz o hash com a senha que acabou de conferir
+            self.password = novo_hash
+            self._password = None
+            self.save(update_fields=['password'])
+        return valida
+
 @receiver(pre_save, sender=Usuario)
 def apagar_foto_antiga(sender, instance, **kwargs):
     if not instance.pk:
@@ -78,8 +101,9 @@ def apagar_foto_antiga(sender, instance, **kwargs):
 
     nova_foto = instance.foto
     if foto_antiga and foto_antiga != nova_foto:
-        if os.path.isfile(foto_antiga.path):
-            os.remove(foto_antiga.path)
+        # O arquivo é apagado por um worker, depois do commit
+        from .tarefas import apagar_arquivo
+        apagar_arquivo.enfileirar(foto_antiga.name)
 
 # -----------------------------
 # RESTAURANTES E CARDÁPIO
@@ -94,6 +118,15 @@ class Restaurante(models.Model):
     endereco = models.TextField()
     aberto = models.BooleanField(default=True)
     criado_em = models.DateTimeField(auto_now_add=True)
+    atualizado_em = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        # Filtros e ordenações da listagem (ver filtros.py); o dono já tem o índice da FK
+        indexes = [
+            models.Index(fields=["aberto", "nome"]),
+            models.Index(fields=["nome"]),
+            models.Index(fields=["criado_em"]),
+        ]
 
     def __str__(self):
         return self.nome
@@ -107,6 +140,10 @@ class CategoriaProduto(models.Model):
         return self.nome
 
 
+class EstoqueInsuficiente(ValueError):
+    pass
+
+
 class Produto(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     restaurante = models.ForeignKey(
@@ -120,10 +157,69 @@ class Produto(models.Model):
     preco = models.DecimalField(max_digits=10, decimal_places=2)
     imagem = models.ImageField(upload_to="produtos/", blank=True, null=True)
     disponivel = models.BooleanField(default=True)
+    # Porções restantes; None = sem controle de estoque. Ao zerar, o produto fica indisponível
+    estoque = models.PositiveIntegerField(null=True, blank=True)
+    # Porções por dia: o comando repor_estoque volta o estoque para este valor
+    limite_diario = models.PositiveIntegerField(null=True, blank=True)
+    atualizado_em = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        # Filtros da listagem (ver filtros.py): igualdades primeiro, a faixa de preço por último
+        indexes = [
+            models.Index(fields=["restaurante", "disponivel", "preco"]),
+            models.Index(fields=["categoria", "disponivel", "preco"]),
+            models.Index(fields=["disponivel", "preco"]),
+            models.Index(fields=["preco"]),
+            # Ordenação por nome (?ordering=nome)
+            models.Index(fields=["nome"]),
+        ]
 
     def __str__(self):
         return f"{self.nome} - {self.restaurante.nome}"
 
+    @classmethod
+    def reservar_estoque(cls, quantidades):
+        """
+        Baixa o estoque dos produtos (``{produto_id: quantidade}``, os que têm estoque controlado)
+        num único UPDATE condicional, sem ler e travar as linhas antes; quem zera o estoque
+        também marca o produto como indisponível. Deve rodar dentro da transação do checkout, o
+        mais perto possível do commit (as linhas ficam travadas do UPDATE até lá).
+        EstoqueInsuficiente se faltar algum (a transação deve ser desfeita).
+        """
+        if not quantidades:
+            return
+        condicao = Q()
+        baixa, esgota = [], []
+        for produto_id, quantidade in quantidades.items():
+            condicao |= Q(pk=produto_id, estoque__gte=quantidade)
+            baixa.append(When(pk=produto_id, then=Value(quantidade)))
+            esgota.append(When(pk=produto_id, estoque=quantidade, then=Value(False)))
+        agora = timezone.now()
+        alterados = cls.objects.filter(condicao).update(
+            estoque=F('estoque') - Case(*baixa),
+            disponivel=Case(*esgota, default=F('disponivel')),
+            atualizado_em=agora,
+        )
+        if alterados == len(quantidades):
+            return
+        # Só aqui a consulta. As linhas baixadas acima têm atualizado_em == agora; das outras,
+        # as que deixaram de ter estoque controlado não contam
+        faltando = cls.objects.filter(pk__in=quantidades, estoque__isnull=False).exclude(
+            atualizado_em=agora
+        ).order_by('nome').values_list('nome', flat=True)
+        if faltando:
+            nomes = ', '.join(f"'{nome}'" for nome in faltando)
+            raise EstoqueInsuficiente(f"Estoque insuficiente para {nomes}.")
+
+    @classmethod
+    def repor_estoque_diario(cls):
+        """Volta o estoque dos produtos com ``limite_diario`` e reativa os que tinham esgotado."""
+        return cls.objects.filter(limite_diario__isnull=False).update(
+            estoque=F('limite_diario'),
+            disponivel=Case(When(estoque=0, then=Value(True)), default=F('disponivel')),
+            atualizado_em=timezone.now(),
+        )
+
 # -----------------------------
 # OPÇÕES ADICIONAIS DO PRODUTO
 # -----------------------------
@@ -134,6 +230,7 @@ class GrupoOpcao(models.Model):
     nome = models.CharField(max_length=100)
     obrigatorio = models.BooleanField(default=False)
     multipla_escolha = models.BooleanField(default=False)
+    atualizado_em = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.nome
@@ -144,6 +241,7 @@ class Opcao(models.Model):
     grupo = models.ForeignKey(GrupoOpcao, on_delete=models.CASCADE, related_name='opcoes')
     nome = models.CharField(max_length=100)
     preco_adicional = models.DecimalField(max_digits=8, decimal_places=2, default=0.00)
+    atualizado_em = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.nome
@@ -190,9 +288,10 @@ class ItemCarrinho(models.Model):
                 raise ValueError(f"O grupo de opções '{grupo.nome}' é obrigatório.")
 
     def subtotal(self):
-        preco_base = self.produto.preco
-        adicionais = sum(op.preco_adicional for op in self.opcoes_escolhidas.all())
-        return (preco_base + adicionais) * self.quantidade
+        from .precos import tabela
+        # Só os ids das opções (do prefetch, se houver); os preços vêm da tabela em cache
+        opcoes = [op.pk for op in self.opcoes_escolhidas.all()]
+        return tabela(self.produto_id).subtotal(opcoes, self.quantidade)
 
     def __str__(self):
         return f"{self.quantidade}x {self.produto.nome}"
@@ -208,24 +307,45 @@ class Pedido(models.Model):
         ("entregue", "Entregue"),
         ("cancelado", "Cancelado"),
     ]
-
+    # Status seguintes permitidos a partir de cada status; entregue e cancelado são finais
+    TRANSICOES = {
+        "pendente": ("confirmado", "cancelado"),
+        "confirmado": ("em_preparo", "cancelado"),
+        "em_preparo": ("a_caminho", "cancelado"),
+        "a_caminho": ("entregue",),
+    }
+
+    # Usuário e restaurante ficam no default, o pedido no shard do restaurante: sem constraint (ver shards.py)
     usuario = models.ForeignKey(
-        Usuario, on_delete=models.CASCADE, related_name="pedidos"
+        Usuario, on_delete=models.CASCADE, related_name="pedidos", db_constraint=False
     )
-    numero_pedido = models.PositiveIntegerField(default=1)
+    numero_pedido = models.PositiveIntegerField(default=0)  # 0 = ainda não numerado (ver save)
     restaurante = models.ForeignKey(
-        Restaurante, on_delete=models.CASCADE, related_name="pedidos"
+        Restaurante, on_delete=models.CASCADE, related_name="pedidos", db_constraint=False
     )
     valor_total = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     status = models.CharField(max_length=30, choices=STATUS_CHOICES, default="pendente")
     criado_em = models.DateTimeField(auto_now_add=True)
+    atualizado_em = models.DateTimeField(auto_now=True)
     data_referencia = models.DateField()
     endereco_entrega = models.TextField(blank=True, null=True)
     endereco_origem = models.TextField(blank=True, null=True)
 
+    objects = QuerySetShard.as_manager()
+
     class Meta:
        # Isso aqui é para não repetir o mesmo número de pedido para o mesmo restaurante
        unique_together = ('restaurante', 'numero_pedido', 'data_referencia')
+       # Filtros da listagem (ver filtros.py): restaurante e status, com a faixa de datas por último
+       indexes = [
+           models.Index(fields=["restaurante", "status", "data_referencia"]),
+           models.Index(fields=["status", "data_referencia"]),
+           models.Index(fields=["data_referencia"]),
+           # Janela das recomendações (recomendacoes.py): só os pedidos que entraram ou saíram dela
+           models.Index(fields=["criado_em"]),
+           # Ordenação por valor (?ordering=valor_total)
+           models.Index(fields=["valor_total"]),
+       ]
 
     def __str__(self):
         return f"Pedido {self.numero_pedido:04d} - {self.restaurante.nome}"
@@ -235,8 +355,9 @@ class Pedido(models.Model):
             self.data_referencia = timezone.now().date()
 
         if not self.numero_pedido:
-            with transaction.atomic():
-                ultimo_pedido = Pedido.objects.select_for_update().filter(restaurante=self.restaurante, data_referencia=self.data_referencia).order_by('-numero_pedido').first()
+            banco = kwargs.get('using') or router.db_for_write(Pedido, instance=self)
+            with transaction.atomic(using=banco):
+                ultimo_pedido = Pedido.objects.using(banco).select_for_update().filter(restaurante=self.restaurante, data_referencia=self.data_referencia).order_by('-numero_pedido').first()
                 if ultimo_pedido:
                     novo_numero = ultimo_pedido.numero_pedido + 1
                     if novo_numero > 99999:
@@ -245,6 +366,30 @@ class Pedido(models.Model):
                     novo_numero = 1
                 self.numero_pedido = novo_numero
         super().save(*args, **kwargs)
+
+    def transicionar(self, novo_status, status_esperado=None):
+        """
+        Muda o status com um UPDATE condicional (compare-and-set) e registra o evento.
+        Devolve False se outra requisição mudou o status antes; ValueError se a transição não é permitida.
+        """
+        esperado = status_esperado or self.status
+        if novo_status not in self.TRANSICOES.get(esperado, ()):
+            raise ValueError(f"Transição de status inválida: {esperado} → {novo_status}.")
+
+        # O evento vai no mesmo banco (shard) do pedido, na mesma transação
+        banco = self._state.db
+        with transaction.atomic(using=banco):
+            alterados = Pedido.objects.using(banco).filter(pk=self.pk, status=esperado).update(
+                status=novo_status, atualizado_em=timezone.now()
+            )
+            if not alterados:
+                return False
+            EventoPedido.objects.using(banco).create(
+                pedido_id=self.pk, status_anterior=esperado, status_novo=novo_status
+            )
+        self.status = novo_status
+        return True
+
     @property
     def numero_formatado(self):
         return f"{self.numero_pedido:05d}"
@@ -253,35 +398,69 @@ class Pedido(models.Model):
 class ItemPedido(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     pedido = models.ForeignKey(Pedido, on_delete=models.CASCADE, related_name="itens")
-    produto = models.ForeignKey(Produto, on_delete=models.SET_NULL, null=True)
+    produto = models.ForeignKey(Produto, on_delete=models.SET_NULL, null=True, db_constraint=False)
     quantidade = models.PositiveIntegerField()
     preco_unitario = models.DecimalField(max_digits=10, decimal_places=2)
     observacao = models.TextField(blank=True, null=True)
     opcoes = models.JSONField(default=list)
 
-    @classmethod
-    def from_item_carrinho(cls, item_carrinho, pedido):
-        opcoes_data = [
-            {"nome": op.nome, "preco_adicional": str(op.preco_adicional)}
-            for op in item_carrinho.opcoes_escolhidas.all()
-        ]
+    objects = QuerySetShard.as_manager()
 
-        adicionais = sum(op['preco_adicional'] for op in opcoes_data)
+    @classmethod
+    def from_item_carrinho(cls, item_carrinho, pedido, tabela=None):
+        """``tabela``: a ``precos.TabelaPrecos`` do produto, se já carregada (checkout de vários itens)."""
+        if tabela is None:
+            from .precos import tabela as tabela_do_produto
+            tabela = tabela_do_produto(item_carrinho.produto_id)
+        opcoes = [op.pk for op in item_carrinho.opcoes_escolhidas.all()]
 
         return cls(
             pedido = pedido,
-            produto=item_carrinho.produto,
+            produto_id=item_carrinho.produto_id,
             quantidade=item_carrinho.quantidade,
-            preco_unitario=item_carrinho.produto.preco + float(adicionais),
+            preco_unitario=tabela.preco_unitario(opcoes),
             observacao=item_carrinho.observacao,
-            opcoes=opcoes_data
+            opcoes=tabela.snapshot_opcoes(opcoes)
         )
 
     def subtotal(self):
         return self.quantidade * self.preco_unitario
 
     def __str__(self):
-        return f"{self.quantidade}x {self.produto.nome}"
+        # O produto pode ter sido apagado depois do pedido (SET_NULL)
+        return f"{self.quantidade}x {self.produto.nome if self.produto_id else 'produto removido'}"
+
+class EventoPedido(models.Model):
+    """
+    Outbox das mudanças de status; consumidores leem em ordem de id a partir do último que viram.
+
+    Ids são reservados no INSERT, mas o commit de um id menor pode vir depois do de um maior. Por
+    isso ``desde`` só entrega eventos criados há mais de ``EVENTOS_ATRASO_LEITURA`` segundos, para o
+    cursor não passar por cima dos que ainda não apareceram. É um limite, não uma garantia: um evento
+    cuja transação leva mais que isso entre o INSERT e o commit pode ficar atrás do cursor e não ser
+    entregue a quem já passou dele. ``transicionar`` grava o evento no fim de uma transação curta;
+    quem chamá-la dentro de uma transação maior deve aumentar o atraso.
+    """
+    id = models.BigAutoField(primary_key=True)
+    pedido = models.ForeignKey(Pedido, on_delete=models.CASCADE, related_name="eventos")
+    status_anterior = models.CharField(max_length=30, choices=Pedido.STATUS_CHOICES)
+    status_novo = models.CharField(max_length=30, choices=Pedido.STATUS_CHOICES)
+    criado_em = models.DateTimeField(auto_now_add=True)
+
+    objects = QuerySetShard.as_manager()
+
+    @classmethod
+    def desde(cls, cursor, limite=100, pedidos=None):
+        """Eventos depois do id ``cursor`` (opcionalmente só dos ``pedidos``, no banco deles), em ordem."""
+        atraso = timedelta(seconds=settings.EVENTOS_ATRASO_LEITURA)
+        eventos = cls.objects.filter(id__gt=cursor, criado_em__lte=timezone.now() - atraso)
+        if pedidos is not None:
+            eventos = eventos.using(pedidos.db).filter(pedido__in=pedidos)
+        return eventos.order_by("id")[:limite]
+
+    def __str__(self):
+        return f"Pedido {self.pedido_id}: {self.status_anterior} → {self.status_novo}"
+
 
 # -----------------------------
 # PAGAMENTO
@@ -303,8 +482,10 @@ class Pagamento(models.Model):
     status = models.CharField(max_length=30, default="pendente")
     criado_em = models.DateTimeField(auto_now_add=True)
 
+    objects = QuerySetShard.as_manager()
+
     def __str__(self):
-        return f"Pagamento {self.metodo} - Pedido {self.pedido.id}"
+        return f"Pagamento {self.metodo} - Pedido {self.pedido_id}"
 
 
 # -----------------------------
@@ -323,16 +504,28 @@ class Entrega(models.Model):
         Pedido, on_delete=models.CASCADE, related_name="entrega"
     )
     entregador = models.OneToOneField(
-        Usuario, on_delete=models.SET_NULL, null=True, related_name="entregas"
+        Usuario, on_delete=models.SET_NULL, null=True, related_name="entregas", db_constraint=False
     )
     status = models.CharField(
         max_length=30, choices=STATUS_CHOICES, default="aguardando"
     )
     inicio = models.DateTimeField(null=True, blank=True)
     fim = models.DateTimeField(null=True, blank=True)
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    objects = QuerySetShard.as_manager()
+
+    class Meta:
+        # Filtros da listagem (ver filtros.py); entregador e pedido já são únicos
+        indexes = [
+            models.Index(fields=["status", "inicio"]),
+            models.Index(fields=["inicio"]),
+            # Ordenação por término (?ordering=fim)
+            models.Index(fields=["fim"]),
+        ]
 
     def __str__(self):
-        return f"Entrega #{self.id} - Pedido {self.pedido.id}"
+        return f"Entrega #{self.id} - Pedido {self.pedido_id}"
 
 
 class RastreamentoEntrega(models.Model):
@@ -344,6 +537,12 @@ class RastreamentoEntrega(models.Model):
     longitude = models.DecimalField(max_digits=9, decimal_places=6)
     registrado_em = models.DateTimeField(auto_now_add=True)
 
+    objects = QuerySetShard.as_manager()
+
+    class Meta:
+        # Rota de uma entrega em ordem (e o ponto mais recente) sem ordenar a tabela
+        indexes = [models.Index(fields=["entrega", "registrado_em"])]
+
     def __str__(self):
         return f"{self.latitude}, {self.longitude}"
 
@@ -428,4 +627,34 @@ class Endereco(models.Model):
 
 
     def __str__(self):
-        return f"[{self.apelido}] ({self.cep}) {self.rua}, {self.numero} - {self.cidade}/{self.estado}"
\ No newline at end of file
+        return f"[{self.apelido}] ({self.cep}) {self.rua}, {self.numero} - {self.cidade}/{self.estado}"
+
+
+# -----------------------------
+# TAREFAS EM SEGUNDO PLANO
+# -----------------------------
+class Tarefa(models.Model):
+    """Fila do broker padrão (``food.fila.BrokerBanco``); tarefas concluídas são apagadas."""
+    STATUS_CHOICES = [
+        ("pendente", "Pendente"),
+        ("executando", "Executando"),
+        ("falhou", "Falhou"),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    nome = models.CharField(max_length=255)
+    fila = models.CharField(max_length=50, default="padrao")
+    argumentos = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pendente")
+    tentativas = models.PositiveIntegerField(default=0)
+    max_tentativas = models.PositiveIntegerField(default=5)
+    # Próxima execução; enquanto executa, o prazo da reserva do worker
+    disponivel_em = models.DateTimeField(default=timezone.now)
+    erro = models.TextField(blank=True, default="")
+    criado_em = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["fila", "status", "disponivel_em"])]
+
+    def __str__(self):
+        return f"{self.nome} ({self.status}, tentativa {self.tentativas}/{self.max_tentativas})"
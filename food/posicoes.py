@@ -0,0 +1,41 @@
+"""
+Última posição das entregas em andamento, no cache.
+
+``atualizar_localizacao`` grava aqui cada ponto, já no formato da resposta, além de inserir o
+``RastreamentoEntrega``; ``posicao_atual`` só lê daqui, sem consultar o banco. Cada entrega
+ocupa uma entrada de tamanho fixo, que sai do cache quando a entrega é concluída ou depois de
+``TEMPO_POSICAO`` sem pontos novos: só as entregas ativas ficam no cache. O histórico completo
+continua na tabela (``?expand=rastreamentos``), fora do caminho de leitura da posição.
+"""
+from django.core.cache import cache
+
+from .serializers_leitura import _COORDENADA, _data_hora, _decimal
+
+TEMPO_POSICAO = 2 * 60 * 60
+
+
+def _chave(entrega_id):
+    return f'entrega:{entrega_id}:posicao'
+
+
+def gravar(entrega_id, latitude, longitude, registrado_em, previsao_chegada=None):
+    cache.set(_chave(entrega_id), {
+        'entrega': str(entrega_id),
+        'latitude': _decimal(latitude, _COORDENADA),
+        'longitude': _decimal(longitude, _COORDENADA),
+        'registrado_em': _data_hora(registrado_em),
+        'previsao_chegada': _data_hora(previsao_chegada),
+    }, TEMPO_POSICAO)
+
+
+def ler(entrega_id):
+    """Última posição da entrega ou ``None`` (sem pontos recentes, concluída ou inexistente)."""
+    return cache.get(_chave(entrega_id))
+
+
+async def aler(entrega_id):
+    return await cache.aget(_chave(entrega_id))
+
+
+def remover(entrega_id):
+    cache.delete(_chave(entrega_id))
@@ -0,0 +1,97 @@
+"""
+Preço de um produto com as opções escolhidas.
+
+A tabela de cada produto (preço base e o adicional de cada opção dos seus grupos, em
+``Decimal``) é montada uma vez, com duas consultas para qualquer número de produtos, e fica no
+cache do Django até um sinal (``sinais.py``) invalidá-la. Com a tabela em mãos, o preço de uma
+escolha é uma soma sobre as opções escolhidas, sem consulta. Carrinho (em cache e no banco),
+checkout e ``Pedido.valor_total`` usam este módulo, para o preço mostrado ser o cobrado.
+"""
+import uuid
+from dataclasses import dataclass
+from decimal import Decimal
+
+from django.core.cache import cache
+
+from .models import Produto, Opcao
+
+TEMPO_TABELA = 60 * 60
+
+
+@dataclass(frozen=True)
+class TabelaPrecos:
+    produto_id: str
+    preco: Decimal
+    # {opcao_id: (nome, preco_adicional)} de todas as opções dos grupos do produto
+    opcoes: dict
+
+    def adicionais(self, opcoes_ids, ignorar_ausentes=False):
+        """Soma dos adicionais; ValueError para opção de outro produto, a não ser que ignorada."""
+        total = Decimal('0')
+        for opcao_id in opcoes_ids:
+            opcao = self.opcoes.get(str(opcao_id))
+            if opcao is not None:
+                total += opcao[1]
+            elif not ignorar_ausentes:
+                raise ValueError(f"A opção '{opcao_id}' não pertence ao produto.")
+        return total
+
+    def preco_unitario(self, opcoes_ids, ignorar_ausentes=False):
+        return self.preco + self.adicionais(opcoes_ids, ignorar_ausentes)
+
+    def subtotal(self, opcoes_ids, quantidade, ignorar_ausentes=False):
+        return self.preco_unitario(opcoes_ids, ignorar_ausentes) * quantidade
+
+    def snapshot_opcoes(self, opcoes_ids):
+        """As opções no formato gravado em ``ItemPedido.opcoes``."""
+        return [
+            {'nome': self.opcoes[str(opcao_id)][0], 'preco_adicional': str(self.opcoes[str(opcao_id)][1])}
+            for opcao_id in opcoes_ids
+        ]
+
+
+def _chave(produto_id):
+    return f'precos:{produto_id}'
+
+
+def _ids_validos(ids):
+    validos = set()
+    for valor in ids:
+        try:
+            validos.add(str(uuid.UUID(str(valor))))
+        except ValueError:
+            pass
+    return validos
+
+
+def compilar(produto_ids):
+    """Monta as tabelas dos produtos direto do banco (os inexistentes ficam de fora)."""
+    opcoes = {}
+    for opcao_id, produto_id, nome, preco_adicional in Opcao.objects.filter(
+        grupo__produto_id__in=produto_ids
+    ).values_list('pk', 'grupo__produto_id', 'nome', 'preco_adicional'):
+        opcoes.setdefault(str(produto_id), {})[str(opcao_id)] = (nome, preco_adicional)
+    return {
+        str(produto_id): TabelaPrecos(str(produto_id), preco, opcoes.get(str(produto_id), {}))
+        for produto_id, preco in Produto.objects.filter(pk__in=produto_ids).values_list('pk', 'preco')
+    }
+
+
+def tabelas(produto_ids):
+    """Tabelas de preço por id de produto; só vai ao banco nas que não estão em cache."""
+    chaves = {_chave(produto_id): produto_id for produto_id in _ids_validos(produto_ids)}
+    encontradas = cache.get_many(chaves)
+    faltando = [produto_id for chave, produto_id in chaves.items() if chave not in encontradas]
+    if faltando:
+        novas = {_chave(produto_id): tabela for produto_id, tabela in compilar(faltando).items()}
+        cache.set_many(novas, TEMPO_TABELA)
+        encontradas.update(novas)
+    return {chaves[chave]: tabela for chave, tabela in encontradas.items()}
+
+
+def tabela(produto_id):
+    return tabelas([produto_id]).get(str(produto_id))
+
+
+def invalidar(produto_ids):
+    cache.delete_many([_chave(produto_id) for produto_id in produto_ids])
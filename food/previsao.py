@@ -0,0 +1,241 @@
+"""
+Previsão de chegada (ETA) das entregas.
+
+Cada entrega em andamento tem um estado no cache, atualizado a cada ponto de GPS
+(``registrar_ponto``) sem reler o histórico: último ponto, distância percorrida e uma média
+móvel exponencial da velocidade. O histórico de cada restaurante (mediana da duração e da
+distância das entregas concluídas) é calculado em lote com NumPy (``calcular_historico``,
+comando ``calcular_historico_entregas``) e também fica no cache. A previsão combina os dois:
+com poucos pontos vale o histórico; conforme os pontos chegam, pesa a velocidade atual.
+
+A previsão é guardada como horário absoluto no momento do ponto, então não muda entre um
+ponto e outro (o ETag da entrega continua valendo) e servi-la é só uma leitura do cache.
+"""
+import math
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core.cache import cache
+from django.db.models import F
+from django.utils import timezone
+
+from . import shards
+from .models import Entrega, RastreamentoEntrega
+
+RAIO_TERRA = 6_371_000  # metros
+# Constante de tempo (s) da média móvel da velocidade: pontos mais velhos que isso pesam pouco
+TAU_VELOCIDADE = 120
+# Acima disso (m/s, ~145 km/h) o trecho é salto de GPS e não entra na velocidade
+VELOCIDADE_MAXIMA = 40
+# Trechos com velocidade medida até a previsão pesar metade histórico, metade velocidade
+PESO_HISTORICO = 5
+# Restaurantes com menos entregas que isso usam o histórico geral
+MINIMO_ENTREGAS = 5
+JANELA_HISTORICO = 30  # dias
+TEMPO_ESTADO = 12 * 60 * 60
+TEMPO_HISTORICO = 2 * 24 * 60 * 60
+_HISTORICO_GERAL = '*'
+
+
+def _chave_estado(entrega_id):
+    return f'entrega:{entrega_id}:eta'
+
+
+def _chave_historico(restaurante_id):
+    return f'eta:historico:{restaurante_id}'
+
+
+def distancia(lat1, lon1, lat2, lon2):
+    """Distância em metros (haversine) entre dois pontos em graus."""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * RAIO_TERRA * math.asin(math.sqrt(a))
+
+
+def distancias(lat1, lon1, lat2, lon2):
+    """``distancia`` vetorizada sobre arrays NumPy."""
+    import numpy as np
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * RAIO_TERRA * np.arcsin(np.sqrt(a))
+
+
+# -----------------------------
+# ESTADO DA ENTREGA
+# -----------------------------
+def atualizar_estado(estado, latitude, longitude, instante):
+    """Incorpora um ponto (graus, timestamp) ao estado; pontos fora de ordem são ignorados."""
+    if estado['t'] is None:
+        return {**estado, 'lat': latitude, 'lon': longitude, 't': instante, 'pontos': 1}
+    intervalo = instante - estado['t']
+    if intervalo <= 0:
+        return estado
+
+    trecho = distancia(estado['lat'], estado['lon'], latitude, longitude)
+    novo = {**estado, 'lat': latitude, 'lon': longitude, 't': instante, 'pontos': estado['pontos'] + 1}
+    velocidade = trecho / intervalo
+    if velocidade > VELOCIDADE_MAXIMA:
+        return novo
+    novo['percorrido'] = estado['percorrido'] + trecho
+    # Média móvel com peso pelo tempo: GPS com intervalos irregulares não distorce a média
+    peso = 1 - math.exp(-intervalo / TAU_VELOCIDADE)
+    anterior = estado['velocidade']
+    novo['velocidade'] = velocidade if anterior is None else anterior + peso * (velocidade - anterior)
+    novo['trechos'] = estado['trechos'] + 1
+    return novo
+
+
+def prever(estado, historico):
+    """Horário previsto de chegada (timestamp), ou ``None`` sem histórico para comparar."""
+    if not historico:
+        return None
+    previsao = estado['inicio'] + historico['duracao']
+    if historico['distancia'] and estado['velocidade']:
+        restante = max(0.0, historico['distancia'] - estado['percorrido'])
+        pela_velocidade = estado['t'] + restante / estado['velocidade']
+        peso = estado['trechos'] / (estado['trechos'] + PESO_HISTORICO)
+        previsao = peso * pela_velocidade + (1 - peso) * previsao
+    # Ainda não chegou: a previsão não fica antes do último ponto
+    return max(previsao, estado['t'])
+
+
+def registrar_ponto(entrega, latitude, longitude, registrado_em):
+    """Atualiza o estado da entrega com um novo ponto de GPS e devolve a previsão (datetime)."""
+    restaurante_id = str(entrega.pedido.restaurante_id)
+    chave = _chave_estado(entrega.pk)
+    chaves_historico = (_chave_historico(restaurante_id), _chave_historico(_HISTORICO_GERAL))
+    encontrados = cache.get_many([chave, *chaves_historico])
+    if chaves_historico[1] not in encontrados:
+        agendar_historico()
+
+    instante = registrado_em.timestamp()
+    estado = encontrados.get(chave) or {
+        'restaurante': restaurante_id,
+        'inicio': entrega.inicio.timestamp() if entrega.inicio else instante,
+        'lat': None, 'lon': None, 't': None,
+        'pontos': 0, 'trechos': 0, 'percorrido': 0.0, 'velocidade': None, 'previsao': None,
+    }
+    estado = atualizar_estado(estado, float(latitude), float(longitude), instante)
+    historico = encontrados.get(chaves_historico[0]) or encontrados.get(chaves_historico[1])
+    estado['previsao'] = prever(estado, historico)
+    cache.set(chave, estado, TEMPO_ESTADO)
+    return _data(estado['previsao'])
+
+
+def _data(timestamp):
+    return None if timestamp is None else datetime.fromtimestamp(timestamp, dt_timezone.utc)
+
+
+def previsoes(entregas):
+    """``{id: datetime | None}`` das entregas, numa ida ao cache; entregues não têm previsão."""
+    chaves = {_chave_estado(entrega.pk): entrega.pk for entrega in entregas if entrega.status != 'entregue'}
+    resultado = dict.fromkeys((entrega.pk for entrega in entregas), None)
+    for chave, estado in cache.get_many(chaves).items():
+        resultado[chaves[chave]] = _data(estado['previsao'])
+    return resultado
+
+
+async def aprevisao(entrega_id, status):
+    """Previsão de uma entrega pelo cache assíncrono."""
+    if status == 'entregue':
+        return None
+    estado = await cache.aget(_chave_estado(entrega_id))
+    return None if estado is None else _data(estado['previsao'])
+
+
+# -----------------------------
+# HISTÓRICO POR RESTAURANTE
+# -----------------------------
+def _medianas(grupos, valores, total_grupos):
+    """Mediana de ``valores`` por grupo (inteiros 0..total_grupos-1) e a contagem de cada grupo."""
+    import numpy as np
+    ordem = np.lexsort((valores, grupos))
+    grupos, valores = grupos[ordem], valores[ordem]
+    contagem = np.bincount(grupos, minlength=total_grupos)
+    inicio = np.concatenate(([0], np.cumsum(contagem)[:-1]))
+    medianas = np.full(total_grupos, np.nan)
+    tem = contagem > 0
+    baixo = inicio[tem] + (contagem[tem] - 1) // 2
+    alto = inicio[tem] + contagem[tem] // 2
+    medianas[tem] = (valores[baixo] + valores[alto]) / 2
+    return medianas, contagem
+
+
+def calcular_historico(dias=JANELA_HISTORICO):
+    """
+    Mediana da duração (s) e da distância percorrida (m) das entregas concluídas nos últimos
+    ``dias``, por restaurante e geral. Devolve ``{restaurante_id | '*': historico}``.
+    """
+    # Só o cálculo em lote usa NumPy; o caminho das requisições não paga a importação
+    import numpy as np
+
+    limite = timezone.now() - timedelta(days=dias)
+    concluidas = Entrega.objects.filter(
+        status='entregue', inicio__isnull=False, fim__gte=limite, fim__gt=F('inicio'),
+    )
+    # Cada entrega e seus pontos ficam num só shard: os pontos continuam agrupados por entrega
+    linhas, pontos = [], []
+    for parte in shards.espalhar(concluidas):
+        linhas += parte.values_list('id', 'pedido__restaurante_id', 'inicio', 'fim')
+        pontos += (
+            RastreamentoEntrega.objects.using(parte.db).filter(entrega__in=parte)
+            .order_by('entrega_id', 'registrado_em')
+            .values_list('entrega_id', 'latitude', 'longitude', 'registrado_em')
+        )
+    if not linhas:
+        return {}
+
+    ids = np.array([str(linha[0]) for linha in linhas])
+    restaurantes, grupo = np.unique([str(linha[1]) for linha in linhas], return_inverse=True)
+    duracoes = np.fromiter(((linha[3] - linha[2]).total_seconds() for linha in linhas), float, len(linhas))
+
+    percorrido = np.zeros(len(linhas))
+    if len(pontos) > 1:
+        de_quem = np.array([str(ponto[0]) for ponto in pontos])
+        lat = np.fromiter((ponto[1] for ponto in pontos), float, len(pontos))
+        lon = np.fromiter((ponto[2] for ponto in pontos), float, len(pontos))
+        instante = np.fromiter((ponto[3].timestamp() for ponto in pontos), float, len(pontos))
+        ordem = np.argsort(ids)
+        entrega = ordem[np.searchsorted(ids, de_quem, sorter=ordem)]
+
+        trechos = distancias(lat[:-1], lon[:-1], lat[1:], lon[1:])
+        intervalos = np.maximum(np.diff(instante), 1e-3)
+        validos = (entrega[1:] == entrega[:-1]) & (trechos / intervalos <= VELOCIDADE_MAXIMA)
+        percorrido = np.bincount(entrega[1:][validos], weights=trechos[validos], minlength=len(linhas))
+
+    total = len(restaurantes)
+    duracao, contagem = _medianas(grupo, duracoes, total)
+    com_gps = percorrido > 0
+    distancia_mediana, _ = _medianas(grupo[com_gps], percorrido[com_gps], total)
+
+    def historico(duracao, distancia, entregas):
+        return {
+            'duracao': float(duracao),
+            'distancia': None if np.isnan(distancia) else float(distancia),
+            'entregas': int(entregas),
+        }
+
+    resultado = {
+        restaurante: historico(duracao[i], distancia_mediana[i], contagem[i])
+        for i, restaurante in enumerate(restaurantes) if contagem[i] >= MINIMO_ENTREGAS
+    }
+    resultado[_HISTORICO_GERAL] = historico(
+        np.median(duracoes), np.median(percorrido[com_gps]) if com_gps.any() else np.nan, len(linhas),
+    )
+    return resultado
+
+
+def atualizar_historico(dias=JANELA_HISTORICO):
+    """Recalcula o histórico e grava no cache; devolve o que foi calculado."""
+    resultado = calcular_historico(dias)
+    cache.set_many({_chave_historico(chave): valor for chave, valor in resultado.items()}, TEMPO_HISTORICO)
+    if not resultado:
+        # Sem entregas concluídas: marca o geral como vazio para não reagendar a cada ponto
+        cache.set(_chave_historico(_HISTORICO_GERAL), {}, TEMPO_HISTORICO)
+    return resultado
+
+
+def agendar_historico():
+    """Cache sem o histórico (expirou ou foi limpo): um worker recalcula, uma vez."""
+    if cache.add('eta:historico:agendado', 1, 10 * 60):
+        from .tarefas import atualizar_historico_entregas
+        atualizar_historico_entregas.enfileirar()
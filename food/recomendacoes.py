@@ -0,0 +1,356 @@
+"""
+Recomendações "peça também": os produtos mais pedidos junto com cada produto.
+
+Contar pares de produtos nos itens de pedido a cada requisição não escala, então o cálculo é
+em lote (``manage.py calcular_recomendacoes``, cron) e vetorizado com NumPy. Os itens dos
+pedidos dos últimos ``JANELA_RECOMENDACOES`` dias viram, por restaurante, duas contagens: a
+popularidade (em quantos pedidos cada produto aparece) e a coocorrência (em quantos pedidos
+cada par aparece), uma matriz esparsa guardada em COO só com o triângulo de cima. As matrizes
+ficam no cache em bytes (int32 e ids de 16 bytes), e cada execução só soma os pedidos que
+entraram na janela e subtrai os que saíram dela.
+
+Das matrizes sai, para cada produto, a lista pronta dos ``RECOMENDACOES_POR_PRODUTO``
+produtos disponíveis mais pedidos junto (completada com os mais populares do restaurante),
+numa chave própria: servir (``do_produto``) é uma leitura do cache, sem banco nem NumPy.
+
+Pedidos cancelados também contam: o status muda depois, e a subtração só desfaz a soma se o
+pedido entrar com os mesmos itens nas duas pontas da janela.
+"""
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from . import shards
+from .models import ItemPedido, Produto
+from .serializers_leitura import _decimal
+
+JANELA_RECOMENDACOES = 90  # dias
+RECOMENDACOES_POR_PRODUTO = 10
+# Menos pedidos juntos que isso é acaso: o lugar fica com os populares
+MINIMO_PEDIDOS_JUNTOS = 2
+# Pedidos com mais produtos distintos (festa, escritório) juntam tudo com tudo e custam pares ao
+# quadrado: contam na popularidade, mas não nos pares
+MAXIMO_ITENS_PARES = 30
+# Os pedidos dos últimos minutos ficam para a próxima execução: um checkout ainda sem commit
+# tem criado_em anterior ao fim da janela e ficaria de fora para sempre
+ATRASO = timedelta(minutes=5)
+TEMPO_MATRIZ = 7 * 24 * 60 * 60
+TEMPO_RECOMENDACOES = 2 * 24 * 60 * 60
+_CHAVE_ESTADO = 'recomendacoes:estado'
+_CONTAGENS = ('popularidade', 'linhas', 'colunas', 'contagens')
+_LOTE_CATALOGO = 500
+
+
+def _chave_matriz(restaurante_id):
+    return f'recomendacoes:matriz:{restaurante_id}'
+
+
+def _chave_produto(produto_id):
+    return f'recomendacoes:{produto_id}'
+
+
+def do_produto(produto_id):
+    """Recomendações prontas de um produto, numa leitura do cache (lista vazia se não houver)."""
+    try:
+        produto_id = uuid.UUID(str(produto_id))
+    except ValueError:
+        return []
+    return cache.get(_chave_produto(produto_id), [])
+
+
+# -----------------------------
+# MATRIZES
+# -----------------------------
+def matrizes(pedidos, produtos, produto_ids, restaurante_do_produto, restaurante_ids):
+    """
+    Matrizes por restaurante a partir dos itens de pedido. ``pedidos`` e ``produtos`` são arrays
+    de índices, um elemento por item; ``produto_ids`` é o id de cada índice de produto e
+    ``restaurante_do_produto`` o índice (em ``restaurante_ids``) do restaurante dele. Devolve
+    ``{restaurante_id: matriz}``, com os produtos de cada matriz em ordem de id.
+    """
+    import numpy as np
+
+    # Produtos em ordem de id, como saem de ``somar``: o resultado não depende da ordem de leitura
+    ordem_ids = np.argsort(produto_ids, kind='stable')
+    posicao = np.empty(len(produto_ids), np.int64)
+    posicao[ordem_ids] = np.arange(len(produto_ids))
+    produtos, produto_ids, restaurante_do_produto = (
+        posicao[produtos], produto_ids[ordem_ids], restaurante_do_produto[ordem_ids]
+    )
+
+    total = np.int64(len(produto_ids))
+    # Um produto conta uma vez por pedido; as linhas saem ordenadas por pedido e produto
+    codigos = np.unique(pedidos.astype(np.int64) * total + produtos)
+    pedidos, produtos = np.divmod(codigos, total)
+    popularidade = np.bincount(produtos, minlength=total)
+
+    # Em cada pedido, cada item forma par com os que vêm depois dele (produto menor na linha)
+    _, inicio, tamanho = np.unique(pedidos, return_index=True, return_counts=True)
+    grupo = np.repeat(np.arange(len(inicio)), tamanho)
+    depois = inicio[grupo] + tamanho[grupo] - np.arange(len(produtos)) - 1
+    depois[tamanho[grupo] > MAXIMO_ITENS_PARES] = 0
+    primeiro = np.repeat(np.arange(len(produtos)), depois)
+    segundo = primeiro + 1 + np.arange(len(primeiro)) - np.repeat(np.cumsum(depois) - depois, depois)
+    pares, contagens = np.unique(produtos[primeiro] * total + produtos[segundo], return_counts=True)
+    linhas, colunas = np.divmod(pares, total)
+
+    restaurantes = len(restaurante_ids)
+    pedidos_por_restaurante = np.bincount(restaurante_do_produto[produtos[inicio]], minlength=restaurantes)
+    # Os produtos e os pares agrupados por restaurante, e a posição de cada produto no seu grupo
+    ordem = np.argsort(restaurante_do_produto, kind='stable')
+    limites = np.searchsorted(restaurante_do_produto[ordem], np.arange(restaurantes + 1))
+    local = np.empty(len(produto_ids), np.int64)
+    local[ordem] = np.arange(len(produto_ids)) - limites[restaurante_do_produto[ordem]]
+    dono_do_par = restaurante_do_produto[linhas]
+    ordem_pares = np.argsort(dono_do_par, kind='stable')
+    limites_pares = np.searchsorted(dono_do_par[ordem_pares], np.arange(restaurantes + 1))
+
+    resultado = {}
+    for r, restaurante_id in enumerate(restaurante_ids):
+        if not pedidos_por_restaurante[r]:
+            continue
+        seus = ordem[limites[r]:limites[r + 1]]
+        seus_pares = ordem_pares[limites_pares[r]:limites_pares[r + 1]]
+        resultado[restaurante_id] = {
+            'pedidos': int(pedidos_por_restaurante[r]),
+            'produtos': produto_ids[seus],
+            'popularidade': popularidade[seus],
+            'linhas': local[linhas[seus_pares]],
+            'colunas': local[colunas[seus_pares]],
+            'contagens': contagens[seus_pares],
+        }
+    return resultado
+
+
+def podar(matriz, manter):
+    """Só os produtos da máscara ``manter`` e os pares entre eles que ainda têm contagem."""
+    import numpy as np
+    novo = np.cumsum(manter) - 1
+    pares = manter[matriz['linhas']] & manter[matriz['colunas']] & (matriz['contagens'] > 0)
+    return {
+        'pedidos': matriz['pedidos'],
+        'produtos': matriz['produtos'][manter],
+        'popularidade': matriz['popularidade'][manter],
+        'linhas': novo[matriz['linhas'][pares]],
+        'colunas': novo[matriz['colunas'][pares]],
+        'contagens': matriz['contagens'][pares],
+    }
+
+
+def somar(base, delta, sinal=1):
+    """``base + sinal * delta`` para duas matrizes do mesmo restaurante; produtos zerados saem."""
+    import numpy as np
+    produtos, indice = np.unique(np.concatenate([base['produtos'], delta['produtos']]), return_inverse=True)
+    na_base, no_delta = indice[:len(base['produtos'])], indice[len(base['produtos']):]
+    popularidade = np.zeros(len(produtos), np.int64)
+    popularidade[na_base] += base['popularidade']
+    popularidade[no_delta] += sinal * delta['popularidade']
+
+    # Os índices mudaram: o par volta a ter o produto menor na linha antes de juntar as contagens
+    a = np.concatenate([na_base[base['linhas']], no_delta[delta['linhas']]])
+    b = np.concatenate([na_base[base['colunas']], no_delta[delta['colunas']]])
+    total = np.int64(len(produtos))
+    pares, posicao = np.unique(np.minimum(a, b) * total + np.maximum(a, b), return_inverse=True)
+    pesos = np.concatenate([base['contagens'], sinal * delta['contagens']])
+    contagens = np.bincount(posicao, weights=pesos, minlength=len(pares)).round().astype(np.int64)
+    soma = {
+        'pedidos': base['pedidos'] + sinal * delta['pedidos'],
+        'produtos': produtos,
+        'popularidade': popularidade,
+        'linhas': pares // total,
+        'colunas': pares % total,
+        'contagens': contagens,
+    }
+    return podar(soma, popularidade > 0)
+
+
+def compactar(matriz, fim):
+    """A matriz como fica no cache: ids em 16 bytes e as contagens em int32."""
+    import numpy as np
+    return {
+        'fim': fim,
+        'pedidos': matriz['pedidos'],
+        'produtos': b''.join(uuid.UUID(produto_id).bytes for produto_id in matriz['produtos'].tolist()),
+        **{campo: matriz[campo].astype(np.int32).tobytes() for campo in _CONTAGENS},
+    }
+
+
+def expandir(guardada):
+    """Inverso de ``compactar``."""
+    import numpy as np
+    ids = guardada['produtos']
+    return {
+        'pedidos': guardada['pedidos'],
+        'produtos': np.array([str(uuid.UUID(bytes=ids[i:i + 16])) for i in range(0, len(ids), 16)], dtype=str),
+        **{campo: np.frombuffer(guardada[campo], dtype=np.int32).astype(np.int64) for campo in _CONTAGENS},
+    }
+
+
+def tamanho(guardada):
+    """Bytes da matriz compactada (ids e contagens)."""
+    return sum(len(guardada[campo]) for campo in ('produtos', *_CONTAGENS))
+
+
+# -----------------------------
+# LISTAS DE RECOMENDAÇÃO
+# -----------------------------
+def vizinhos(matriz, disponiveis, k=RECOMENDACOES_POR_PRODUTO):
+    """
+    Para cada produto, os ``k`` produtos ``disponiveis`` (máscara) mais pedidos junto com ele,
+    com a popularidade desempatando. Devolve ``(de, para, juntos)``, ordenados por ``de``.
+    """
+    import numpy as np
+    de = np.concatenate([matriz['linhas'], matriz['colunas']])
+    para = np.concatenate([matriz['colunas'], matriz['linhas']])
+    juntos = np.concatenate([matriz['contagens'], matriz['contagens']])
+    validos = disponiveis[para] & (juntos >= MINIMO_PEDIDOS_JUNTOS)
+    de, para, juntos = de[validos], para[validos], juntos[validos]
+    ordem = np.lexsort((-matriz['popularidade'][para], -juntos, de))
+    de, para, juntos = de[ordem], para[ordem], juntos[ordem]
+    manter = np.arange(len(de)) - np.searchsorted(de, de) < k
+    return de[manter], para[manter], juntos[manter]
+
+
+def listas(matriz, catalogo, k=RECOMENDACOES_POR_PRODUTO):
+    """
+    ``{produto_id: [recomendação]}`` para cada produto do restaurante em ``catalogo``
+    (``{id: linha}``, com ``nome``, ``preco`` e ``disponivel``). ``confianca`` é a fração dos
+    pedidos do produto que também tiveram o recomendado ou, nos ``popular``, dos pedidos do
+    restaurante.
+    """
+    import numpy as np
+    ids = matriz['produtos'].tolist()
+    popularidade = matriz['popularidade'].tolist()
+    disponiveis = np.array([catalogo[produto_id]['disponivel'] for produto_id in ids], dtype=bool)
+    de, para, juntos = vizinhos(matriz, disponiveis, k)
+    populares = [i for i in np.argsort(-matriz['popularidade'], kind='stable').tolist() if disponiveis[i]][:k + 1]
+
+    def recomendacao(i, motivo, confianca):
+        linha = catalogo[ids[i]]
+        return {
+            'id': ids[i], 'nome': linha['nome'], 'preco': _decimal(linha['preco']),
+            'motivo': motivo, 'confianca': round(confianca, 4),
+        }
+
+    juntos_de = defaultdict(list)
+    for a, b, n in zip(de.tolist(), para.tolist(), juntos.tolist()):
+        juntos_de[a].append((b, n))
+    indice = {produto_id: i for i, produto_id in enumerate(ids)}
+    resultado = {}
+    for produto_id in catalogo:
+        i = indice.get(produto_id)
+        lista = [recomendacao(b, 'juntos', n / popularidade[i]) for b, n in juntos_de.get(i, ())]
+        vistos = {i, *(b for b, _ in juntos_de.get(i, ()))}
+        for b in populares:
+            if len(lista) >= k:
+                break
+            if b not in vistos:
+                lista.append(recomendacao(b, 'popular', popularidade[b] / matriz['pedidos']))
+        resultado[produto_id] = lista
+    return resultado
+
+
+# -----------------------------
+# ATUALIZAÇÃO EM LOTE
+# -----------------------------
+def _matrizes_do_periodo(depois_de, ate):
+    """Matrizes dos pedidos criados em ``(depois_de, ate]``, de todos os shards, e o total de itens."""
+    import numpy as np
+    pedidos, produtos, restaurantes = {}, {}, {}
+    restaurante_do_produto, linhas_pedido, linhas_produto = [], [], []
+    consulta = ItemPedido.objects.filter(
+        produto__isnull=False, pedido__criado_em__gt=depois_de, pedido__criado_em__lte=ate,
+    )
+    for parte in shards.espalhar(consulta):
+        linhas = parte.values_list('pedido_id', 'produto_id', 'pedido__restaurante_id').iterator(chunk_size=10_000)
+        for pedido_id, produto_id, restaurante_id in linhas:
+            produto = produtos.get(produto_id)
+            if produto is None:
+                produto = produtos[produto_id] = len(produtos)
+                restaurante_do_produto.append(restaurantes.setdefault(restaurante_id, len(restaurantes)))
+            linhas_pedido.append(pedidos.setdefault(pedido_id, len(pedidos)))
+            linhas_produto.append(produto)
+    resultado = matrizes(
+        np.array(linhas_pedido, dtype=np.int64), np.array(linhas_produto, dtype=np.int64),
+        np.array([str(produto_id) for produto_id in produtos], dtype=str),
+        np.array(restaurante_do_produto, dtype=np.int64), [str(r) for r in restaurantes],
+    )
+    return resultado, len(linhas_pedido)
+
+
+def _catalogo(restaurante_ids):
+    """``{restaurante_id: {produto_id: linha}}`` dos produtos existentes dos restaurantes."""
+    catalogo = defaultdict(dict)
+    restaurante_ids = list(restaurante_ids)
+    for i in range(0, len(restaurante_ids), _LOTE_CATALOGO):
+        for linha in Produto.objects.filter(restaurante_id__in=restaurante_ids[i:i + _LOTE_CATALOGO]).values(
+            'id', 'restaurante_id', 'nome', 'preco', 'disponivel',
+        ):
+            catalogo[str(linha['restaurante_id'])][str(linha['id'])] = linha
+    return catalogo
+
+
+def atualizar(dias=JANELA_RECOMENDACOES, completo=False, agora=None):
+    """
+    Atualiza as matrizes e as listas de recomendação no cache. Com as matrizes da execução
+    anterior no cache (mesma janela, todas presentes), soma os pedidos novos e subtrai os que
+    saíram da janela; senão, ou com ``completo``, relê a janela inteira. Devolve um resumo.
+    """
+    import numpy as np
+
+    fim = (agora or timezone.now()) - ATRASO
+    inicio = fim - timedelta(days=dias)
+    estado = None if completo else cache.get(_CHAVE_ESTADO)
+    if estado and not (estado['dias'] == dias and inicio <= estado['fim'] <= fim):
+        estado = None
+    anteriores = []
+    if estado:
+        anteriores = estado['restaurantes']
+        guardadas = cache.get_many([_chave_matriz(r) for r in anteriores])
+        # Uma matriz que saiu do cache (ou de outra execução) não fecha a conta: relê tudo
+        if len(guardadas) < len(anteriores) or any(m['fim'] != estado['fim'] for m in guardadas.values()):
+            estado = None
+
+    if estado:
+        atuais = {r: expandir(guardadas[_chave_matriz(r)]) for r in anteriores}
+        novos, linhas_novas = _matrizes_do_periodo(estado['fim'], fim)
+        expirados, linhas_expiradas = _matrizes_do_periodo(estado['inicio'], inicio)
+        for r, matriz in novos.items():
+            atuais[r] = somar(atuais[r], matriz) if r in atuais else matriz
+        for r, matriz in expirados.items():
+            if r in atuais:
+                atuais[r] = somar(atuais[r], matriz, -1)
+        linhas = linhas_novas + linhas_expiradas
+    else:
+        atuais, linhas = _matrizes_do_periodo(inicio, fim)
+
+    # Produtos excluídos saem (seus itens ficam com produto nulo e não voltam a ser subtraídos)
+    catalogo = _catalogo(atuais)
+    prontas, matrizes_cache = {}, {}
+    for r, matriz in atuais.items():
+        produtos = catalogo.get(r, {})
+        matriz = podar(matriz, np.array([p in produtos for p in matriz['produtos'].tolist()], dtype=bool))
+        if matriz['pedidos'] <= 0 or not len(matriz['produtos']):
+            continue
+        matrizes_cache[_chave_matriz(r)] = compactar(matriz, fim)
+        prontas.update({_chave_produto(p): lista for p, lista in listas(matriz, produtos).items()})
+
+    restaurantes = sorted(r for r in atuais if _chave_matriz(r) in matrizes_cache)
+    sairam = set(anteriores) - set(restaurantes)
+    if sairam:
+        cache.delete_many([_chave_matriz(r) for r in sairam] + [
+            _chave_produto(p) for produtos in _catalogo(sairam).values() for p in produtos
+        ])
+    cache.set_many(matrizes_cache, TEMPO_MATRIZ)
+    cache.set_many(prontas, TEMPO_RECOMENDACOES)
+    cache.set(_CHAVE_ESTADO, {'dias': dias, 'inicio': inicio, 'fim': fim, 'restaurantes': restaurantes}, TEMPO_MATRIZ)
+    return {
+        'modo': 'incremental' if estado else 'completo',
+        'itens': linhas,
+        'restaurantes': len(restaurantes),
+        'produtos': len(prontas),
+        'bytes': sum(tamanho(guardada) for guardada in matrizes_cache.values()),
+    }
@@ -0,0 +1,119 @@
+"""
+Roteamento entre o banco primário, as réplicas de leitura e os shards de pedidos.
+
+As leituras só vão para uma réplica quando a requisição liberou (``LeituraEmReplicaMixin``
+nos ViewSets, ``aliberar_replica`` nas views assíncronas): métodos seguros de um usuário
+que não escreveu nos últimos ``DB_JANELA_PRIMARIO`` segundos. Escritas, ``select_for_update``
+e tudo o que roda dentro de ``transaction.atomic`` ficam no primário.
+
+Os dados de pedido vão para o shard do restaurante (``RoteadorShards``, ver ``shards.py``),
+que vem antes na lista de roteadores e não usa as réplicas.
+"""
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.permissions import SAFE_METHODS
+
+from . import shards
+
+_leitura_em_replica = ContextVar('leitura_em_replica', default=False)
+
+
+def replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', ())
+
+
+def _chave_primario(usuario):
+    return f'db:primario:{usuario.pk}'
+
+
+def fixar_no_primario(usuario):
+    """Depois de uma escrita, o usuário lê do primário até a réplica alcançá-lo."""
+    if replicas() and usuario.is_authenticated:
+        cache.set(_chave_primario(usuario), True, settings.DB_JANELA_PRIMARIO)
+
+
+def liberar_replica(usuario):
+    """Libera as leituras da requisição atual para as réplicas; devolve o token para ``reset``."""
+    if not replicas():
+        return None
+    if usuario.is_authenticated and cache.get(_chave_primario(usuario)):
+        return None
+    return _leitura_em_replica.set(True)
+
+
+async def aliberar_replica(usuario):
+    """Versão assíncrona de ``liberar_replica``; o contexto morre com a requisição."""
+    if not replicas():
+        return
+    if usuario.is_authenticated and await cache.aget(_chave_primario(usuario)):
+        return
+    _leitura_em_replica.set(True)
+
+
+def _escolher_replica():
+    return random.choice(replicas())
+
+
+class RoteadorShards:
+    # Sem allow_migrate: cada shard recebe o schema inteiro, com as tabelas do default vazias
+    def db_for_read(self, model, **hints):
+        if not shards.shards() or model._meta.label_lower not in shards.MODELOS or 'instance' not in hints:
+            return None
+        return shards.banco_da_instancia(hints['instance'])
+
+    db_for_write = db_for_read
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if not shards.shards():
+            return None
+        particionados = [obj._meta.label_lower in shards.MODELOS for obj in (obj1, obj2)]
+        if all(particionados):
+            # Objeto novo ainda não tem o banco certo em _state.db: vale o do restaurante/pedido
+            return len({shards.banco_da_instancia(obj) for obj in (obj1, obj2)} - {None}) <= 1
+        # Usuário, restaurante e produto ficam no default e valem para qualquer shard
+        return True if any(particionados) else None
+
+
+class RoteadorPrimarioReplica:
+    def db_for_read(self, model, **hints):
+        if not _leitura_em_replica.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return _escolher_replica()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        bancos = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in bancos and obj2._state.db in bancos:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # As réplicas recebem o schema pela replicação
+        if db in replicas():
+            return False
+        return None
+
+
+class LeituraEmReplicaMixin:
+    """Métodos seguros leem das réplicas; escritas bem-sucedidas fixam o usuário no primário"""
+
+    _token_replica = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method in SAFE_METHODS:
+            self._token_replica = liberar_replica(request.user)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if self._token_replica is not None:
+            _leitura_em_replica.reset(self._token_replica)
+            self._token_replica = None
+        elif request.method not in SAFE_METHODS and response.status_code < 400:
+            fixar_no_primario(request.user)
+        return super().finalize_response(request, response, *args, **kwargs)
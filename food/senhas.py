@@ -0,0 +1,130 @@
+"""
+Hash e verificação de senha fora da thread da requisição.
+
+PBKDF2, scrypt e argon2 gastam dezenas de milissegundos de CPU por senha, de propósito; com o
+hash na thread da requisição, uma rajada de logins ocupa todos os núcleos e as leituras do
+catálogo esperam CPU. Aqui o hash roda num pool de ``SENHA_WORKERS`` threads por processo (os
+três algoritmos soltam o GIL enquanto calculam), então no máximo essa quantidade de núcleos
+calcula senhas ao mesmo tempo. Com ``SENHA_FILA_MAXIMA`` senhas já esperando o pool, a próxima é
+recusada na hora (``FilaDeSenhasCheia``, 503 com ``Retry-After`` nas views) em vez de prender
+mais uma thread da requisição.
+
+O algoritmo dos hashes novos vem de ``SENHA_HASHER`` e o custo dos ``SENHA_*`` do settings
+(``manage.py calibrar_senhas`` sugere os valores para a máquina). Hashes de outro algoritmo ou
+de outro custo continuam valendo e são refeitos com o atual no próximo login.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+class FilaDeSenhasCheia(Exception):
+    """O pool e a fila de espera estão cheios; a requisição deve tentar de novo em instantes."""
+
+
+_pool = None
+_trava = threading.Lock()
+
+
+def _pool_do_processo():
+    global _pool
+    chave = (os.getpid(), settings.SENHA_WORKERS, settings.SENHA_FILA_MAXIMA)
+    with _trava:
+        # Threads não sobrevivem ao fork (gunicorn --preload): cada worker cria o seu pool
+        if _pool is None or _pool[0] != chave:
+            if _pool is not None:
+                _pool[1].shutdown(wait=False)
+            vagas = threading.BoundedSemaphore(settings.SENHA_WORKERS + settings.SENHA_FILA_MAXIMA)
+            _pool = (chave, ThreadPoolExecutor(settings.SENHA_WORKERS, thread_name_prefix='senhas'), vagas)
+        return _pool[1], _pool[2]
+
+
+def _liberando_vaga(vagas, funcao, *args):
+    # Libera antes do resultado chegar a quem espera: a próxima chamada dele já encontra a vaga
+    try:
+        return funcao(*args)
+    finally:
+        vagas.release()
+
+
+def _executar(funcao, *args):
+    """Roda ``funcao`` no pool e espera o resultado; com ``SENHA_WORKERS=0``, na própria thread."""
+    if not settings.SENHA_WORKERS:
+        return funcao(*args)
+    pool, vagas = _pool_do_processo()
+    if not vagas.acquire(blocking=False):
+        raise FilaDeSenhasCheia()
+    try:
+        futuro = pool.submit(_liberando_vaga, vagas, funcao, *args)
+    except BaseException:
+        vagas.release()
+        raise
+    return futuro.result()
+
+
+def gerar_hash(senha):
+    """``make_password`` no pool; ``None`` gera uma senha inutilizável sem calcular hash."""
+    if senha is None:
+        return hashers.make_password(None)
+    return _executar(hashers.make_password, senha)
+
+
+def _verificar(senha, codificado):
+    novos = []
+    valida = hashers.check_password(senha, codificado, setter=lambda s: novos.append(hashers.make_password(s)))
+    return valida, (novos[0] if novos else None)
+
+
+def verificar(senha, codificado):
+    """
+    ``check_password`` no pool. Devolve ``(válida, novo_hash)``: ``novo_hash`` só vem quando a
+    senha confere e o hash guardado é de outro algoritmo ou custo, e já vem com o atual.
+    """
+    return _executar(_verificar, senha, codificado)
+
+
+# -----------------------------
+# HASHERS COM CUSTO DO SETTINGS
+# -----------------------------
+class PBKDF2Calibrado(hashers.PBKDF2PasswordHasher):
+    @property
+    def iterations(self):
+        return settings.SENHA_PBKDF2_ITERACOES
+
+
+class ScryptCalibrado(hashers.ScryptPasswordHasher):
+    """scrypt usa 128·N·r·p bytes de memória por hash: o pool também limita a memória."""
+
+    # Só um teto (o padrão do OpenSSL, 32 MiB, não comporta N=2**15 com r=8)
+    maxmem = 1024 ** 3
+
+    @property
+    def work_factor(self):
+        return settings.SENHA_SCRYPT_N
+
+    @property
+    def block_size(self):
+        return settings.SENHA_SCRYPT_R
+
+    @property
+    def parallelism(self):
+        return settings.SENHA_SCRYPT_P
+
+
+class Argon2Calibrado(hashers.Argon2PasswordHasher):
+    """Precisa do ``argon2-cffi``; ``memory_cost`` em KiB."""
+
+    @property
+    def time_cost(self):
+        return settings.SENHA_ARGON2_TEMPO
+
+    @property
+    def memory_cost(self):
+        return settings.SENHA_ARGON2_MEMORIA
+
+    @property
+    def parallelism(self):
+        return settings.SENHA_ARGON2_PARALELISMO
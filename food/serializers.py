@@ -1,15 +1,57 @@
 from rest_framework import serializers
+from . import previsao
 from .models import (
     Endereco, GrupoOpcao, Opcao, Usuario, Restaurante, CategoriaProduto, Produto,
-    Carrinho, ItemCarrinho, Pedido, ItemPedido, Pagamento,
+    Carrinho, ItemCarrinho, Pedido, ItemPedido, EventoPedido, Pagamento,
     Entrega, RastreamentoEntrega,
     AvaliacaoRestaurante, AvaliacaoEntregador, AvaliacaoProduto
 )
 
+
+# -----------------------------
+# CAMPOS SOB DEMANDA
+# -----------------------------
+def _lista_parametro(request, nome):
+    parametros = getattr(request, 'query_params', None) or request.GET
+    return frozenset(filter(None, (parte.strip() for parte in parametros.get(nome, '').split(','))))
+
+
+def campos_incluidos(serializer_class, request=None):
+    """
+    Campos de ``serializer_class`` na resposta: ``?fields=a,b`` limita a esses, e as relações
+    de ``Meta.expansiveis`` só entram com ``?expand=``. Sem ``request``, o padrão.
+    """
+    fields = _lista_parametro(request, 'fields') if request is not None else frozenset()
+    expand = _lista_parametro(request, 'expand') if request is not None else frozenset()
+    expansiveis = getattr(serializer_class.Meta, 'expansiveis', ())
+    return frozenset(
+        nome for nome in serializer_class.Meta.fields
+        if (nome not in expansiveis or nome in expand) and (not fields or nome in fields)
+    )
+
+
+class SerializerDinamico(serializers.ModelSerializer):
+    """
+    ``?fields=``/``?expand=`` da requisição do contexto; vale só para o serializer da raiz.
+    Campos graváveis nunca saem numa escrita, para o ``?fields=`` não descartar dados enviados.
+    """
+
+    def get_fields(self):
+        campos = super().get_fields()
+        pai = self.parent.parent if isinstance(self.parent, serializers.ListSerializer) else self.parent
+        request = self.context.get('request') if pai is None else None
+        incluidos = campos_incluidos(type(self), request)
+        escrita = request is not None and request.method not in ('GET', 'HEAD', 'OPTIONS')
+        return {
+            nome: campo for nome, campo in campos.items()
+            if nome in incluidos or campo.write_only or (escrita and not campo.read_only)
+        }
+
+
 # -----------------------------
 # USUÁRIOS E PERFIS
 # -----------------------------
-class UsuarioSerializer(serializers.ModelSerializer):
+class UsuarioSerializer(SerializerDinamico):
     password = serializers.CharField(write_only=True)
 
     class Meta:
@@ -19,12 +61,11 @@ class UsuarioSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         foto = validated_data.pop('foto', None)
         password = validated_data.pop('password', None)
-        usuario = Usuario.objects.create_user(**validated_data)
-        
+        # Um hash só, já no create_user (sem senha, ela fica inutilizável)
+        usuario = Usuario.objects.create_user(password=password or None, **validated_data)
+
         if foto:
             usuario.foto = foto
-        if password:
-            usuario.set_password(password)
             usuario.save()
 
         return usuario
@@ -32,13 +73,13 @@ class UsuarioSerializer(serializers.ModelSerializer):
 # -----------------------------
 # RESTAURANTES E CARDÁPIO
 # -----------------------------
-class CategoriaProdutoSerializer(serializers.ModelSerializer):
+class CategoriaProdutoSerializer(SerializerDinamico):
     class Meta:
         model = CategoriaProduto
         fields = ['id', 'nome']
 
 
-class ProdutoSerializer(serializers.ModelSerializer):
+class ProdutoSerializer(SerializerDinamico):
     categoria = CategoriaProdutoSerializer(read_only=True)
     restaurante = serializers.StringRelatedField()
     restaurante_id = serializers.PrimaryKeyRelatedField(
@@ -50,28 +91,29 @@ class ProdutoSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Produto
-        fields = ['id', 'nome', 'descricao', 'preco', 'imagem', 'disponivel', 'categoria', 'restaurante', 'categoria_id', 'restaurante_id']
+        fields = ['id', 'nome', 'descricao', 'preco', 'imagem', 'disponivel', 'estoque', 'limite_diario', 'categoria', 'restaurante', 'categoria_id', 'restaurante_id']
 
 
-class RestauranteSerializer(serializers.ModelSerializer):
+class RestauranteSerializer(SerializerDinamico):
     produtos = ProdutoSerializer(many=True, read_only=True)
     dono = serializers.StringRelatedField()
 
     class Meta:
         model = Restaurante
         fields = ['id', 'nome', 'cnpj', 'endereco', 'aberto', 'produtos', 'dono']
+        expansiveis = ['produtos']
 
 
 # -----------------------------
 # CARRINHO E PEDIDOS
 # -----------------------------
 
-class OpcaoSerializer(serializers.ModelSerializer):
+class OpcaoSerializer(SerializerDinamico):
     class Meta:
         model = Opcao
         fields = ['id', 'nome', 'preco_adicional']
 
-class GrupoOpcaoSerializer(serializers.ModelSerializer):
+class GrupoOpcaoSerializer(SerializerDinamico):
     produto = serializers.StringRelatedField()
     produto_id = serializers.PrimaryKeyRelatedField(
         source='produto', queryset=Produto.objects.all(), write_only=True
@@ -82,13 +124,14 @@ class GrupoOpcaoSerializer(serializers.ModelSerializer):
         model = GrupoOpcao
         fields = ['id', 'nome', 'obrigatorio', 'multipla_escolha', 'opcoes', 'produto', 'produto_id']
 
-class ItemCarrinhoSerializer(serializers.ModelSerializer):
+class ItemCarrinhoSerializer(SerializerDinamico):
     produto = ProdutoSerializer(read_only=True)
     opcoes_escolhidas = OpcaoSerializer(many=True, read_only=True)
     opcoes = serializers.PrimaryKeyRelatedField(
         many=True,
         queryset=Opcao.objects.all(),
-        required=False
+        required=False,
+        write_only=True
     )
 
     def validate(self, data):
@@ -113,10 +156,10 @@ class ItemCarrinhoSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = ItemCarrinho
-        fields = ['id', 'produto', 'quantidade', 'observacao', 'opcoes_escolhidas', 'opcoes' 'subtotal']
+        fields = ['id', 'produto', 'quantidade', 'observacao', 'opcoes_escolhidas', 'opcoes', 'subtotal']
 
 
-class CarrinhoSerializer(serializers.ModelSerializer):
+class CarrinhoSerializer(SerializerDinamico):
     usuario = serializers.StringRelatedField()
     itens = ItemCarrinhoSerializer(many=True, read_only=True)
     endereco_id = serializers.PrimaryKeyRelatedField(
@@ -128,7 +171,27 @@ class CarrinhoSerializer(serializers.ModelSerializer):
         fields = ['id', 'usuario', 'criado_em', 'itens', 'endereco_id']
 
 
-class ItemPedidoSerializer(serializers.ModelSerializer):
+class OperacaoCarrinhoSerializer(serializers.Serializer):
+    """Uma operação do lote de ``POST /carrinhos/{id}/itens/``."""
+    acao = serializers.ChoiceField(choices=['adicionar', 'alterar', 'remover'])
+    produto_id = serializers.UUIDField(required=False)
+    item_id = serializers.UUIDField(required=False)
+    quantidade = serializers.IntegerField(min_value=1, required=False)
+    observacao = serializers.CharField(required=False, allow_blank=True)
+    opcoes = serializers.ListField(child=serializers.UUIDField(), required=False)
+
+    def validate(self, data):
+        obrigatorio = 'produto_id' if data['acao'] == 'adicionar' else 'item_id'
+        if obrigatorio not in data:
+            raise serializers.ValidationError({obrigatorio: 'Este campo é obrigatório.'})
+        return data
+
+
+class LoteCarrinhoSerializer(serializers.Serializer):
+    operacoes = OperacaoCarrinhoSerializer(many=True, allow_empty=False, max_length=100)
+
+
+class ItemPedidoSerializer(SerializerDinamico):
     produto = ProdutoSerializer(read_only=True)
     opcoes = serializers.JSONField(read_only=True)
 
@@ -137,7 +200,7 @@ class ItemPedidoSerializer(serializers.ModelSerializer):
         fields = ['id', 'produto', 'quantidade', 'preco_unitario', 'observacao', 'opcoes', 'subtotal']
 
 
-class PedidoSerializer(serializers.ModelSerializer):
+class PedidoSerializer(SerializerDinamico):
     usuario = serializers.StringRelatedField()
     restaurante = serializers.StringRelatedField()
     itens = ItemPedidoSerializer(many=True, read_only=True)
@@ -150,11 +213,17 @@ class PedidoSerializer(serializers.ModelSerializer):
         fields = ['id', 'usuario', 'restaurante', 'valor_total', 'status', 'criado_em', 'itens', 'numero_formatado', 'endereco_entrega', 'endereco_origem']
 
 
+class EventoPedidoSerializer(SerializerDinamico):
+    class Meta:
+        model = EventoPedido
+        fields = ['id', 'pedido', 'status_anterior', 'status_novo', 'criado_em']
+
+
 # -----------------------------
 # PAGAMENTO
 # -----------------------------
-class PagamentoSerializer(serializers.ModelSerializer):
-    pedido = serializers.PrimaryKeyRelatedField(read_only=True)
+class PagamentoSerializer(SerializerDinamico):
+    pedido = serializers.PrimaryKeyRelatedField(queryset=Pedido.objects.all())
 
     class Meta:
         model = Pagamento
@@ -164,26 +233,37 @@ class PagamentoSerializer(serializers.ModelSerializer):
 # -----------------------------
 # ENTREGA E RASTREAMENTO
 # -----------------------------
-class RastreamentoEntregaSerializer(serializers.ModelSerializer):
+class RastreamentoEntregaSerializer(SerializerDinamico):
     class Meta:
         model = RastreamentoEntrega
         fields = ['id', 'latitude', 'longitude', 'registrado_em']
 
 
-class EntregaSerializer(serializers.ModelSerializer):
+class EntregaSerializer(SerializerDinamico):
     pedido = serializers.PrimaryKeyRelatedField(read_only=True)
     entregador = serializers.StringRelatedField()
     rastreamentos = RastreamentoEntregaSerializer(many=True, read_only=True)
+    previsao_chegada = serializers.SerializerMethodField()
 
     class Meta:
         model = Entrega
-        fields = ['id', 'pedido', 'entregador', 'status', 'inicio', 'fim', 'rastreamentos']
+        fields = ['id', 'pedido', 'entregador', 'status', 'inicio', 'fim', 'previsao_chegada', 'rastreamentos']
+        expansiveis = ['rastreamentos']
+
+    def get_previsao_chegada(self, entrega):
+        # Numa listagem, as previsões de todas as entregas vêm do cache de uma vez
+        previsoes = self.context.get('previsoes_chegada')
+        if previsoes is None or entrega.pk not in previsoes:
+            lote = self.parent.instance if isinstance(self.parent, serializers.ListSerializer) else [entrega]
+            previsoes = self.context['previsoes_chegada'] = previsao.previsoes(lote)
+        valor = previsoes[entrega.pk]
+        return None if valor is None else serializers.DateTimeField().to_representation(valor)
 
 
 # -----------------------------
 # AVALIAÇÕES
 # -----------------------------
-class AvaliacaoRestauranteSerializer(serializers.ModelSerializer):
+class AvaliacaoRestauranteSerializer(SerializerDinamico):
     usuario = serializers.StringRelatedField()
 
     class Meta:
@@ -191,7 +271,7 @@ class AvaliacaoRestauranteSerializer(serializers.ModelSerializer):
         fields = ['id', 'usuario', 'nota', 'comentario', 'criado_em']
 
 
-class AvaliacaoEntregadorSerializer(serializers.ModelSerializer):
+class AvaliacaoEntregadorSerializer(SerializerDinamico):
     entregador = serializers.StringRelatedField()
     usuario = serializers.StringRelatedField()
 
@@ -200,7 +280,7 @@ class AvaliacaoEntregadorSerializer(serializers.ModelSerializer):
         fields = ['id', 'entregador', 'usuario', 'nota', 'comentario', 'criado_em']
 
 
-class AvaliacaoProdutoSerializer(serializers.ModelSerializer):
+class AvaliacaoProdutoSerializer(SerializerDinamico):
     usuario = serializers.StringRelatedField()
     produto = serializers.StringRelatedField()
 
@@ -208,7 +288,7 @@ class AvaliacaoProdutoSerializer(serializers.ModelSerializer):
         model = AvaliacaoProduto
         fields = ['id', 'produto', 'usuario', 'nota', 'comentario', 'criado_em']
 
-class EnderecoSerializer(serializers.ModelSerializer):
+class EnderecoSerializer(SerializerDinamico):
     usuario = serializers.StringRelatedField()
     usuario_id = serializers.PrimaryKeyRelatedField(
         source='usuario', queryset=Usuario.objects.all(), write_only=True
@@ -0,0 +1,275 @@
+"""
+Serialização rápida (somente leitura) para as listagens mais acessadas.
+
+As linhas são montadas a partir de ``.values()`` e as relações são juntadas
+por dicionário, sem instanciar models nem passar pela maquinaria de campos do
+``ModelSerializer``. A saída é idêntica à dos serializers de ``serializers.py``
+(``ProdutoSerializer``, ``RestauranteSerializer``, ``PedidoSerializer`` e
+``EntregaSerializer``), inclusive com ``?fields=``/``?expand=``: o parâmetro ``campos``
+recebe o ``campos_incluidos`` do serializer, e relações que ficaram de fora não são
+consultadas. As funções ``aserializar_*`` usam o ORM assíncrono.
+
+Com os pedidos em shards (``shards.py``), usuário, restaurante e produto não estão no banco do
+pedido: vêm de uma consulta à parte no default em vez do JOIN.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.utils import timezone
+
+from . import previsao, shards
+from .models import Usuario, Restaurante, Produto, ItemPedido, RastreamentoEntrega
+from .serializers import EntregaSerializer, PedidoSerializer, RestauranteSerializer, campos_incluidos
+
+_CENTAVOS = Decimal('0.01')
+_COORDENADA = Decimal('0.000001')
+_storage_imagem = Produto._meta.get_field('imagem').storage
+
+
+def _decimal(valor, casas=_CENTAVOS):
+    """Mesmo formato do DecimalField do DRF (string com as casas do campo)."""
+    if valor is None:
+        return ''
+    if not isinstance(valor, Decimal):
+        valor = Decimal(str(valor).strip())
+    return f'{valor.quantize(casas):f}'
+
+
+def _data_hora(valor):
+    """Mesmo formato do DateTimeField do DRF (ISO 8601, 'Z' para UTC)."""
+    if valor is None:
+        return None
+    valor = valor.astimezone(timezone.get_current_timezone()).isoformat()
+    if valor.endswith('+00:00'):
+        valor = valor[:-6] + 'Z'
+    return valor
+
+
+def _texto(valor):
+    return None if valor is None else str(valor)
+
+
+def _url_imagem(nome, request):
+    if not nome:
+        return None
+    url = _storage_imagem.url(nome)
+    if request is not None:
+        return request.build_absolute_uri(url)
+    return url
+
+
+def _nome_usuario(username, email):
+    """Equivalente a ``Usuario.__str__``."""
+    return username or email
+
+
+def _filtrar(dados, campos):
+    """Mantém só os ``campos`` pedidos, na ordem do serializer."""
+    if campos is None:
+        return dados
+    return [{nome: valor for nome, valor in item.items() if nome in campos} for item in dados]
+
+
+# -----------------------------
+# RESTAURANTES E CARDÁPIO
+# -----------------------------
+_CAMPOS_PRODUTO = (
+    'id', 'nome', 'descricao', 'preco', 'imagem', 'disponivel', 'estoque', 'limite_diario',
+    'categoria_id', 'categoria__nome', 'restaurante__nome',
+)
+
+
+def _produto(linha, request):
+    categoria_id = linha['categoria_id']
+    return {
+        'id': str(linha['id']),
+        'nome': linha['nome'],
+        'descricao': _texto(linha['descricao']),
+        'preco': _decimal(linha['preco']),
+        'imagem': _url_imagem(linha['imagem'], request),
+        'disponivel': linha['disponivel'],
+        'estoque': linha['estoque'],
+        'limite_diario': linha['limite_diario'],
+        'categoria': None if categoria_id is None else {
+            'id': str(categoria_id),
+            'nome': linha['categoria__nome'],
+        },
+        'restaurante': linha['restaurante__nome'],
+    }
+
+
+def serializar_produtos(queryset, request=None, campos=None):
+    """Equivalente a ``ProdutoSerializer(queryset, many=True).data``."""
+    return _filtrar([_produto(linha, request) for linha in queryset.values(*_CAMPOS_PRODUTO)], campos)
+
+
+_CAMPOS_RESTAURANTE = ('id', 'nome', 'cnpj', 'endereco', 'aberto', 'dono__username', 'dono__email')
+
+
+def _produtos_dos_restaurantes(linhas):
+    return Produto.objects.filter(
+        restaurante_id__in=[linha['id'] for linha in linhas]
+    ).values('restaurante_id', *_CAMPOS_PRODUTO)
+
+
+def _montar_restaurantes(linhas, produtos, request, campos):
+    produtos_por_restaurante = defaultdict(list)
+    for linha in produtos:
+        produtos_por_restaurante[linha['restaurante_id']].append(_produto(linha, request))
+
+    return _filtrar([
+        {
+            'id': str(linha['id']),
+            'nome': linha['nome'],
+            'cnpj': linha['cnpj'],
+            'endereco': linha['endereco'],
+            'aberto': linha['aberto'],
+            'produtos': produtos_por_restaurante.get(linha['id'], []),
+            'dono': _nome_usuario(linha['dono__username'], linha['dono__email']),
+        }
+        for linha in linhas
+    ], campos)
+
+
+def serializar_restaurantes(queryset, request=None, campos=None):
+    """Equivalente a ``RestauranteSerializer(queryset, many=True).data``."""
+    campos = campos_incluidos(RestauranteSerializer) if campos is None else campos
+    linhas = list(queryset.values(*_CAMPOS_RESTAURANTE))
+    if not linhas:
+        return []
+    produtos = _produtos_dos_restaurantes(linhas) if 'produtos' in campos else []
+    return _montar_restaurantes(linhas, produtos, request, campos)
+
+
+async def aserializar_produtos(queryset, request=None, campos=None):
+    """Versão assíncrona (ORM async) de ``serializar_produtos``."""
+    return _filtrar([_produto(linha, request) async for linha in queryset.values(*_CAMPOS_PRODUTO)], campos)
+
+
+async def aserializar_restaurantes(queryset, request=None, campos=None):
+    """Versão assíncrona (ORM async) de ``serializar_restaurantes``."""
+    campos = campos_incluidos(RestauranteSerializer) if campos is None else campos
+    linhas = [linha async for linha in queryset.values(*_CAMPOS_RESTAURANTE)]
+    if not linhas:
+        return []
+    produtos = [linha async for linha in _produtos_dos_restaurantes(linhas)] if 'produtos' in campos else []
+    return _montar_restaurantes(linhas, produtos, request, campos)
+
+
+# -----------------------------
+# PEDIDOS
+# -----------------------------
+def serializar_pedidos(queryset, request=None, campos=None):
+    """Equivalente a ``PedidoSerializer(queryset, many=True).data``."""
+    campos = campos_incluidos(PedidoSerializer) if campos is None else campos
+    colunas = (
+        'id', 'valor_total', 'status', 'criado_em', 'numero_pedido', 'endereco_entrega', 'endereco_origem',
+    )
+    if shards.shards():
+        linhas = list(queryset.values(*colunas, 'usuario_id', 'restaurante_id'))
+        shards.completar(linhas, 'usuario', Usuario, ('username', 'email'))
+        shards.completar(linhas, 'restaurante', Restaurante, ('nome',))
+    else:
+        linhas = list(queryset.values(*colunas, 'usuario__username', 'usuario__email', 'restaurante__nome'))
+    if not linhas:
+        return []
+
+    itens_por_pedido = defaultdict(list)
+    itens = []
+    if 'itens' in campos:
+        # Os itens estão no mesmo banco dos pedidos
+        itens = ItemPedido.objects.using(queryset.db).filter(pedido_id__in=[linha['id'] for linha in linhas])
+        colunas_itens = ('pedido_id', 'id', 'quantidade', 'preco_unitario', 'observacao', 'opcoes', 'produto_id')
+        if shards.shards():
+            itens = shards.completar(list(itens.values(*colunas_itens)), 'produto', Produto, _CAMPOS_PRODUTO[1:])
+        else:
+            itens = itens.values(*colunas_itens, *(f'produto__{campo}' for campo in _CAMPOS_PRODUTO[1:]))
+    for linha in itens:
+        # Sem nome: produto apagado depois (num shard, o SET_NULL do default não chega ao item)
+        if linha['produto_id'] is None or linha['produto__nome'] is None:
+            produto = None
+        else:
+            produto = _produto({
+                'id': linha['produto_id'],
+                **{campo: linha[f'produto__{campo}'] for campo in _CAMPOS_PRODUTO[1:]},
+            }, request)
+        itens_por_pedido[linha['pedido_id']].append({
+            'id': str(linha['id']),
+            'produto': produto,
+            'quantidade': linha['quantidade'],
+            'preco_unitario': _decimal(linha['preco_unitario']),
+            'observacao': _texto(linha['observacao']),
+            'opcoes': linha['opcoes'],
+            'subtotal': linha['quantidade'] * linha['preco_unitario'],
+        })
+
+    return _filtrar([
+        {
+            'id': str(linha['id']),
+            'usuario': _nome_usuario(linha['usuario__username'], linha['usuario__email']),
+            'restaurante': linha['restaurante__nome'],
+            'valor_total': _decimal(linha['valor_total']),
+            'status': linha['status'],
+            'criado_em': _data_hora(linha['criado_em']),
+            'itens': itens_por_pedido.get(linha['id'], []),
+            'numero_formatado': f"{linha['numero_pedido']:05d}",
+            'endereco_entrega': _texto(linha['endereco_entrega']),
+            'endereco_origem': _texto(linha['endereco_origem']),
+        }
+        for linha in linhas
+    ], campos)
+
+
+# -----------------------------
+# ENTREGA E RASTREAMENTO
+# -----------------------------
+_CAMPOS_ENTREGA = (
+    'id', 'pedido_id', 'entregador_id', 'entregador__username', 'entregador__email', 'status', 'inicio', 'fim',
+)
+
+
+def _montar_entrega(linha, pontos, campos, chegada=None):
+    entregador = None
+    if linha['entregador_id'] is not None:
+        entregador = _nome_usuario(linha['entregador__username'], linha['entregador__email'])
+    return _filtrar([{
+        'id': str(linha['id']),
+        'pedido': linha['pedido_id'],
+        'entregador': entregador,
+        'status': linha['status'],
+        'inicio': _data_hora(linha['inicio']),
+        'fim': _data_hora(linha['fim']),
+        'previsao_chegada': _data_hora(chegada),
+        'rastreamentos': [
+            {
+                'id': str(ponto['id']),
+                'latitude': _decimal(ponto['latitude'], _COORDENADA),
+                'longitude': _decimal(ponto['longitude'], _COORDENADA),
+                'registrado_em': _data_hora(ponto['registrado_em']),
+            }
+            for ponto in pontos
+        ],
+    }], campos)[0]
+
+
+async def aserializar_entrega(queryset, campos=None):
+    """Equivalente assíncrono a ``EntregaSerializer(entrega).data``; ``None`` se não existir."""
+    campos = campos_incluidos(EntregaSerializer) if campos is None else campos
+    if shards.shards():
+        linha = await queryset.values(*(campo for campo in _CAMPOS_ENTREGA if '__' not in campo)).afirst()
+        if linha is not None:
+            await shards.acompletar([linha], 'entregador', Usuario, ('username', 'email'))
+    else:
+        linha = await queryset.values(*_CAMPOS_ENTREGA).afirst()
+    if linha is None:
+        return None
+    pontos = []
+    if 'rastreamentos' in campos:
+        rastreamentos = RastreamentoEntrega.objects.using(queryset.db).filter(entrega_id=linha['id'])
+        pontos = [ponto async for ponto in rastreamentos.values(
+            'id', 'latitude', 'longitude', 'registrado_em'
+        )]
+    chegada = None
+    if 'previsao_chegada' in campos:
+        chegada = await previsao.aprevisao(linha['id'], linha['status'])
+    return _montar_entrega(linha, pontos, campos, chegada)
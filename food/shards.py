@@ -0,0 +1,257 @@
+"""
+Divisão (sharding) dos dados de pedido por restaurante.
+
+Pedidos, itens, eventos, pagamentos, entregas e rastreamentos de um restaurante ficam todos no
+mesmo banco (shard), escolhido por um anel de hash consistente sobre ``Restaurante.id``: incluir
+um shard em ``DATABASE_SHARDS`` só muda de lugar os restaurantes que caem no trecho do anel que
+ele assumiu (``manage.py rebalancear_shards`` os leva). Usuários, restaurantes e cardápio
+continuam no ``default``; o banco não segue chave estrangeira entre bancos, então essas relações
+não têm constraint e as leituras buscam os dois lados em consultas separadas, nunca num JOIN.
+
+Sem ``DATABASE_SHARDS`` tudo fica no ``default``, como antes, e as funções daqui devolvem o
+próprio queryset.
+"""
+import bisect
+import hashlib
+from functools import cmp_to_key, lru_cache
+from heapq import merge
+from operator import attrgetter
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, models, router
+
+# Modelos que moram no shard do restaurante do pedido
+MODELOS = frozenset({
+    'food.pedido', 'food.itempedido', 'food.eventopedido',
+    'food.pagamento', 'food.entrega', 'food.rastreamentoentrega',
+})
+# Pontos de cada shard no anel: com mais pontos, a divisão entre os shards fica mais uniforme
+PONTOS_POR_SHARD = 128
+
+
+def shards():
+    return getattr(settings, 'DATABASE_SHARDS', ())
+
+
+# -----------------------------
+# ANEL DE HASH CONSISTENTE
+# -----------------------------
+def _hash(texto):
+    return int.from_bytes(hashlib.md5(texto.encode()).digest()[:8], 'big')
+
+
+class Anel:
+    """Cada shard ocupa ``pontos`` posições do anel; a chave fica com o primeiro ponto depois dela."""
+
+    def __init__(self, bancos, pontos=PONTOS_POR_SHARD):
+        marcas = sorted((_hash(f'{banco}#{indice}'), banco) for banco in bancos for indice in range(pontos))
+        self._posicoes = [posicao for posicao, _ in marcas]
+        self._bancos = [banco for _, banco in marcas]
+
+    def banco(self, chave):
+        indice = bisect.bisect(self._posicoes, _hash(str(chave))) % len(self._posicoes)
+        return self._bancos[indice]
+
+
+@lru_cache(maxsize=8)
+def _anel(bancos):
+    return Anel(bancos)
+
+
+def banco_do_restaurante(restaurante_id):
+    if not shards():
+        return DEFAULT_DB_ALIAS
+    return _anel(tuple(shards())).banco(restaurante_id)
+
+
+def bancos(restaurantes=None):
+    """Shards com os pedidos dos ``restaurantes`` (ids); todos quando ``None``."""
+    if not shards():
+        return [DEFAULT_DB_ALIAS]
+    if restaurantes is None:
+        return list(shards())
+    return sorted({banco_do_restaurante(restaurante) for restaurante in restaurantes})
+
+
+def banco_da_instancia(instancia):
+    """
+    Shard de um objeto de pedido ainda não salvo (pelo restaurante ou pelo pedido/entrega a que
+    pertence) ou de um já carregado (o banco de onde veio); para um restaurante, o dos pedidos dele.
+    """
+    rotulo = instancia._meta.label_lower
+    if rotulo == 'food.restaurante':
+        return banco_do_restaurante(instancia.pk)
+    if rotulo not in MODELOS:
+        return None
+    if not instancia._state.adding:
+        return instancia._state.db
+    if rotulo == 'food.pedido':
+        return banco_do_restaurante(instancia.restaurante_id) if instancia.restaurante_id else None
+    for campo in ('pedido', 'entrega'):
+        relacionado = instancia._state.fields_cache.get(campo)
+        if relacionado is not None:
+            return banco_da_instancia(relacionado)
+    return None
+
+
+class QuerySetShard(models.QuerySet):
+    """
+    QuerySet dos modelos de ``MODELOS``. Sem ``using()``, ``create``/``bulk_create`` gravam no shard
+    de cada objeto e ``get`` procura em todos (busca por pk sem saber o restaurante). O resto
+    (filter, count, update) segue o roteador: use ``espalhar`` para consultar todos os shards.
+    """
+
+    def _sem_banco(self):
+        return bool(shards()) and self._db is None and 'instance' not in self._hints
+
+    def create(self, **kwargs):
+        if not self._sem_banco():
+            return super().create(**kwargs)
+        objeto = self.model(**kwargs)
+        objeto.save(force_insert=True)
+        return objeto
+
+    def bulk_create(self, objs, *args, **kwargs):
+        if not self._sem_banco():
+            return super().bulk_create(objs, *args, **kwargs)
+        objs = list(objs)
+        por_banco = {}
+        for objeto in objs:
+            por_banco.setdefault(router.db_for_write(self.model, instance=objeto), []).append(objeto)
+        for banco, grupo in por_banco.items():
+            self.using(banco).bulk_create(grupo, *args, **kwargs)
+        return objs
+
+    def get(self, *args, **kwargs):
+        if not self._sem_banco():
+            return super().get(*args, **kwargs)
+        for banco in shards():
+            try:
+                return self.using(banco).get(*args, **kwargs)
+            except self.model.DoesNotExist:
+                continue
+        raise self.model.DoesNotExist(f'{self.model._meta.object_name} matching query does not exist.')
+
+
+# -----------------------------
+# SCATTER-GATHER
+# -----------------------------
+def espalhar(queryset, restaurantes=None):
+    """O ``queryset`` em cada shard que pode ter linhas dele (sem shards, o próprio queryset)."""
+    if not shards():
+        return [queryset]
+    return [queryset.using(banco) for banco in bancos(restaurantes)]
+
+
+def localizar(queryset):
+    """O ``queryset`` no primeiro shard em que ele tem linhas (no último, se em nenhum)."""
+    partes = espalhar(queryset)
+    for parte in partes[:-1]:
+        if parte.exists():
+            return parte
+    return partes[-1]
+
+
+async def alocalizar(queryset):
+    """Versão assíncrona de ``localizar``."""
+    partes = espalhar(queryset)
+    for parte in partes[:-1]:
+        if await parte.aexists():
+            return parte
+    return partes[-1]
+
+
+def _ordem(queryset):
+    """ORDER BY do queryset, com a pk no fim: as partes de cada shard saem na mesma ordem total."""
+    return [*(queryset.query.order_by or queryset.model._meta.ordering), 'pk']
+
+
+def _chave(ordem):
+    # NULL vem por último em ordem crescente e primeiro em decrescente, como no PostgreSQL
+    sentidos = [-1 if campo.startswith('-') else 1 for campo in ordem]
+
+    def comparar(a, b):
+        for x, y, sentido in zip(a[0], b[0], sentidos):
+            if x == y:
+                continue
+            if x is None or y is None:
+                return sentido if x is None else -sentido
+            return sentido if x > y else -sentido
+        return 0
+    return cmp_to_key(comparar)
+
+
+def _intercalar(partes, ordem):
+    """Junta listas ``[(valores da ordem, item)]`` já ordenadas (uma por shard) numa só."""
+    return [item for _, item in merge(*partes, key=_chave(ordem))]
+
+
+def listar(queryset, restaurantes=None):
+    """Os objetos do ``queryset`` em todos os shards, intercalados pela ordem dele."""
+    partes = espalhar(queryset, restaurantes)
+    if len(partes) == 1:
+        return list(partes[0])
+    ordem = _ordem(queryset)
+    leitores = [attrgetter(campo.lstrip('-').replace('__', '.')) for campo in ordem]
+    return _intercalar([
+        [(tuple(ler(objeto) for ler in leitores), objeto) for objeto in parte.order_by(*ordem)]
+        for parte in partes
+    ], ordem)
+
+
+def serializar(queryset, serializar_parte, restaurantes=None):
+    """
+    Scatter-gather do caminho rápido (``serializers_leitura``): ``serializar_parte(queryset)`` em
+    cada shard, e as linhas intercaladas pela ordem do queryset.
+    """
+    partes = espalhar(queryset, restaurantes)
+    if len(partes) == 1:
+        return serializar_parte(partes[0])
+    ordem = _ordem(queryset)
+    listas = []
+    for parte in partes:
+        parte = parte.order_by(*ordem)
+        valores = parte.values_list(*(campo.lstrip('-') for campo in ordem))
+        listas.append(list(zip(valores, serializar_parte(parte))))
+    return _intercalar(listas, ordem)
+
+
+def completar(linhas, relacao, model, campos):
+    """
+    O JOIN que o shard não faz: busca ``campos`` de ``model`` pelos ``<relacao>_id`` das linhas e
+    grava em cada uma como ``<relacao>__<campo>``, como viriam do ``.values()``.
+    """
+    ids = {linha[f'{relacao}_id'] for linha in linhas} - {None}
+    encontrados = {valores['pk']: valores for valores in model.objects.filter(pk__in=ids).values('pk', *campos)}
+    for linha in linhas:
+        relacionado = encontrados.get(linha[f'{relacao}_id'], {})
+        for campo in campos:
+            linha[f'{relacao}__{campo}'] = relacionado.get(campo)
+    return linhas
+
+
+async def acompletar(linhas, relacao, model, campos):
+    """Versão assíncrona de ``completar``."""
+    ids = {linha[f'{relacao}_id'] for linha in linhas} - {None}
+    encontrados = {
+        valores['pk']: valores async for valores in model.objects.filter(pk__in=ids).values('pk', *campos)
+    }
+    for linha in linhas:
+        relacionado = encontrados.get(linha[f'{relacao}_id'], {})
+        for campo in campos:
+            linha[f'{relacao}__{campo}'] = relacionado.get(campo)
+    return linhas
+
+
+def campos_locais(model, campos):
+    """Os ``campos`` (caminhos com ``__``) que não saem do shard: as relações só entre ``MODELOS``."""
+    locais = []
+    for campo in campos:
+        atual = model
+        for nome in campo.split('__')[:-1]:
+            atual = atual._meta.get_field(nome).related_model
+            if atual._meta.label_lower not in MODELOS:
+                break
+        else:
+            locais.append(campo)
+    return tuple(locais)
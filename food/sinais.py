@@ -0,0 +1,108 @@
+"""
+Sinais que mantêm os caches coerentes com o banco.
+
+Ficam fora dos módulos de cache para serem registrados no ``ready`` de qualquer processo
+(servidor, workers, comandos, migrações) sem importar o DRF na subida: o módulo de cache
+que cada receptor usa só é importado quando ele dispara.
+"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Restaurante, CategoriaProduto, Produto, GrupoOpcao, Opcao, Entrega
+
+
+# -----------------------------
+# SNAPSHOTS DO CARRINHO
+# -----------------------------
+@receiver([post_save, post_delete], sender=Produto)
+def invalidar_produto(sender, instance, **kwargs):
+    from .carrinho_cache import invalidar_produtos
+    invalidar_produtos([instance.pk])
+
+
+@receiver(post_save, sender=CategoriaProduto)
+@receiver(post_save, sender=Restaurante)
+def invalidar_produtos_relacionados(sender, instance, created=False, **kwargs):
+    # O snapshot traz o nome da categoria e do restaurante
+    if created:
+        return
+    from .carrinho_cache import invalidar_produtos
+    filtro = {'categoria': instance} if sender is CategoriaProduto else {'restaurante': instance}
+    invalidar_produtos(Produto.objects.filter(**filtro).values_list('pk', flat=True))
+
+
+@receiver([post_save, post_delete], sender=GrupoOpcao)
+def invalidar_grupos_do_produto(sender, instance, **kwargs):
+    from .carrinho_cache import invalidar_grupos
+    invalidar_grupos([instance.produto_id])
+
+
+@receiver([post_save, post_delete], sender=Opcao)
+def invalidar_grupos_da_opcao(sender, instance, **kwargs):
+    from .carrinho_cache import invalidar_grupos
+    from .precos import invalidar
+    produto_ids = list(GrupoOpcao.objects.filter(pk=instance.grupo_id).values_list('produto_id', flat=True))
+    invalidar_grupos(produto_ids)
+    invalidar(produto_ids)  # a tabela de preços tem o adicional da opção
+
+
+# -----------------------------
+# TABELAS DE PREÇO
+# -----------------------------
+# As opções invalidam a tabela em invalidar_grupos_da_opcao, com a mesma consulta
+@receiver([post_save, post_delete], sender=Produto)
+@receiver([post_save, post_delete], sender=GrupoOpcao)
+def invalidar_precos_do_produto(sender, instance, **kwargs):
+    from .precos import invalidar
+    invalidar([instance.pk if sender is Produto else instance.produto_id])
+
+
+# -----------------------------
+# GET CONDICIONAL
+# -----------------------------
+# A categoria aparece no produto serializado, mas não tem data própria
+@receiver(post_save, sender=CategoriaProduto)
+@receiver(pre_delete, sender=CategoriaProduto)
+def tocar_produtos_da_categoria(sender, instance, created=False, **kwargs):
+    if not created:
+        Produto.objects.filter(categoria=instance).update(atualizado_em=timezone.now())
+
+
+# -----------------------------
+# POSIÇÃO DAS ENTREGAS
+# -----------------------------
+@receiver(post_save, sender=Entrega)
+def remover_posicao_da_entrega_concluida(sender, instance, **kwargs):
+    if instance.status == 'entregue':
+        from .posicoes import remover
+        remover(instance.pk)
+
+
+# -----------------------------
+# AUTOCOMPLETAR
+# -----------------------------
+_TIPOS_AUTOCOMPLETAR = {Restaurante: 'restaurante', Produto: 'produto', CategoriaProduto: 'categoria'}
+
+
+@receiver(post_save, sender=Restaurante)
+@receiver(post_save, sender=Produto)
+@receiver(post_save, sender=CategoriaProduto)
+def indexar_nome(sender, instance, update_fields=None, **kwargs):
+    # Baixa de estoque e afins salvam só os próprios campos: o nome não mudou
+    if update_fields is not None and not {'nome', 'restaurante'} & set(update_fields):
+        return
+    from .autocompletar import publicar
+    pk, nome = instance.pk, instance.nome
+    restaurante_id = instance.restaurante_id if sender is Produto else None
+    transaction.on_commit(lambda: publicar(_TIPOS_AUTOCOMPLETAR[sender], pk, nome, restaurante_id))
+
+
+@receiver(post_delete, sender=Restaurante)
+@receiver(post_delete, sender=Produto)
+@receiver(post_delete, sender=CategoriaProduto)
+def desindexar_nome(sender, instance, **kwargs):
+    from .autocompletar import publicar
+    pk = instance.pk  # o delete() zera o pk da instância antes do commit
+    transaction.on_commit(lambda: publicar(_TIPOS_AUTOCOMPLETAR[sender], pk, None))
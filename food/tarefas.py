@@ -0,0 +1,28 @@
+"""
+Tarefas da aplicação executadas pelos workers (``manage.py run_workers``).
+
+Cada uma é enfileirada pelas views e sinais com ``.enfileirar(...)`` e roda depois do
+commit; os argumentos são serializados em JSON, então vão ids e nomes, não instâncias.
+"""
+from .fila import tarefa
+from .models import Usuario
+
+
+@tarefa
+def apagar_arquivo(nome):
+    """Apaga do storage um arquivo que não é mais referenciado (ex.: foto de perfil trocada)."""
+    Usuario._meta.get_field('foto').storage.delete(nome)
+
+
+@tarefa(max_tentativas=3)
+def atualizar_certificados_google():
+    """Renova no cache as chaves públicas do Google antes de expirarem."""
+    from .login_google import baixar_certificados
+    baixar_certificados()
+
+
+@tarefa(max_tentativas=3)
+def atualizar_historico_entregas():
+    """Recalcula o histórico de duração das entregas usado na previsão de chegada."""
+    from .previsao import atualizar_historico
+    atualizar_historico()
@@ -1,3 +1,1842 @@
-from django.test import TestCase
+import itertools
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import OperationalError, connection, transaction
+from django.utils import timezone
+from django.test import AsyncClient, RequestFactory, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.test import APIClient, APIRequestFactory
+
+from .fila import BrokerBanco, ERRO_RESERVA_VENCIDA, processar, tarefa
+from .filtros import RestauranteFiltro, ProdutoFiltro, PedidoFiltro, EntregaFiltro, filtrar
+from .models import (
+    Usuario, Restaurante, CategoriaProduto, Produto, GrupoOpcao, Opcao, Carrinho, ItemCarrinho, Pedido, ItemPedido, Endereco,
+    Pagamento, Entrega, RastreamentoEntrega, Tarefa, EventoPedido, EstoqueInsuficiente
+)
+from .serializers import (
+    ProdutoSerializer, RestauranteSerializer, PedidoSerializer, CarrinhoSerializer, campos_incluidos
+)
+from .serializers_leitura import serializar_produtos, serializar_restaurantes, serializar_pedidos
+from .management.commands import tempo_importacao
+from .management.commands.teste_carga import percentil
+from . import (
+    admin as food_admin, aquecimento, autocompletar, carrinho_cache, idempotencia, login_google, metricas, posicoes, precos,
+    previsao, recomendacoes, senhas, shards, throttles,
+)
+from .roteador import RoteadorPrimarioReplica, RoteadorShards, liberar_replica, _leitura_em_replica
+from rest_framework_simplejwt.tokens import AccessToken
+
+
+def criar_cardapio():
+    dono = Usuario.objects.create_user('dono', 'dono@email.com', 'senha', perfil='restaurante')
+    cliente = Usuario.objects.create_user('cliente', 'cliente@email.com', 'senha')
+    categoria = CategoriaProduto.objects.create(nome='Lanches')
+    restaurante = Restaurante.objects.create(dono=dono, nome='Pizzaria', cnpj='1', endereco='Rua A')
+    Restaurante.objects.create(dono=dono, nome='Vazio', cnpj='2', endereco='Rua B', aberto=False)
+    x_burguer = Produto.objects.create(
+        restaurante=restaurante, categoria=categoria, nome='X-Burguer',
+        preco=Decimal('20'), imagem='produtos/x.png'
+    )
+    Produto.objects.create(restaurante=restaurante, nome='Suco', descricao='Laranja', preco=Decimal('7.5'))
+    return dono, cliente, restaurante, x_burguer
+
+
+class SerializacaoLeituraTests(TestCase):
+    """A serialização rápida deve gerar exatamente os mesmos bytes dos serializers"""
+
+    def setUp(self):
+        self.dono, self.cliente, self.restaurante, self.produto = criar_cardapio()
+        self.request = APIRequestFactory().get('/api/')
+
+    def assertMesmosBytes(self, esperado, obtido):
+        self.assertEqual(JSONRenderer().render(esperado), JSONRenderer().render(obtido))
+
+    def test_produtos(self):
+        produtos = Produto.objects.order_by('nome')
+        for request in (None, self.request):
+            self.assertMesmosBytes(
+                ProdutoSerializer(produtos, many=True, context={'request': request}).data,
+                serializar_produtos(produtos, request=request),
+            )
+
+    def test_restaurantes(self):
+        restaurantes = Restaurante.objects.order_by('nome')
+        self.assertMesmosBytes(
+            RestauranteSerializer(restaurantes, many=True, context={'request': self.request}).data,
+            serializar_restaurantes(restaurantes, request=self.request),
+        )
+
+    def test_pedidos(self):
+        pedido = Pedido.objects.create(
+            usuario=self.cliente, restaurante=self.restaurante,
+            valor_total=Decimal('47.5'), endereco_entrega='Rua C, 1'
+        )
+        ItemPedido.objects.create(
+            pedido=pedido, produto=self.produto, quantidade=2, preco_unitario=Decimal('21'),
+            opcoes=[{'nome': 'Bacon', 'preco_adicional': '1.00'}]
+        )
+        ItemPedido.objects.create(pedido=pedido, produto=None, quantidade=1, preco_unitario=Decimal('5.5'))
+        pedidos = Pedido.objects.all()
+        self.assertMesmosBytes(
+            PedidoSerializer(pedidos, many=True, context={'request': self.request}).data,
+            serializar_pedidos(pedidos, request=self.request),
+        )
+
+    def test_campos_sob_demanda(self):
+        restaurantes = Restaurante.objects.order_by('nome')
+        for url in ('/api/?expand=produtos', '/api/?fields=id,nome,produtos&expand=produtos', '/api/?fields=nome'):
+            request = Request(APIRequestFactory().get(url))
+            self.assertMesmosBytes(
+                RestauranteSerializer(restaurantes, many=True, context={'request': request}).data,
+                serializar_restaurantes(
+                    restaurantes, request=request, campos=campos_incluidos(RestauranteSerializer, request)
+                ),
+            )
+
+    def test_queryset_vazio(self):
+        self.assertEqual(serializar_restaurantes(Restaurante.objects.none()), [])
+        self.assertEqual(serializar_pedidos(Pedido.objects.none()), [])
+
+
+class MetricasTests(TestCase):
+    def setUp(self):
+        metricas.limpar()
+        criar_cardapio()
+        self.client = APIClient()
+
+    def test_registra_rota_sql_bytes_e_status(self):
+        resposta = self.client.get('/api/restaurantes/')
+        self.client.get('/api/restaurantes/')
+        self.client.get('/nao-existe/')
+
+        staff = Usuario.objects.create_user('staff', 'staff@email.com', 'senha', is_staff=True)
+        self.client.force_authenticate(staff)
+        texto = self.client.get('/metrics/').content.decode()
+
+        rotulos = 'rota="restaurante-list",metodo="GET"'
+        self.assertIn(f'happyfood_http_request_duration_seconds_count{{{rotulos}}} 2', texto)
+        self.assertIn(f'happyfood_http_request_duration_seconds_bucket{{{rotulos},le="+Inf"}} 2', texto)
+        self.assertIn(f'happyfood_http_responses_total{{{rotulos},status="200"}} 2', texto)
+        self.assertIn(f'happyfood_http_response_bytes_total{{{rotulos}}} {2 * len(resposta.content)}', texto)
+        # Por requisição: a agregação dos validadores (ETag) e a listagem (produtos só com ?expand=)
+        self.assertIn(f'happyfood_db_queries_total{{{rotulos}}} 4', texto)
+        self.assertIn('happyfood_http_responses_total{rota="<nao_resolvida>",metodo="GET",status="404"} 1', texto)
+
+    def test_threads_encerradas_sem_vazar_buffer(self):
+        threads = [
+            threading.Thread(target=metricas.registrar, args=('rota-x', 'GET', 0.01, 200, 10)) for _ in range(3)
+        ]
+        for thread in threads:
+            thread.start()
+            thread.join()
+        contagem = 'happyfood_http_request_duration_seconds_count{rota="rota-x",metodo="GET"} 3'
+        self.assertIn(contagem, metricas.exportar_prometheus())
+        self.assertFalse(any(thread in metricas._buffers for thread in threads))
+        # Somados ao que ficou das threads encerradas: o contador não volta para trás
+        self.assertIn(contagem, metricas.exportar_prometheus())
+
+    def test_somente_staff(self):
+        self.assertEqual(self.client.get('/metrics/').status_code, 401)
+        self.client.force_authenticate(Usuario.objects.get(username='cliente'))
+        self.assertEqual(self.client.get('/metrics/').status_code, 403)
+
+
+class TesteCargaTests(TestCase):
+    def test_fluxos_sem_erros_e_baseline(self):
+        with tempfile.TemporaryDirectory() as pasta:
+            caminho = os.path.join(pasta, 'baseline.json')
+            saida = StringIO()
+            call_command('teste_carga', concorrencia=1, iteracoes=2, rajada=3,
+                         salvar_baseline=caminho, stdout=saida)
+            with open(caminho, encoding='utf-8') as arquivo:
+                baseline = json.load(arquivo)
+            call_command('teste_carga', concorrencia=1, iteracoes=1, comparar=caminho, stdout=saida)
+
+        passos = baseline['passos']
+        self.assertEqual(set(passos), {
+            'listar_restaurantes', 'listar_produtos', 'adicionar_item', 'finalizar',
+            'atualizar_localizacao', 'refresh_token',
+        })
+        self.assertTrue(all(p['erros'] == 0 for p in passos.values()), passos)
+        self.assertEqual(passos['atualizar_localizacao']['requisicoes'], 6)
+        self.assertIn('Comparação com o baseline', saida.getvalue())
+        self.assertFalse(Usuario.objects.filter(username__startswith='carga-').exists())
+        self.assertFalse(Pedido.objects.exists())
+
+    def test_percentil_nearest_rank(self):
+        valores = list(range(1, 101))
+        self.assertEqual([percentil(valores, p) for p in (50, 95, 99, 100)], [50, 95, 99, 100])
+        self.assertEqual(percentil([3, 7], 50), 3)
+        self.assertEqual(percentil([], 99), 0.0)
+
+
+class SeedFoodTests(TestCase):
+    def gerar(self, seed):
+        call_command('seed_food', escala=0.02, seed=seed, ate='2025-01-31', limpar=True, stdout=StringIO())
+        return set(Pedido.objects.values_list('id', 'numero_pedido', 'valor_total', 'criado_em'))
+
+    def test_deterministico_por_seed(self):
+        primeira = self.gerar(7)
+        self.assertEqual(len(primeira), 400)
+        self.assertEqual(primeira, self.gerar(7))
+        self.assertNotEqual(primeira, self.gerar(8))
+
+    def test_distribuicoes(self):
+        self.gerar(7)
+        self.assertTrue(RastreamentoEntrega.objects.exists())
+        self.assertTrue(ItemPedido.objects.exclude(opcoes=[]).exists())
+        horas = [p.criado_em.hour for p in Pedido.objects.all()]
+        almoco = sum(11 <= h <= 13 for h in horas)
+        madrugada = sum(2 <= h <= 5 for h in horas)
+        self.assertGreater(almoco, 10 * max(madrugada, 1))
+
+    def test_limpar_com_eventos_e_tarefas(self):
+        self.gerar(7)
+        pedido = Pedido.objects.filter(status='pendente').first()
+        self.assertTrue(pedido.transicionar('confirmado'))
+        Tarefa.objects.create(nome='food.tarefas.qualquer', argumentos={'pedido': str(pedido.pk)})
+        self.gerar(7)
+        self.assertFalse(EventoPedido.objects.exists())
+        self.assertFalse(Tarefa.objects.exists())
+        connection.check_constraints()
+
+    def test_copy_preenche_datas_automaticas(self):
+        from .management.commands.seed_food import _EscritorCopy
+
+        conexao = mock.MagicMock()
+        conexao.ops.quote_name = connection.ops.quote_name
+        copy = conexao.cursor.return_value.__enter__.return_value.cursor.copy.return_value.__enter__.return_value
+        restaurante = Restaurante(dono_id=uuid.uuid4(), nome='Pizzaria', cnpj='1', endereco='Rua A')
+        linha = {campo.attname: getattr(restaurante, campo.attname) for campo in Restaurante._meta.concrete_fields}
+        del linha['criado_em'], linha['atualizado_em']
+        _EscritorCopy(conexao).gravar(Restaurante, [linha])
+
+        valores = dict(zip([campo.attname for campo in Restaurante._meta.concrete_fields], copy.write_row.call_args[0][0]))
+        self.assertIsNotNone(valores['criado_em'])
+        self.assertIsNotNone(valores['atualizado_em'])
+        self.assertEqual(valores['nome'], 'Pizzaria')
+
+
+class InicializacaoTests(TestCase):
+    """Subida do processo: sem dependências pesadas no import e aquecida antes da primeira requisição"""
+
+    def test_dependencias_pesadas_fora_da_subida(self):
+        saida = StringIO()
+        call_command('tempo_importacao', alvo='setup', verificar=True, stdout=saida)
+        self.assertIn('Nenhuma de google, numpy', saida.getvalue())
+        # Comandos (migrate, workers, cron) nem carregam o DRF
+        modulos = {linha[3] for linha in tempo_importacao.medir('')}
+        self.assertIn('food.sinais', modulos)
+        self.assertNotIn('rest_framework.serializers', modulos)
+
+    def test_aquecimento(self):
+        self.assertEqual(set(aquecimento.aquecer()), {'rotas', 'serializers', 'filtros', 'jwt'})
+        # Os sinais, registrados por sinais.py, continuam invalidando os snapshots
+        produto = criar_cardapio()[3]
+        carrinho_cache.produto_em_cache(produto.pk)
+        produto.nome = 'X-Salada'
+        produto.save()
+        self.assertEqual(carrinho_cache.produto_em_cache(produto.pk)['nome'], 'X-Salada')
+
+
+class ViewsAssincronasTests(TestCase):
+    """Sob ASGI as rotas de leitura usam views assíncronas com a mesma resposta das síncronas"""
+
+    def setUp(self):
+        self.dono, self.cliente, self.restaurante, self.produto = criar_cardapio()
+        pedido = Pedido.objects.create(usuario=self.cliente, restaurante=self.restaurante)
+        entregador = Usuario.objects.create_user('moto', 'moto@email.com', 'senha', perfil='entregador')
+        self.entrega = Entrega.objects.create(pedido=pedido, entregador=entregador)
+        RastreamentoEntrega.objects.create(entrega=self.entrega, latitude='-23.5', longitude='-46.612345')
+        self.async_client = AsyncClient()
+
+    def auth(self, usuario):
+        return {'headers': {'Authorization': f'Bearer {AccessToken.for_user(usuario)}'}}
+
+    async def assertMesmaResposta(self, url, **extras):
+        sincrona = await self.async_client.get(url, **extras)
+        with self.settings(ASYNC_ROOT_URLCONF=None):
+            esperada = await self.async_client.get(url, **extras)
+        self.assertEqual((sincrona.status_code, sincrona.content), (esperada.status_code, esperada.content))
+        return sincrona
+
+    async def test_paridade_com_views_sincronas(self):
+        restaurante, entrega = self.restaurante.pk, self.entrega.pk
+        cliente, dono = self.auth(self.cliente), self.auth(self.dono)
+        await self.assertMesmaResposta('/api/restaurantes/')
+        await self.assertMesmaResposta('/api/restaurantes/', **dono)
+        await self.assertMesmaResposta(f'/api/restaurantes/{restaurante}/produtos/', **cliente)
+        await self.assertMesmaResposta('/api/restaurantes/nao-e-uuid/produtos/')
+        await self.assertMesmaResposta('/api/produtos/')
+        resposta = await self.assertMesmaResposta(f'/api/entregas/{entrega}/?expand=rastreamentos', **cliente)
+        self.assertEqual(resposta.json()['rastreamentos'][0]['latitude'], '-23.500000')
+        await self.assertMesmaResposta(f'/api/entregas/{entrega}/?fields=id,status', **cliente)
+        await self.assertMesmaResposta('/api/restaurantes/?expand=produtos&fields=nome,produtos')
+        await self.assertMesmaResposta('/api/produtos/?preco_max=10&ordering=-preco')
+        await self.assertMesmaResposta('/api/produtos/?ordering=senha')
+        await self.assertMesmaResposta(f'/api/entregas/{entrega}/')
+        await self.assertMesmaResposta('/api/entregas/', **cliente)
+        await self.assertMesmaResposta('/api/restaurantes/', headers={'Authorization': 'Bearer invalido'})
+
+    async def test_posicao_atual(self):
+        posicoes.gravar(self.entrega.pk, '-23.5', '-46.6', timezone.now())
+        url = f'/api/entregas/{self.entrega.pk}/posicao_atual/'
+        resposta = await self.assertMesmaResposta(url, **self.auth(self.cliente))
+        self.assertEqual(resposta.json()['latitude'], '-23.500000')
+        await self.assertMesmaResposta('/api/entregas/nao-e-uuid/posicao_atual/', **self.auth(self.cliente))
+        await self.assertMesmaResposta(url)
+
+    async def test_limite_fora_do_event_loop(self):
+        await cache.aclear()
+        loop = threading.get_ident()
+        threads = []
+        consumir = throttles.consumir
+
+        def consumir_e_anotar(*args):
+            threads.append(threading.get_ident())
+            return consumir(*args)
+
+        with self.settings(THROTTLE_BALDES={'catalogo': (2, 1 / 60)}), \
+                mock.patch('food.throttles.consumir', side_effect=consumir_e_anotar):
+            codigos = [(await self.async_client.get('/api/produtos/')).status_code for _ in range(3)]
+        self.assertEqual(codigos, [200, 200, 429])
+        # As idas ao cache não bloqueiam o event loop
+        self.assertEqual(len(threads), 3)
+        self.assertNotIn(loop, threads)
+
+    async def test_usa_view_assincrona_so_para_leitura(self):
+        resposta = await self.async_client.get('/api/restaurantes/')
+        self.assertEqual(resposta.resolver_match.func.__name__, 'view')
+        resposta = await self.async_client.post('/api/restaurantes/', {}, content_type='application/json')
+        self.assertEqual(resposta.status_code, 401)
+
+    async def test_google_login(self):
+        info = {'email': 'nova@gmail.com', 'name': 'Nova', 'iss': 'accounts.google.com'}
+        with mock.patch('food.view_async.verificar_token_google', return_value=info):
+            resposta = await self.async_client.post(
+                '/api/auth/google/', {'id_token': 'x'}, content_type='application/json'
+            )
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.json()['usuario']['username'], 'nova')
+        self.assertTrue(await Usuario.objects.filter(email='nova@gmail.com').aexists())
+
+        with mock.patch('food.view_async.verificar_token_google', side_effect=ValueError):
+            resposta = await self.async_client.post(
+                '/api/auth/google/', {'id_token': 'x'}, content_type='application/json'
+            )
+        self.assertEqual(resposta.json(), {'erro': 'Token Google inválido.'})
+
+
+class RoteadorReplicaTests(TransactionTestCase):
+    """Leituras seguras vão para a réplica; escritas e transações ficam no primário"""
+    # Sem a transação em volta de cada teste, que mandaria toda leitura para o primário
+
+    def setUp(self):
+        self.dono, self.cliente, self.restaurante, self.produto = criar_cardapio()
+        self.client = APIClient()
+        self.client.force_authenticate(self.cliente)
+        cache.clear()
+        # A réplica de teste é o próprio banco; só registramos quando o roteador a escolhe
+        self.replica = mock.patch('food.roteador._escolher_replica', return_value='default')
+        self.escolhida = self.replica.start()
+        self.addCleanup(self.replica.stop)
+        configuracao = self.settings(DATABASE_REPLICAS=['replica_1'])
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+
+    def test_leitura_segura_vai_para_replica(self):
+        resposta = self.client.get('/api/restaurantes/')
+        self.assertEqual(resposta.status_code, 200)
+        self.assertTrue(self.escolhida.called)
+        # A liberação não vaza para fora da requisição
+        self.assertFalse(_leitura_em_replica.get())
+
+    def test_escrita_fixa_usuario_no_primario(self):
+        carrinho = Carrinho.objects.create(usuario=self.cliente, restaurante=self.restaurante)
+        resposta = self.client.post(f'/api/carrinhos/{carrinho.pk}/adicionar_item/', {
+            'produto_id': str(self.produto.pk), 'quantidade': 1,
+        }, format='json')
+        self.assertEqual(resposta.status_code, 201)
+        self.client.get('/api/carrinhos/')
+        self.assertFalse(self.escolhida.called)
+
+        outro = APIClient()
+        outro.force_authenticate(self.dono)
+        outro.get('/api/restaurantes/')
+        self.assertTrue(self.escolhida.called)
+
+    def test_transacao_e_select_for_update_ficam_no_primario(self):
+        roteador = RoteadorPrimarioReplica()
+        token = liberar_replica(self.cliente)
+        try:
+            self.assertEqual(roteador.db_for_read(Produto), 'default')
+            self.assertTrue(self.escolhida.called)
+            self.escolhida.reset_mock()
+            with transaction.atomic():
+                self.assertEqual(roteador.db_for_read(Produto), 'default')
+                self.assertEqual(Produto.objects.select_for_update().db, 'default')
+            self.assertFalse(self.escolhida.called)
+        finally:
+            _leitura_em_replica.reset(token)
+
+    def test_replicas_exigem_cache_compartilhado(self):
+        # A fixação no primário num cache de cada processo não valeria para os outros workers
+        ambiente = {**os.environ, 'DB_REPLICA_HOSTS': 'localhost', 'REDIS_URL': ''}
+        comando = [sys.executable, '-c', 'import happy_food_backend.settings']
+        processo = subprocess.run(comando, env=ambiente, cwd=settings.BASE_DIR, capture_output=True, text=True)
+        self.assertIn('ImproperlyConfigured: DB_REPLICA_HOSTS exige um cache compartilhado', processo.stderr)
+        ambiente['REDIS_URL'] = 'redis://localhost:6379/0'
+        processo = subprocess.run(comando, env=ambiente, cwd=settings.BASE_DIR, capture_output=True, text=True)
+        self.assertEqual(processo.returncode, 0, processo.stderr)
+
+    def test_sem_replicas_nao_libera(self):
+        with self.settings(DATABASE_REPLICAS=[]):
+            self.assertIsNone(liberar_replica(self.cliente))
+            self.client.get('/api/restaurantes/')
+        self.assertFalse(self.escolhida.called)
+
+
+class CarrinhoCacheTests(TestCase):
+    """O carrinho vive no cache e só é gravado no checkout ou no flush periódico"""
+
+    def setUp(self):
+        self.dono, self.cliente, self.restaurante, self.produto = criar_cardapio()
+        self.suco = Produto.objects.get(nome='Suco')
+        self.carrinho = Carrinho.objects.create(usuario=self.cliente, restaurante=self.restaurante)
+        self.url = f'/api/carrinhos/{self.carrinho.pk}/'
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.cliente)
+
+    def adicionar(self, produto, quantidade=1):
+        return self.client.post(self.url + 'adicionar_item/', {
+            'produto_id': str(produto.pk), 'quantidade': quantidade,
+        }, format='json')
+
+    def test_mutacao_nao_vai_ao_banco(self):
+        self.adicionar(self.produto)
+        with self.assertNumQueries(0):
+            resposta = self.adicionar(self.produto, 2)
+        self.assertEqual(resposta.status_code, 200)  # somou ao item existente
+        self.assertEqual(resposta.json()['quantidade'], 3)
+        self.assertEqual(resposta.json()['subtotal'], 60.0)
+        self.assertFalse(ItemCarrinho.objects.exists())
+
+        self.assertEqual(self.adicionar(Produto(pk='00000000-0000-0000-0000-000000000000')).status_code, 404)
+        resposta = self.client.post('/api/carrinhos/nao-e-uuid/adicionar_item/', {
+            'produto_id': str(self.produto.pk),
+        }, format='json')
+        self.assertEqual(resposta.status_code, 404)
+
+    def test_comando_exige_cache_compartilhado(self):
+        self.adicionar(self.produto)
+        with self.settings(DEBUG=False, CACHE_COMPARTILHADO=False), self.assertRaises(CommandError):
+            call_command('persistir_carrinhos', stdout=StringIO())
+        erros = StringIO()
+        with self.settings(DEBUG=True, CACHE_COMPARTILHADO=False):
+            call_command('persistir_carrinhos', stdout=StringIO(), stderr=erros)
+        self.assertIn('REDIS_URL', erros.getvalue())
+        with self.settings(CACHE_COMPARTILHADO=True):
+            saida = StringIO()
+            call_command('persistir_carrinhos', stdout=saida)
+        self.assertEqual(saida.getvalue().strip(), '0 carrinho(s) gravado(s)')
+
+    def test_flush_grava_mesmo_conteudo(self):
+        self.adicionar(self.produto, 2)
+        self.adicionar(self.suco)
+        em_cache = self.client.get(self.url).json()
+
+        self.assertEqual(carrinho_cache.persistir_pendentes(), 1)
+        self.assertEqual(carrinho_cache.persistir_pendentes(), 0)
+        self.assertEqual(ItemCarrinho.objects.filter(carrinho=self.carrinho).count(), 2)
+        esperado = json.loads(JSONRenderer().render(CarrinhoSerializer(self.carrinho).data))
+        self.assertEqual(em_cache, esperado)
+
+        # Sem o cache, o carrinho é remontado a partir das tabelas
+        carrinho_cache.descartar_carrinho(self.carrinho.pk)
+        self.assertEqual(self.client.get(self.url).json(), esperado)
+        self.assertEqual(self.client.get('/api/carrinhos/').json(), [esperado])
+
+    def test_finalizar_grava_conteudo_do_cache(self):
+        endereco = Endereco.objects.create(
+            usuario=self.cliente, rua='Rua C', numero='1', bairro='Centro', cidade='SP', estado='SP', cep='01000-000'
+        )
+        self.adicionar(self.produto, 2)
+        resposta = self.client.post(self.url + 'finalizar/', {'endereco_id': str(endereco.pk)}, format='json')
+        self.assertEqual(resposta.status_code, 201)
+        self.assertEqual(resposta.json()['valor_total'], '40.00')
+        self.assertFalse(ItemCarrinho.objects.exists())
+        self.assertEqual(self.client.get(self.url).json()['itens'], [])
+
+    def criar_grupos(self):
+        ponto = GrupoOpcao.objects.create(produto=self.produto, nome='Ponto', obrigatorio=True)
+        adicionais = GrupoOpcao.objects.create(produto=self.produto, nome='Adicionais', multipla_escolha=True)
+        return (
+            Opcao.objects.create(grupo=ponto, nome='Mal passado'),
+            Opcao.objects.create(grupo=ponto, nome='Bem passado'),
+            Opcao.objects.create(grupo=adicionais, nome='Bacon', preco_adicional=Decimal('3')),
+        )
+
+    def lote(self, *operacoes):
+        return self.client.post(self.url + 'itens/', {'operacoes': list(operacoes)}, format='json')
+
+    def test_lote_de_operacoes(self):
+        mal, bem, bacon = self.criar_grupos()
+        resposta = self.lote(
+            {'acao': 'adicionar', 'produto_id': str(self.produto.pk), 'quantidade': 2,
+             'opcoes': [str(mal.pk), str(bacon.pk)]},
+            {'acao': 'adicionar', 'produto_id': str(self.suco.pk)},
+        )
+        self.assertEqual(resposta.status_code, 200)
+        burguer, suco = resposta.json()['itens']
+        self.assertEqual(burguer['subtotal'], 46.0)
+        self.assertEqual([o['nome'] for o in burguer['opcoes_escolhidas']], ['Mal passado', 'Bacon'])
+
+        # Com produtos e opções em cache, o lote inteiro não vai ao banco
+        with self.assertNumQueries(0):
+            resposta = self.lote(
+                {'acao': 'alterar', 'item_id': burguer['id'], 'quantidade': 1, 'opcoes': [str(bem.pk)]},
+                {'acao': 'remover', 'item_id': suco['id']},
+                {'acao': 'adicionar', 'produto_id': str(self.produto.pk), 'opcoes': [str(bem.pk)]},
+            )
+        itens = resposta.json()['itens']
+        self.assertEqual([(i['quantidade'], i['subtotal']) for i in itens], [(2, 40.0)])
+
+        carrinho_cache.persistir_pendentes()
+        esperado = json.loads(JSONRenderer().render(CarrinhoSerializer(self.carrinho).data))
+        self.assertEqual(self.client.get(self.url).json(), esperado)
+
+    def test_lote_invalido_nao_aplica_nada(self):
+        mal, bem, bacon = self.criar_grupos()
+        self.adicionar(self.suco)
+        antes = self.client.get(self.url).json()
+        resposta = self.lote(
+            {'acao': 'adicionar', 'produto_id': str(self.suco.pk)},
+            {'acao': 'adicionar', 'produto_id': str(self.produto.pk), 'opcoes': [str(bacon.pk)]},
+            {'acao': 'adicionar', 'produto_id': str(self.produto.pk), 'opcoes': [str(mal.pk), str(bem.pk)]},
+            {'acao': 'remover', 'item_id': str(self.produto.pk)},
+        )
+        self.assertEqual(resposta.status_code, 400)
+        self.assertEqual(resposta.json()['operacoes'], {
+            '1': "O grupo de opções 'Ponto' é obrigatório.",
+            '2': "O grupo de opções 'Ponto' não permite múltiplas escolhas.",
+            '3': 'Item não encontrado no carrinho.',
+        })
+        self.assertEqual(self.client.get(self.url).json(), antes)
+
+        self.assertEqual(self.lote({'acao': 'alterar', 'quantidade': 0}).status_code, 400)
+        self.assertEqual(self.lote().status_code, 400)
+        resposta = self.client.post(self.url + 'adicionar_item/', {'produto_id': str(self.produto.pk)}, format='json')
+        self.assertEqual(resposta.status_code, 400)
+
+    def test_alteracao_de_produto_invalida_snapshot(self):
+        self.adicionar(self.produto)
+        self.produto.preco = Decimal('25')
+        self.produto.save()
+        item = self.client.get(self.url).json()['itens'][0]
+        self.assertEqual(item['produto']['preco'], '25.00')
+        self.restaurante.nome = 'Pizzaria Nova'
+        self.restaurante.save()
+        self.assertEqual(self.client.get(self.url).json()['itens'][0]['produto']['restaurante'], 'Pizzaria Nova')
+
+
+class PrecosTests(TestCase):
+    """Tabela de preços compilada por produto: Decimal exato, em cache e a mesma do carrinho ao pedido"""
+
+    def setUp(self):
+        self.dono, self.cliente, self.restaurante, self.produto = criar_cardapio()
+        cache.clear()
+        grupo = GrupoOpcao.objects.create(produto=self.produto, nome='Adicionais', multipla_escolha=True)
+        self.extras = [
+            Opcao.objects.create(grupo=grupo, nome=f'Extra {i}', preco_adicional=Decimal('0.10')) for i in range(3)
+        ]
+        # Como chega do adicionar_opcao: string
+        self.bacon = Opcao.objects.create(grupo=grupo, nome='Bacon', preco_adicional='3.33')
+        self.escolha = [*(extra.pk for extra in self.extras), self.bacon.pk]
+
+    def test_preco_exato(self):
+        tabela = precos.tabela(self.produto.pk)
+        self.assertEqual(tabela.preco_unitario([extra.pk for extra in self.extras]), Decimal('20.30'))
+        self.assertEqual(tabela.subtotal(self.escolha, 3), Decimal('70.89'))
+        self.assertEqual(tabela.preco_unitario([]), Decimal('20'))
+        with self.assertRaises(ValueError):
+            precos.tabela(Produto.objects.get(nome='Suco').pk).preco_unitario([self.bacon.pk])
+        self.assertIsNone(precos.tabela(uuid.uuid4()))
+        self.assertEqual(precos.tabelas(['nao-e-uuid']), {})
+
+    def test_cache_e_invalidacao(self):
+        precos.tabelas([self.produto.pk])
+        with self.assertNumQueries(0):
+            self.assertEqual(precos.tabela(self.produto.pk).subtotal(self.escolha, 1), Decimal('23.63'))
+
+        self.bacon.preco_adicional = Decimal('4')
+        self.bacon.save()
+        self.assertEqual(precos.tabela(self.produto.pk).preco_unitario([self.bacon.pk]), Decimal('24'))
+        self.produto.preco = Decimal('25')
+        self.produto.save()
+        self.assertEqual(precos.tabela(self.produto.pk).preco_unitario([self.bacon.pk]), Decimal('29'))
+        bacon_id = self.bacon.pk
+        self.bacon.grupo.delete()
+        with self.assertRaises(ValueError):
+            precos.tabela(self.produto.pk).preco_unitario([bacon_id])
+
+    def test_carrinho_e_pedido_com_o_mesmo_preco(self):
+        endereco = Endereco.objects.create(
+            usuario=self.cliente, rua='Rua C', numero='1', bairro='Centro', cidade='SP', estado='SP', cep='01000-000'
+        )
+        carrinho = Carrinho.objects.create(usuario=self.cliente, restaurante=self.restaurante)
+        url = f'/api/carrinhos/{carrinho.pk}/'
+        client = APIClient()
+        client.force_authenticate(self.cliente)
+        resposta = client.post(url + 'itens/', {'operacoes': [{
+            'acao': 'adicionar', 'produto_id': str(self.produto.pk), 'quantidade': 3,
+            'opcoes': [str(opcao_id) for opcao_id in self.escolha],
+        }]}, format='json')
+        self.assertEqual(resposta.json()['itens'][0]['subtotal'], 70.89)
+
+        # Preço alterado depois da escolha: o carrinho já mostra o que o checkout vai cobrar
+        self.bacon.preco_adicional = Decimal('4')
+        self.bacon.save()
+        self.assertEqual(client.get(url).json()['itens'][0]['subtotal'], 72.9)
+        resposta = client.post(url + 'finalizar/', {'endereco_id': str(endereco.pk)}, format='json')
+        self.assertEqual(resposta.status_code, 201)
+        self.assertEqual(resposta.json()['valor_total'], '72.90')
+        item = ItemPedido.objects.get()
+        self.assertEqual(item.preco_unitario, Decimal('24.30'))
+        self.assertIn({'nome': 'Bacon', 'preco_adicional': '4.00'}, item.opcoes)
+        self.assertEqual(len(item.opcoes), 4)
+
+
+class IdempotenciaTests(TestCase):
+    """Repetições com a mesma Idempotency-Key reproduzem a primeira resposta"""
+
+    def setUp(self):
+        self.dono, self.cliente, self.restaurante, self.produto = criar_cardapio()
+        self.carrinho = Carrinho.objects.create(usuario=self.cliente, restaurante=self.restaurante)
+        self.endereco = Endereco.objects.create(
+            usuario=self.cliente, rua='Rua C', numero='1', bairro='Centro', cidade='SP', estado='SP', cep='01000-000'
+        )
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.cliente)
+        self.client.post(f'/api/carrinhos/{self.carrinho.pk}/adicionar_item/', {
+            'produto_id': str(self.produto.pk), 'quantidade': 2,
+        }, format='json')
+
+    def finalizar(self, chave, endereco=None):
+        return self.client.post(
+            f'/api/carrinhos/{self.carrinho.pk}/finalizar/',
+            {'endereco_id': str(endereco or self.endereco.pk)}, format='json', HTTP_IDEMPOTENCY_KEY=chave
+        )
+
+    def test_repeticao_reproduz_resposta_sem_executar(self):
+        primeira = self.finalizar('chave-1')
+        self.assertEqual(primeira.status_code, 201)
+        with self.assertNumQueries(0):
+            segunda = self.finalizar('chave-1')
+        self.assertEqual((segunda.status_code, segunda.json()), (201, primeira.json()))
+        self.assertEqual(segunda['Idempotent-Replayed'], 'true')
+        self.assertEqual(Pedido.objects.count(), 1)
+
+        # Outra chave executa de novo (o carrinho agora está vazio)
+        self.assertEqual(self.finalizar('chave-2').status_code, 400)
+
+    def test_mesma_chave_com_outro_corpo(self):
+        self.finalizar('chave-1')
+        resposta = self.finalizar('chave-1', endereco='00000000-0000-0000-0000-000000000000')
+        self.assertEqual(resposta.status_code, 422)
+
+    def test_repeticao_concorrente_espera_a_primeira(self):
+        execucoes, respostas = [], []
+        liberar = threading.Event()
+
+        class View:
+            @idempotencia.idempotente
+            def create(self, request):
+                execucoes.append(request)
+                liberar.wait(5)
+                return Response({'execucoes': len(execucoes)}, status=201)
+
+        def chamar():
+            request = Request(APIRequestFactory().post('/api/pagamentos/', {'valor': '10'}, format='json',
+                                                       HTTP_IDEMPOTENCY_KEY='chave-1'))
+            request.user = self.cliente
+            respostas.append(View().create(request))
+
+        threads = [threading.Thread(target=chamar) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        while not execucoes:
+            threading.Event().wait(0.01)
+        liberar.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(execucoes), 1)
+        self.assertEqual([r.data for r in respostas], [{'execucoes': 1}] * 3)
+        self.assertEqual(sum(r.has_header('Idempotent-Replayed') for r in respostas), 2)
+
+    def test_execucao_lenta_mantem_a_chave(self):
+        execucoes, respostas = [], []
+        liberar = threading.Event()
+
+        class View:
+            @idempotencia.idempotente
+            def create(self, request):
+                execucoes.append(request)
+                liberar.wait(5)
+                return Response({'execucoes': len(execucoes)}, status=201)
+
+        def chamar():
+            request = Request(APIRequestFactory().post('/api/pagamentos/', {'valor': '10'}, format='json',
+                                                       HTTP_IDEMPOTENCY_KEY='chave-1'))
+            request.user = self.cliente
+            respostas.append(View().create(request))
+
+        # A primeira execução passa da validade da marca; a renovação (uma thread nova, com o
+        # intervalo curto) a mantém
+        with mock.patch.object(idempotencia, 'ESPERA_MAXIMA', 0.3), \
+                mock.patch.object(idempotencia, 'RENOVACAO_ANDAMENTO', 0.05), \
+                mock.patch.object(idempotencia, '_renovador', None):
+            primeira = threading.Thread(target=chamar)
+            primeira.start()
+            while not execucoes:
+                threading.Event().wait(0.01)
+            threading.Event().wait(0.6)
+            chamar()
+            liberar.set()
+            primeira.join()
+
+        self.assertEqual(len(execucoes), 1)
+        self.assertEqual(respostas[0].status_code, 409)
+        self.assertEqual(respostas[1].data, {'execucoes': 1})
+        self.assertFalse(idempotencia._em_andamento)
+
+    def test_pagamento(self):
+        pedido = Pedido.objects.create(usuario=self.cliente, restaurante=self.restaurante)
+        dados = {'pedido': str(pedido.pk), 'metodo': 'pix', 'valor': '40.00'}
+        primeira = self.client.post('/api/pagamentos/', dados, format='json', HTTP_IDEMPOTENCY_KEY='pg-1')
+        segunda = self.client.post('/api/pagamentos/', dados, format='json', HTTP_IDEMPOTENCY_KEY='pg-1')
+        self.assertEqual(primeira.status_code, 201)
+        self.assertEqual(segunda.json(), primeira.json())
+        self.assertEqual(Pagamento.objects.count(), 1)
+
+
+class ThrottleTests(TestCase):
+    """Balde de tokens por escopo: o abuso de um cliente não consome o orçamento dos outros"""
+
+    def setUp(self):
+        self.dono, self.cliente, self.restaurante, self.produto = criar_cardapio()
+        cache.clear()
+
+    def test_balde_de_tokens(self):
+        relogio = [1_000_000]
+        with mock.patch('food.throttles._agora_ms', side_effect=lambda: relogio[0]):
+            self.assertEqual([throttles.consumir('balde:teste', 3, 1) for _ in range(3)], [0, 0, 0])
+            self.assertEqual(throttles.consumir('balde:teste', 3, 1), 1.0)
+            relogio[0] += 500
+            self.assertEqual(throttles.consumir('balde:teste', 3, 1), 0.5)
+            relogio[0] += 500
+            self.assertEqual(throttles.consumir('balde:teste', 3, 1), 0)
+            self.assertEqual(throttles.consumir('balde:teste', 3, 1), 1.0)
+            # Ociosidade longa enche o balde, mas não além da capacidade
+            relogio[0] += 60_000
+            self.assertEqual([throttles.consumir('balde:teste', 3, 1) for _ in range(4)], [0, 0, 0, 1.0])
+
+    def test_abuso_nao_afeta_cliente_bem_comportado(self):
+        atacante, bem_comportado = APIClient(), APIClient()
+        bem_comportado.force_authenticate(self.cliente)
+        baldes = {'auth': (3, 1 / 60), 'catalogo': (5, 1)}
+        with self.settings(THROTTLE_BALDES=baldes), \
+                mock.patch.object(Usuario, 'check_password', autospec=True, return_value=False) as hashing:
+            respostas = [
+                atacante.post('/auth/token/', {'username': 'dono', 'password': 'x'}, format='json')
+                for _ in range(3)
+            ]
+            self.assertEqual({r.status_code for r in respostas}, {401})
+            # Depois do orçamento, a recusa não consulta o banco nem calcula hash de senha
+            with self.assertNumQueries(0):
+                recusada = atacante.post('/auth/token/', {'username': 'dono', 'password': 'x'}, format='json')
+            self.assertEqual(recusada.status_code, 429)
+            self.assertEqual(int(recusada['Retry-After']), 60)
+            self.assertEqual(hashing.call_count, 3)
+
+            # Catálogo: o balde é por usuário
+            atacante.force_authenticate(self.dono)
+            codigos = [atacante.get('/api/produtos/').status_code for _ in range(8)]
+            self.assertEqual(codigos.count(429), 3)
+            self.assertEqual(
+                [bem_comportado.get('/api/produtos/').status_code for _ in range(5)], [200] * 5
+            )
+
+    def test_gps_limitado_por_entregador(self):
+        entregadores = [
+            Usuario.objects.create_user(f'moto{i}', f'moto{i}@email.com', 'senha', perfil='entregador')
+            for i in range(2)
+        ]
+        pedido = Pedido.objects.create(usuario=self.cliente, restaurante=self.restaurante)
+        entrega = Entrega.objects.create(pedido=pedido, entregador=entregadores[0])
+        url = f'/api/entregas/{entrega.pk}/atualizar_localizacao/'
+        ponto = {'latitude': '-23.5', 'longitude': '-46.6'}
+        with self.settings(THROTTLE_BALDES={'gps': (2, 1)}):
+            inundando = APIClient()
+            inundando.force_authenticate(entregadores[0])
+            codigos = [inundando.post(url, ponto, format='json').status_code for _ in range(4)]
+            self.assertEqual(codigos, [201, 201, 429, 429])
+            outro = APIClient()
+            outro.force_authenticate(entregadores[1])
+            self.assertEqual(outro.post(url, ponto, format='json').status_code, 201)
+
+
+class SenhasTests(TestCase):
+    """Hash de senha no pool limitado, com recusa quando a fila enche e rehash no login"""
+
+    def test_hash_fora_da_thread_da_requisicao(self):
+        threads = []
+        make_password = senhas.hashers.make_password
+
+        def registrar_thread(*args, **kwargs):
+            threads.append(threading.current_thread().name)
+            return make_password(*args, **kwargs)
+
+        with self.settings(SENHA_WORKERS=2), mock.patch.object(senhas.hashers, 'make_password', registrar_thread):
+            resposta = APIClient().post(
+                '/api/usuarios/registrar/', {'username': 'novo', 'email': 'novo@email.com', 'password': 'senha-forte'},
+                format='json'
+            )
+        self.assertEqual(resposta.status_code, 201)
+        self.assertEqual(len(threads), 1)
+        self.assertTrue(threads[0].startswith('senhas'))
+        self.assertTrue(Usuario.objects.get(username='novo').check_password('senha-forte'))
+
+    def test_fila_cheia_devolve_503(self):
+        Usuario.objects.create_user('cliente', 'cliente@email.com', 'senha')
+        ocupado, liberar = threading.Event(), threading.Event()
+
+        def ocupar():
+            ocupado.set()
+            liberar.wait(5)
+
+        with self.settings(SENHA_WORKERS=1, SENHA_FILA_MAXIMA=0, THROTTLE_BALDES={}):
+            thread = threading.Thread(target=senhas._executar, args=(ocupar,))
+            thread.start()
+            ocupado.wait(5)
+            try:
+                recusada = APIClient().post('/auth/token/', {'username': 'cliente', 'password': 'senha'}, format='json')
+            finally:
+                liberar.set()
+                thread.join()
+            self.assertEqual(recusada.status_code, 503)
+            self.assertEqual(recusada['Retry-After'], '1')
+            aceita = APIClient().post('/auth/token/', {'username': 'cliente', 'password': 'senha'}, format='json')
+            self.assertEqual(aceita.status_code, 200)
+
+    def test_rehash_no_login(self):
+        with self.settings(SENHA_PBKDF2_ITERACOES=1000):
+            usuario = Usuario.objects.create_user('cliente', 'cliente@email.com', 'senha')
+        self.assertTrue(usuario.password.startswith('pbkdf2_sha256$1000$'))
+
+        hashers = ['food.senhas.ScryptCalibrado', 'food.senhas.PBKDF2Calibrado']
+        with self.settings(PASSWORD_HASHERS=hashers, SENHA_SCRYPT_N=2 ** 10, SENHA_SCRYPT_R=8, SENHA_SCRYPT_P=1):
+            errada = APIClient().post('/auth/token/', {'username': 'cliente', 'password': 'x'}, format='json')
+            self.assertEqual(errada.status_code, 401)
+            usuario.refresh_from_db()
+            self.assertTrue(usuario.password.startswith('pbkdf2_sha256$1000$'))
+
+            resposta = APIClient().post('/auth/token/', {'username': 'cliente', 'password': 'senha'}, format='json')
+            self.assertEqual(resposta.status_code, 200)
+            usuario.refresh_from_db()
+            self.assertTrue(usuario.password.startswith('scrypt$'))
+            self.assertEqual(senhas.verificar('senha', usuario.password), (True, None))
+
+            # Custo novo no settings: o próximo login refaz o hash outra vez
+            with self.settings(SENHA_SCRYPT_N=2 ** 11):
+                self.assertTrue(usuario.check_password('senha'))
+            self.assertIn('$2048$', Usuario.objects.get(pk=usuario.pk).password)
+
+
+class StatusPedidoTests(TestCase):
+    """Mudanças de status por compare-and-set, com evento no outbox"""
+
+    def setUp(self):
+        self.dono, self.cliente, self.restaurante, self.produto = criar_cardapio()
+        self.pedido = Pedido.objects.create(usuario=self.cliente, restaurante=self.restaurante)
+        self.client = APIClient()
+        self.client.force_authenticate(self.cliente)
+        self.url = f'/api/pedidos/{self.pedido.pk}/alterar_status/'
+
+    def test_transicoes(self):
+        resposta = self.client.post(self.url, {'status': 'entregue'}, format='json')
+        self.assertEqual(resposta.status_code, 409)
+        self.assertEqual(resposta.json(), {'erro': 'Transição de status inválida: pendente → entregue.'})
+
+        for novo in ('confirmado', 'em_preparo', 'a_caminho', 'entregue'):
+            resposta = self.client.post(self.url, {'status': novo}, format='json')
+            self.assertEqual((resposta.status_code, resposta.json()['status']), (200, novo))
+        self.assertEqual(self.client.post(self.url, {'status': 'cancelado'}, format='json').status_code, 409)
+        self.assertEqual(
+            list(EventoPedido.objects.order_by('id').values_list('status_anterior', 'status_novo')),
+            [('pendente', 'confirmado'), ('confirmado', 'em_preparo'), ('em_preparo', 'a_caminho'),
+             ('a_caminho', 'entregue')],
+        )
+
+    def test_sem_atualizacao_perdida(self):
+        restaurante = Pedido.objects.get(pk=self.pedido.pk)
+        cliente = Pedido.objects.get(pk=self.pedido.pk)
+        self.assertTrue(restaurante.transicionar('confirmado'))
+        # O segundo ainda vê "pendente": o UPDATE condicional não encontra a linha
+        self.assertFalse(cliente.transicionar('cancelado'))
+        self.pedido.refresh_from_db()
+        self.assertEqual(self.pedido.status, 'confirmado')
+        self.assertEqual(EventoPedido.objects.count(), 1)
+
+        resposta = self.client.post(self.url, {'status': 'cancelado', 'status_atual': 'pendente'}, format='json')
+        self.assertEqual(resposta.status_code, 409)
+        self.assertEqual(resposta.json()['status'], 'confirmado')
+
+    def test_eventos_por_cursor(self):
+        for novo in ('confirmado', 'em_preparo'):
+            self.client.post(self.url, {'status': novo}, format='json')
+        self.assertEqual(self.client.get('/api/pedidos/eventos/').json(), {'eventos': [], 'cursor': 0})
+
+        with self.settings(EVENTOS_ATRASO_LEITURA=0):
+            pagina = self.client.get('/api/pedidos/eventos/').json()
+            self.assertEqual([e['status_novo'] for e in pagina['eventos']], ['confirmado', 'em_preparo'])
+            self.client.post(self.url, {'status': 'cancelado'}, format='json')
+            pagina = self.client.get('/api/pedidos/eventos/', {'desde': pagina['cursor']}).json()
+        self.assertEqual(
+            [(e['status_anterior'], e['status_novo']) for e in pagina['eventos']], [('em_preparo', 'cancelado')]
+        )
+
+
+class RespostaCondicionalTests(TestCase):
+    """ETag/Last-Modified calculados por agregação, com 304 sem serializar"""
+
+    def setUp(self):
+        self.dono, self.cliente, self.restaurante, self.produto = criar_cardapio()
+        cache.clear()
+        self.client = APIClient()
+
+    def test_listagem_publica(self):
+        url = '/api/restaurantes/?expand=produtos'
+        resposta = self.client.get(url)
+        self.assertEqual(resposta['Cache-Control'], 'public, max-age=60')
+        self.assertIn('Authorization', resposta['Vary'])
+        etag = resposta['ETag']
+        sem_produtos = self.client.get('/api/restaurantes/')['ETag']
+        self.assertNotEqual(sem_produtos, etag)
+
+        with self.assertNumQueries(1):
+            resposta = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 304)
+        self.assertEqual(resposta.content, b'')
+        self.assertEqual(resposta['ETag'], etag)
+
+        # Produto aninhado alterado ou removido muda a versão da listagem de restaurantes que o mostra
+        self.produto.preco = Decimal('21')
+        self.produto.save()
+        self.assertEqual(self.client.get('/api/restaurantes/', HTTP_IF_NONE_MATCH=sem_produtos).status_code, 304)
+        resposta = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 200)
+        etag = resposta['ETag']
+        Produto.objects.filter(nome='Suco').delete()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_detalhe_com_if_modified_since(self):
+        url = f'/api/produtos/{self.produto.pk}/'
+        resposta = self.client.get(url)
+        ultima = resposta['Last-Modified']
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=ultima).status_code, 304)
+        self.assertEqual(self.client.get('/api/produtos/nao-existe/', HTTP_IF_NONE_MATCH='*').status_code, 404)
+
+        # Renomear a categoria muda o produto serializado
+        etag = resposta['ETag']
+        CategoriaProduto.objects.filter(pk=self.produto.categoria_id).get().save()
+        self.assertNotEqual(self.client.get(url)['ETag'], etag)
+
+    def test_pedidos_sao_privados(self):
+        pedido = Pedido.objects.create(usuario=self.cliente, restaurante=self.restaurante)
+        self.client.force_authenticate(self.cliente)
+        resposta = self.client.get('/api/pedidos/')
+        self.assertEqual(resposta['Cache-Control'], 'private, no-cache')
+        etag = resposta['ETag']
+        self.assertEqual(self.client.get('/api/pedidos/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        pedido.transicionar('confirmado')
+        self.assertEqual(self.client.get('/api/pedidos/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    async def test_views_assincronas_usam_a_mesma_versao(self):
+        with self.settings(ASYNC_ROOT_URLCONF=None):
+            sincrona = await self.async_client.get('/api/restaurantes/')
+        resposta = await self.async_client.get('/api/restaurantes/', headers={'If-None-Match': sincrona['ETag']})
+        self.assertEqual(resposta.status_code, 304)
+        self.assertEqual(resposta['Cache-Control'], 'public, max-age=60')
+
+
+class CamposSobDemandaTests(TestCase):
+    def setUp(self):
+        self.dono, self.cliente, self.restaurante, self.produto = criar_cardapio()
+        cache.clear()
+        self.client = APIClient()
+
+    def test_relacoes_aninhadas_sob_demanda(self):
+        url = f'/api/restaurantes/{self.restaurante.pk}/'
+        # Validadores (ETag) e o restaurante com o dono; os produtos só com ?expand=
+        with self.assertNumQueries(2):
+            resposta = self.client.get(url)
+        self.assertNotIn('produtos', resposta.json())
+        with self.assertNumQueries(3):
+            resposta = self.client.get(f'{url}?expand=produtos')
+        self.assertEqual(len(resposta.json()['produtos']), 2)
+
+        detalhe = self.client.get(f'{url}?fields=id,produtos&expand=produtos').json()
+        listagem = self.client.get('/api/restaurantes/?fields=id,produtos&expand=produtos').json()
+        self.assertEqual(list(detalhe), ['id', 'produtos'])
+        self.assertIn(detalhe, listagem)
+
+    def test_fields_limita_a_resposta(self):
+        resposta = self.client.get('/api/produtos/?fields=id,nome,inexistente')
+        self.assertEqual([list(produto) for produto in resposta.json()], [['id', 'nome']] * 2)
+        resposta = self.client.get(f'/api/produtos/{self.produto.pk}/?fields=preco')
+        self.assertEqual(resposta.json(), {'preco': '20.00'})
+
+    def test_escrita_nao_descarta_campos_enviados(self):
+        self.client.force_authenticate(self.dono)
+        resposta = self.client.patch(
+            f'/api/restaurantes/{self.restaurante.pk}/?fields=id', {'nome': 'Pizzaria Nova'}, format='json'
+        )
+        self.assertEqual(resposta.status_code, 200)
+        self.restaurante.refresh_from_db()
+        self.assertEqual(self.restaurante.nome, 'Pizzaria Nova')
+
+
+class FiltrosTests(TestCase):
+    def setUp(self):
+        self.dono, self.cliente, self.restaurante, self.produto = criar_cardapio()
+        cache.clear()
+        self.client = APIClient()
+
+    def nomes(self, url):
+        resposta = self.client.get(url)
+        self.assertEqual(resposta.status_code, 200)
+        return [item['nome'] for item in resposta.json()]
+
+    def test_filtros_e_ordenacao_de_produtos(self):
+        Produto.objects.create(restaurante=self.restaurante, nome='Água', preco=Decimal('3'), disponivel=False)
+        self.assertEqual(self.nomes('/api/produtos/?ordering=-preco'), ['X-Burguer', 'Suco', 'Água'])
+        self.assertEqual(self.nomes('/api/produtos/?disponivel=true&preco_max=10'), ['Suco'])
+        self.assertEqual(self.nomes(f'/api/produtos/?categoria={self.produto.categoria_id}'), ['X-Burguer'])
+        self.assertEqual(self.nomes('/api/produtos/?preco_min=5&ordering=preco'), ['Suco', 'X-Burguer'])
+
+    def test_parametros_invalidos(self):
+        for url in ('/api/produtos/?ordering=senha', '/api/produtos/?categoria=abc',
+                    '/api/produtos/?preco_min=barato'):
+            resposta = self.client.get(url)
+            self.assertEqual(resposta.status_code, 400, url)
+
+    def test_pedidos_por_status_e_data(self):
+        self.client.force_authenticate(self.cliente)
+        pedido = Pedido.objects.create(usuario=self.cliente, restaurante=self.restaurante)
+        Pedido.objects.create(usuario=self.cliente, restaurante=self.restaurante, status='cancelado')
+        hoje = pedido.data_referencia.isoformat()
+        resposta = self.client.get(f'/api/pedidos/?status=pendente&data_inicio={hoje}&data_fim={hoje}')
+        self.assertEqual([p['id'] for p in resposta.json()], [str(pedido.pk)])
+        self.assertEqual(self.client.get('/api/pedidos/?status=sumido').status_code, 400)
+
+    def test_toda_combinacao_usa_indice(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Verifica o plano do SQLite')
+        uuid = str(self.restaurante.pk)
+        casos = {
+            ProdutoFiltro: (Produto, {
+                'restaurante': uuid, 'categoria': uuid, 'disponivel': 'true', 'preco_min': '5', 'preco_max': '50',
+            }),
+            RestauranteFiltro: (Restaurante, {'aberto': 'true', 'dono': uuid}),
+            PedidoFiltro: (Pedido, {
+                'restaurante': uuid, 'status': 'pendente', 'data_inicio': '2025-01-01', 'data_fim': '2025-02-01',
+            }),
+            EntregaFiltro: (Entrega, {
+                'status': 'em_rota', 'entregador': uuid,
+                'inicio_apos': '2025-01-01T00:00:00Z', 'inicio_antes': '2025-02-01T00:00:00Z',
+            }),
+        }
+        for filterset_class, (modelo, parametros) in casos.items():
+            for quantidade in range(1, len(parametros) + 1):
+                for combinacao in itertools.combinations(parametros, quantidade):
+                    # O SQLite compara booleanos sem "= 1", o que impede o índice; o PostgreSQL o usa
+                    if combinacao in (('disponivel',), ('aberto',)):
+                        continue
+                    request = RequestFactory().get('/', {nome: parametros[nome] for nome in combinacao})
+                    plano = filtrar(filterset_class, request, modelo.objects.all()).explain()
+                    self.assertIn('USING', plano, f'{filterset_class.__name__} {combinacao}: {plano}')
+            # Cada ordenação aceita sai de um índice, sem ordenar a tabela inteira
+            for campo in filterset_class.base_filters['ordering'].param_map:
+                for ordem in (campo, f'-{campo}'):
+                    request = RequestFactory().get('/', {'ordering': ordem})
+                    plano = filtrar(filterset_class, request, modelo.objects.all()).explain()
+                    self.assertIn('USING', plano, f'{filterset_class.__name__} {ordem}: {plano}')
+                    self.assertNotIn('TEMP B-TREE', plano, f'{filterset_class.__name__} {ordem}: {plano}')
+
+
+class EstoqueTests(TestCase):
+    def setUp(self):
+        self.dono, self.cliente, self.restaurante, self.produto = criar_cardapio()
+        self.suco = Produto.objects.get(nome='Suco')
+        Produto.objects.filter(pk=self.produto.pk).update(estoque=3, limite_diario=3)
+        cache.clear()
+
+    def test_baixa_condicional_e_esgotamento(self):
+        atualizado_em = self.suco.atualizado_em
+        Produto.reservar_estoque({self.produto.pk: 2, self.suco.pk: 5})
+        self.produto.refresh_from_db()
+        self.assertEqual((self.produto.estoque, self.produto.disponivel), (1, True))
+
+        Produto.reservar_estoque({self.produto.pk: 1})
+        self.produto.refresh_from_db()
+        self.assertEqual((self.produto.estoque, self.produto.disponivel), (0, False))
+        with self.assertRaisesMessage(EstoqueInsuficiente, "Estoque insuficiente para 'X-Burguer'."):
+            Produto.reservar_estoque({self.produto.pk: 1})
+        # Sem estoque controlado, o produto nem é atualizado
+        self.suco.refresh_from_db()
+        self.assertEqual(self.suco.atualizado_em, atualizado_em)
+
+        saida = StringIO()
+        call_command('repor_estoque', stdout=saida)
+        self.assertIn('1 produto(s)', saida.getvalue())
+        self.produto.refresh_from_db()
+        self.assertEqual((self.produto.estoque, self.produto.disponivel), (3, True))
+
+    def test_finalizar_sem_estoque_nao_cria_pedido(self):
+        endereco = Endereco.objects.create(
+            usuario=self.cliente, rua='Rua C', numero='1', bairro='Centro', cidade='SP', estado='SP', cep='01000-000'
+        )
+        carrinho = Carrinho.objects.create(usuario=self.cliente, restaurante=self.restaurante)
+        client = APIClient()
+        client.force_authenticate(self.cliente)
+        url = f'/api/carrinhos/{carrinho.pk}/'
+        client.post(url + 'adicionar_item/', {'produto_id': str(self.produto.pk), 'quantidade': 4}, format='json')
+        self.assertEqual(client.get('/api/produtos/').json()[0]['estoque'], 3)
+
+        resposta = client.post(url + 'finalizar/', {'endereco_id': str(endereco.pk)}, format='json')
+        self.assertEqual(resposta.status_code, 409)
+        self.assertFalse(Pedido.objects.exists())
+        self.assertEqual(len(client.get(url).json()['itens']), 1)
+
+        client.post(url + 'itens/', {'operacoes': [
+            {'acao': 'alterar', 'item_id': client.get(url).json()['itens'][0]['id'], 'quantidade': 3},
+        ]}, format='json')
+        resposta = client.post(url + 'finalizar/', {'endereco_id': str(endereco.pk)}, format='json')
+        self.assertEqual(resposta.status_code, 201)
+        # O snapshot do carrinho foi invalidado: o produto esgotado não entra mais
+        resposta = client.post(url + 'adicionar_item/', {'produto_id': str(self.produto.pk)}, format='json')
+        self.assertEqual(resposta.status_code, 400)
+
+
+class EstoqueConcorrenciaTests(TransactionTestCase):
+    def test_checkouts_simultaneos_nao_vendem_alem_do_estoque(self):
+        dono, cliente, restaurante, produto = criar_cardapio()
+        Produto.objects.filter(pk=produto.pk).update(estoque=5)
+        vendidos, esgotados = [], []
+        inicio = threading.Barrier(8)
+
+        def comprar():
+            inicio.wait()
+            try:
+                while True:
+                    try:
+                        with transaction.atomic():
+                            Produto.reservar_estoque({produto.pk: 1})
+                        vendidos.append(1)
+                    except EstoqueInsuficiente:
+                        esgotados.append(1)
+                    except OperationalError:
+                        # SQLite recusa escritas simultâneas ("table is locked") em vez de esperar
+                        continue
+                    return
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=comprar) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        produto.refresh_from_db()
+        self.assertEqual((len(vendidos), len(esgotados)), (5, 3))
+        self.assertEqual((produto.estoque, produto.disponivel), (0, False))
+
+
+class PrevisaoChegadaTests(TestCase):
+    """ETA: velocidade incremental a cada ponto de GPS combinada com o histórico do restaurante"""
+
+    def setUp(self):
+        cache.clear()
+        self.dono, self.cliente, self.restaurante, _ = criar_cardapio()
+        self.agora = timezone.now()
+
+    def entrega_concluida(self, restaurante, minutos, dias_atras=0):
+        pedido = Pedido.objects.create(usuario=self.cliente, restaurante=restaurante)
+        inicio = self.agora - timedelta(days=dias_atras, hours=2)
+        entrega = Entrega.objects.create(
+            pedido=pedido, status='entregue', inicio=inicio, fim=inicio + timedelta(minutes=minutos)
+        )
+        for i in range(3):
+            ponto = RastreamentoEntrega.objects.create(
+                entrega=entrega, latitude=Decimal('-23.5') + Decimal('0.01') * i, longitude='-46.6'
+            )
+            RastreamentoEntrega.objects.filter(pk=ponto.pk).update(registrado_em=inicio + timedelta(minutes=2 * i))
+        return entrega
+
+    def test_historico_vetorizado_por_restaurante(self):
+        for minutos in (10, 20, 30, 40, 50):
+            self.entrega_concluida(self.restaurante, minutos)
+        outro = Restaurante.objects.get(nome='Vazio')
+        self.entrega_concluida(outro, 60)
+        self.entrega_concluida(self.restaurante, 500, dias_atras=40)
+
+        historico = previsao.calcular_historico()
+        proprio = historico[str(self.restaurante.pk)]
+        self.assertEqual((proprio['duracao'], proprio['entregas']), (30 * 60, 5))
+        self.assertAlmostEqual(proprio['distancia'], 2 * previsao.distancia(-23.5, -46.6, -23.49, -46.6), places=3)
+        # Poucas entregas: o restaurante usa o histórico geral
+        self.assertNotIn(str(outro.pk), historico)
+        self.assertEqual((historico['*']['duracao'], historico['*']['entregas']), (35 * 60, 6))
+
+    def test_velocidade_incremental(self):
+        estado = {
+            'inicio': 0.0, 'lat': None, 'lon': None, 't': None,
+            'pontos': 0, 'trechos': 0, 'percorrido': 0.0, 'velocidade': None,
+        }
+        passo = 100 / (previsao.RAIO_TERRA * math.pi / 180)  # 100 m em graus de latitude
+        for i in range(5):
+            estado = previsao.atualizar_estado(estado, -23.5 + passo * i, -46.6, 10.0 * i)
+        self.assertAlmostEqual(estado['velocidade'], 10, places=3)
+        self.assertAlmostEqual(estado['percorrido'], 400, places=3)
+        # Ponto repetido e salto de GPS não contam
+        self.assertIs(previsao.atualizar_estado(estado, -23.4, -46.6, 40.0), estado)
+        saltou = previsao.atualizar_estado(estado, -23.4, -46.6, 50.0)
+        self.assertEqual((saltou['percorrido'], saltou['trechos'], saltou['t']), (estado['percorrido'], 4, 50.0))
+
+        # 4 trechos contra peso 5 do histórico: 4/9 de (40 + 2600/10) e 5/9 de 1200
+        self.assertAlmostEqual(previsao.prever(estado, {'duracao': 1200, 'distancia': 3000}), 800, places=3)
+        self.assertEqual(previsao.prever(estado, {'duracao': 1200, 'distancia': None}), 1200)
+        self.assertIsNone(previsao.prever(estado, {}))
+
+    def test_previsao_na_entrega(self):
+        for minutos in (10, 20, 30, 40, 50):
+            self.entrega_concluida(self.restaurante, minutos)
+        entregador = Usuario.objects.create_user('moto', 'moto@email.com', 'senha', perfil='entregador')
+        pedido = Pedido.objects.create(usuario=self.cliente, restaurante=self.restaurante)
+        entrega = Entrega.objects.create(pedido=pedido, entregador=entregador, status='em_rota', inicio=self.agora)
+        client = APIClient()
+        client.force_authenticate(entregador)
+        url = f'/api/entregas/{entrega.pk}/'
+
+        # Sem histórico no cache ainda: sem previsão, e um worker recalcula
+        ponto = {'latitude': '-23.5', 'longitude': '-46.6'}
+        with self.captureOnCommitCallbacks(execute=True):
+            resposta = client.post(url + 'atualizar_localizacao/', ponto, format='json')
+        self.assertEqual(resposta.status_code, 201)
+        self.assertIsNone(resposta.json()['previsao_chegada'])
+        self.assertEqual(processar(), 1)
+        etag = client.get(url)['ETag']
+
+        resposta = client.post(url + 'atualizar_localizacao/', {**ponto, 'latitude': '-23.49'}, format='json')
+        chegada = resposta.json()['previsao_chegada']
+        esperada = (self.agora + timedelta(minutes=30)).timestamp()
+        self.assertAlmostEqual(datetime.fromisoformat(chegada).timestamp(), esperada, places=3)
+
+        resposta = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.json()['previsao_chegada'], chegada)
+        listagem = {item['id']: item['previsao_chegada'] for item in client.get('/api/entregas/').json()}
+        self.assertEqual(listagem[str(entrega.pk)], chegada)
+        self.assertEqual(sum(valor is not None for valor in listagem.values()), 1)
+
+        Entrega.objects.filter(pk=entrega.pk).update(status='entregue')
+        self.assertIsNone(client.get(url).json()['previsao_chegada'])
+
+
+class PosicaoAtualTests(TestCase):
+    """A última posição da entrega vem do cache, sem consultar o banco"""
+
+    def setUp(self):
+        cache.clear()
+        _, self.cliente, restaurante, _ = criar_cardapio()
+        self.entregador = Usuario.objects.create_user('moto', 'moto@email.com', 'senha', perfil='entregador')
+        pedido = Pedido.objects.create(usuario=self.cliente, restaurante=restaurante)
+        self.entrega = Entrega.objects.create(pedido=pedido, entregador=self.entregador, status='em_rota')
+        self.url = f'/api/entregas/{self.entrega.pk}/'
+
+    def test_posicao_atual_sem_consultas(self):
+        entregador = APIClient()
+        entregador.force_authenticate(self.entregador)
+        for latitude in ('-23.5', '-23.51'):
+            resposta = entregador.post(self.url + 'atualizar_localizacao/',
+                                       {'latitude': latitude, 'longitude': '-46.6'}, format='json')
+            self.assertEqual(resposta.status_code, 201)
+
+        cliente = APIClient()
+        cliente.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.cliente)}')
+        with self.assertNumQueries(0):
+            resposta = cliente.get(self.url + 'posicao_atual/')
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.json(), {
+            'entrega': str(self.entrega.pk), 'latitude': '-23.510000', 'longitude': '-46.600000',
+            'registrado_em': resposta.json()['registrado_em'], 'previsao_chegada': None,
+        })
+        # O histórico completo continua gravado
+        self.assertEqual(RastreamentoEntrega.objects.filter(entrega=self.entrega).count(), 2)
+
+        self.assertEqual(cliente.get('/api/entregas/nao-e-uuid/posicao_atual/').status_code, 404)
+        self.entrega.status = 'entregue'
+        self.entrega.save()
+        resposta = cliente.get(self.url + 'posicao_atual/')
+        self.assertEqual((resposta.status_code, resposta.json()), (404, {'erro': 'Entrega sem posição recente.'}))
+
+
+class RecomendacoesTests(TestCase):
+    """Produtos pedidos junto: matrizes em lote, atualização incremental e leitura só do cache"""
+
+    def setUp(self):
+        cache.clear()
+        _, self.cliente, self.restaurante, self.x_burguer = criar_cardapio()
+        self.suco = Produto.objects.get(nome='Suco')
+        self.batata = Produto.objects.create(restaurante=self.restaurante, nome='Batata', preco=Decimal('9'))
+        self.refri = Produto.objects.create(
+            restaurante=self.restaurante, nome='Refri', preco=Decimal('6'), disponivel=False
+        )
+        self.agora = timezone.now()
+
+    def pedido(self, *produtos, criado_em=None):
+        pedido = Pedido.objects.create(usuario=self.cliente, restaurante=self.restaurante)
+        Pedido.objects.filter(pk=pedido.pk).update(criado_em=criado_em or self.agora - timedelta(hours=1))
+        ItemPedido.objects.bulk_create([
+            ItemPedido(pedido=pedido, produto=produto, quantidade=1, preco_unitario=produto.preco)
+            for produto in produtos
+        ])
+
+    def resumo(self, produto):
+        return [(item['nome'], item['motivo'], item['confianca']) for item in recomendacoes.do_produto(produto.pk)]
+
+    def test_pedidos_juntos_e_populares(self):
+        for _ in range(2):
+            self.pedido(self.x_burguer, self.suco, self.suco)
+        self.pedido(self.x_burguer, self.batata)
+        for _ in range(3):
+            self.pedido(self.x_burguer, self.refri)
+        self.pedido(self.batata)
+        for _ in range(3):
+            self.pedido(self.x_burguer, self.batata, criado_em=self.agora - timedelta(days=100))
+
+        resultado = recomendacoes.atualizar()
+        self.assertEqual((resultado['modo'], resultado['itens'], resultado['restaurantes']), ('completo', 15, 1))
+        # Batata só saiu uma vez com o X-Burguer na janela: entra como popular (2 dos 7 pedidos);
+        # Refri está indisponível
+        self.assertEqual(self.resumo(self.x_burguer), [('Suco', 'juntos', 0.3333), ('Batata', 'popular', 0.2857)])
+        self.assertEqual(self.resumo(self.suco), [('X-Burguer', 'juntos', 1.0), ('Batata', 'popular', 0.2857)])
+        refri = self.resumo(self.refri)
+        self.assertEqual(refri[0], ('X-Burguer', 'juntos', 1.0))
+        self.assertEqual(sorted(refri[1:]), [('Batata', 'popular', 0.2857), ('Suco', 'popular', 0.2857)])
+        self.assertEqual(recomendacoes.do_produto(self.suco.pk)[0], {
+            'id': str(self.x_burguer.pk), 'nome': 'X-Burguer', 'preco': '20.00', 'motivo': 'juntos', 'confianca': 1.0,
+        })
+
+    def test_incremental_igual_ao_completo(self):
+        self.pedido(self.x_burguer, self.suco, criado_em=self.agora - timedelta(days=89))
+        self.pedido(self.x_burguer, self.suco, criado_em=self.agora - timedelta(days=60))
+        self.pedido(self.x_burguer, self.batata)
+        self.assertEqual(recomendacoes.atualizar(agora=self.agora)['modo'], 'completo')
+
+        depois = self.agora + timedelta(days=2)
+        self.pedido(self.x_burguer, self.batata, criado_em=depois - timedelta(hours=1))
+        self.pedido(self.suco, self.batata, criado_em=depois - timedelta(hours=2))
+        # Mais recente que ``agora - ATRASO``: fica para a próxima execução
+        self.pedido(self.suco, criado_em=depois - timedelta(minutes=1))
+        resultado = recomendacoes.atualizar(agora=depois)
+        # Só as bordas: os 4 itens que entraram e os 2 do pedido que saiu da janela
+        self.assertEqual((resultado['modo'], resultado['itens']), ('incremental', 6))
+        chaves = [recomendacoes._chave_matriz(self.restaurante.pk)] + [
+            recomendacoes._chave_produto(produto.pk) for produto in (self.x_burguer, self.suco, self.batata, self.refri)
+        ]
+        incremental = cache.get_many(chaves)
+
+        self.assertEqual(recomendacoes.atualizar(agora=depois, completo=True)['modo'], 'completo')
+        self.assertEqual(cache.get_many(chaves), incremental)
+        self.assertEqual(self.resumo(self.batata)[0], ('X-Burguer', 'juntos', round(2 / 3, 4)))
+
+        # Produto excluído sai da matriz e das listas
+        self.suco.delete()
+        recomendacoes.atualizar(agora=depois)
+        self.assertNotIn('Suco', [nome for nome, _, _ in self.resumo(self.batata)])
+
+    def test_endpoint_le_so_o_cache(self):
+        for _ in range(2):
+            self.pedido(self.x_burguer, self.suco)
+        recomendacoes.atualizar()
+        client = APIClient()
+        with self.assertNumQueries(0):
+            resposta = client.get(f'/api/produtos/{self.suco.pk}/recomendacoes/')
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual([item['nome'] for item in resposta.json()], ['X-Burguer'])
+        # Sem pedidos ainda: os populares do restaurante
+        populares = client.get(f'/api/produtos/{self.batata.pk}/recomendacoes/').json()
+        self.assertEqual(sorted(item['nome'] for item in populares), ['Suco', 'X-Burguer'])
+        self.assertEqual(client.get(f'/api/produtos/{uuid.uuid4()}/recomendacoes/').json(), [])
+        self.assertEqual(client.get('/api/produtos/nao-e-uuid/recomendacoes/').json(), [])
+
+
+class AutocompletarTests(TestCase):
+    """Busca por prefixo no índice em memória, atualizado pelos sinais e pelo log no cache"""
+
+    def setUp(self):
+        cache.clear()
+        # Sem as categorias da migração 0002, que também entrariam nas sugestões
+        CategoriaProduto.objects.all().delete()
+        self.dono, _, self.restaurante, self.x_burguer = criar_cardapio()
+        self.acai = Restaurante.objects.create(dono=self.dono, nome='Açaí da Praça', cnpj='3', endereco='Rua C')
+        autocompletar.montar()
+        self.addCleanup(setattr, autocompletar, '_estado', None)
+
+    def nomes(self, texto, **kwargs):
+        return [sugestao['nome'] for sugestao in autocompletar.sugerir(texto, **kwargs)]
+
+    def test_prefixo_de_qualquer_palavra_sem_acento(self):
+        self.assertEqual(autocompletar.normalizar('  Pão de Queijo!! AÇAÍ_grande '), 'pao de queijo acai grande')
+        self.assertEqual(autocompletar.sugerir('burg'), [{
+            'tipo': 'produto', 'id': str(self.x_burguer.pk), 'nome': 'X-Burguer', 'restaurante': str(self.restaurante.pk),
+        }])
+        self.assertEqual(self.nomes('PRAÇ'), ['Açaí da Praça'])
+        self.assertEqual(self.nomes('acai da p'), ['Açaí da Praça'])
+        self.assertEqual(self.nomes('lanch'), ['Lanches'])
+        self.assertEqual(self.nomes('lanch', tipos=['restaurante']), [])
+        self.assertEqual(self.nomes('  '), [])
+
+    def test_sinais_e_outros_processos(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Produto.objects.create(restaurante=self.restaurante, nome='Pizza Calabresa', preco=Decimal('40'))
+        self.assertEqual(self.nomes('calab'), ['Pizza Calabresa'])
+
+        # Outro processo salva: a mudança só chega pelo log do cache, na próxima sincronia
+        deste_processo = autocompletar._estado
+        deste_processo.sincronizado_em = math.inf  # sem sincronia até o teste pedir
+        with mock.patch.object(autocompletar, '_estado', None), self.captureOnCommitCallbacks(execute=True):
+            self.x_burguer.nome = 'X-Salada'
+            self.x_burguer.save()
+            self.acai.delete()
+        self.assertEqual(self.nomes('burg'), ['X-Burguer'])
+        deste_processo.sincronizado_em = 0
+        self.assertEqual((self.nomes('burg'), self.nomes('sala'), self.nomes('acai')), ([], ['X-Salada'], []))
+
+        # Salvar outros campos não mexe no índice
+        versao = cache.get('autocompletar:versao')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.x_burguer.save(update_fields=['preco'])
+        self.assertEqual(cache.get('autocompletar:versao'), versao)
+
+        # Cache limpo: o log se perdeu, o índice é remontado do banco
+        Produto.objects.filter(pk=self.x_burguer.pk).update(nome='X-Tudo')
+        cache.clear()
+        autocompletar._estado.sincronizado_em = 0
+        self.assertEqual(self.nomes('x tu'), ['X-Tudo'])
+
+    def test_memoria_limitada(self):
+        with self.settings(AUTOCOMPLETAR_MAXIMO_CHAVES=2):
+            autocompletar.montar()
+        # "Açaí da Praça" ocupa 3 chaves; "Pizzaria" e "Vazio", uma cada
+        self.assertEqual(autocompletar.estatisticas()['restaurante'], {'chaves': 2, 'documentos': 2, 'descartados': 1})
+
+    def test_endpoint_sem_consultas(self):
+        client = APIClient()
+        with self.assertNumQueries(0):
+            resposta = client.get('/api/autocompletar/', {'q': 'piz', 'limite': 5})
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual([(item['tipo'], item['nome']) for item in resposta.json()], [('restaurante', 'Pizzaria')])
+        resposta = client.get('/api/autocompletar/', {'q': 'a', 'tipo': ['restaurante', 'categoria']})
+        self.assertEqual([item['nome'] for item in resposta.json()], ['Açaí da Praça'])
+        self.assertEqual(client.get('/api/autocompletar/', {'q': 'a', 'limite': 1}).json()[0]['nome'], 'Açaí da Praça')
+        self.assertEqual(client.get('/api/autocompletar/', {'q': 'a', 'tipo': 'loja'}).status_code, 400)
+        self.assertEqual(client.get('/api/autocompletar/', {'q': 'a', 'limite': 'dez'}).status_code, 400)
+
+
+class AdminTests(TestCase):
+    """Changelists do admin com custo que não cresce com a tabela"""
+
+    def setUp(self):
+        _, self.cliente, self.restaurante, _ = criar_cardapio()
+        self.admin = Usuario.objects.create_superuser('suporte', 'suporte@email.com', 'senha')
+        self.client.force_login(self.admin)
+
+    def criar_pedidos(self, quantidade, inicio=0):
+        Pedido.objects.bulk_create(
+            Pedido(usuario=self.cliente, restaurante=self.restaurante, numero_pedido=numero,
+                   data_referencia=timezone.now().date() - timedelta(days=numero % 3))
+            for numero in range(inicio + 1, inicio + quantidade + 1)
+        )
+
+    def test_changelists(self):
+        self.criar_pedidos(3)
+        for model in food_admin.admin.site._registry:
+            if model._meta.app_label != 'food':
+                continue
+            url = f'/admin/food/{model._meta.model_name}/'
+            self.assertEqual(self.client.get(url).status_code, 200, url)
+            self.assertEqual(self.client.get(url, {'q': 'qualquer'}).status_code, 200, url)
+
+    def test_consultas_nao_crescem_com_a_tabela(self):
+        self.criar_pedidos(3)
+        with CaptureQueriesContext(connection) as poucos:
+            self.client.get('/admin/food/pedido/')
+        self.criar_pedidos(120, inicio=3)
+        with CaptureQueriesContext(connection) as muitos:
+            resposta = self.client.get('/admin/food/pedido/')
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(len(poucos), len(muitos))
+        self.assertNotIn('DISTINCT', ' '.join(consulta['sql'] for consulta in muitos.captured_queries))
+
+    def test_contagem_limitada(self):
+        self.criar_pedidos(12)
+        # Como o admin pagina: com a ordenação da lista
+        pedidos = Pedido.objects.order_by('-data_referencia')
+        with mock.patch.object(food_admin, 'LIMITE_CONTAGEM', 5):
+            with mock.patch.object(food_admin, 'estimar_linhas', return_value=1000):
+                self.assertEqual(food_admin.ContagemEstimadaPaginator(pedidos, 50).count, 1000)
+            with mock.patch.object(food_admin, 'estimar_linhas', return_value=3):
+                # Estimativa desatualizada abaixo do que já foi contado
+                self.assertEqual(food_admin.ContagemEstimadaPaginator(pedidos, 50).count, 6)
+            self.assertEqual(food_admin.ContagemEstimadaPaginator(pedidos, 50).count, 12)
+        self.assertEqual(food_admin.ContagemEstimadaPaginator(pedidos.filter(numero_pedido__lte=2), 50).count, 2)
+
+    def test_busca_exata_e_datas(self):
+        self.criar_pedidos(3)
+        pedido = Pedido.objects.first()
+        modelo_admin = food_admin.admin.site._registry[Pedido]
+        requisicao = RequestFactory().get('/')
+        resultado, _ = modelo_admin.get_search_results(requisicao, Pedido.objects.all(), f' {pedido.pk} ')
+        self.assertEqual(list(resultado), [pedido])
+        resultado, _ = modelo_admin.get_search_results(requisicao, Pedido.objects.all(), 'Pizzaria')
+        self.assertEqual(list(resultado), [])
+
+        hoje = timezone.now().date()
+        dias = modelo_admin.get_queryset(requisicao).dates('data_referencia', 'day', order='DESC')
+        self.assertEqual(dias, [hoje - timedelta(days=n) for n in range(3)])
+        self.assertEqual(food_admin.QuerySetAdmin(Pedido).none().dates('data_referencia', 'year'), [])
+        self.assertEqual(
+            list(food_admin._periodos(datetime(2025, 11, 20).date(), datetime(2026, 2, 1).date(), 'month')),
+            [datetime(2025, 11, 1).date(), datetime(2025, 12, 1).date(),
+             datetime(2026, 1, 1).date(), datetime(2026, 2, 1).date()],
+        )
+
+
+class ShardsTests(TestCase):
+    """Dados de pedido divididos por restaurante; o shard de teste é o próprio default"""
+
+    def setUp(self):
+        cache.clear()
+        self.dono, self.cliente, self.restaurante, self.produto = criar_cardapio()
+        self.outro = Restaurante.objects.get(nome='Vazio')
+        self.pedidos = []
+        for restaurante, valor in ((self.restaurante, '30'), (self.outro, '10'), (self.restaurante, '20')):
+            pedido = Pedido.objects.create(usuario=self.cliente, restaurante=restaurante, valor_total=Decimal(valor))
+            ItemPedido.objects.create(pedido=pedido, produto=self.produto, quantidade=1, preco_unitario=Decimal(valor))
+            self.pedidos.append(pedido)
+        self.entrega = Entrega.objects.create(pedido=self.pedidos[0], status='em_rota')
+        RastreamentoEntrega.objects.create(entrega=self.entrega, latitude='-23.5', longitude='-46.6')
+        self.client = APIClient()
+        self.client.force_authenticate(self.cliente)
+
+    def test_anel_consistente(self):
+        chaves = [str(numero) for numero in range(3000)]
+        antes = shards.Anel(['shard_1', 'shard_2', 'shard_3'])
+        depois = shards.Anel(['shard_1', 'shard_2', 'shard_3', 'shard_4'])
+        for banco in ('shard_1', 'shard_2', 'shard_3'):
+            self.assertTrue(600 < sum(antes.banco(chave) == banco for chave in chaves) < 1400, banco)
+        movidas = [chave for chave in chaves if antes.banco(chave) != depois.banco(chave)]
+        # Só muda de lugar o que o shard novo assumiu: cerca de um quarto das chaves
+        self.assertTrue(all(depois.banco(chave) == 'shard_4' for chave in movidas))
+        self.assertTrue(450 < len(movidas) < 1100)
+
+    def test_intercalar(self):
+        # Cada shard já vem na ordem (decrescente, NULL primeiro); a junção mantém a ordem
+        partes = [[((None, 'b'), 'y'), ((3, 'a'), 'x')], [((5, 'c'), 'z'), ((1, 'd'), 'w')]]
+        self.assertEqual(shards._intercalar(partes, ['-valor_total', 'pk']), ['y', 'z', 'x', 'w'])
+        self.assertEqual(shards._intercalar(partes[1:], ['-valor_total', 'pk']), ['z', 'w'])
+        pedidos = Pedido.objects.order_by('valor_total')
+        self.assertEqual(shards.espalhar(pedidos), [pedidos])
+
+    def test_roteador(self):
+        roteador = RoteadorShards()
+        novo = Pedido(usuario=self.cliente, restaurante=self.outro)
+        with self.settings(DATABASE_SHARDS=['default', 'shard_2']):
+            banco = shards.banco_do_restaurante(self.outro.pk)
+            self.assertEqual(roteador.db_for_write(Pedido, instance=novo), banco)
+            self.assertEqual(roteador.db_for_write(ItemPedido, instance=ItemPedido(pedido=novo)), banco)
+            self.assertEqual(roteador.db_for_read(Pedido, instance=self.outro), banco)
+            # Já salvo: o banco de onde veio
+            self.assertEqual(roteador.db_for_read(ItemPedido, instance=self.pedidos[0]), 'default')
+            self.assertIsNone(roteador.db_for_read(Produto, instance=novo))
+            self.assertIsNone(roteador.db_for_read(Pedido))
+            self.assertTrue(roteador.allow_relation(self.pedidos[0], self.cliente))
+        self.assertIsNone(roteador.db_for_write(Pedido, instance=novo))
+
+    def test_respostas_iguais_com_shards(self):
+        urls = [
+            '/api/pedidos/?ordering=-valor_total', f'/api/pedidos/?restaurante={self.restaurante.pk}',
+            f'/api/pedidos/{self.pedidos[1].pk}/', '/api/entregas/', f'/api/entregas/{self.entrega.pk}/?expand=rastreamentos',
+            f'/api/pedidos/{self.pedidos[0].pk}/pagamento/',
+        ]
+        sem_shards = [self.client.get(url).json() for url in urls]
+        with self.settings(DATABASE_SHARDS=['default']):
+            self.assertEqual([self.client.get(url).json() for url in urls], sem_shards)
+            self.assertEqual([p['valor_total'] for p in sem_shards[0]], ['30.00', '20.00', '10.00'])
+
+            # Produto apagado: o SET_NULL do default não chega ao item num shard de verdade
+            ItemPedido.objects.filter(pedido=self.pedidos[1]).update(produto_id=uuid.uuid4())
+            item = self.client.get(f'/api/pedidos/?restaurante={self.outro.pk}').json()[0]['itens'][0]
+            self.assertIsNone(item['produto'])
+
+    def test_escritas_com_shards(self):
+        with self.settings(DATABASE_SHARDS=['default']):
+            url = f'/api/pedidos/{self.pedidos[0].pk}/alterar_status/'
+            self.assertEqual(self.client.post(url, {'status': 'confirmado'}, format='json').status_code, 200)
+            self.assertEqual(EventoPedido.objects.get().status_novo, 'confirmado')
+
+            resposta = self.client.get('/api/pedidos/eventos/', {'restaurante': str(self.restaurante.pk)})
+            self.assertEqual(resposta.status_code, 200)
+            with self.settings(DATABASE_SHARDS=['default', 'shard_2']):
+                # Sem restaurante, os eventos estariam em mais de um shard
+                self.assertEqual(self.client.get('/api/pedidos/eventos/').status_code, 400)
+
+            resposta = self.client.post('/api/pagamentos/', {
+                'pedido': str(self.pedidos[1].pk), 'metodo': 'pix', 'valor': '10.00',
+            }, format='json')
+            self.assertEqual(resposta.status_code, 201)
+            self.assertEqual(Pagamento.objects.get().pedido_id, self.pedidos[1].pk)
+
+            entregador = Usuario.objects.create_user('moto', 'moto@email.com', 'senha', perfil='entregador')
+            Entrega.objects.filter(pk=self.entrega.pk).update(entregador=entregador)
+            url = f'/api/entregas/{self.entrega.pk}/atualizar_localizacao/'
+            resposta = self.client.post(url, {'latitude': '-23.51', 'longitude': '-46.61'}, format='json')
+            self.assertEqual(resposta.status_code, 201)
+            self.assertEqual(self.client.get(f'/api/entregas/{self.entrega.pk}/').json()['entregador'], 'moto')
+
+    def test_rebalancear(self):
+        with self.assertRaises(CommandError):
+            call_command('rebalancear_shards', stdout=StringIO())
+
+        saida = StringIO()
+        mapa = {str(self.restaurante.pk): 'shard_2'}
+        with self.settings(DATABASE_SHARDS=['default']), mock.patch.object(
+            shards, 'banco_do_restaurante', side_effect=lambda restaurante: mapa.get(str(restaurante), 'default')
+        ):
+            call_command('rebalancear_shards', simular=True, stdout=saida)
+        self.assertIn(f'Restaurante {self.restaurante.pk}: 2 pedido(s) default → shard_2', saida.getvalue())
+        self.assertIn('2 pedido(s) a mover', saida.getvalue())
+        self.assertEqual(Pedido.objects.count(), 3)
+
+
+@skipUnless('shard_2' in settings.DATABASES, 'Sem o banco shard_2 (use happy_food_backend.settings_teste)')
+class ShardsDoisBancosTests(TestCase):
+    """Pedidos movidos para um segundo banco de verdade e lidos de volta pelo scatter-gather"""
+    databases = {'default', 'shard_2'} & set(settings.DATABASES)
+    setUp = ShardsTests.setUp
+
+    def test_rebalancear_e_listar_em_dois_bancos(self):
+        urls = [
+            '/api/pedidos/?ordering=-valor_total', f'/api/pedidos/?restaurante={self.restaurante.pk}&ordering=valor_total',
+            f'/api/pedidos/{self.pedidos[0].pk}/', '/api/entregas/', f'/api/entregas/{self.entrega.pk}/?expand=rastreamentos',
+        ]
+        antes = [self.client.get(url).json() for url in urls]
+        criados = {pedido.pk: pedido.criado_em for pedido in self.pedidos}
+        # Um evento que já está no shard_2 com o mesmo id do que vai chegar: o copiado ganha outro
+        vizinho = Pedido.objects.using('shard_2').create(
+            usuario=self.dono, restaurante=self.restaurante, numero_pedido=99, valor_total=Decimal('5')
+        )
+        ja_no_destino = EventoPedido.objects.using('shard_2').create(
+            pedido_id=vizinho.pk, status_anterior='pendente', status_novo='confirmado'
+        )
+        EventoPedido.objects.create(
+            id=ja_no_destino.pk, pedido=self.pedidos[0], status_anterior='pendente', status_novo='cancelado'
+        )
+
+        saida = StringIO()
+        mapa = {str(self.restaurante.pk): 'shard_2'}
+        with self.settings(DATABASE_SHARDS=['default', 'shard_2']), mock.patch.object(
+            shards, 'banco_do_restaurante', side_effect=lambda restaurante: mapa.get(str(restaurante), 'default')
+        ):
+            call_command('rebalancear_shards', lote=1, stdout=saida)
+            self.assertIn(f'Restaurante {self.restaurante.pk}: 2 pedido(s) default → shard_2', saida.getvalue())
+            self.assertIn('2 pedido(s) movido(s)', saida.getvalue())
+
+            self.assertEqual(list(Pedido.objects.using('default').values_list('pk', flat=True)), [self.pedidos[1].pk])
+            movidos = Pedido.objects.using('shard_2').filter(usuario=self.cliente)
+            self.assertEqual({pedido.pk: pedido.criado_em for pedido in movidos}, {
+                pk: criado_em for pk, criado_em in criados.items() if pk != self.pedidos[1].pk
+            })
+            # A exclusão em cascata levou itens, entrega e rastreamento da origem
+            self.assertEqual(ItemPedido.objects.using('default').get().pedido_id, self.pedidos[1].pk)
+            self.assertEqual(ItemPedido.objects.using('shard_2').filter(pedido__in=movidos).count(), 2)
+            for model in (Entrega, RastreamentoEntrega):
+                self.assertFalse(model.objects.using('default').exists())
+                self.assertEqual(model.objects.using('shard_2').count(), 1)
+            self.assertFalse(EventoPedido.objects.using('default').exists())
+            eventos = list(EventoPedido.objects.using('shard_2').order_by('id').values_list('id', 'pedido', 'status_novo'))
+            self.assertEqual([evento[1:] for evento in eventos], [
+                (vizinho.pk, 'confirmado'), (self.pedidos[0].pk, 'cancelado'),
+            ])
+            self.assertGreater(eventos[1][0], ja_no_destino.pk)
+            vizinho.delete()
+
+            # Scatter-gather: as mesmas respostas, com os pedidos intercalados dos dois bancos
+            self.assertEqual([self.client.get(url).json() for url in urls], antes)
+            self.assertEqual([p['valor_total'] for p in antes[0]], ['30.00', '20.00', '10.00'])
+
+            # Rodar de novo não move nada
+            call_command('rebalancear_shards', stdout=saida)
+            self.assertIn('0 pedido(s) movido(s)', saida.getvalue())
+
+
+@tarefa(max_tentativas=2)
+def tarefa_que_falha():
+    raise RuntimeError('falhou')
+
+
+tarefas_executadas = []
+
+
+@tarefa
+def tarefa_que_anota(valor):
+    tarefas_executadas.append(valor)
+
+
+class FilaTarefasTests(TestCase):
+    """Tarefas entram na fila no commit e são executadas pelos workers, com novas tentativas"""
+
+    def setUp(self):
+        cache.clear()
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+
+    def test_enfileira_so_no_commit(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            tarefa_que_falha.enfileirar()
+            self.assertFalse(Tarefa.objects.exists())
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(Tarefa.objects.get().nome, 'food.tests.tarefa_que_falha')
+
+    def test_novas_tentativas_com_backoff(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            tarefa_que_falha.enfileirar()
+        with self.assertLogs('food.fila', 'ERROR'):
+            self.assertEqual(processar(), 1)
+        tarefa = Tarefa.objects.get()
+        self.assertEqual((tarefa.status, tarefa.tentativas), ('pendente', 1))
+        self.assertIn('RuntimeError', tarefa.erro)
+        # Só volta a ser reservada depois do backoff
+        self.assertEqual(processar(), 0)
+
+        Tarefa.objects.update(disponivel_em=tarefa.criado_em)
+        with self.assertLogs('food.fila', 'ERROR'):
+            processar()
+        tarefa.refresh_from_db()
+        self.assertEqual((tarefa.status, tarefa.tentativas), ('falhou', 2))
+        self.assertEqual(processar(), 0)
+
+    def test_reserva_vencida_conta_tentativa(self):
+        # O worker morre executando (nem concluir nem falhar): a reserva vence e volta para a fila
+        with self.captureOnCommitCallbacks(execute=True):
+            tarefa_que_falha.enfileirar()
+        broker = BrokerBanco()
+        for tentativa in (1, 2):
+            reservas = broker.reservar('padrao', 10)
+            self.assertEqual([reserva.tentativas for reserva in reservas], [tentativa])
+            Tarefa.objects.update(disponivel_em=timezone.now() - timedelta(seconds=1))
+        # Venceu na última tentativa: não volta mais
+        self.assertEqual(broker.reservar('padrao', 10), [])
+        tarefa = Tarefa.objects.get()
+        self.assertEqual((tarefa.status, tarefa.tentativas, tarefa.erro), ('falhou', 2, ERRO_RESERVA_VENCIDA))
+
+    def test_lote_lento_nao_executa_duas_vezes(self):
+        self.addCleanup(tarefas_executadas.clear)
+        with self.captureOnCommitCallbacks(execute=True):
+            for valor in (1, 2, 3):
+                tarefa_que_anota.enfileirar(valor)
+        reservar = BrokerBanco.reservar
+
+        def reservar_e_perder_a_terceira(broker, fila, limite):
+            reservas = reservar(broker, fila, limite)
+            # A reserva da terceira venceu durante o lote e outro worker a pegou
+            Tarefa.objects.filter(id=reservas[2].id).update(disponivel_em=timezone.now() + timedelta(minutes=1))
+            return reservas
+
+        antes = timezone.now()
+        with mock.patch.object(BrokerBanco, 'reservar', reservar_e_perder_a_terceira), \
+                self.assertLogs('food.fila', 'WARNING'):
+            self.assertEqual(processar(), 3)
+        self.assertEqual(tarefas_executadas, [1, 2])
+        # A terceira fica com o outro worker
+        tarefa = Tarefa.objects.get()
+        self.assertEqual(tarefa.argumentos, {'args': [3], 'kwargs': {}})
+
+        self.assertEqual(BrokerBanco().reservar('padrao', 10), [])
+
+        # A renovação estende a reserva de quem ainda é dono dela
+        Tarefa.objects.update(disponivel_em=antes)
+        reserva, = BrokerBanco().reservar('padrao', 10)
+        prazo = reserva.prazo
+        self.assertTrue(BrokerBanco().renovar(reserva))
+        self.assertGreater(reserva.prazo, prazo)
+        self.assertEqual(Tarefa.objects.get().disponivel_em, reserva.prazo)
+
+    def test_foto_antiga_apagada_pelo_worker(self):
+        with self.settings(MEDIA_ROOT=self.media.name):
+            caminho = os.path.join(self.media.name, 'usuarios', 'fotos', 'antiga.png')
+            os.makedirs(os.path.dirname(caminho))
+            open(caminho, 'wb').close()
+            usuario = Usuario.objects.create_user('foto', 'foto@email.com', 'senha', foto='usuarios/fotos/antiga.png')
+            client = APIClient()
+            client.force_authenticate(usuario)
+
+            with self.captureOnCommitCallbacks(execute=True):
+                resposta = client.delete(f'/api/usuarios/{usuario.pk}/remover_foto/')
+            self.assertEqual(resposta.status_code, 200)
+            # A resposta não esperou pelo storage
+            self.assertTrue(os.path.exists(caminho))
+            out = StringIO()
+            call_command('run_workers', uma_vez=True, stdout=out)
+            self.assertEqual(out.getvalue().strip(), '1 tarefa(s) executada(s)')
+            self.assertFalse(os.path.exists(caminho))
+            self.assertFalse(Tarefa.objects.exists())
+
+    def test_login_google_com_chaves_em_cache(self):
+        info = {'email': 'nova@gmail.com', 'name': 'Nova', 'iss': 'accounts.google.com'}
+        login_google.guardar_certificados({'chave': 'publica'}, login_google.RENOVAR_ANTES - 1)
+        with mock.patch('requests.get') as baixar, \
+                mock.patch('google.auth.jwt.decode', return_value=info) as decode, \
+                self.captureOnCommitCallbacks(execute=True):
+            resposta = APIClient().post('/api/auth/google/', {'id_token': 'x'}, format='json')
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(decode.call_args.kwargs['certs'], {'chave': 'publica'})
+        # Perto de expirar: a renovação vai para a fila, o login não baixa nada
+        baixar.assert_not_called()
+        self.assertEqual(Tarefa.objects.get().nome, 'food.tarefas.atualizar_certificados_google')
 
-# Create your tests here.
@@ -0,0 +1,92 @@
+"""
+Limite de requisições por balde de tokens, com orçamento separado por classe de endpoint.
+
+O balde é implementado como GCRA: por cliente e escopo o cache guarda só o instante
+teórico (em ms) em que o balde volta a ficar cheio, e cada requisição soma um intervalo
+a ele com ``cache.incr`` — atômico no Redis e no locmem, sem linhas no banco. Requisição
+recusada desfaz a soma com ``cache.decr`` e devolve o tempo de espera (``Retry-After``).
+"""
+import math
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import exceptions
+from rest_framework.throttling import BaseThrottle
+
+# Idle longo reancora o balde no relógio; sob tráfego contínuo a chave vive pelo menos isto
+_VALIDADE_MINIMA = 60 * 60
+
+
+def _agora_ms():
+    return int(time.time() * 1000)
+
+
+def consumir(chave, capacidade, por_segundo):
+    """Consome um token do balde; devolve 0 se liberou ou os segundos até o próximo token."""
+    agora = _agora_ms()
+    intervalo = max(1, round(1000 / por_segundo))
+    tolerancia = intervalo * capacidade
+    validade = max(_VALIDADE_MINIMA, math.ceil(tolerancia / 1000) + 1)
+
+    try:
+        cheio_em = cache.incr(chave, intervalo)
+    except ValueError:
+        if cache.add(chave, agora + intervalo, validade):
+            return 0
+        cheio_em = cache.incr(chave, intervalo)
+
+    if cheio_em - intervalo < agora:
+        # O balde já estava cheio: volta a contar a partir de agora
+        cache.set(chave, agora + intervalo, validade)
+        return 0
+    if cheio_em - agora > tolerancia:
+        cache.decr(chave, intervalo)
+        return (cheio_em - agora - tolerancia) / 1000
+    return 0
+
+
+def limitar(escopo, identificador):
+    """Levanta ``Throttled`` se o balde do escopo para o identificador estiver vazio."""
+    balde = getattr(settings, 'THROTTLE_BALDES', {}).get(escopo)
+    if balde is None:
+        return
+    espera = consumir(f'balde:{escopo}:{identificador}', *balde)
+    if espera:
+        raise exceptions.Throttled(wait=espera)
+
+
+async def alimitar(escopo, identificador):
+    """Versão assíncrona de ``limitar``: as idas ao cache (Redis) saem do event loop."""
+    if getattr(settings, 'THROTTLE_BALDES', {}).get(escopo) is not None:
+        await sync_to_async(limitar)(escopo, identificador)
+
+
+def identificar(usuario, ip):
+    """O usuário autenticado ou, sem login, o IP do cliente."""
+    if usuario is not None and usuario.is_authenticated:
+        return f'usuario:{usuario.pk}'
+    return f'ip:{ip}'
+
+
+class BaldeDeTokensThrottle(BaseThrottle):
+    """
+    Usa o ``throttle_scope`` da view (ou da @action) e o balde configurado em
+    ``THROTTLE_BALDES``; views sem escopo não são limitadas.
+    """
+
+    def allow_request(self, request, view):
+        escopo = getattr(view, 'throttle_scope', None)
+        self.espera = None
+        if not escopo:
+            return True
+        try:
+            limitar(escopo, identificar(request.user, self.get_ident(request)))
+        except exceptions.Throttled as exc:
+            self.espera = exc.wait
+            return False
+        return True
+
+    def wait(self):
+        return self.espera
@@ -1,6 +1,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import GoogleLoginView, GrupoOpcaoViewSet
+from .view_autocompletar import AutocompletarView
 
 from .views import (
     UsuarioViewSet, RestauranteViewSet, CategoriaProdutoViewSet, ProdutoViewSet,
@@ -27,4 +28,5 @@ router.register(r'avaliacoes/produtos', AvaliacaoProdutoViewSet)
 urlpatterns = [
     path('', include(router.urls)),
     path("auth/google/", GoogleLoginView.as_view(), name="google-login"),
+    path("autocompletar/", AutocompletarView.as_view(), name="autocompletar"),
 ]
@@ -0,0 +1,266 @@
+"""
+Views assíncronas para o caminho de leitura sob ASGI.
+
+Servem as mesmas rotas e respostas dos ViewSets (ver ``happy_food_backend/urls_async.py``),
+mas usam o ORM assíncrono, então a requisição não ocupa uma thread enquanto espera o banco
+ou o Google. Métodos que não são de leitura seguem para a view síncrona original.
+"""
+import json
+import math
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions, status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.throttling import BaseThrottle
+from rest_framework_simplejwt.authentication import JWTAuthentication, JWTStatelessUserAuthentication
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import condicional, login_google, posicoes, shards
+from .filtros import RestauranteFiltro, ProdutoFiltro, EntregaFiltro, filtrar
+from .models import Usuario, Produto, Entrega
+from .roteador import aliberar_replica
+from .throttles import alimitar, identificar
+from .serializers import EntregaSerializer, ProdutoSerializer, RestauranteSerializer, campos_incluidos
+from .serializers_leitura import aserializar_produtos, aserializar_restaurantes, aserializar_entrega
+from .views import EntregaViewSet, ProdutoViewSet, RestauranteViewSet, restaurantes_visiveis
+
+
+_jwt = JWTAuthentication()
+_jwt_sem_banco = JWTStatelessUserAuthentication()
+_renderer = JSONRenderer()
+
+
+def _resposta(dados, status_code=status.HTTP_200_OK, headers=None):
+    """Mesmos bytes e content-type que o JSONRenderer dos ViewSets."""
+    return HttpResponse(_renderer.render(dados), status=status_code,
+                        content_type='application/json', headers=headers)
+
+
+def _erro_api(exc):
+    headers = None
+    if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+        headers = {'WWW-Authenticate': _jwt.authenticate_header(None)}
+        status_code = status.HTTP_401_UNAUTHORIZED
+    else:
+        status_code = exc.status_code
+    if getattr(exc, 'wait', None):
+        headers = {'Retry-After': str(math.ceil(exc.wait))}
+    detalhe = exc.detail if isinstance(exc.detail, dict) else {'detail': exc.detail}
+    return _resposta(detalhe, status_code, headers)
+
+
+async def autenticar(request):
+    """Equivalente assíncrono do JWTAuthentication: devolve o usuário ou AnonymousUser."""
+    header = _jwt.get_header(request)
+    raw_token = _jwt.get_raw_token(header) if header is not None else None
+    if raw_token is None:
+        return AnonymousUser()
+
+    token = _jwt.get_validated_token(raw_token)
+    try:
+        user_id = token[jwt_settings.USER_ID_CLAIM]
+    except KeyError:
+        raise exceptions.AuthenticationFailed('Token contained no recognizable user identification')
+    try:
+        usuario = await Usuario.objects.aget(**{jwt_settings.USER_ID_FIELD: user_id})
+    except Usuario.DoesNotExist:
+        raise exceptions.AuthenticationFailed('User not found', code='user_not_found')
+    if not usuario.is_active:
+        raise exceptions.AuthenticationFailed('User is inactive', code='user_inactive')
+    return usuario
+
+
+async def _limitar(request, usuario, escopo):
+    """Mesmo balde do BaldeDeTokensThrottle das views síncronas."""
+    await alimitar(escopo, identificar(usuario, BaseThrottle().get_ident(request)))
+
+
+async def _resposta_condicional(request, usuario, queryset, campos, serializar, publico=False):
+    """Como o ``RespostaCondicionalMixin``: 304 sem serializar se a cópia do cliente ainda vale."""
+    validadores = await condicional.acalcular(queryset, campos, condicional.variante(request, usuario))
+    if condicional.nao_modificado(request, validadores, usar_data=False):
+        resposta = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        resposta = _resposta(await serializar())
+    return condicional.aplicar_cabecalhos(resposta, validadores, publico and not usuario.is_authenticated)
+
+
+def _pk_ou_404(pk):
+    """Como o ``get_object_or_404`` dos ViewSets: pk malformado vira 404."""
+    try:
+        return uuid.UUID(str(pk))
+    except ValueError:
+        raise exceptions.NotFound()
+
+
+def rota_assincrona(view_async, view_sync, metodos=('GET', 'HEAD')):
+    """Atende ``metodos`` com a view assíncrona e repassa os demais para a view síncrona."""
+    view_sync_async = sync_to_async(view_sync)
+
+    @csrf_exempt
+    async def view(request, *args, **kwargs):
+        if request.method not in metodos:
+            return await view_sync_async(request, *args, **kwargs)
+        try:
+            return await view_async(request, *args, **kwargs)
+        except exceptions.APIException as exc:
+            return _erro_api(exc)
+    return view
+
+
+# -----------------------------
+# RESTAURANTES E PRODUTOS
+# -----------------------------
+async def listar_restaurantes(request):
+    usuario = await autenticar(request)
+    await _limitar(request, usuario, 'catalogo')
+    await aliberar_replica(usuario)
+    queryset = filtrar(RestauranteFiltro, request, restaurantes_visiveis(usuario))
+    campos = campos_incluidos(RestauranteSerializer, request)
+    return await _resposta_condicional(
+        request, usuario, queryset,
+        condicional.campos_mostrados(RestauranteViewSet.campos_atualizacao, RestauranteSerializer, request),
+        lambda: aserializar_restaurantes(queryset, request=request, campos=campos), publico=True,
+    )
+
+
+async def produtos_do_restaurante(request, pk):
+    usuario = await autenticar(request)
+    await _limitar(request, usuario, 'catalogo')
+    await aliberar_replica(usuario)
+    pk = _pk_ou_404(pk)
+    # Como o get_object da ViewSet, que também aplica os filtros da listagem
+    if not await filtrar(RestauranteFiltro, request, restaurantes_visiveis(usuario)).filter(pk=pk).aexists():
+        raise exceptions.NotFound()
+    produtos = Produto.objects.filter(restaurante_id=pk)
+    campos = campos_incluidos(ProdutoSerializer, request)
+    return await _resposta_condicional(
+        request, usuario, produtos,
+        condicional.campos_mostrados(ProdutoViewSet.campos_atualizacao, ProdutoSerializer, request),
+        lambda: aserializar_produtos(produtos, campos=campos), publico=True,
+    )
+
+
+async def listar_produtos(request):
+    usuario = await autenticar(request)
+    await _limitar(request, usuario, 'catalogo')
+    await aliberar_replica(usuario)
+    produtos = filtrar(ProdutoFiltro, request, Produto.objects.all())
+    campos = campos_incluidos(ProdutoSerializer, request)
+    return await _resposta_condicional(
+        request, usuario, produtos,
+        condicional.campos_mostrados(ProdutoViewSet.campos_atualizacao, ProdutoSerializer, request),
+        lambda: aserializar_produtos(produtos, request=request, campos=campos), publico=True,
+    )
+
+
+# -----------------------------
+# ENTREGA
+# -----------------------------
+async def detalhe_entrega(request, pk):
+    usuario = await autenticar(request)
+    if not usuario.is_authenticated:
+        raise exceptions.NotAuthenticated()
+    await aliberar_replica(usuario)
+    entrega = filtrar(EntregaFiltro, request, Entrega.objects.all()).filter(pk=_pk_ou_404(pk))
+    entrega = await shards.alocalizar(entrega)
+    if not await entrega.aexists():
+        raise exceptions.NotFound()
+    campos = campos_incluidos(EntregaSerializer, request)
+    return await _resposta_condicional(
+        request, usuario, entrega,
+        condicional.campos_mostrados(EntregaViewSet.campos_atualizacao, EntregaSerializer, request),
+        lambda: aserializar_entrega(entrega, campos=campos),
+    )
+
+
+async def posicao_entrega(request, pk):
+    """Como ``EntregaViewSet.posicao_atual``: token sem consulta ao usuário e posição do cache."""
+    autenticado = _jwt_sem_banco.authenticate(request)
+    if autenticado is None:
+        raise exceptions.NotAuthenticated()
+    await _limitar(request, autenticado[0], 'posicao')
+    posicao = await posicoes.aler(pk)
+    if posicao is None:
+        return _resposta({'erro': 'Entrega sem posição recente.'}, status.HTTP_404_NOT_FOUND)
+    return _resposta(posicao)
+
+
+# -----------------------------
+# LOGIN COM GOOGLE
+# -----------------------------
+_contexto_ssl = None
+
+
+async def _certificados_google():
+    """Chaves públicas do Google do cache compartilhado; no miss, baixa sem bloquear a thread."""
+    certs = await sync_to_async(login_google.certificados_em_cache)()
+    if certs is not None:
+        return certs
+
+    import httpx
+    global _contexto_ssl
+    if _contexto_ssl is None:
+        # Carregar os certificados de CA custa dezenas de ms; faz uma vez por processo
+        _contexto_ssl = httpx.create_ssl_context()
+    async with httpx.AsyncClient(timeout=5, verify=_contexto_ssl) as client:
+        resposta = await client.get(login_google.GOOGLE_CERTS_URL)
+    resposta.raise_for_status()
+    certs = resposta.json()
+    await sync_to_async(login_google.guardar_certificados)(
+        certs, login_google.max_age(resposta.headers.get('cache-control', ''))
+    )
+    return certs
+
+
+async def verificar_token_google(token):
+    """Equivalente assíncrono de ``login_google.verificar_token``; ValueError se inválido."""
+    return login_google.decodificar(token, await _certificados_google())
+
+
+async def google_login(request):
+    """Mesmo contrato do GoogleLoginView, com a verificação do token sem bloquear thread."""
+    await _limitar(request, AnonymousUser(), 'auth')
+    try:
+        dados = json.loads(request.body or b'{}')
+    except ValueError:
+        raise exceptions.ParseError()
+    token = dados.get('id_token') if isinstance(dados, dict) else None
+    if not token:
+        return _resposta({"erro": "Token Google ausente."}, status.HTTP_400_BAD_REQUEST)
+
+    try:
+        info = await verificar_token_google(token)
+    except ValueError:
+        return _resposta({"erro": "Token Google inválido."}, status.HTTP_400_BAD_REQUEST)
+
+    email = info.get("email")
+    if not email:
+        return _resposta({"erro": "Token inválido: sem email."}, status.HTTP_400_BAD_REQUEST)
+
+    usuario, criado = await Usuario.objects.aget_or_create(
+        email=email,
+        defaults={
+            "username": email.split("@")[0],
+            "first_name": info.get("name", ""),
+            "foto": info.get("picture", ""),
+            "ativo": True,
+        },
+    )
+    refresh = await sync_to_async(RefreshToken.for_user)(usuario)
+
+    return _resposta({
+        "refresh": str(refresh),
+        "access": str(refresh.access_token),
+        "usuario": {
+            "id": usuario.id,
+            "username": usuario.username,
+            "email": usuario.email,
+            "foto": usuario.foto.url if usuario.foto else None,
+        }
+    })
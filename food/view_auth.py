@@ -1,6 +1,26 @@
+from rest_framework import exceptions
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 
+from . import senhas
+
+
+class SenhasOcupadas(exceptions.APIException):
+    status_code = 503
+    default_detail = 'Muitas senhas sendo verificadas agora; tente de novo em instantes.'
+    default_code = 'senhas_ocupadas'
+    wait = 1  # vira o Retry-After
+
+
+class SenhaEmPoolMixin:
+    """Fila do pool de hash cheia (``senhas.FilaDeSenhasCheia``) vira 503 com ``Retry-After``"""
+
+    def handle_exception(self, exc):
+        if isinstance(exc, senhas.FilaDeSenhasCheia):
+            exc = SenhasOcupadas()
+        return super().handle_exception(exc)
+
+
 class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
     @classmethod
     def get_token(cls, user):
@@ -11,5 +31,6 @@ class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
 
         return token
 
-class CustomTokenObtainPairView(TokenObtainPairView):
-    serializer_class = MyTokenObtainPairSerializer
\ No newline at end of file
+class CustomTokenObtainPairView(SenhaEmPoolMixin, TokenObtainPairView):
+    serializer_class = MyTokenObtainPairSerializer
+    throttle_scope = 'auth'
@@ -0,0 +1,32 @@
+from rest_framework import permissions, status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+
+from . import autocompletar
+
+
+class AutocompletarView(APIView):
+    """
+    Sugestões da busca a cada tecla: restaurantes, produtos e categorias com uma palavra do nome
+    começando por ``?q=`` (sem acento nem caixa). ``?tipo=`` (repetível) restringe os tipos e
+    ``?limite=`` vai até 20. Só lê o índice em memória; nem a autenticação consulta o banco.
+    """
+    permission_classes = [permissions.AllowAny]
+    authentication_classes = [JWTStatelessUserAuthentication]
+    throttle_scope = 'busca'
+
+    def get(self, request):
+        tipos = list(dict.fromkeys(request.query_params.getlist('tipo'))) or autocompletar.TIPOS
+        invalidos = sorted(set(tipos) - set(autocompletar.TIPOS))
+        if invalidos:
+            return Response(
+                {'erro': f"Tipo inválido: {', '.join(invalidos)}. Use {', '.join(autocompletar.TIPOS)}."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            limite = int(request.query_params.get('limite', autocompletar.LIMITE_PADRAO))
+        except ValueError:
+            return Response({'erro': 'O "limite" deve ser um número inteiro.'}, status=status.HTTP_400_BAD_REQUEST)
+        limite = max(1, min(limite, autocompletar.LIMITE_MAXIMO))
+        return Response(autocompletar.sugerir(request.query_params.get('q', ''), tipos, limite))
@@ -0,0 +1,15 @@
+from django.http import HttpResponse
+from rest_framework.views import APIView
+from rest_framework.permissions import IsAdminUser
+
+from .metricas import exportar_prometheus
+
+
+class MetricasView(APIView):
+    """Expõe as métricas do processo no formato texto do Prometheus (somente staff)"""
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return HttpResponse(
+            exportar_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8'
+        )
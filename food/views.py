@@ -4,26 +4,73 @@ from rest_framework.response import Response
 from rest_framework.decorators import action
 from .permissions import IsAdminOrReadOnly, IsRestaurante, IsEntregador, IsCliente
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
 from rest_framework_simplejwt.tokens import RefreshToken
-from google.oauth2 import id_token
-from google.auth.transport import requests
-from django.conf import settings
+from collections import defaultdict
+from decimal import Decimal
 from django.core.exceptions import PermissionDenied
+from django.db import transaction
+from django.db.models import Prefetch
+from django.http import Http404
+from django.shortcuts import get_object_or_404
 from rest_framework.permissions import IsAuthenticated
 from .models import (
     Endereco, GrupoOpcao, Opcao, Usuario, Restaurante, CategoriaProduto, Produto,
-    Carrinho, ItemCarrinho, Pedido, ItemPedido, Pagamento,
+    Carrinho, ItemCarrinho, Pedido, ItemPedido, EventoPedido, Pagamento, EstoqueInsuficiente,
     Entrega, RastreamentoEntrega,
     AvaliacaoRestaurante, AvaliacaoEntregador, AvaliacaoProduto
 )
 from .serializers import (
     EnderecoSerializer, GrupoOpcaoSerializer, OpcaoSerializer, UsuarioSerializer, RestauranteSerializer,
     CategoriaProdutoSerializer, ProdutoSerializer,
-    CarrinhoSerializer, ItemCarrinhoSerializer,
-    PedidoSerializer, ItemPedidoSerializer, PagamentoSerializer,
+    CarrinhoSerializer, ItemCarrinhoSerializer, LoteCarrinhoSerializer,
+    PedidoSerializer, ItemPedidoSerializer, EventoPedidoSerializer, PagamentoSerializer,
     EntregaSerializer, RastreamentoEntregaSerializer,
-    AvaliacaoRestauranteSerializer, AvaliacaoEntregadorSerializer, AvaliacaoProdutoSerializer
+    AvaliacaoRestauranteSerializer, AvaliacaoEntregadorSerializer, AvaliacaoProdutoSerializer,
+    campos_incluidos
 )
+from .serializers_leitura import serializar_produtos, serializar_restaurantes, serializar_pedidos, _data_hora
+from .condicional import RespostaCondicionalMixin, campos_mostrados
+from .filtros import RestauranteFiltro, ProdutoFiltro, PedidoFiltro, EntregaFiltro
+from .roteador import LeituraEmReplicaMixin
+from . import carrinho_cache, login_google, posicoes, precos, previsao, recomendacoes, shards
+from .idempotencia import idempotente
+from .view_auth import SenhaEmPoolMixin
+
+# Actions que devolvem um objeto pelo serializer; as listagens têm caminho rápido próprio
+ACOES_DETALHE = ('retrieve', 'update', 'partial_update')
+
+
+def _produtos_para_serializar():
+    return Produto.objects.select_related('categoria', 'restaurante')
+
+
+class DadosEmShardsMixin:
+    """
+    ViewSets dos dados de pedido: com shards, ``list`` e a versão do GET condicional juntam todos
+    os shards (ou só os de ``restaurantes_consultados``); o detalhe acha o objeto pelo ``get`` que
+    procura em todos (``shards.QuerySetShard``). Deve vir antes do ``RespostaCondicionalMixin``.
+    """
+
+    def restaurantes_consultados(self):
+        """Ids dos restaurantes a que a consulta se limita (só os shards deles), ou ``None``."""
+        return None
+
+    def get_validadores(self):
+        alvo = super().get_validadores()
+        if alvo is None or not shards.shards():
+            return alvo
+        queryset, campos = alvo
+        # Datas de usuário, restaurante e produto ficam no default: a versão usa as do shard
+        partes = shards.espalhar(queryset, self.restaurantes_consultados())
+        return partes, shards.campos_locais(queryset.model, campos)
+
+    def list(self, request, *args, **kwargs):
+        if not shards.shards():
+            return super().list(request, *args, **kwargs)
+        objetos = shards.listar(self.filter_queryset(self.get_queryset()), self.restaurantes_consultados())
+        return Response(self.get_serializer(objetos, many=True).data)
+
 
 # -----------------------------
 # USUÁRIOS
@@ -34,6 +81,9 @@ class GoogleLoginView(APIView):
     Endpoint para login/cadastro via conta Google.
     Frontend deve enviar o id_token do Google.
     """
+    permission_classes = [permissions.AllowAny]
+    throttle_scope = 'auth'
+
     def post(self, request):
         token = request.data.get("id_token")
 
@@ -41,8 +91,8 @@ class GoogleLoginView(APIView):
             return Response({"erro": "Token Google ausente."}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            # valida o token
-            info = id_token.verify_oauth2_token(token, requests.Request(), settings.GOOGLE_CLIENT_ID)
+            # valida o token (chaves públicas do Google em cache, renovadas pela fila de tarefas)
+            info = login_google.verificar_token(token)
 
             email = info.get("email")
             nome = info.get("name", "")
@@ -79,12 +129,17 @@ class GoogleLoginView(APIView):
         except ValueError:
             return Response({"erro": "Token Google inválido."}, status=status.HTTP_400_BAD_REQUEST)
 
-class UsuarioViewSet(viewsets.ModelViewSet):
+class UsuarioViewSet(SenhaEmPoolMixin, LeituraEmReplicaMixin, viewsets.ModelViewSet):
     queryset = Usuario.objects.all()
     serializer_class = UsuarioSerializer
     permission_classes = [permissions.AllowAny]
     parser_classes = [MultiPartParser, FormParser, JSONParser]
 
+    def get_throttles(self):
+        # Cadastro e troca de senha fazem hashing de senha: mesmo orçamento do login
+        self.throttle_scope = 'auth' if self.action in ('create', 'registrar', 'atualizar_senha') else None
+        return super().get_throttles()
+
     def get_queryset(self):
         if self.request.user.is_staff:
             return self.queryset
@@ -136,9 +191,7 @@ class UsuarioViewSet(viewsets.ModelViewSet):
         if request.user != usuario and not request.user.is_staff:
             return Response({'erro': 'Permissão negada.'}, status=status.HTTP_403_FORBIDDEN)
 
-        if usuario.foto:
-            usuario.foto.delete(save=False)
-
+        # O arquivo antigo é apagado pela fila de tarefas (sinal pre_save do Usuario)
         usuario.foto = None
         usuario.save()
 
@@ -147,24 +200,41 @@ class UsuarioViewSet(viewsets.ModelViewSet):
 # -----------------------------
 # RESTAURANTES E PRODUTOS
 # -----------------------------
-class RestauranteViewSet(viewsets.ModelViewSet):
+def restaurantes_visiveis(user):
+    """Restaurantes que o usuário pode ver (também usado pelas views assíncronas)"""
+    if not user.is_authenticated or user.perfil in ('cliente', 'entregador'):
+        return Restaurante.objects.filter(aberto=True)
+
+    if user.perfil == 'restaurante':
+        return Restaurante.objects.filter(dono=user)
+
+    return Restaurante.objects.all()
+
+
+class RestauranteViewSet(RespostaCondicionalMixin, LeituraEmReplicaMixin, viewsets.ModelViewSet):
     queryset = Restaurante.objects.all()
     serializer_class = RestauranteSerializer
+    filterset_class = RestauranteFiltro
+    throttle_scope = 'catalogo'
     permission_classes = [permissions.IsAuthenticated]
+    campos_atualizacao = ('atualizado_em', 'produtos__atualizado_em')
+    cache_publico = True
 
 
     def get_queryset(self):
-        user = self.request.user
-        if not user.is_authenticated or user.perfil in ('cliente', 'entregador'):
-            return Restaurante.objects.filter(aberto=True)
-        
-        if user.perfil == 'restaurante':
-            return Restaurante.objects.filter(dono=user)
-
-        if user.is_staff or user.is_superuser:
-            return Restaurante.objects.all()
-        
-        return Restaurante.objects.all()
+        queryset = restaurantes_visiveis(self.request.user)
+        if self.action not in ACOES_DETALHE:
+            return queryset
+        queryset = queryset.select_related('dono')
+        if 'produtos' in campos_incluidos(RestauranteSerializer, self.request):
+            queryset = queryset.prefetch_related(Prefetch('produtos', queryset=_produtos_para_serializar()))
+        return queryset
+
+    def get_validadores(self):
+        if self.action == 'produtos':
+            produtos = Produto.objects.filter(restaurante__in=self.get_queryset().filter(pk=self.kwargs['pk']))
+            return produtos, campos_mostrados(ProdutoViewSet.campos_atualizacao, ProdutoSerializer, self.request)
+        return super().get_validadores()
     
     def get_permissions(self):
         if self.request.method not in ('GET', 'HEAD', 'OPTIONS'):
@@ -176,18 +246,24 @@ class RestauranteViewSet(viewsets.ModelViewSet):
             raise PermissionDenied("Apenas usuários com perfil 'restaurante' podem criar restaurantes.")
         serializer.save(dono=self.request.user)
 
+    def list(self, request, *args, **kwargs):
+        """Listagem pelo caminho rápido de serialização (somente leitura)"""
+        queryset = self.filter_queryset(self.get_queryset())
+        campos = campos_incluidos(RestauranteSerializer, request)
+        return Response(serializar_restaurantes(queryset, request=request, campos=campos))
+
     @action(detail=True, methods=['get'])
     def produtos(self, request, pk=None):
         """Listar produtos de um restaurante específico"""
         restaurante = self.get_object()
         produtos = restaurante.produtos.all()
-        serializer = ProdutoSerializer(produtos, many=True)
-        return Response(serializer.data)
+        return Response(serializar_produtos(produtos, campos=campos_incluidos(ProdutoSerializer, request)))
                       
 
-class CategoriaProdutoViewSet(viewsets.ModelViewSet):
+class CategoriaProdutoViewSet(LeituraEmReplicaMixin, viewsets.ModelViewSet):
     queryset = CategoriaProduto.objects.all()
     serializer_class = CategoriaProdutoSerializer
+    throttle_scope = 'catalogo'
     permission_classes = [permissions.AllowAny]
 
     def get_permissions(self):
@@ -197,14 +273,30 @@ class CategoriaProdutoViewSet(viewsets.ModelViewSet):
         return [permissions.AllowAny(),]
 
 
-class ProdutoViewSet(viewsets.ModelViewSet):
+class ProdutoViewSet(RespostaCondicionalMixin, LeituraEmReplicaMixin, viewsets.ModelViewSet):
     queryset = Produto.objects.all()
     serializer_class = ProdutoSerializer
+    filterset_class = ProdutoFiltro
+    throttle_scope = 'catalogo'
+    campos_atualizacao = ('atualizado_em', 'restaurante__atualizado_em')
+    cache_publico = True
+
+    def get_queryset(self):
+        if self.action in ACOES_DETALHE:
+            return _produtos_para_serializar()
+        return super().get_queryset()
+
     def get_permissions(self):
         # só restaurantes (ou admin) podem criar/editar produtos
         if self.request.method not in ('GET', 'HEAD', 'OPTIONS'):
             return [IsAuthenticated(), IsRestaurante()]
         return [permissions.AllowAny(),]
+
+    def list(self, request, *args, **kwargs):
+        """Listagem pelo caminho rápido de serialização (somente leitura)"""
+        queryset = self.filter_queryset(self.get_queryset())
+        campos = campos_incluidos(ProdutoSerializer, request)
+        return Response(serializar_produtos(queryset, request=request, campos=campos))
     
     @action(detail=True, methods=['get'], url_path='grupos-opcoes', url_name='grupos_opcoes')
     def grupos_opcoes(self, request, pk=None):
@@ -214,11 +306,27 @@ class ProdutoViewSet(viewsets.ModelViewSet):
         serializer = GrupoOpcaoSerializer(grupos, many=True)
         return Response(serializer.data)
 
-class GrupoOpcaoViewSet(viewsets.ModelViewSet):
+    @action(detail=True, methods=['get'])
+    def recomendacoes(self, request, pk=None):
+        """Produtos pedidos junto com este, calculados em lote: uma leitura do cache, sem banco"""
+        return Response(recomendacoes.do_produto(pk))
+
+class GrupoOpcaoViewSet(RespostaCondicionalMixin, LeituraEmReplicaMixin, viewsets.ModelViewSet):
     queryset = GrupoOpcao.objects.all()
     serializer_class = GrupoOpcaoSerializer
+    throttle_scope = 'catalogo'
+    campos_atualizacao = ('atualizado_em', 'opcoes__atualizado_em', 'produto__atualizado_em')
     permission_classes = [permissions.IsAuthenticated, IsRestaurante]
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action not in ('list', *ACOES_DETALHE):
+            return queryset
+        queryset = queryset.select_related('produto')
+        if 'opcoes' in campos_incluidos(GrupoOpcaoSerializer, self.request):
+            queryset = queryset.prefetch_related('opcoes')
+        return queryset
+
     @action(detail=True, methods=['get'])
     def opcoes(self, request, pk=None):
         """Listar opções de um grupo de opções específico"""
@@ -247,19 +355,46 @@ class GrupoOpcaoViewSet(viewsets.ModelViewSet):
 # -----------------------------
 # CARRINHO
 # -----------------------------
-class CarrinhoViewSet(viewsets.ModelViewSet):
+class CarrinhoViewSet(LeituraEmReplicaMixin, viewsets.ModelViewSet):
     queryset = Carrinho.objects.all()
     serializer_class = CarrinhoSerializer
     permission_classes = [permissions.IsAuthenticated, IsCliente]
-
-    @action(detail=True, methods=['post'])
+    throttle_scope = None  # só as mutações (ver @action) são limitadas
+
+    # O conteúdo dos carrinhos é servido pelo cache (ver carrinho_cache.py)
+    def list(self, request, *args, **kwargs):
+        ids = [str(pk) for pk in self.filter_queryset(self.get_queryset()).values_list('pk', flat=True)]
+        estados = carrinho_cache.obter_carrinhos(ids)
+        campos = campos_incluidos(CarrinhoSerializer, request)
+        return Response(carrinho_cache.serializar_carrinhos([estados[i] for i in ids if i in estados], campos))
+
+    def retrieve(self, request, *args, **kwargs):
+        estado = carrinho_cache.obter_carrinho(kwargs['pk'])
+        if estado is None:
+            raise Http404
+        return Response(carrinho_cache.serializar_carrinhos([estado], campos_incluidos(CarrinhoSerializer, request))[0])
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        carrinho_cache.descartar_carrinho(serializer.instance.pk)
+
+    def perform_destroy(self, instance):
+        carrinho_cache.descartar_carrinho(instance.pk)
+        super().perform_destroy(instance)
+
+    @action(detail=True, methods=['post'], throttle_scope='carrinho')
+    @idempotente
     def finalizar(self, request, pk=None):
         carrinho = self.get_object()
-        itens_do_carrinho = carrinho.itens.all()
-        if not itens_do_carrinho.exists():
+        with carrinho_cache.fechar_carrinho(carrinho.pk):
+            return self._finalizar(request, carrinho)
+
+    def _finalizar(self, request, carrinho):
+        itens_do_carrinho = list(carrinho.itens.select_related('produto__restaurante').prefetch_related('opcoes_escolhidas'))
+        if not itens_do_carrinho:
             return Response({'erro': 'Carrinho vazio.'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        restaurante = itens_do_carrinho.first().produto.restaurante
+
+        restaurante = itens_do_carrinho[0].produto.restaurante
 
         #Endereço
         endereco_id = request.data.get('endereco_id')
@@ -270,79 +405,184 @@ class CarrinhoViewSet(viewsets.ModelViewSet):
 
         endereco_entrega = endereco_cliente.gerar_snapshot()
         
-        if restaurante.enderecos.exists():
+        if hasattr(restaurante, 'enderecos'):
             endereco_origem = restaurante.enderecos.gerar_snapshot()
         else:
             endereco_origem = "Endereço do restaurante não cadastrado."
 
         try:
-            with transaction.atomic():
-                pedido = Pedido.objects.create(
+            # Pedido no shard do restaurante, estoque no default. O default confirma primeiro: se o
+            # shard falhar depois, sobra estoque reservado, nunca um pedido sem a reserva
+            with transaction.atomic(using=shards.banco_do_restaurante(restaurante.pk)), transaction.atomic():
+                # Preços das tabelas compiladas (precos.py): o total sai dos itens, sem relê-los
+                tabelas = precos.tabelas({item.produto_id for item in itens_do_carrinho})
+                pedido = Pedido(
                     usuario=carrinho.usuario,
                     restaurante=restaurante,
                     endereco_entrega=endereco_entrega,
                     endereco_origem=endereco_origem
                 )
-                for item_carrinho in itens_do_carrinho:
-                    item_pedido = ItemPedido.from_item_carrinho(item_carrinho, pedido)
-                    item_pedido.save()
+                itens_pedido = [
+                    ItemPedido.from_item_carrinho(item_carrinho, pedido, tabelas[str(item_carrinho.produto_id)])
+                    for item_carrinho in itens_do_carrinho
+                ]
+                pedido.valor_total = sum((item.subtotal() for item in itens_pedido), Decimal('0'))
+                pedido.save(force_insert=True)
+                ItemPedido.objects.bulk_create(itens_pedido)
 
-                pedido.valor_total = sum(i.subtotal() for i in pedido.itens.all())
-                pedido.save()
-
-                pedido = finalizar_carrinho(carrinho)
                 carrinho.itens.all().delete()
+
+                # Por último: a linha do produto fica travada do UPDATE até o commit
+                quantidades = defaultdict(int)
+                for item_carrinho in itens_do_carrinho:
+                    if item_carrinho.produto.estoque is not None:
+                        quantidades[item_carrinho.produto_id] += item_carrinho.quantidade
+                Produto.reservar_estoque(quantidades)
+            carrinho_cache.invalidar_produtos(quantidades)
             serializer = PedidoSerializer(pedido)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
+        except EstoqueInsuficiente as e:
+            return Response({"erro": str(e)}, status=status.HTTP_409_CONFLICT)
         except ValueError as e:
             return Response({"erro": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-    @action(detail=True, methods=['post'])
+    @action(detail=True, methods=['post'], throttle_scope='carrinho')
     def adicionar_item(self, request, pk=None):
-        """Adiciona produto ao carrinho"""
-        carrinho = self.get_object()
+        """
+        Adiciona produto ao carrinho (só no cache; vai para o banco no checkout ou no flush).
+        201 se criou um item; 200 se somou ao item com o mesmo produto, opções e observação.
+        """
         produto_id = request.data.get('produto_id')
         quantidade = int(request.data.get('quantidade', 1))
         observacao = request.data.get('observacao', '')
 
-        try:
-            produto = Produto.objects.get(id=produto_id)
-        except Produto.DoesNotExist:
+        produto = carrinho_cache.produto_em_cache(produto_id)
+        if produto is None:
             return Response({'erro': 'Produto não encontrado.'}, status=status.HTTP_404_NOT_FOUND)
-
-        item, criado = ItemCarrinho.objects.get_or_create(
-            carrinho=carrinho, produto=produto,
-            defaults={'quantidade': quantidade, 'observacao': observacao}
+        grupos = carrinho_cache.grupos_em_cache([produto['id']]).get(produto['id'], [])
+        try:
+            opcoes = carrinho_cache.escolher_opcoes(produto, grupos, request.data.get('opcoes', []))
+        except ValueError as e:
+            return Response({'erro': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        with carrinho_cache.alterar_carrinho(pk) as carrinho:
+            if carrinho is None:
+                raise Http404
+            antes = len(carrinho['itens'])
+            item = carrinho_cache.adicionar_item(carrinho, produto['id'], quantidade, observacao, opcoes)
+            criado = len(carrinho['itens']) > antes
+
+        return Response(
+            carrinho_cache.serializar_item(item, {produto['id']: produto}, precos.tabelas([produto['id']])),
+            status=status.HTTP_201_CREATED if criado else status.HTTP_200_OK
         )
 
-        if not criado:
-            item.quantidade += quantidade
-            item.save()
+    @action(detail=True, methods=['post'], throttle_scope='carrinho')
+    @idempotente
+    def itens(self, request, pk=None):
+        """
+        Aplica um lote de operações (adicionar, alterar, remover) de uma vez e devolve o carrinho.
+        Tudo é validado antes; se uma operação for inválida, nenhuma é aplicada.
+        """
+        lote = LoteCarrinhoSerializer(data=request.data)
+        lote.is_valid(raise_exception=True)
 
-        return Response(ItemCarrinhoSerializer(item).data, status=status.HTTP_201_CREATED)
+        try:
+            with carrinho_cache.alterar_carrinho(pk) as carrinho:
+                if carrinho is None:
+                    raise Http404
+                carrinho_cache.aplicar_operacoes(carrinho, lote.validated_data['operacoes'])
+        except carrinho_cache.OperacoesInvalidas as e:
+            return Response(
+                {'erro': 'Nenhuma operação foi aplicada.', 'operacoes': e.erros}, status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(carrinho_cache.serializar_carrinhos([carrinho])[0])
 
 
 # -----------------------------
 # PEDIDOS E PAGAMENTOS
 # -----------------------------
-class PedidoViewSet(viewsets.ModelViewSet):
+class PedidoViewSet(DadosEmShardsMixin, RespostaCondicionalMixin, LeituraEmReplicaMixin, viewsets.ModelViewSet):
     queryset = Pedido.objects.all()
     serializer_class = PedidoSerializer
+    filterset_class = PedidoFiltro
     permission_classes = [permissions.IsAuthenticated, IsCliente]
+    campos_atualizacao = ('atualizado_em', 'restaurante__atualizado_em', 'itens__produto__atualizado_em')
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action not in ACOES_DETALHE:
+            return queryset
+        # Com shards, usuário e restaurante estão em outro banco: consulta à parte em vez do JOIN
+        if shards.shards():
+            queryset = queryset.prefetch_related('usuario', 'restaurante')
+        else:
+            queryset = queryset.select_related('usuario', 'restaurante')
+        if 'itens' in campos_incluidos(PedidoSerializer, self.request):
+            queryset = queryset.prefetch_related(
+                Prefetch('itens__produto', queryset=_produtos_para_serializar())
+            )
+        return queryset
+
+    def restaurantes_consultados(self):
+        # Já validado pelo PedidoFiltro
+        restaurante = self.request.query_params.get('restaurante')
+        return [restaurante] if restaurante else None
+
+    def list(self, request, *args, **kwargs):
+        """Histórico de pedidos pelo caminho rápido de serialização (de todos os shards, sem ?restaurante=)"""
+        queryset = self.filter_queryset(self.get_queryset())
+        campos = campos_incluidos(PedidoSerializer, request)
+        return Response(shards.serializar(
+            queryset, lambda parte: serializar_pedidos(parte, request=request, campos=campos),
+            self.restaurantes_consultados(),
+        ))
 
     @action(detail=True, methods=['post'])
     def alterar_status(self, request, pk=None):
-        """Permite o restaurante ou admin mudar status do pedido"""
+        """
+        Permite o restaurante ou admin mudar status do pedido, só pelas transições permitidas.
+        ``status_atual`` (opcional) é o status que o cliente viu; se mudou nesse meio tempo, 409.
+        """
         pedido = self.get_object()
         novo_status = request.data.get('status')
 
         if novo_status not in dict(Pedido._meta.get_field('status').choices):
             return Response({'erro': 'Status inválido.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        pedido.status = novo_status
-        pedido.save()
+        try:
+            alterado = pedido.transicionar(novo_status, request.data.get('status_atual'))
+        except ValueError as e:
+            return Response({'erro': str(e)}, status=status.HTTP_409_CONFLICT)
+        if not alterado:
+            atual = Pedido.objects.using(pedido._state.db).filter(pk=pedido.pk).values_list('status', flat=True).first()
+            return Response(
+                {'erro': 'O status do pedido foi alterado por outra requisição.', 'status': atual},
+                status=status.HTTP_409_CONFLICT
+            )
         return Response(PedidoSerializer(pedido).data)
 
+    @action(detail=False, methods=['get'])
+    def eventos(self, request):
+        """Mudanças de status depois do evento ``desde`` (cursor: o último id recebido)"""
+        try:
+            desde = int(request.query_params.get('desde', 0))
+        except ValueError:
+            return Response({'erro': 'desde deve ser o id de um evento.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # O cursor é o id do evento, que cada shard numera por conta própria
+        pedidos = shards.espalhar(self.filter_queryset(self.get_queryset()), self.restaurantes_consultados())
+        if len(pedidos) > 1:
+            return Response(
+                {'erro': 'Com os pedidos divididos em shards, informe o restaurante.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        eventos = list(EventoPedido.desde(desde, pedidos=pedidos[0]))
+        return Response({
+            'eventos': EventoPedidoSerializer(eventos, many=True).data,
+            'cursor': eventos[-1].id if eventos else desde,
+        })
+
     @action(detail=True, methods=['get'])
     def pagamento(self, request, pk=None):
         """Retorna pagamento vinculado a um pedido"""
@@ -352,21 +592,40 @@ class PedidoViewSet(viewsets.ModelViewSet):
         return Response({'mensagem': 'Sem pagamento registrado.'})
 
 
-class PagamentoViewSet(viewsets.ModelViewSet):
+class PagamentoViewSet(DadosEmShardsMixin, LeituraEmReplicaMixin, viewsets.ModelViewSet):
     queryset = Pagamento.objects.all()
     serializer_class = PagamentoSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    @idempotente
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
+
 
 # -----------------------------
 # ENTREGA E RASTREAMENTO
 # -----------------------------
-class EntregaViewSet(viewsets.ModelViewSet):
+class EntregaViewSet(DadosEmShardsMixin, RespostaCondicionalMixin, LeituraEmReplicaMixin, viewsets.ModelViewSet):
     queryset = Entrega.objects.all()
     serializer_class = EntregaSerializer
+    filterset_class = EntregaFiltro
     permission_classes = [permissions.IsAuthenticated]
+    campos_atualizacao = ('atualizado_em', 'rastreamentos__registrado_em')
+    throttle_scope = None  # só o GPS (ver @action) é limitado
 
-    @action(detail=True, methods=['post'])
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'atualizar_localizacao':
+            return queryset.select_related('pedido')
+        if self.action not in ('list', *ACOES_DETALHE):
+            return queryset
+        # Com shards, o entregador está em outro banco: consulta à parte em vez do JOIN
+        queryset = queryset.prefetch_related('entregador') if shards.shards() else queryset.select_related('entregador')
+        if 'rastreamentos' in campos_incluidos(EntregaSerializer, self.request):
+            queryset = queryset.prefetch_related('rastreamentos')
+        return queryset
+
+    @action(detail=True, methods=['post'], throttle_scope='gps')
     def atualizar_localizacao(self, request, pk=None):
         """Entregador atualiza coordenadas GPS"""
         entrega = self.get_object()
@@ -379,30 +638,45 @@ class EntregaViewSet(viewsets.ModelViewSet):
         rastreamento = RastreamentoEntrega.objects.create(
             entrega=entrega, latitude=latitude, longitude=longitude
         )
-        return Response(RastreamentoEntregaSerializer(rastreamento).data, status=status.HTTP_201_CREATED)
+        chegada = previsao.registrar_ponto(entrega, latitude, longitude, rastreamento.registrado_em)
+        posicoes.gravar(entrega.pk, latitude, longitude, rastreamento.registrado_em, chegada)
+        # A previsão mudou: avança a versão da entrega para o ETag não servir a anterior
+        Entrega.objects.using(entrega._state.db).filter(pk=entrega.pk).update(atualizado_em=rastreamento.registrado_em)
+        dados = RastreamentoEntregaSerializer(rastreamento).data
+        dados['previsao_chegada'] = _data_hora(chegada)
+        return Response(dados, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['get'], throttle_scope='posicao',
+            authentication_classes=[JWTStatelessUserAuthentication])
+    def posicao_atual(self, request, pk=None):
+        """Última posição do entregador; só lê o cache (nem a autenticação consulta o banco)"""
+        posicao = posicoes.ler(pk)
+        if posicao is None:
+            return Response({'erro': 'Entrega sem posição recente.'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(posicao)
 
 
 # -----------------------------
 # AVALIAÇÕES
 # -----------------------------
-class AvaliacaoRestauranteViewSet(viewsets.ModelViewSet):
+class AvaliacaoRestauranteViewSet(LeituraEmReplicaMixin, viewsets.ModelViewSet):
     queryset = AvaliacaoRestaurante.objects.all()
     serializer_class = AvaliacaoRestauranteSerializer
     permission_classes = [permissions.IsAuthenticated]
 
 
-class AvaliacaoEntregadorViewSet(viewsets.ModelViewSet):
+class AvaliacaoEntregadorViewSet(LeituraEmReplicaMixin, viewsets.ModelViewSet):
     queryset = AvaliacaoEntregador.objects.all()
     serializer_class = AvaliacaoEntregadorSerializer
     permission_classes = [permissions.IsAuthenticated]
 
 
-class AvaliacaoProdutoViewSet(viewsets.ModelViewSet):
+class AvaliacaoProdutoViewSet(LeituraEmReplicaMixin, viewsets.ModelViewSet):
     queryset = AvaliacaoProduto.objects.all()
     serializer_class = AvaliacaoProdutoSerializer
     permission_classes = [permissions.IsAuthenticated]
 
-class EnderecoViewSet(viewsets.ModelViewSet):
+class EnderecoViewSet(LeituraEmReplicaMixin, viewsets.ModelViewSet):
     queryset = Endereco.objects.all()
     serializer_class = EnderecoSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'happy_food_backend.settings')
 
 application = get_asgi_application()
+
+# Rotas, serializers e conexões prontos antes da primeira requisição (AQUECER=0 desliga)
+from food.aquecimento import aquecer_processo  # noqa: E402
+
+aquecer_processo()
@@ -4,6 +4,7 @@ AUTH_USER_MODEL = 'food.Usuario'
 from pathlib import Path
 import os
 from dotenv import load_dotenv
+from django.core.exceptions import ImproperlyConfigured
 from datetime import timedelta
 
 # Carrega as variáveis do arquivo .env
@@ -40,12 +41,15 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'rest_framework',
+    'django_filters',
     'rest_framework_simplejwt',
     'rest_framework_simplejwt.token_blacklist',
     'food',
 ]
 
 MIDDLEWARE = [
+    'food.metricas.MetricasMiddleware',  # primeiro, para medir a requisição inteira
+    'food.middleware.RotasAssincronasMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -68,9 +72,28 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',  # padrão, altere conforme necessário
     ],
+    'DEFAULT_THROTTLE_CLASSES': [
+        'food.throttles.BaldeDeTokensThrottle',  # limita as views que definem throttle_scope
+    ],
+    'DEFAULT_FILTER_BACKENDS': [
+        'django_filters.rest_framework.DjangoFilterBackend',  # usa o filterset_class de cada ViewSet
+    ],
+}
+
+# Balde de tokens por throttle_scope: (rajada máxima, reposição em requisições por segundo).
+# Os contadores ficam no cache (CACHES), compartilhados entre os workers.
+THROTTLE_BALDES = {
+    'auth': (10, 10 / 60),      # login e cadastro: hashing de senha é caro
+    'gps': (20, 2),             # atualizar_localizacao de cada entregador
+    'posicao': (30, 1),         # posicao_atual: acompanhamento do entregador pelo cliente
+    'carrinho': (60, 5),        # mutações de carrinho e checkout
+    'catalogo': (120, 20),      # leitura de restaurantes, produtos e opções
+    'busca': (60, 10),          # autocompletar: uma requisição por tecla
 }
 
 ROOT_URLCONF = 'happy_food_backend.urls'
+# Sob ASGI, as rotas de leitura mais acessadas usam views assíncronas
+ASYNC_ROOT_URLCONF = 'happy_food_backend.urls_async'
 
 TEMPLATES = [
     {
@@ -97,10 +120,127 @@ DATABASES = {
         'PASSWORD': os.getenv('DB_PASSWORD'),
         'HOST': os.getenv('DB_HOST'),
         'PORT': os.getenv('DB_PORT'),
+        # Segundos que a conexão sobrevive entre requisições; com 0, cada requisição conecta de novo
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '0')),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Réplicas de leitura (opcional): DB_REPLICA_HOSTS=host1,host2:5433
+# Para testar localmente, aponte uma réplica para o próprio banco: DB_REPLICA_HOSTS=localhost
+DATABASE_REPLICAS = []
+for indice, endereco in enumerate(filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(',')), start=1):
+    host, _, porta = endereco.strip().partition(':')
+    DATABASES[f'replica_{indice}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': porta or os.getenv('DB_PORT'),
+        'USER': os.getenv('DB_REPLICA_USER', os.getenv('DB_USER')),
+        'PASSWORD': os.getenv('DB_REPLICA_PASSWORD', os.getenv('DB_PASSWORD')),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica_{indice}')
+
+# Shards dos dados de pedido (opcional): DB_SHARDS=host1/banco1,host2:5433/banco2, um banco por shard.
+# Cada restaurante tem os pedidos num só shard (anel de hash consistente, ver food/shards.py); usuários,
+# restaurantes e cardápio continuam no default. Para testar localmente, use bancos no mesmo servidor
+# (DB_SHARDS=localhost/food_shard_1,localhost/food_shard_2), arquivos SQLite (shard_1.sqlite3) ou
+# inclua o próprio default (DB_SHARDS=default,localhost/food_shard_2).
+DATABASE_SHARDS = []
+for indice, endereco in enumerate(filter(None, os.getenv('DB_SHARDS', '').split(',')), start=1):
+    endereco = endereco.strip()
+    if endereco == 'default':
+        DATABASE_SHARDS.append('default')
+        continue
+    if endereco.endswith('.sqlite3'):
+        DATABASES[f'shard_{indice}'] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': BASE_DIR / endereco}
+    else:
+        servidor, _, nome = endereco.partition('/')
+        host, _, porta = servidor.partition(':')
+        DATABASES[f'shard_{indice}'] = {
+            **DATABASES['default'],
+            'NAME': nome or f"{os.getenv('DB_NAME')}_shard_{indice}",
+            'HOST': host,
+            'PORT': porta or os.getenv('DB_PORT'),
+        }
+    DATABASE_SHARDS.append(f'shard_{indice}')
+
+DATABASE_ROUTERS = ['food.roteador.RoteadorShards', 'food.roteador.RoteadorPrimarioReplica']
+# Segundos em que o usuário lê do primário depois de escrever (atraso de replicação)
+DB_JANELA_PRIMARIO = int(os.getenv('DB_JANELA_PRIMARIO', '5'))
+
+# Cache compartilhado entre os workers (carrinhos, fixação no primário); sem REDIS_URL usa memória local,
+# que é de cada processo: com mais de um worker, cada um teria os próprios carrinhos. Só para runserver
+CACHE_COMPARTILHADO = bool(os.getenv('REDIS_URL'))
+if CACHE_COMPARTILHADO:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
 
+# A fixação no primário depois de uma escrita (food/roteador.py) fica no cache: num cache de cada processo,
+# a próxima requisição do usuário em outro worker leria da réplica um dado que ele acabou de mudar
+if DATABASE_REPLICAS and not CACHE_COMPARTILHADO:
+    raise ImproperlyConfigured('DB_REPLICA_HOSTS exige um cache compartilhado entre os processos: defina REDIS_URL.')
+
+# Carrinhos abandonados saem do cache depois disso; rode persistir_carrinhos bem antes
+CARRINHO_CACHE_TIMEOUT = int(os.getenv('CARRINHO_CACHE_TIMEOUT', str(7 * 24 * 60 * 60)))
+
+# Por quanto tempo a resposta de um POST com Idempotency-Key é reproduzida nas repetições
+IDEMPOTENCIA_TTL = int(os.getenv('IDEMPOTENCIA_TTL', str(24 * 60 * 60)))
+
+# Por quanto tempo a CDN/navegador pode servir o catálogo público sem revalidar (ETag)
+CATALOGO_CACHE_MAX_AGE = int(os.getenv('CATALOGO_CACHE_MAX_AGE', '60'))
+
+# `pedidos/eventos/` só entrega eventos com mais que isso (segundos): um id menor pode ser
+# commitado depois de um maior, e o cursor passaria por cima dele. Deve cobrir a transação
+# mais longa que grava eventos (ver EventoPedido)
+EVENTOS_ATRASO_LEITURA = float(os.getenv('EVENTOS_ATRASO_LEITURA', '2'))
+
+# Broker da fila de tarefas (food.fila): a tabela Tarefa, consumida por `manage.py run_workers`.
+# 'food.fila.BrokerImediato' executa as tarefas na hora, sem worker.
+TAREFAS_BROKER = os.getenv('TAREFAS_BROKER', 'food.fila.BrokerBanco')
+
+# Índice de prefixos da busca (food/autocompletar.py), em memória em cada processo: no máximo
+# tantas chaves por tipo (cada nome ocupa uma por palavra, até 4; ~170 bytes cada)
+AUTOCOMPLETAR_MAXIMO_CHAVES = int(os.getenv('AUTOCOMPLETAR_MAXIMO_CHAVES', '200000'))
+
+
+
+# Hash de senha (food/senhas.py): calculado num pool de SENHA_WORKERS threads por processo, fora da
+# thread da requisição; com SENHA_FILA_MAXIMA senhas esperando, o login/cadastro recebe 503.
+# SENHA_WORKERS=0 volta a calcular na requisição. `manage.py calibrar_senhas` sugere o custo.
+SENHA_WORKERS = int(os.getenv('SENHA_WORKERS', str(max(1, (os.cpu_count() or 2) // 2))))
+SENHA_FILA_MAXIMA = int(os.getenv('SENHA_FILA_MAXIMA', '16'))
+SENHA_HASHER = os.getenv('SENHA_HASHER', 'pbkdf2')  # pbkdf2, scrypt ou argon2 (pip install argon2-cffi)
+SENHA_PBKDF2_ITERACOES = int(os.getenv('SENHA_PBKDF2_ITERACOES', '1000000'))
+SENHA_SCRYPT_N = int(os.getenv('SENHA_SCRYPT_N', str(2 ** 14)))
+SENHA_SCRYPT_R = int(os.getenv('SENHA_SCRYPT_R', '8'))
+SENHA_SCRYPT_P = int(os.getenv('SENHA_SCRYPT_P', '1'))
+SENHA_ARGON2_TEMPO = int(os.getenv('SENHA_ARGON2_TEMPO', '2'))
+SENHA_ARGON2_MEMORIA = int(os.getenv('SENHA_ARGON2_MEMORIA', str(64 * 1024)))  # KiB
+SENHA_ARGON2_PARALELISMO = int(os.getenv('SENHA_ARGON2_PARALELISMO', '1'))  # o pool já divide os núcleos
+
+# O primeiro gera os hashes novos; os demais só conferem os antigos, refeitos com o primeiro no login
+_HASHERS_SENHA = {
+    'pbkdf2': 'food.senhas.PBKDF2Calibrado',
+    'scrypt': 'food.senhas.ScryptCalibrado',
+    'argon2': 'food.senhas.Argon2Calibrado',
+}
+PASSWORD_HASHERS = [
+    _HASHERS_SENHA[SENHA_HASHER],
+    *(hasher for nome, hasher in _HASHERS_SENHA.items() if nome != SENHA_HASHER),
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+]
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
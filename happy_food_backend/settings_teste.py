@@ -0,0 +1,13 @@
+"""
+Settings para rodar os testes com um segundo banco de verdade, usado pelos testes que movem
+pedidos entre shards (ShardsDoisBancosTests; sem este alias eles são pulados):
+
+    DJANGO_SETTINGS_MODULE=happy_food_backend.settings_teste python manage.py test food
+
+O runner cria e apaga test_<DB_NAME>_shard_2 ao lado do banco de teste do default.
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import DATABASES
+
+if 'shard_2' not in DATABASES:
+    DATABASES['shard_2'] = {**DATABASES['default'], 'NAME': f"{DATABASES['default']['NAME']}_shard_2"}
@@ -7,6 +7,7 @@ from rest_framework_simplejwt.views import (
 )
 from food.view_auth import CustomTokenObtainPairView
 from food.view_logout import LogoutView
+from food.view_metricas import MetricasView
 from django.conf import settings
 from django.conf.urls.static import static
 
@@ -17,6 +18,7 @@ urlpatterns = [
     path("auth/token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
     path("auth/token/verify/", TokenVerifyView.as_view(), name="token_verify"),
     path("api/logout/", LogoutView.as_view(), name="auth_logout"),
+    path("metrics/", MetricasView.as_view(), name="metricas"),
 ]
 
 if settings.DEBUG:
@@ -0,0 +1,38 @@
+"""
+URLconf usada nas requisições ASGI (ver ``food.middleware.RotasAssincronasMiddleware``).
+
+As rotas de leitura mais acessadas apontam para as views assíncronas de ``food.view_async``;
+todo o resto, inclusive os outros métodos dessas mesmas rotas, segue para as views síncronas.
+"""
+from django.urls import path, re_path
+
+from food.urls import router
+from food.views import GoogleLoginView
+from food.view_async import (
+    rota_assincrona, listar_restaurantes, produtos_do_restaurante, listar_produtos,
+    detalhe_entrega, posicao_entrega, google_login,
+)
+from .urls import urlpatterns as urlpatterns_sync
+
+views_sync = {url.name: url.callback for url in router.urls}
+
+urlpatterns = [
+    re_path(r'^api/restaurantes/$',
+            rota_assincrona(listar_restaurantes, views_sync['restaurante-list']),
+            name='restaurante-list'),
+    re_path(r'^api/restaurantes/(?P<pk>[^/.]+)/produtos/$',
+            rota_assincrona(produtos_do_restaurante, views_sync['restaurante-produtos']),
+            name='restaurante-produtos'),
+    re_path(r'^api/produtos/$',
+            rota_assincrona(listar_produtos, views_sync['produto-list']),
+            name='produto-list'),
+    re_path(r'^api/entregas/(?P<pk>[^/.]+)/$',
+            rota_assincrona(detalhe_entrega, views_sync['entrega-detail']),
+            name='entrega-detail'),
+    re_path(r'^api/entregas/(?P<pk>[^/.]+)/posicao_atual/$',
+            rota_assincrona(posicao_entrega, views_sync['entrega-posicao-atual']),
+            name='entrega-posicao-atual'),
+    path('api/auth/google/',
+         rota_assincrona(google_login, GoogleLoginView.as_view(), metodos=('POST',)),
+         name='google-login'),
+] + urlpatterns_sync